@@ -16,12 +16,16 @@ from config import (
     WEBSOCKET_URL, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT,
     TOKEN_REFRESH_INTERVAL, TOKEN_RETRY_INTERVAL, COOKIES_STR,
     LOG_CONFIG, AUTO_REPLY, DEFAULT_HEADERS, WEBSOCKET_HEADERS,
-    APP_CONFIG, API_ENDPOINTS
+    APP_CONFIG, API_ENDPOINTS, get_memory_limit
 )
 import sys
 import aiohttp
 from collections import defaultdict
 from db_manager import db_manager
+from utils.bounded_cache import TTLCache, TTLSet, KeyedLocks, container_stats
+from utils.item_catalog import get_item_catalog
+from utils.single_flight import get_single_flight
+from utils.reply_api_client import get_reply_api_client
 
 # 滑块验证补丁已废弃，使用集成的 Playwright 登录方法
 # 不再需要猴子补丁，所有功能已集成到 XianyuSliderStealth 类中
@@ -163,16 +167,13 @@ class XianyuLive:
     # 记录锁的持有状态和释放时间 {lock_key: {'locked': bool, 'release_time': float, 'task': asyncio.Task}}
     _lock_hold_info = {}
 
-    # 独立的锁字典，用于订单详情获取（不使用延迟锁机制）
-    _order_detail_locks = defaultdict(lambda: asyncio.Lock())
-    # 记录订单详情锁的使用时间
-    _order_detail_lock_times = {}
-
-    # 商品详情缓存（24小时有效）
-    _item_detail_cache = {}  # {item_id: {'detail': str, 'timestamp': float, 'access_time': float}}
-    _item_detail_cache_lock = asyncio.Lock()
-    _item_detail_cache_max_size = 1000  # 最大缓存1000个商品
-    _item_detail_cache_ttl = 24 * 60 * 60  # 24小时TTL
+    # 独立的锁字典，用于订单详情获取（不使用延迟锁机制），有容量上限，空闲超过TTL自动清理
+    _order_detail_max_size, _order_detail_ttl = get_memory_limit('order_detail_locks', 2000, 86400)
+    _order_detail_locks = KeyedLocks(max_size=_order_detail_max_size, ttl=_order_detail_ttl)
+    # 订单详情远程获取的请求合并（按 (账号, 订单ID)），成功结果短暂缓存，避免多路消息重复拉取；入库由各调用方执行
+    _order_detail_results_max_size, _order_detail_results_ttl = get_memory_limit('order_detail_results', 2000, 60)
+    _order_detail_flight = get_single_flight('order_detail', result_ttl=_order_detail_results_ttl,
+                                             max_size=_order_detail_results_max_size)
 
     # 类级别的实例管理字典，用于API调用
     _instances = {}  # {cookie_id: XianyuLive实例}
@@ -506,6 +507,10 @@ class XianyuLive:
                 cleaned_total += len(expired_confirms)
                 logger.warning(f"【{self.cookie_id}】清理了 {len(expired_confirms)} 个过期订单确认记录")
             
+            # 清理过期的已发货订单和防抖任务记录
+            cleaned_total += self.delivery_sent_orders.purge_expired()
+            cleaned_total += self.message_debounce_tasks.purge_expired()
+
             # 只有实际清理了内容才记录总数日志
             if cleaned_total > 0:
                 logger.info(f"【{self.cookie_id}】实例缓存清理完成，共清理 {cleaned_total} 条记录")
@@ -666,22 +671,27 @@ class XianyuLive:
         self.token_refresh_task = None
         self.connection_restart_flag = False  # 连接重启标志
 
+        # 各类记录的容量上限与过期时间（见 global_config.yml 的 MEMORY_LIMITS）
+        delivery_max_size, delivery_ttl = get_memory_limit('delivery_records', 5000, 86400)
+        notification_max_size, notification_ttl = get_memory_limit('notification_records', 2000, 3600)
+        debounce_max_size, debounce_ttl = get_memory_limit('debounce_tasks', 2000, 600)
+
         # 通知防重复机制
-        self.last_notification_time = {}  # 记录每种通知类型的最后发送时间
+        self.last_notification_time = TTLCache(max_size=notification_max_size, ttl=notification_ttl)  # 记录每种通知类型的最后发送时间
         self.notification_cooldown = 300  # 5分钟内不重复发送相同类型的通知
         self.token_refresh_notification_cooldown = 18000  # Token刷新异常通知冷却时间：3小时
         self.notification_lock = asyncio.Lock()  # 通知防重复机制的异步锁
 
         # 自动发货防重复机制
-        self.last_delivery_time = {}  # 记录每个商品的最后发货时间
+        self.last_delivery_time = TTLCache(max_size=delivery_max_size, ttl=delivery_ttl)  # 记录每个商品的最后发货时间
         self.delivery_cooldown = 600  # 10分钟内不重复发货
 
         # 自动确认发货防重复机制
-        self.confirmed_orders = {}  # 记录已确认发货的订单，防止重复确认
+        self.confirmed_orders = TTLCache(max_size=delivery_max_size, ttl=delivery_ttl)  # 记录已确认发货的订单，防止重复确认
         self.order_confirm_cooldown = 600  # 10分钟内不重复确认同一订单
 
         # 自动发货已发送订单记录
-        self.delivery_sent_orders = set()  # 记录已发货的订单ID，防止重复发货
+        self.delivery_sent_orders = TTLSet(max_size=delivery_max_size, ttl=delivery_ttl)  # 记录已发货的订单ID，防止重复发货
 
         self.session = None  # 用于API调用的aiohttp session
 
@@ -728,7 +738,7 @@ class XianyuLive:
 
         # 消息防抖管理器：用于处理用户连续发送消息的情况
         # {chat_id: {'task': asyncio.Task, 'last_message': dict, 'timer': float}}
-        self.message_debounce_tasks = {}  # 存储每个chat_id的防抖任务
+        self.message_debounce_tasks = TTLCache(max_size=debounce_max_size, ttl=debounce_ttl)  # 存储每个chat_id的防抖任务
         self.message_debounce_delay = 1  # 防抖延迟时间（秒）：用户停止发送消息1秒后才回复
         self.message_debounce_lock = asyncio.Lock()  # 防抖任务管理的锁
         
@@ -788,6 +798,38 @@ class XianyuLive:
         """获取当前活跃实例数量"""
         return len(cls._instances)
     
+    def get_memory_report(self) -> dict:
+        """获取当前实例各内存结构的条目数和近似字节数"""
+        structures = {
+            'last_notification_time': self.last_notification_time,
+            'last_delivery_time': self.last_delivery_time,
+            'confirmed_orders': self.confirmed_orders,
+            'delivery_sent_orders': self.delivery_sent_orders,
+            'message_debounce_tasks': self.message_debounce_tasks,
+            'processed_message_ids': self.processed_message_ids,
+            'background_tasks': self.background_tasks,
+        }
+        report = {name: container_stats(name, container) for name, container in structures.items()}
+        return {
+            'cookie_id': self.cookie_id,
+            'structures': report,
+            'total_entries': sum(item['entries'] for item in report.values()),
+            'total_approx_bytes': sum(item['approx_bytes'] for item in report.values()),
+        }
+
+    @classmethod
+    def get_shared_memory_report(cls) -> dict:
+        """获取类级别（所有账号共享）内存结构的统计"""
+        structures = {
+            '_order_locks': cls._order_locks,
+            '_lock_usage_times': cls._lock_usage_times,
+            '_lock_hold_info': cls._lock_hold_info,
+            '_order_detail_locks': cls._order_detail_locks,
+            '_item_catalog': get_item_catalog().memory,
+            '_last_password_login_time': cls._last_password_login_time,
+        }
+        return {name: container_stats(name, container) for name, container in structures.items()}
+
     def _create_tracked_task(self, coro):
         """创建并追踪后台任务，确保异常不会被静默忽略"""
         task = asyncio.create_task(coro)
@@ -928,22 +970,14 @@ class XianyuLive:
                         lock_info['task'].cancel()
                     del self._lock_hold_info[order_id]
 
-            # 清理订单详情锁
-            expired_detail_locks = []
-            for order_id, last_used in self._order_detail_lock_times.items():
-                if current_time - last_used > max_age_seconds:
-                    expired_detail_locks.append(order_id)
-
-            # 清理过期的订单详情锁
-            for order_id in expired_detail_locks:
-                if order_id in self._order_detail_locks:
-                    del self._order_detail_locks[order_id]
-                if order_id in self._order_detail_lock_times:
-                    del self._order_detail_lock_times[order_id]
+            # 清理订单详情锁（空闲超过TTL且未被持有的锁）
+            expired_detail_locks = self._order_detail_locks.purge_expired()
+            # 清理订单详情合并器中过期的缓存结果
+            self._order_detail_flight.purge_expired()
 
-            total_expired = len(expired_delivery_locks) + len(expired_detail_locks)
+            total_expired = len(expired_delivery_locks) + expired_detail_locks
             if total_expired > 0:
-                logger.info(f"【{self.cookie_id}】清理了 {total_expired} 个过期锁 (发货锁: {len(expired_delivery_locks)}, 详情锁: {len(expired_detail_locks)})")
+                logger.info(f"【{self.cookie_id}】清理了 {total_expired} 个过期锁 (发货锁: {len(expired_delivery_locks)}, 详情锁: {expired_detail_locks})")
                 logger.warning(f"【{self.cookie_id}】当前锁数量 - 发货锁: {len(self._order_locks)}, 详情锁: {len(self._order_detail_locks)}")
 
         except Exception as e:
@@ -2498,7 +2532,7 @@ class XianyuLive:
             return False
 
     async def fetch_item_detail_from_api(self, item_id: str) -> str:
-        """获取商品详情（使用浏览器获取，支持24小时缓存）
+        """获取商品详情（通过商品目录分层缓存：内存 → 数据库 → 浏览器获取）
 
         Args:
             item_id: 商品ID
@@ -2515,104 +2549,69 @@ class XianyuLive:
                 logger.warning(f"自动获取商品详情功能已禁用: {item_id}")
                 return ""
 
-            # 1. 首先检查缓存（24小时有效）
-            async with self._item_detail_cache_lock:
-                if item_id in self._item_detail_cache:
-                    cache_data = self._item_detail_cache[item_id]
-                    cache_time = cache_data['timestamp']
-                    current_time = time.time()
-
-                    # 检查缓存是否在24小时内
-                    if current_time - cache_time < self._item_detail_cache_ttl:
-                        # 更新访问时间（用于LRU）
-                        cache_data['access_time'] = current_time
-                        logger.info(f"从缓存获取商品详情: {item_id}")
-                        return cache_data['detail']
-                    else:
-                        # 缓存过期，删除
-                        del self._item_detail_cache[item_id]
-                        logger.warning(f"缓存已过期，删除: {item_id}")
-
-            # 2. 尝试使用浏览器获取商品详情
-            detail_from_browser = await self._fetch_item_detail_from_browser(item_id)
-            if detail_from_browser:
-                # 保存到缓存（带大小限制）
-                await self._add_to_item_cache(item_id, detail_from_browser)
-                logger.info(f"成功通过浏览器获取商品详情: {item_id}, 长度: {len(detail_from_browser)}")
-                return detail_from_browser
-
-            # 浏览器获取失败
-            logger.warning(f"浏览器获取商品详情失败: {item_id}")
-            return ""
+            # 同一商品的并发查询（跨账号）只会触发一次浏览器获取，失败结果会短暂负缓存
+            detail = await get_item_catalog().get_detail(
+                item_id, self._fetch_item_detail_from_browser, cookie_id=self.cookie_id
+            )
+            if detail:
+                logger.info(f"成功获取商品详情: {item_id}, 长度: {len(detail)}")
+            else:
+                logger.warning(f"获取商品详情失败: {item_id}")
+            return detail
 
         except Exception as e:
             logger.error(f"获取商品详情异常: {item_id}, 错误: {self._safe_str(e)}")
             return ""
 
-    async def _add_to_item_cache(self, item_id: str, detail: str):
-        """添加商品详情到缓存，实现LRU策略和大小限制
-        
-        Args:
-            item_id: 商品ID
-            detail: 商品详情
-        """
-        async with self._item_detail_cache_lock:
-            current_time = time.time()
-            
-            # 检查缓存大小，如果超过限制则清理
-            if len(self._item_detail_cache) >= self._item_detail_cache_max_size:
-                # 使用LRU策略删除最久未访问的项
-                if self._item_detail_cache:
-                    # 找到最久未访问的项
-                    oldest_item = min(
-                        self._item_detail_cache.items(),
-                        key=lambda x: x[1].get('access_time', x[1]['timestamp'])
-                    )
-                    oldest_item_id = oldest_item[0]
-                    del self._item_detail_cache[oldest_item_id]
-                    logger.warning(f"缓存已满，删除最旧项: {oldest_item_id}")
-            
-            # 添加新项到缓存
-            self._item_detail_cache[item_id] = {
-                'detail': detail,
-                'timestamp': current_time,
-                'access_time': current_time
-            }
-            logger.warning(f"添加商品详情到缓存: {item_id}, 当前缓存大小: {len(self._item_detail_cache)}")
-
     @classmethod
     async def _cleanup_item_cache(cls):
         """清理过期的商品详情缓存"""
+        return get_item_catalog().purge_expired()
+
+    async def _extract_item_detail_from_page(self, page, item_id: str) -> str:
+        """在给定页面中打开商品详情页并提取详情文本"""
+        # 构造商品详情页面URL
+        item_url = f"https://www.goofish.com/item?id={item_id}"
+        logger.info(f"访问商品页面: {item_url}")
+
+        # 访问页面
+        await page.goto(item_url, wait_until='networkidle', timeout=30000)
+
+        # 等待页面完全加载
+        await asyncio.sleep(3)
+
+        # 获取商品详情内容
         try:
-            async with cls._item_detail_cache_lock:
-                # 在持有锁时也要能响应取消信号
-                await asyncio.sleep(0)
-                
-                current_time = time.time()
-                expired_items = []
-                
-                # 找出所有过期的项
-                for item_id, cache_data in cls._item_detail_cache.items():
-                    # 在循环中也要能响应取消信号
-                    await asyncio.sleep(0)
-                    if current_time - cache_data['timestamp'] >= cls._item_detail_cache_ttl:
-                        expired_items.append(item_id)
-                
-                # 删除过期项
-                for item_id in expired_items:
-                    await asyncio.sleep(0)  # 让出控制权
-                    del cls._item_detail_cache[item_id]
-                
-                if expired_items:
-                    logger.info(f"清理了 {len(expired_items)} 个过期的商品详情缓存")
-                
-                return len(expired_items)
-        except asyncio.CancelledError:
-            # 如果被取消，确保锁能正确释放
-            raise
+            # 等待目标元素出现
+            await page.wait_for_selector('.desc--GaIUKUQY', timeout=10000)
+
+            # 获取商品详情文本
+            detail_element = await page.query_selector('.desc--GaIUKUQY')
+            if detail_element:
+                detail_text = await detail_element.inner_text()
+                logger.info(f"成功获取商品详情: {item_id}, 长度: {len(detail_text)}")
+                return detail_text.strip()
+            else:
+                logger.warning(f"未找到商品详情元素: {item_id}")
+
+        except Exception as e:
+            logger.warning(f"获取商品详情元素失败: {item_id}, 错误: {self._safe_str(e)}")
+
+        return ""
 
     async def _fetch_item_detail_from_browser(self, item_id: str) -> str:
-        """使用浏览器获取商品详情"""
+        """使用浏览器获取商品详情（优先从浏览器池借用页面）"""
+        from utils.browser_pool import get_browser_pool, is_browser_pool_enabled
+
+        if is_browser_pool_enabled():
+            try:
+                logger.info(f"开始使用浏览器池获取商品详情: {item_id}")
+                async with get_browser_pool().page(self.cookie_id, self.cookies_str) as page:
+                    return await self._extract_item_detail_from_page(page, item_id)
+            except Exception as e:
+                logger.error(f"浏览器池获取商品详情异常: {item_id}, 错误: {self._safe_str(e)}")
+                return ""
+
         playwright = None
         browser = None
         try:
@@ -2691,36 +2690,7 @@ class XianyuLive:
 
             # 创建页面
             page = await context.new_page()
-
-            # 构造商品详情页面URL
-            item_url = f"https://www.goofish.com/item?id={item_id}"
-            logger.info(f"访问商品页面: {item_url}")
-
-            # 访问页面
-            await page.goto(item_url, wait_until='networkidle', timeout=30000)
-
-            # 等待页面完全加载
-            await asyncio.sleep(3)
-
-            # 获取商品详情内容
-            detail_text = ""
-            try:
-                # 等待目标元素出现
-                await page.wait_for_selector('.desc--GaIUKUQY', timeout=10000)
-
-                # 获取商品详情文本
-                detail_element = await page.query_selector('.desc--GaIUKUQY')
-                if detail_element:
-                    detail_text = await detail_element.inner_text()
-                    logger.info(f"成功获取商品详情: {item_id}, 长度: {len(detail_text)}")
-                    return detail_text.strip()
-                else:
-                    logger.warning(f"未找到商品详情元素: {item_id}")
-
-            except Exception as e:
-                logger.warning(f"获取商品详情元素失败: {item_id}, 错误: {self._safe_str(e)}")
-
-            return ""
+            return await self._extract_item_detail_from_page(page, item_id)
 
         except Exception as e:
             logger.error(f"浏览器获取商品详情异常: {item_id}, 错误: {self._safe_str(e)}")
@@ -3168,6 +3138,16 @@ class XianyuLive:
 
     async def get_keyword_reply(self, send_user_name: str, send_user_id: str, send_message: str, item_id: str = None) -> str:
         """获取关键词匹配回复（支持商品ID优先匹配和图片类型）"""
+        keyword_data = self.match_keyword(send_message, item_id)
+        if not keyword_data:
+            return None
+        return await self.render_keyword_reply(keyword_data, send_user_name, send_user_id, send_message)
+
+    def match_keyword(self, send_message: str, item_id: str = None) -> dict:
+        """只做关键词匹配（商品ID关键词优先，其次通用关键词），返回命中的关键词记录，未命中返回None
+
+        不上传图片、不改写数据库，可以与API请求并发执行；确定采用关键词回复后再调用 render_keyword_reply
+        """
         try:
             from db_manager import db_manager
 
@@ -3178,76 +3158,19 @@ class XianyuLive:
                 logger.warning(f"账号 {self.cookie_id} 没有配置关键词")
                 return None
 
+            message = send_message.lower()
             # 1. 如果有商品ID，优先匹配该商品ID对应的关键词
             if item_id:
                 for keyword_data in keywords:
-                    keyword = keyword_data['keyword']
-                    reply = keyword_data['reply']
-                    keyword_item_id = keyword_data['item_id']
-                    keyword_type = keyword_data.get('type', 'text')
-                    image_url = keyword_data.get('image_url')
-
-                    if keyword_item_id == item_id and keyword.lower() in send_message.lower():
-                        logger.info(f"商品ID关键词匹配成功: 商品{item_id} '{keyword}' (类型: {keyword_type})")
-
-                        # 根据关键词类型处理
-                        if keyword_type == 'image' and image_url:
-                            # 图片类型关键词，发送图片
-                            return await self._handle_image_keyword(keyword, image_url, send_user_name, send_user_id, send_message)
-                        else:
-                            # 文本类型关键词，检查回复内容是否为空
-                            if not reply or (reply and reply.strip() == ''):
-                                logger.info(f"商品ID关键词 '{keyword}' 回复内容为空，不进行回复")
-                                return "EMPTY_REPLY"  # 返回特殊标记表示匹配到但不回复
-
-                            # 进行变量替换
-                            try:
-                                formatted_reply = reply.format(
-                                    send_user_name=send_user_name,
-                                    send_user_id=send_user_id,
-                                    send_message=send_message
-                                )
-                                logger.info(f"商品ID文本关键词回复: {formatted_reply}")
-                                return formatted_reply
-                            except Exception as format_error:
-                                logger.error(f"关键词回复变量替换失败: {self._safe_str(format_error)}")
-                                # 如果变量替换失败，返回原始内容
-                                return reply
+                    if keyword_data['item_id'] == item_id and keyword_data['keyword'].lower() in message:
+                        logger.info(f"商品ID关键词匹配成功: 商品{item_id} '{keyword_data['keyword']}' (类型: {keyword_data.get('type', 'text')})")
+                        return keyword_data
 
             # 2. 如果商品ID匹配失败或没有商品ID，匹配没有商品ID的通用关键词
             for keyword_data in keywords:
-                keyword = keyword_data['keyword']
-                reply = keyword_data['reply']
-                keyword_item_id = keyword_data['item_id']
-                keyword_type = keyword_data.get('type', 'text')
-                image_url = keyword_data.get('image_url')
-
-                if not keyword_item_id and keyword.lower() in send_message.lower():
-                    logger.info(f"通用关键词匹配成功: '{keyword}' (类型: {keyword_type})")
-
-                    # 根据关键词类型处理
-                    if keyword_type == 'image' and image_url:
-                        # 图片类型关键词，发送图片
-                        return await self._handle_image_keyword(keyword, image_url, send_user_name, send_user_id, send_message)
-                    else:
-                        # 文本类型关键词，检查回复内容是否为空
-                        if not reply or (reply and reply.strip() == ''):
-                            logger.info(f"通用关键词 '{keyword}' 回复内容为空，不进行回复")
-                            return "EMPTY_REPLY"  # 返回特殊标记表示匹配到但不回复
-
-                        # 进行变量替换
-                        try:
-                            formatted_reply = reply.format(
-                                send_user_name=send_user_name,
-                                send_user_id=send_user_id,
-                                send_message=send_message
-                            )
-                            logger.info(f"通用文本关键词回复: {formatted_reply}")
-                            return formatted_reply
-                        except Exception as format_error:
-                            logger.error(f"关键词回复变量替换失败: {self._safe_str(format_error)}")
-                            # 如果变量替换失败，返回原始内容
-                            return reply
+                if not keyword_data['item_id'] and keyword_data['keyword'].lower() in message:
+                    logger.info(f"通用关键词匹配成功: '{keyword_data['keyword']}' (类型: {keyword_data.get('type', 'text')})")
+                    return keyword_data
 
             logger.warning(f"未找到匹配的关键词: {send_message}")
             return None
@@ -3256,6 +3179,43 @@ class XianyuLive:
             logger.error(f"获取关键词回复失败: {self._safe_str(e)}")
             return None
 
+    async def render_keyword_reply(self, keyword_data: dict, send_user_name: str, send_user_id: str, send_message: str) -> str:
+        """根据命中的关键词生成回复：图片类型在此时才上传到闲鱼CDN，文本类型做变量替换"""
+        keyword = keyword_data['keyword']
+        reply = keyword_data['reply']
+        keyword_type = keyword_data.get('type', 'text')
+        image_url = keyword_data.get('image_url')
+        scope = '商品ID' if keyword_data['item_id'] else '通用'
+
+        try:
+            # 根据关键词类型处理
+            if keyword_type == 'image' and image_url:
+                # 图片类型关键词，发送图片
+                return await self._handle_image_keyword(keyword, image_url, send_user_name, send_user_id, send_message)
+
+            # 文本类型关键词，检查回复内容是否为空
+            if not reply or (reply and reply.strip() == ''):
+                logger.info(f"{scope}关键词 '{keyword}' 回复内容为空，不进行回复")
+                return "EMPTY_REPLY"  # 返回特殊标记表示匹配到但不回复
+
+            # 进行变量替换
+            try:
+                formatted_reply = reply.format(
+                    send_user_name=send_user_name,
+                    send_user_id=send_user_id,
+                    send_message=send_message
+                )
+                logger.info(f"{scope}文本关键词回复: {formatted_reply}")
+                return formatted_reply
+            except Exception as format_error:
+                logger.error(f"关键词回复变量替换失败: {self._safe_str(format_error)}")
+                # 如果变量替换失败，返回原始内容
+                return reply
+
+        except Exception as e:
+            logger.error(f"获取关键词回复失败: {self._safe_str(e)}")
+            return None
+
     async def _handle_image_keyword(self, keyword: str, image_url: str, send_user_name: str, send_user_id: str, send_message: str) -> str:
         """处理图片类型关键词"""
         try:
@@ -3358,14 +3318,14 @@ class XianyuLive:
         try:
             from ai_reply_engine import ai_reply_engine
 
-            # 检查是否启用AI回复
-            if not ai_reply_engine.is_ai_enabled(self.cookie_id):
+            # 检查是否启用AI回复（数据库操作放到线程中，避免阻塞事件循环）
+            if not await asyncio.to_thread(ai_reply_engine.is_ai_enabled, self.cookie_id):
                 logger.warning(f"账号 {self.cookie_id} 未启用AI回复")
                 return None
 
             # 从数据库获取商品信息
             from db_manager import db_manager
-            item_info_raw = db_manager.get_item_info(self.cookie_id, item_id)
+            item_info_raw = await asyncio.to_thread(db_manager.get_item_info, self.cookie_id, item_id)
 
             if not item_info_raw:
                 logger.warning(f"数据库中无商品信息: {item_id}")
@@ -3383,9 +3343,9 @@ class XianyuLive:
                     'desc': item_info_raw.get('item_detail', '暂无商品描述')
                 }
 
-            # 生成AI回复
+            # 生成AI回复（异步调用，不阻塞同一事件循环上的其他账号）
             # 由于外部已实现防抖机制，跳过内部等待（skip_wait=True）
-            reply = ai_reply_engine.generate_reply(
+            reply = await ai_reply_engine.generate_reply_async(
                 message=send_message,
                 item_info=item_info,
                 chat_id=chat_id,
@@ -4376,22 +4336,39 @@ class XianyuLive:
             return {"error": f"免拼发货模块调用失败: {self._safe_str(e)}", "order_id": order_id}
 
     async def fetch_order_detail_info(self, order_id: str, item_id: str = None, buyer_id: str = None, debug_headless: bool = None):
-        """获取订单详情信息（使用独立的锁机制，不受延迟锁影响）"""
+        """获取订单详情信息并保存到数据库
+
+        远程获取按 (账号, 订单ID) 合并：同一账号对同一订单的并发请求只拉取一次，成功结果短暂缓存；
+        入库和订单状态处理由每个调用方使用自己的 item_id/buyer_id 执行
+        """
+        if debug_headless is not None:
+            # 调试模式需要实际打开浏览器，不参与合并
+            result = await self._fetch_order_detail_remote(order_id, debug_headless)
+        else:
+            result = await self._order_detail_flight.do(
+                (self.cookie_id, order_id),
+                lambda: self._fetch_order_detail_remote(order_id)
+            )
+
+        if not result:
+            logger.warning(f"【{self.cookie_id}】订单详情获取失败: {order_id}")
+            return None
+        self._save_order_detail(order_id, item_id, buyer_id, result)
+        return result
+
+    async def _fetch_order_detail_remote(self, order_id: str, debug_headless: bool = None):
+        """从闲鱼获取订单详情（使用独立的锁机制，不受延迟锁影响），不写数据库"""
         # 使用独立的订单详情锁，不与自动发货锁冲突
         order_detail_lock = self._order_detail_locks[order_id]
 
-        # 记录订单详情锁的使用时间
-        self._order_detail_lock_times[order_id] = time.time()
-
         async with order_detail_lock:
             logger.info(f"🔍 【{self.cookie_id}】获取订单详情锁 {order_id}，开始处理...")
-            
+
             try:
                 logger.info(f"【{self.cookie_id}】开始获取订单详情: {order_id}")
 
                 # 导入订单详情获取器
                 from utils.order_detail_fetcher import fetch_order_detail_simple
-                from db_manager import db_manager
 
                 # 获取当前账号的cookie字符串
                 cookie_string = self.cookies_str
@@ -4403,85 +4380,91 @@ class XianyuLive:
                     logger.info(f"【{self.cookie_id}】🖥️ 启用有头模式进行调试")
 
                 # 异步获取订单详情（使用当前账号的cookie）
-                result = await fetch_order_detail_simple(order_id, cookie_string, headless=headless_mode)
-
-                if result:
-                    logger.info(f"【{self.cookie_id}】订单详情获取成功: {order_id}")
-                    logger.info(f"【{self.cookie_id}】页面标题: {result.get('title', '未知')}")
-
-                    # 获取解析后的规格信息
-                    spec_name = result.get('spec_name', '')
-                    spec_value = result.get('spec_value', '')
-                    quantity = result.get('quantity', '')
-                    amount = result.get('amount', '')
-
-                    if spec_name and spec_value:
-                        logger.info(f"【{self.cookie_id}】📋 规格名称: {spec_name}")
-                        logger.info(f"【{self.cookie_id}】📝 规格值: {spec_value}")
-                        print(f"🛍️ 【{self.cookie_id}】订单 {order_id} 规格信息: {spec_name} -> {spec_value}")
-                    else:
-                        logger.warning(f"【{self.cookie_id}】未获取到有效的规格信息")
-                        print(f"⚠️ 【{self.cookie_id}】订单 {order_id} 规格信息获取失败")
+                result = await fetch_order_detail_simple(order_id, cookie_string, headless=headless_mode,
+                                                         cookie_id=self.cookie_id)
+                # mtop接口刷新了_m_h5_tk时，与其他mtop调用一样更新当前Cookie并写回数据库
+                refreshed_cookies = result.pop('refreshed_cookies', None) if result else None
+                if refreshed_cookies:
+                    self.cookies.update(refreshed_cookies)
+                    self.cookies_str = '; '.join([f"{k}={v}" for k, v in self.cookies.items()])
+                    await self.update_config_cookies()
+                    logger.info(f"【{self.cookie_id}】订单详情接口刷新了Cookie，已更新到数据库")
+                return result
+            except Exception as e:
+                logger.error(f"【{self.cookie_id}】获取订单详情异常: {self._safe_str(e)}")
+                return None
 
-                    # 插入或更新订单信息到数据库
-                    try:
-                        # 检查cookie_id是否在cookies表中存在
-                        cookie_info = db_manager.get_cookie_by_id(self.cookie_id)
-                        if not cookie_info:
-                            logger.warning(f"Cookie ID {self.cookie_id} 不存在于cookies表中，丢弃订单 {order_id}")
-                        else:
-                            # 先保存订单基本信息
-                            success = db_manager.insert_or_update_order(
-                                order_id=order_id,
-                                item_id=item_id,
-                                buyer_id=buyer_id,
-                                spec_name=spec_name,
-                                spec_value=spec_value,
-                                quantity=quantity,
-                                amount=amount,
-                                cookie_id=self.cookie_id
-                            )
-                            
-                            # 使用订单状态处理器设置状态
-                            logger.info(f"【{self.cookie_id}】检查订单状态处理器调用条件: success={success}, handler_exists={self.order_status_handler is not None}")
-                            if success and self.order_status_handler:
-                                logger.info(f"【{self.cookie_id}】准备调用订单状态处理器.handle_order_detail_fetched_status: {order_id}")
-                                try:
-                                    handler_result = self.order_status_handler.handle_order_detail_fetched_status(
-                                        order_id=order_id,
-                                        cookie_id=self.cookie_id,
-                                        context="订单详情已拉取"
-                                    )
-                                    logger.info(f"【{self.cookie_id}】订单状态处理器.handle_order_detail_fetched_status返回结果: {handler_result}")
-                                    
-                                    # 处理待处理队列
-                                    logger.info(f"【{self.cookie_id}】准备调用订单状态处理器.on_order_details_fetched: {order_id}")
-                                    self.order_status_handler.on_order_details_fetched(order_id)
-                                    logger.info(f"【{self.cookie_id}】订单状态处理器.on_order_details_fetched调用成功: {order_id}")
-                                except Exception as e:
-                                    logger.error(f"【{self.cookie_id}】订单状态处理器调用失败: {self._safe_str(e)}")
-                                    import traceback
-                                    logger.error(f"【{self.cookie_id}】详细错误信息: {traceback.format_exc()}")
-                            else:
-                                logger.warning(f"【{self.cookie_id}】订单状态处理器调用条件不满足: success={success}, handler_exists={self.order_status_handler is not None}")
+    def _save_order_detail(self, order_id: str, item_id: str, buyer_id: str, result: dict):
+        """保存订单详情到数据库并更新订单状态"""
+        from db_manager import db_manager
 
-                            if success:
-                                logger.info(f"【{self.cookie_id}】订单信息已保存到数据库: {order_id}")
-                                print(f"💾 【{self.cookie_id}】订单 {order_id} 信息已保存到数据库")
-                            else:
-                                logger.warning(f"【{self.cookie_id}】订单信息保存失败: {order_id}")
+        logger.info(f"【{self.cookie_id}】订单详情获取成功: {order_id}")
+        logger.info(f"【{self.cookie_id}】页面标题: {result.get('title', '未知')}")
 
-                    except Exception as db_e:
-                        logger.error(f"【{self.cookie_id}】保存订单信息到数据库失败: {self._safe_str(db_e)}")
+        # 获取解析后的规格信息
+        spec_name = result.get('spec_name', '')
+        spec_value = result.get('spec_value', '')
+        quantity = result.get('quantity', '')
+        amount = result.get('amount', '')
+
+        if spec_name and spec_value:
+            logger.info(f"【{self.cookie_id}】📋 规格名称: {spec_name}")
+            logger.info(f"【{self.cookie_id}】📝 规格值: {spec_value}")
+            print(f"🛍️ 【{self.cookie_id}】订单 {order_id} 规格信息: {spec_name} -> {spec_value}")
+        else:
+            logger.warning(f"【{self.cookie_id}】未获取到有效的规格信息")
+            print(f"⚠️ 【{self.cookie_id}】订单 {order_id} 规格信息获取失败")
 
-                    return result
+        # 插入或更新订单信息到数据库
+        try:
+            # 检查cookie_id是否在cookies表中存在
+            cookie_info = db_manager.get_cookie_by_id(self.cookie_id)
+            if not cookie_info:
+                logger.warning(f"Cookie ID {self.cookie_id} 不存在于cookies表中，丢弃订单 {order_id}")
+            else:
+                # 先保存订单基本信息
+                success = db_manager.insert_or_update_order(
+                    order_id=order_id,
+                    item_id=item_id,
+                    buyer_id=buyer_id,
+                    spec_name=spec_name,
+                    spec_value=spec_value,
+                    quantity=quantity,
+                    amount=amount,
+                    cookie_id=self.cookie_id
+                )
+                
+                # 使用订单状态处理器设置状态
+                logger.info(f"【{self.cookie_id}】检查订单状态处理器调用条件: success={success}, handler_exists={self.order_status_handler is not None}")
+                if success and self.order_status_handler:
+                    logger.info(f"【{self.cookie_id}】准备调用订单状态处理器.handle_order_detail_fetched_status: {order_id}")
+                    try:
+                        handler_result = self.order_status_handler.handle_order_detail_fetched_status(
+                            order_id=order_id,
+                            cookie_id=self.cookie_id,
+                            context="订单详情已拉取"
+                        )
+                        logger.info(f"【{self.cookie_id}】订单状态处理器.handle_order_detail_fetched_status返回结果: {handler_result}")
+                        
+                        # 处理待处理队列
+                        logger.info(f"【{self.cookie_id}】准备调用订单状态处理器.on_order_details_fetched: {order_id}")
+                        self.order_status_handler.on_order_details_fetched(order_id)
+                        logger.info(f"【{self.cookie_id}】订单状态处理器.on_order_details_fetched调用成功: {order_id}")
+                    except Exception as e:
+                        logger.error(f"【{self.cookie_id}】订单状态处理器调用失败: {self._safe_str(e)}")
+                        import traceback
+                        logger.error(f"【{self.cookie_id}】详细错误信息: {traceback.format_exc()}")
                 else:
-                    logger.warning(f"【{self.cookie_id}】订单详情获取失败: {order_id}")
-                    return None
+                    logger.warning(f"【{self.cookie_id}】订单状态处理器调用条件不满足: success={success}, handler_exists={self.order_status_handler is not None}")
 
-            except Exception as e:
-                logger.error(f"【{self.cookie_id}】获取订单详情异常: {self._safe_str(e)}")
-                return None
+                if success:
+                    logger.info(f"【{self.cookie_id}】订单信息已保存到数据库: {order_id}")
+                    print(f"💾 【{self.cookie_id}】订单 {order_id} 信息已保存到数据库")
+                else:
+                    logger.warning(f"【{self.cookie_id}】订单信息保存失败: {order_id}")
+
+        except Exception as db_e:
+            logger.error(f"【{self.cookie_id}】保存订单信息到数据库失败: {self._safe_str(db_e)}")
 
     async def _auto_delivery(self, item_id: str, item_title: str = None, order_id: str = None, send_user_id: str = None):
         """自动发货功能 - 获取卡券规则，执行延时，确认发货，发送内容"""
@@ -5309,6 +5292,15 @@ class XianyuLive:
                     except Exception as cache_clean_e:
                         logger.warning(f"【{self.cookie_id}】清理商品详情缓存时出错: {cache_clean_e}")
 
+                    # 清理空闲过期的AI对话状态（放到线程中，避免与数据库冷加载争用锁时阻塞事件循环）
+                    try:
+                        from ai_reply_engine import ai_reply_engine
+                        await asyncio.to_thread(ai_reply_engine.cleanup_conversation_states)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as state_clean_e:
+                        logger.warning(f"【{self.cookie_id}】清理AI对话状态时出错: {state_clean_e}")
+
                     # 清理过期的通知、发货和订单确认记录（防止内存泄漏）
                     self._cleanup_instance_caches()
                     await asyncio.sleep(0)  # 让出控制权，允许检查取消信号
@@ -6813,14 +6805,9 @@ class XianyuLive:
             self.session = None
 
     async def get_api_reply(self, msg_time, user_url, send_user_id, send_user_name, item_id, send_message, chat_id):
-        """调用API获取回复消息"""
+        """调用API获取回复消息（进程级长连接、耗时预算、短时缓存和熔断见 utils.reply_api_client）"""
         try:
-            if not self.session:
-                await self.create_session()
-
             api_config = AUTO_REPLY.get('api', {})
-            timeout = aiohttp.ClientTimeout(total=api_config.get('timeout', 10))
-
             payload = {
                 "cookie_id": self.cookie_id,
                 "msg_time": msg_time,
@@ -6832,33 +6819,17 @@ class XianyuLive:
                 "chat_id": chat_id
             }
 
-            async with self.session.post(
-                api_config.get('url', 'http://localhost:8080/xianyu/reply'),
-                json=payload,
-                timeout=timeout
-            ) as response:
-                result = await response.json()
-
-                # 将code转换为字符串进行比较，或者直接用数字比较
-                if str(result.get('code')) == '200' or result.get('code') == 200:
-                    send_msg = result.get('data', {}).get('send_msg')
-                    if send_msg:
-                        # 格式化消息中的占位符
-                        return send_msg.format(
-                            send_user_id=payload['send_user_id'],
-                            send_user_name=payload['send_user_name'],
-                            send_message=payload['send_message']
-                        )
-                    else:
-                        logger.warning("API返回成功但无回复消息")
-                        return None
-                else:
-                    logger.warning(f"API返回错误: {result.get('msg', '未知错误')}")
-                    return None
-
-        except asyncio.TimeoutError:
-            logger.error("API调用超时")
-            return None
+            send_msg = await get_reply_api_client().fetch(
+                api_config.get('url', 'http://localhost:8080/xianyu/reply'), payload, self.cookie_id
+            )
+            if not send_msg:
+                return None
+            # 格式化消息中的占位符
+            return send_msg.format(
+                send_user_id=payload['send_user_id'],
+                send_user_name=payload['send_user_name'],
+                send_message=payload['send_message']
+            )
         except Exception as e:
             logger.error(f"调用API出错: {self._safe_str(e)}")
             return None
@@ -7100,14 +7071,25 @@ class XianyuLive:
             user_url = f'https://www.goofish.com/personal?userId={send_user_id}'
 
             reply = None
-            # 判断是否启用API回复
+            keyword_match = None
+            # 判断是否启用API回复：API请求与关键词匹配并发进行，API在耗时预算内返回则优先使用
             if AUTO_REPLY.get('api', {}).get('enabled', False):
-                reply = await self.get_api_reply(
+                api_task = asyncio.ensure_future(self.get_api_reply(
                     msg_time, user_url, send_user_id, send_user_name,
                     item_id, send_message, chat_id
-                )
+                ))
+                try:
+                    # 并发阶段只做匹配，图片上传等副作用等确定采用关键词回复后再执行
+                    keyword_match = self.match_keyword(send_message, item_id)
+                except BaseException:
+                    api_task.cancel()
+                    raise
+                # get_api_reply 自身受耗时预算约束，这里最多等到预算结束
+                reply = await api_task
                 if not reply:
                     logger.error(f"[{msg_time}] 【API调用失败】用户: {send_user_name} (ID: {send_user_id}), 商品({item_id}): {send_message}")
+            else:
+                keyword_match = self.match_keyword(send_message, item_id)
 
             # 记录回复来源
             reply_source = 'API'  # 默认假设是API回复
@@ -7115,7 +7097,8 @@ class XianyuLive:
             # 如果API回复失败或未启用API，按新的优先级顺序处理
             if not reply:
                 # 1. 首先尝试关键词匹配（传入商品ID）
-                reply = await self.get_keyword_reply(send_user_name, send_user_id, send_message, item_id)
+                if keyword_match:
+                    reply = await self.render_keyword_reply(keyword_match, send_user_name, send_user_id, send_message)
                 if reply == "EMPTY_REPLY":
                     # 匹配到关键词但回复内容为空，不进行任何回复
                     logger.info(f"[{msg_time}] 【{self.cookie_id}】匹配到空回复关键词，跳过自动回复")
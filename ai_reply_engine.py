@@ -7,18 +7,42 @@ AI回复引擎模块
 - 修复 P0-2 (部署陷阱): 移除客户端缓存，实现无状态
 - 修复 P1-3 (健壮性): 增强 Gemini 消息格式化
 - 遵照指示，未修复 P0-1 (议价竞争条件)
+- 全异步实现：LLM请求使用 aiohttp / AsyncOpenAI，数据库读写放到专用线程池，
+  同一chat_id使用 asyncio.Lock 串行，不再阻塞机器人事件循环
 """
 
 import os
 import json
 import time
 import sqlite3
-import requests  # 确保已导入
-import threading
-from typing import List, Dict, Optional
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urlparse
 from loguru import logger
-from openai import OpenAI
+from openai import AsyncOpenAI
 from db_manager import db_manager
+from config import config, get_memory_limit
+from utils.bounded_cache import KeyedLocks
+from utils.llm_client_pool import llm_client_pool
+from utils.reply_cache import get_reply_cache
+from utils.conversation_state import ConversationStateStore
+from utils.llm_hedging import get_hedged_caller
+from utils.ai_governor import get_ai_governor, RateLimitedError, parse_retry_after
+from utils.intent_classifier import get_intent_classifier
+from utils.prompt_builder import get_prompt_builder, estimate_tokens
+from utils.llm_streaming import get_streaming, iter_sse_data, dashscope_delta
+
+# DashScope/Gemini 接口根地址，可在 AI_REPLY.endpoints 中改为代理或本地测试桩
+DEFAULT_ENDPOINTS = {
+    'dashscope': 'https://dashscope.aliyuncs.com/api/v1',
+    'gemini': 'https://generativelanguage.googleapis.com/v1beta',
+}
+
+
+def get_endpoint(name: str) -> str:
+    """读取接口根地址（去掉末尾的 /），未配置时使用官方地址"""
+    return (config.get(f'AI_REPLY.endpoints.{name}') or DEFAULT_ENDPOINTS[name]).rstrip('/')
 
 
 class AIReplyEngine:
@@ -26,13 +50,19 @@ class AIReplyEngine:
     
     def __init__(self):
         # 修复 P0-2: 移除有状态的缓存，以支持多进程部署
+        # （大模型客户端改由 utils/llm_client_pool 按凭据哈希复用，见 _call_provider）
         # self.clients = {}  # 已移除
         # self.agents = {}   # 已移除
         # self.client_last_used = {}  # 已移除
         self._init_default_prompts()
-        # 用于控制同一chat_id消息的串行处理
-        self._chat_locks = {}
-        self._chat_locks_lock = threading.Lock()
+        # 用于控制同一chat_id消息的串行处理（有容量上限，空闲锁超过TTL自动清理）
+        chat_lock_max_size, chat_lock_ttl = get_memory_limit('ai_chat_locks', 5000, 3600)
+        self._chat_locks = KeyedLocks(max_size=chat_lock_max_size, ttl=chat_lock_ttl, factory=asyncio.Lock)
+        # 对话状态（最近消息环形缓冲、议价次数），首次使用时从数据库加载，之后随 save_conversation 增量更新
+        state_max_size, state_ttl = get_memory_limit('ai_conversation_states', 5000, 3600)
+        self._conversations = ConversationStateStore(max_size=state_max_size, ttl=state_ttl, max_turns=20)
+        # 数据库操作专用线程池（sqlite连接由db_manager.lock串行化，少量线程即可）
+        self._db_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ai-db')
     
     def _init_default_prompts(self):
         """初始化默认提示词"""
@@ -59,26 +89,9 @@ class AIReplyEngine:
 注意：结合商品信息，给出实用建议。'''
         }
     
-    def _create_openai_client(self, cookie_id: str) -> Optional[OpenAI]:
-        """
-        (原 get_client) 创建指定账号的OpenAI客户端
-        修复 P0-2: 移除了缓存逻辑，以支持多进程无状态部署
-        """
-        settings = db_manager.get_ai_reply_settings(cookie_id)
-        if not settings['ai_enabled'] or not settings['api_key']:
-            return None
-        
-        try:
-            logger.info(f"创建新的OpenAI客户端实例 {cookie_id}: base_url={settings['base_url']}, api_key={'***' + settings['api_key'][-4:] if settings['api_key'] else 'None'}")
-            client = OpenAI(
-                api_key=settings['api_key'],
-                base_url=settings['base_url']
-            )
-            logger.info(f"为账号 {cookie_id} 创建OpenAI客户端成功，实际base_url: {client.base_url}")
-            return client
-        except Exception as e:
-            logger.error(f"创建OpenAI客户端失败 {cookie_id}: {e}")
-            return None
+    async def _run_db(self, func, *args):
+        """在数据库线程池中执行同步的数据库操作，避免阻塞事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(self._db_executor, func, *args)
 
     def _is_dashscope_api(self, settings: dict) -> bool:
         """判断是否为DashScope API - 只有选择自定义模型时才使用"""
@@ -86,7 +99,8 @@ class AIReplyEngine:
         base_url = settings.get('base_url', '')
 
         is_custom_model = model_name.lower() in ['custom', '自定义', 'dashscope', 'qwen-custom']
-        is_dashscope_url = 'dashscope.aliyuncs.com' in base_url
+        endpoint_host = urlparse(get_endpoint('dashscope')).netloc
+        is_dashscope_url = 'dashscope.aliyuncs.com' in base_url or bool(endpoint_host and endpoint_host in base_url)
 
         logger.info(f"API类型判断: model_name={model_name}, is_custom_model={is_custom_model}, is_dashscope_url={is_dashscope_url}")
 
@@ -97,7 +111,7 @@ class AIReplyEngine:
         model_name = settings.get('model_name', '').lower()
         return 'gemini' in model_name
 
-    def _call_dashscope_api(self, settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7) -> str:
+    async def _call_dashscope_api(self, settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7) -> str:
         """调用DashScope API"""
         base_url = settings['base_url']
         if '/apps/' in base_url:
@@ -105,7 +119,7 @@ class AIReplyEngine:
         else:
             raise ValueError("DashScope API URL中未找到app_id")
 
-        url = f"https://dashscope.aliyuncs.com/api/v1/apps/{app_id}/completion"
+        url = f"{get_endpoint('dashscope')}/apps/{app_id}/completion"
 
         system_content = ""
         user_content = ""
@@ -122,6 +136,7 @@ class AIReplyEngine:
         else:
             prompt = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
 
+        streaming = get_streaming()
         data = {
             "input": {"prompt": prompt},
             "parameters": {"max_tokens": max_tokens, "temperature": temperature},
@@ -131,18 +146,41 @@ class AIReplyEngine:
             "Authorization": f"Bearer {settings['api_key']}",
             "Content-Type": "application/json"
         }
+        if streaming.enabled:
+            # 增量输出：每个SSE事件只包含新增文本，便于达到截断条件后立即停止
+            data["parameters"]["incremental_output"] = True
+            headers["X-DashScope-SSE"] = "enable"
 
         logger.info(f"DashScope API请求: {url}")
         logger.info(f"发送的prompt: {prompt[:100]}...") # 避免 prompt 过长
         logger.debug(f"请求数据: {json.dumps(data, ensure_ascii=False)}")
 
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-
-        if response.status_code != 200:
-            logger.error(f"DashScope API请求失败: {response.status_code} - {response.text}")
-            raise Exception(f"DashScope API请求失败: {response.status_code} - {response.text}")
+        async with llm_client_pool.http_session() as session, \
+                session.post(url, headers=headers, json=data) as response:
+            if response.status == 429:
+                text = await response.text()
+                raise RateLimitedError(f"DashScope API限流: {text}", parse_retry_after(response.headers.get('Retry-After')))
+            if response.status != 200:
+                text = await response.text()
+                logger.error(f"DashScope API请求失败: {response.status} - {text}")
+                raise Exception(f"DashScope API请求失败: {response.status} - {text}")
+
+            if streaming.enabled:
+                session_stream = streaming.session(max_tokens)
+                try:
+                    async for payload in iter_sse_data(response.content):
+                        if session_stream.feed(dashscope_delta(payload)):
+                            # 已得到完整句子或达到字数上限，退出上下文即关闭连接、取消剩余输出
+                            break
+                except Exception:
+                    streaming.metrics.record_failure()
+                    raise
+                reply = session_stream.finish()
+                if not reply:
+                    raise Exception("DashScope API流式响应为空")
+                return reply
 
-        result = response.json()
+            result = await response.json(content_type=None)
         logger.debug(f"DashScope API响应: {json.dumps(result, ensure_ascii=False)}")
 
         if 'output' in result and 'text' in result['output']:
@@ -150,14 +188,14 @@ class AIReplyEngine:
         else:
             raise Exception(f"DashScope API响应格式错误: {result}")
 
-    def _call_gemini_api(self, settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7) -> str:
+    async def _call_gemini_api(self, settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7) -> str:
         """
         调用Google Gemini REST API (v1beta)
         """
         api_key = settings['api_key']
         model_name = settings['model_name'] 
         
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={api_key}"
+        url = f"{get_endpoint('gemini')}/models/{model_name}:generateContent?key={api_key}"
 
         headers = {"Content-Type": "application/json"}
 
@@ -203,13 +241,17 @@ class AIReplyEngine:
         logger.info(f"Calling Gemini REST API: {url.split('?')[0]}")
         logger.debug(f"Gemini Payload: {json.dumps(payload, ensure_ascii=False)}")
         
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-
-        if response.status_code != 200:
-            logger.error(f"Gemini API 请求失败: {response.status_code} - {response.text}")
-            raise Exception(f"Gemini API 请求失败: {response.status_code} - {response.text}")
-            
-        result = response.json()
+        async with llm_client_pool.http_session() as session, \
+                session.post(url, headers=headers, json=payload) as response:
+            if response.status == 429:
+                text = await response.text()
+                raise RateLimitedError(f"Gemini API限流: {text}", parse_retry_after(response.headers.get('Retry-After')))
+            if response.status != 200:
+                text = await response.text()
+                logger.error(f"Gemini API 请求失败: {response.status} - {text}")
+                raise Exception(f"Gemini API 请求失败: {response.status} - {text}")
+
+            result = await response.json(content_type=None)
         logger.debug(f"Gemini API 响应: {json.dumps(result, ensure_ascii=False)}")
 
         try:
@@ -219,9 +261,13 @@ class AIReplyEngine:
             logger.error(f"Gemini API 响应格式错误: {result} - {e}")
             raise Exception(f"Gemini API 响应格式错误: {result}")
 
-    def _call_openai_api(self, client: OpenAI, settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7) -> str:
-        """调用OpenAI兼容API"""
-        response = client.chat.completions.create(
+    async def _call_openai_api(self, client: AsyncOpenAI, settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7) -> str:
+        """调用OpenAI兼容API（启用流式输出时边收边判断截断）"""
+        streaming = get_streaming()
+        if streaming.enabled:
+            return await self._stream_openai_api(client, settings, messages, max_tokens, temperature)
+
+        response = await client.chat.completions.create(
             model=settings['model_name'],
             messages=messages,
             max_tokens=max_tokens,
@@ -229,90 +275,123 @@ class AIReplyEngine:
         )
         return response.choices[0].message.content.strip()
 
+    async def _stream_openai_api(self, client: AsyncOpenAI, settings: dict, messages: list,
+                                 max_tokens: int, temperature: float) -> str:
+        """以SSE流式调用OpenAI兼容API，得到完整句子或达到字数上限后关闭流"""
+        streaming = get_streaming()
+        session_stream = streaming.session(max_tokens)
+        stream = await client.chat.completions.create(
+            model=settings['model_name'],
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True
+        )
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if session_stream.feed(delta or ''):
+                    break
+        except Exception:
+            streaming.metrics.record_failure()
+            raise
+        finally:
+            # 关闭底层HTTP响应，服务端随之停止生成
+            await stream.close()
+        reply = session_stream.finish()
+        if not reply:
+            raise Exception("OpenAI兼容API流式响应为空")
+        return reply
+
     def is_ai_enabled(self, cookie_id: str) -> bool:
         """检查指定账号是否启用AI回复"""
         settings = db_manager.get_ai_reply_settings(cookie_id)
         return settings['ai_enabled']
     
-    def detect_intent(self, message: str, cookie_id: str) -> str:
+    def detect_intent(self, message: str, cookie_id: str, settings: dict = None) -> str:
         """
-        检测用户消息意图 (基于关键词的本地检测)
+        检测用户消息意图（本地分类：账号自定义关键词 → 离线训练的n-gram朴素贝叶斯模型 → 内置关键词）
         修复 P1-1: 移除了AI调用，以降低成本和延迟。
+        settings: 调用方已读取的AI回复设置，传入时不再查询数据库
         """
         try:
             # 检查AI是否启用，如果未启用，不应执行任何AI相关逻辑
             # 注意：此检查在 generate_reply 的开头已经做过，但保留此处作为第二道防线
-            settings = db_manager.get_ai_reply_settings(cookie_id)
+            if settings is None:
+                settings = db_manager.get_ai_reply_settings(cookie_id)
             if not settings['ai_enabled']:
                 return 'default'
 
-            msg_lower = message.lower()
-
-            # 价格相关关键词
-            price_keywords = [
-                '便宜', '优惠', '刀', '降价', '包邮', '价格', '多少钱', '能少', '还能', '最低', '底价',
-                '实诚价', '到100', '能到', '包个邮', '给个价', '什么价' # <-- 增加这些“口语化”的词
-            ]
-            
-            # 同样，你也可以通过正则表达式来匹配纯数字，比如 "100" "80"
-            # 但那可能有点复杂，先加关键词是最小改动
-            if any(kw in msg_lower for kw in price_keywords):
-                logger.debug(f"本地意图检测: price ({message})")
-                return 'price'
-
-            # 技术相关关键词
-            tech_keywords = ['怎么用', '参数', '坏了', '故障', '设置', '说明书', '功能', '用法', '教程', '驱动']
-            if any(kw in msg_lower for kw in tech_keywords):
-                logger.debug(f"本地意图检测: tech ({message})")
-                return 'tech'
-            
-            logger.debug(f"本地意图检测: default ({message})")
-            return 'default'
+            intent = get_intent_classifier().classify(message, cookie_id, settings.get('intent_keywords'))
+            logger.debug(f"本地意图检测: {intent} ({message})")
+            return intent
         
         except Exception as e:
             logger.error(f"本地意图检测失败 {cookie_id}: {e}")
             return 'default'
     
-    def _get_chat_lock(self, chat_id: str) -> threading.Lock:
+    def _get_chat_lock(self, chat_id: str) -> asyncio.Lock:
         """获取指定chat_id的锁，如果不存在则创建"""
-        with self._chat_locks_lock:
-            if chat_id not in self._chat_locks:
-                self._chat_locks[chat_id] = threading.Lock()
-            return self._chat_locks[chat_id]
+        return self._chat_locks[chat_id]
+
+    def get_memory_report(self) -> dict:
+        """获取AI回复引擎内存结构的统计"""
+        return {
+            '_chat_locks': self._chat_locks.stats('_chat_locks'),
+            'llm_clients': llm_client_pool.stats()['cache'],
+            'reply_cache': get_reply_cache().memory.stats('reply_cache'),
+            '_conversations': self._conversations.stats('_conversations'),
+        }
     
     def generate_reply(self, message: str, item_info: dict, chat_id: str,
                       cookie_id: str, user_id: str, item_id: str,
                       skip_wait: bool = False) -> Optional[str]:
-        """生成AI回复"""
-        if not self.is_ai_enabled(cookie_id):
-            return None
-        
+        """生成AI回复（同步包装，仅供没有运行中事件循环的线程调用，异步代码请使用 generate_reply_async）"""
+        async def _run():
+            try:
+                return await self.generate_reply_async(message, item_info, chat_id, cookie_id,
+                                                       user_id, item_id, skip_wait)
+            finally:
+                # 临时事件循环即将关闭，释放在其中创建的客户端
+                await llm_client_pool.close_loop_clients()
+
+        return asyncio.run(_run())
+
+    async def generate_reply_async(self, message: str, item_info: dict, chat_id: str,
+                                   cookie_id: str, user_id: str, item_id: str,
+                                   skip_wait: bool = False) -> Optional[str]:
+        """生成AI回复（全异步：HTTP请求和数据库操作都不会阻塞事件循环）"""
         try:
+            settings = await self._run_db(db_manager.get_ai_reply_settings, cookie_id)
+            if not settings['ai_enabled']:
+                return None
+
             # 先检测意图（用于后续保存）
-            intent = self.detect_intent(message, cookie_id)
+            intent = self.detect_intent(message, cookie_id, settings)
             logger.info(f"检测到意图: {intent} (账号: {cookie_id})")
             
             # 在锁外先保存用户消息到数据库，让所有消息都能立即保存
-            message_created_at = self.save_conversation(chat_id, cookie_id, user_id, item_id, "user", message, intent)
+            message_created_at = await self._run_db(
+                self.save_conversation, chat_id, cookie_id, user_id, item_id, "user", message, intent
+            )
             
             # 如果调用方已经实现了去抖（debounce），可以通过 skip_wait=True 跳过内部等待
             if not skip_wait:
                 logger.info(f"【{cookie_id}】消息已保存，等待10秒收集后续消息: {message[:20]}... (时间:{message_created_at})")
                 # 固定等待10秒，等待可能的后续消息（在锁外延迟，避免阻塞其他消息保存）
-                time.sleep(10)
+                await asyncio.sleep(10)
             else:
                 logger.info(f"【{cookie_id}】消息已保存（外部防抖已启用，跳过内部等待）: {message[:20]}... (时间:{message_created_at})")
             
-            # 获取该chat_id的锁，确保同一对话的消息串行处理
-            chat_lock = self._get_chat_lock(chat_id)
-            
-            # 使用锁确保同一chat_id的消息串行处理
-            with chat_lock:
+            # 使用该chat_id的锁确保同一对话的消息串行处理
+            async with self._get_chat_lock(chat_id):
                 # 获取最近时间窗口内的所有用户消息
                 # 如果 skip_wait=True（外部防抖），查询窗口为6秒（1秒防抖 + 5秒缓冲）
                 # 如果 skip_wait=False（内部等待），查询窗口为25秒（10秒等待 + 10秒消息间隔 + 5秒缓冲）
                 query_seconds = 6 if skip_wait else 25
-                recent_messages = self._get_recent_user_messages(chat_id, cookie_id, seconds=query_seconds)
+                recent_messages, history, bargain_count = await self._run_db(
+                    self._load_chat_state, chat_id, cookie_id, query_seconds
+                )
                 logger.info(f"【{cookie_id}】最近{query_seconds}秒内的消息: {[msg['content'][:20] for msg in recent_messages]}")
                 
                 if recent_messages and len(recent_messages) > 0:
@@ -323,43 +402,91 @@ class AIReplyEngine:
                         return None
                     else:
                         logger.info(f"【{cookie_id}】当前消息是最新消息，开始处理: {message[:20]}... (时间:{message_created_at})")
-                
-                # 1. 获取AI回复设置
-                settings = db_manager.get_ai_reply_settings(cookie_id)
-
-                # 3. 获取对话历史
-                context = self.get_conversation_context(chat_id, cookie_id)
-
-                # 4. 获取议价次数
-                bargain_count = self.get_bargain_count(chat_id, cookie_id)
 
-                # 5. 检查议价轮数限制 (P0-1 竞争条件风险点 - 遵照指示未修改)
+                # 检查议价轮数限制 (P0-1 竞争条件风险点 - 遵照指示未修改)
                 if intent == "price":
                     max_bargain_rounds = settings.get('max_bargain_rounds', 3)
                     if bargain_count >= max_bargain_rounds:
                         logger.info(f"议价次数已达上限 ({bargain_count}/{max_bargain_rounds})，拒绝继续议价")
                         refuse_reply = f"抱歉，这个价格已经是最优惠的了，不能再便宜了哦！"
-                        self.save_conversation(chat_id, cookie_id, user_id, item_id, "assistant", refuse_reply, intent)
+                        await self._run_db(self.save_conversation, chat_id, cookie_id, user_id, item_id,
+                                           "assistant", refuse_reply, intent)
                         return refuse_reply
 
-                # 6. 构建提示词
-                custom_prompts = json.loads(settings['custom_prompts']) if settings['custom_prompts'] else {}
-                system_prompt = custom_prompts.get(intent, self.default_prompts[intent])
-
-                # 7. 构建商品信息
-                item_desc = f"商品标题: {item_info.get('title', '未知')}\n"
-                item_desc += f"商品价格: {item_info.get('price', '未知')}元\n"
-                item_desc += f"商品描述: {item_info.get('desc', '无')}"
-
-                # 8. 构建对话历史
-                context_str = "\n".join([f"{msg['role']}: {msg['content']}" for msg in context[-10:]])  # 最近10条
+                # 账号开启回复缓存时，相同商品+意图+问题（议价按轮次）直接复用之前的回复
+                cache_key = None
+                if settings.get('reply_cache_enabled'):
+                    reply_cache = get_reply_cache()
+                    cache_key = reply_cache.build_key(cookie_id, item_id, intent, message,
+                                                      item_info, settings, bargain_count)
+                    cached_reply = await self._run_db(reply_cache.get, cache_key) if cache_key else None
+                    if cached_reply:
+                        logger.info(f"【{cookie_id}】命中AI回复缓存: {message[:20]}...")
+                        await self._run_db(self.save_conversation, chat_id, cookie_id, user_id, item_id,
+                                           "assistant", cached_reply, intent)
+                        return cached_reply
+
+                messages = self._build_messages(settings, intent, message, item_info, history, bargain_count)
+
+                # 调用AI生成回复
+                llm_started = time.monotonic()
+                reply = await self._call_llm(cookie_id, settings, messages)
+                prompt_builder = get_prompt_builder()
+                prompt_bytes = sum(len(m['content'].encode('utf-8')) for m in messages)
+                prompt_tokens = sum(estimate_tokens(m['content']) for m in messages)
+                llm_latency = (time.monotonic() - llm_started) * 1000
+                prompt_builder.metrics.record(prompt_bytes, prompt_tokens, llm_latency)
+                logger.info(f"【{cookie_id}】提示词 {prompt_bytes} 字节（约 {prompt_tokens} tokens），大模型耗时 {llm_latency:.0f}ms")
+                if reply is None:
+                    return None
+
+                if cache_key:
+                    await self._run_db(get_reply_cache().put, cache_key, cookie_id, item_id, intent,
+                                       message, reply, llm_latency)
+
+                # 保存AI回复到对话记录
+                await self._run_db(self.save_conversation, chat_id, cookie_id, user_id, item_id,
+                                   "assistant", reply, intent)
 
-                # 9. 构建用户消息
-                max_bargain_rounds = settings.get('max_bargain_rounds', 3)
-                max_discount_percent = settings.get('max_discount_percent', 10)
-                max_discount_amount = settings.get('max_discount_amount', 100)
+                logger.info(f"AI回复生成成功 (账号: {cookie_id}): {reply}")
+                return reply
+                
+        except Exception as e:
+            logger.error(f"AI回复生成失败 {cookie_id}: {e}")
+            if hasattr(e, 'response') and hasattr(e.response, 'url'):
+                logger.error(f"请求URL: {e.response.url}")
+            if hasattr(e, 'request') and hasattr(e.request, 'url'):
+                logger.error(f"请求URL: {e.request.url}")
+            return None
 
-                user_prompt = f"""商品信息：
+    def _load_chat_state(self, chat_id: str, cookie_id: str, query_seconds: int):
+        """一次性读取生成回复所需的对话状态：(最近用户消息, (对话轮次, 滚动摘要), 议价次数)"""
+        with self._conversations.lock:
+            state = self._conversations.get(cookie_id, chat_id)
+            return state.recent_user_messages(query_seconds), state.prompt_history(), state.bargain_count
+
+    def _build_messages(self, settings: dict, intent: str, message: str, item_info: dict,
+                        history: Tuple[List[Tuple[str, str]], List[str]], bargain_count: int) -> List[Dict]:
+        """构建发送给大模型的消息列表（系统提示词 + 商品信息/对话历史/议价设置）"""
+        prompt_builder = get_prompt_builder()
+        custom_prompts = prompt_builder.custom_prompts(settings['custom_prompts'])
+        system_prompt = custom_prompts.get(intent, self.default_prompts[intent])
+
+        # 商品信息片段（按商品内容哈希缓存，详情已精简）
+        item_desc = prompt_builder.item_fragment(item_info)
+
+        # 对话历史：预算内的最近轮次原文 + 更早轮次的滚动摘要
+        turns, summary = history
+        context_str, summary_str = prompt_builder.history(turns, summary)
+        if summary_str:
+            context_str = f"（更早对话摘要）{summary_str}\n{context_str}"
+
+        # 构建用户消息
+        max_bargain_rounds = settings.get('max_bargain_rounds', 3)
+        max_discount_percent = settings.get('max_discount_percent', 10)
+        max_discount_amount = settings.get('max_discount_amount', 100)
+
+        user_prompt = f"""商品信息：
 {item_desc}
 
 对话历史：
@@ -375,117 +502,159 @@ class AIReplyEngine:
 
 请根据以上信息生成回复："""
 
-                # 10. 调用AI生成回复
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ]
-
-                reply = None # 初始化 reply 变量
-
-                if self._is_dashscope_api(settings):
-                    logger.info(f"使用DashScope API生成回复")
-                    reply = self._call_dashscope_api(settings, messages, max_tokens=100, temperature=0.7)
-                
-                elif self._is_gemini_api(settings):
-                    logger.info(f"使用Gemini API生成回复")
-                    reply = self._call_gemini_api(settings, messages, max_tokens=100, temperature=0.7)
-                
-                else:
-                    logger.info(f"使用OpenAI兼容API生成回复")
-                    # 修复 P0-2: 调用已修改的无状态客户端创建方法
-                    client = self._create_openai_client(cookie_id)
-                    if not client:
-                        return None
-                    logger.info(f"messages:{messages}")
-                    reply = self._call_openai_api(client, settings, messages, max_tokens=100, temperature=0.7)
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    async def _call_llm(self, cookie_id: str, settings: dict, messages: List[Dict],
+                        max_tokens: int = 100, temperature: float = 0.7) -> Optional[str]:
+        """调用大模型：配置了备用接口时按对冲策略调用主/备接口，并受账号的耗时预算约束"""
+        budget_ms = settings.get('latency_budget_ms', 30000)
+        deadline = time.monotonic() + budget_ms / 1000 if budget_ms and budget_ms > 0 else None
+        providers = [{
+            'name': self._provider_name(settings),
+            'call': lambda: self._call_provider(cookie_id, settings, messages, max_tokens, temperature, deadline),
+        }]
+        fallback_settings = self._get_fallback_settings(settings)
+        if fallback_settings:
+            # 备用接口使用单独的账号标识登记到客户端池，设置变更时主备客户端都能被失效
+            fallback_id = f"{cookie_id}#fallback"
+            providers.append({
+                'name': self._provider_name(fallback_settings),
+                'call': lambda: self._call_provider(fallback_id, fallback_settings, messages, max_tokens, temperature,
+                                                    deadline),
+            })
+
+        return await get_hedged_caller().call(
+            providers,
+            budget_ms=budget_ms,
+            hedge_delay_ms=settings.get('hedge_delay_ms', 0),
+            cookie_id=cookie_id,
+        )
 
-                # 11. 保存AI回复到对话记录
-                self.save_conversation(chat_id, cookie_id, user_id, item_id, "assistant", reply, intent)
+    @staticmethod
+    def _provider_name(settings: dict) -> str:
+        """接口统计名：模型@接口地址"""
+        return f"{settings.get('model_name', '')}@{settings.get('base_url', '')}"
 
-                # 12. 更新议价次数 (此方法已在 get_bargain_count 中通过 SQL COUNT(*) 隐式实现)
-                if intent == "price":
-                    # self.increment_bargain_count(chat_id, cookie_id) # 此行原先就没有，保持不变
-                    pass
-                
-                logger.info(f"AI回复生成成功 (账号: {cookie_id}): {reply}")
-                return reply
-                
-        except Exception as e:
-            logger.error(f"AI回复生成失败 {cookie_id}: {e}")
-            if hasattr(e, 'response') and hasattr(e.response, 'url'):
-                logger.error(f"请求URL: {e.response.url}")
-            if hasattr(e, 'request') and hasattr(e.request, 'url'):
-                logger.error(f"请求URL: {e.request.url}")
+    @staticmethod
+    def _get_fallback_settings(settings: dict) -> Optional[dict]:
+        """根据账号设置生成备用接口的设置（未配置备用模型/地址时返回None），未填写的项沿用主接口"""
+        if not settings.get('fallback_model_name') and not settings.get('fallback_base_url'):
             return None
-
-    async def generate_reply_async(self, message: str, item_info: dict, chat_id: str,
-                                   cookie_id: str, user_id: str, item_id: str,
-                                   skip_wait: bool = False) -> Optional[str]:
-        """
-        异步包装器：在独立线程池中执行同步的 `generate_reply`，并返回结果。
-        这样可以在异步代码中直接 await，而不阻塞事件循环。
-        """
-        try:
-            import asyncio as _asyncio
-            return await _asyncio.to_thread(self.generate_reply, message, item_info, chat_id, cookie_id, user_id, item_id, skip_wait)
-        except Exception as e:
-            logger.error(f"异步生成回复失败: {e}")
+        fallback = dict(settings)
+        fallback['model_name'] = settings.get('fallback_model_name') or settings.get('model_name', '')
+        fallback['base_url'] = settings.get('fallback_base_url') or settings.get('base_url', '')
+        fallback['api_key'] = settings.get('fallback_api_key') or settings.get('api_key', '')
+        if (fallback['model_name'], fallback['base_url']) == (settings.get('model_name'), settings.get('base_url')):
             return None
+        return fallback
+
+    async def _call_provider(self, cookie_id: str, settings: dict, messages: List[Dict],
+                             max_tokens: int = 100, temperature: float = 0.7,
+                             deadline: Optional[float] = None) -> Optional[str]:
+        """在调度器取得执行名额后，按接口设置选择DashScope/Gemini/OpenAI兼容接口并异步调用"""
+        is_dashscope = self._is_dashscope_api(settings)
+        is_gemini = not is_dashscope and self._is_gemini_api(settings)
+        if not is_dashscope and not is_gemini and not settings['api_key']:
+            return None
+
+        # 并发受接口/账号上限约束，排队超出预算、队列已满或接口熔断时抛出 AIDispatchRejected
+        async with get_ai_governor().slot(self._provider_name(settings), cookie_id, deadline):
+            if is_dashscope:
+                logger.info(f"使用DashScope API生成回复")
+                return await self._call_dashscope_api(settings, messages, max_tokens=max_tokens, temperature=temperature)
+
+            if is_gemini:
+                logger.info(f"使用Gemini API生成回复")
+                return await self._call_gemini_api(settings, messages, max_tokens=max_tokens, temperature=temperature)
+
+            logger.info(f"使用OpenAI兼容API生成回复")
+            # 按 (base_url, api_key哈希) 复用客户端连接；凭据每次都从数据库读取，多进程部署下不会使用旧凭据
+            async with llm_client_pool.openai_client(cookie_id, settings['base_url'], settings['api_key']) as client:
+                logger.info(f"messages:{messages}")
+                return await self._call_openai_api(client, settings, messages, max_tokens=max_tokens, temperature=temperature)
+
+    def invalidate_clients(self, cookie_id: str):
+        """账号AI设置变更后失效该账号使用的大模型客户端（含备用接口）"""
+        llm_client_pool.invalidate_account(cookie_id)
+        llm_client_pool.invalidate_account(f"{cookie_id}#fallback")
+
+    def get_client_pool_stats(self) -> dict:
+        """获取大模型客户端池统计"""
+        return llm_client_pool.stats()
+
+    def invalidate_reply_cache(self, cookie_id: str, item_id: str = None) -> int:
+        """AI设置或商品信息变更后清理对应的AI回复缓存"""
+        return get_reply_cache().invalidate(cookie_id, item_id)
+
+    def get_reply_cache_stats(self) -> dict:
+        """获取AI回复缓存统计（命中率、估算节省的耗时）"""
+        return get_reply_cache().stats()
+
+    def get_provider_stats(self) -> dict:
+        """获取各大模型接口的耗时/错误率统计及对冲、降级次数"""
+        return get_hedged_caller().stats()
+
+    def get_governor_stats(self) -> dict:
+        """获取AI请求调度器的排队与熔断状态"""
+        return get_ai_governor().stats()
+
+    def get_intent_stats(self) -> dict:
+        """获取意图分类各来源的命中次数和模型信息"""
+        return get_intent_classifier().stats()
+
+    def get_prompt_stats(self) -> dict:
+        """获取提示词大小（字节/估算token）与大模型耗时统计"""
+        return get_prompt_builder().stats()
+
+    def get_streaming_stats(self) -> dict:
+        """获取流式输出的首字/回复耗时、提前截断次数和估算节省的token"""
+        return get_streaming().stats()
     
     def get_conversation_context(self, chat_id: str, cookie_id: str, limit: int = 20) -> List[Dict]:
-        """获取对话上下文"""
+        """获取对话上下文（最多为内存环形缓冲保留的轮数）"""
         try:
-            with db_manager.lock:
-                cursor = db_manager.conn.cursor()
-                cursor.execute('''
-                SELECT role, content FROM ai_conversations 
-                WHERE chat_id = ? AND cookie_id = ? 
-                ORDER BY created_at DESC LIMIT ?
-                ''', (chat_id, cookie_id, limit))
-                
-                results = cursor.fetchall()
-                context = [{"role": row[0], "content": row[1]} for row in reversed(results)]
-                return context
+            with self._conversations.lock:
+                return self._conversations.get(cookie_id, chat_id).context(limit)
         except Exception as e:
             logger.error(f"获取对话上下文失败: {e}")
             return []
     
     def save_conversation(self, chat_id: str, cookie_id: str, user_id: str, 
                          item_id: str, role: str, content: str, intent: str = None) -> Optional[str]:
-        """保存对话记录，返回创建时间"""
+        """保存对话记录并同步更新内存中的对话状态，返回创建时间"""
         try:
-            with db_manager.lock:
-                cursor = db_manager.conn.cursor()
-                cursor.execute('''
-                INSERT INTO ai_conversations 
-                (cookie_id, chat_id, user_id, item_id, role, content, intent)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (cookie_id, chat_id, user_id, item_id, role, content, intent))
-                db_manager.conn.commit()
-                
-                # 获取刚插入记录的created_at
-                cursor.execute('''
-                SELECT created_at FROM ai_conversations 
-                WHERE rowid = last_insert_rowid()
-                ''')
-                result = cursor.fetchone()
-                return result[0] if result else None
+            # 持有对话状态锁完成写库和状态更新，避免与并发的冷加载交错导致状态缺少这条记录
+            with self._conversations.lock:
+                with db_manager.lock:
+                    cursor = db_manager.conn.cursor()
+                    cursor.execute('''
+                    INSERT INTO ai_conversations 
+                    (cookie_id, chat_id, user_id, item_id, role, content, intent)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (cookie_id, chat_id, user_id, item_id, role, content, intent))
+                    db_manager.conn.commit()
+                    
+                    # 获取刚插入记录的created_at
+                    cursor.execute('''
+                    SELECT created_at FROM ai_conversations 
+                    WHERE rowid = last_insert_rowid()
+                    ''')
+                    result = cursor.fetchone()
+                    created_at = result[0] if result else None
+                self._conversations.append(cookie_id, chat_id, role, content, intent, created_at)
+                return created_at
         except Exception as e:
             logger.error(f"保存对话记录失败: {e}")
             return None
+
     def get_bargain_count(self, chat_id: str, cookie_id: str) -> int:
-        """获取议价次数"""
+        """获取议价次数（内存计数，冷启动时从数据库统计）"""
         try:
-            with db_manager.lock:
-                cursor = db_manager.conn.cursor()
-                cursor.execute('''
-                SELECT COUNT(*) FROM ai_conversations 
-                WHERE chat_id = ? AND cookie_id = ? AND intent = 'price' AND role = 'user'
-                ''', (chat_id, cookie_id))
-                
-                result = cursor.fetchone()
-                return result[0] if result else 0
+            with self._conversations.lock:
+                return self._conversations.get(cookie_id, chat_id).bargain_count
         except Exception as e:
             logger.error(f"获取议价次数失败: {e}")
             return 0
@@ -493,37 +662,23 @@ class AIReplyEngine:
     def _get_recent_user_messages(self, chat_id: str, cookie_id: str, seconds: int = 2) -> List[Dict]:
         """获取最近seconds秒内的所有用户消息（包含内容和时间戳）"""
         try:
-            with db_manager.lock:
-                cursor = db_manager.conn.cursor()
-                # 先查询所有该chat的user消息，用于调试
-                cursor.execute('''
-                SELECT content, created_at, 
-                       julianday('now') - julianday(created_at) as time_diff_days,
-                       (julianday('now') - julianday(created_at)) * 86400.0 as time_diff_seconds
-                FROM ai_conversations 
-                WHERE chat_id = ? AND cookie_id = ? AND role = 'user' 
-                ORDER BY created_at DESC LIMIT 10
-                ''', (chat_id, cookie_id))
-                
-                all_messages = cursor.fetchall()
-                logger.info(f"【调试】chat_id={chat_id} 最近10条user消息: {[(msg[0][:10], msg[1], f'{msg[3]:.2f}秒前') for msg in all_messages]}")
-                
-                # 正式查询
-                cursor.execute('''
-                SELECT content, created_at FROM ai_conversations 
-                WHERE chat_id = ? AND cookie_id = ? AND role = 'user' 
-                AND julianday('now') - julianday(created_at) < (? / 86400.0)
-                ORDER BY created_at ASC
-                ''', (chat_id, cookie_id, seconds))
-                
-                results = cursor.fetchall()
-                return [{"content": row[0], "created_at": row[1]} for row in results]
+            with self._conversations.lock:
+                return self._conversations.get(cookie_id, chat_id).recent_user_messages(seconds)
         except Exception as e:
             logger.error(f"获取最近用户消息列表失败: {e}")
             return []
+
+    def reset_conversation_states(self):
+        """对话表被直接修改（管理员删除/清空/导入数据）后丢弃内存状态，之后从数据库重新加载"""
+        self._conversations.clear()
+        logger.info("已重置AI对话状态缓存")
+
+    def cleanup_conversation_states(self) -> int:
+        """清理空闲过期的对话状态，返回清理数量"""
+        return self._conversations.purge_expired()
     
     def increment_bargain_count(self, chat_id: str, cookie_id: str):
-        """(此方法已废弃，通过 get_bargain_count 的 SQL 查询实现)"""
+        """(此方法已废弃，议价次数随 save_conversation 自动累加)"""
         pass
     
     #
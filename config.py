@@ -116,6 +116,18 @@ AUTO_REPLY = config.get('AUTO_REPLY', {
 })
 MANUAL_MODE = config.get('MANUAL_MODE', {})
 LOG_CONFIG = config.get('LOG_CONFIG', {}) 
+MEMORY_LIMITS = config.get('MEMORY_LIMITS', {})
+
+
+def get_memory_limit(name: str, default_max_size: int = 1000, default_ttl: float = None):
+    """获取指定内存结构的容量上限和过期时间
+
+    Returns:
+        (max_size, ttl) 元组
+    """
+    limit = MEMORY_LIMITS.get(name) or {}
+    return limit.get('max_size', default_max_size), limit.get('ttl', default_ttl)
+
 _cookies_raw = config.get('COOKIES', [])
 if isinstance(_cookies_raw, list):
     COOKIES_LIST = _cookies_raw
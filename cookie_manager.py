@@ -1,5 +1,6 @@
 from __future__ import annotations
 import asyncio
+import threading
 from typing import Dict, List, Tuple, Optional
 from loguru import logger
 from db_manager import db_manager
@@ -18,8 +19,22 @@ class CookieManager:
         self.cookie_status: Dict[str, bool] = {}  # 账号启用状态
         self.auto_confirm_settings: Dict[str, bool] = {}  # 自动确认发货设置
         self._task_locks: Dict[str, asyncio.Lock] = {}  # 每个cookie_id的任务锁，防止重复创建
+        self._task_change_lock: Optional[asyncio.Lock] = None  # 批量启停按批次顺序执行
+        # 批量操作中尚未执行的任务启停数：请求线程增加、事件循环线程减少，读写都需持有 _pending_lock
+        self._pending_task_changes = 0
+        self._pending_lock = threading.Lock()
         self._load_from_db()
 
+    @property
+    def pending_task_changes(self) -> int:
+        """批量操作中尚未执行的任务启停数"""
+        with self._pending_lock:
+            return self._pending_task_changes
+
+    def _add_pending_task_changes(self, delta: int):
+        with self._pending_lock:
+            self._pending_task_changes += delta
+
     def _load_from_db(self):
         """从数据库加载所有Cookie、关键字和状态"""
         try:
@@ -404,6 +419,93 @@ class CookieManager:
         except Exception as e:
             logger.error(f"停止Cookie任务失败: {cookie_id}, {e}")
 
+    async def _start_task_async(self, cookie_id: str) -> bool:
+        """启动账号任务（不改动数据库中的Cookie记录），任务已在运行时跳过"""
+        lock = self._task_locks.setdefault(cookie_id, asyncio.Lock())
+        async with lock:
+            existing = self.tasks.get(cookie_id)
+            if existing is not None and not existing.done():
+                return False
+            cookie_value = self.cookies.get(cookie_id)
+            if not cookie_value:
+                logger.error(f"Cookie值不存在，无法启动任务: {cookie_id}")
+                return False
+            cookie_info = db_manager.get_cookie_details(cookie_id)
+            user_id = cookie_info.get('user_id') if cookie_info else None
+            self.tasks[cookie_id] = self.loop.create_task(self._run_xianyu(cookie_id, cookie_value, user_id))
+            logger.info(f"成功启动Cookie任务: {cookie_id}")
+            return True
+
+    async def _stop_task_async(self, cookie_id: str) -> bool:
+        """停止账号任务并等待清理（最多10秒）"""
+        lock = self._task_locks.setdefault(cookie_id, asyncio.Lock())
+        async with lock:
+            task = self.tasks.pop(cookie_id, None)
+            if task is None:
+                return False
+            if not task.done():
+                task.cancel()
+                try:
+                    await asyncio.wait_for(task, timeout=10.0)
+                except asyncio.TimeoutError:
+                    logger.warning(f"【{cookie_id}】等待任务停止超时（10秒），强制继续")
+                except asyncio.CancelledError:
+                    pass
+                except Exception as e:
+                    logger.error(f"等待任务清理时出错: {cookie_id}, {e}")
+            logger.info(f"成功停止Cookie任务: {cookie_id}")
+            return True
+
+    async def _apply_task_changes(self, cookie_ids: List[str], enabled: bool, interval: float):
+        """按间隔依次启动/停止任务，避免同时建立大量连接"""
+        if self._task_change_lock is None:
+            self._task_change_lock = asyncio.Lock()
+        async with self._task_change_lock:
+            for index, cookie_id in enumerate(cookie_ids):
+                try:
+                    # 排队期间状态可能已被再次修改，以当前状态为准
+                    if self.cookie_status.get(cookie_id, True) == enabled and cookie_id in self.cookies:
+                        if enabled:
+                            await self._start_task_async(cookie_id)
+                        else:
+                            await self._stop_task_async(cookie_id)
+                except Exception as e:
+                    logger.error(f"批量{'启动' if enabled else '停止'}Cookie任务失败: {cookie_id}, {e}")
+                finally:
+                    self._add_pending_task_changes(-1)
+                if index < len(cookie_ids) - 1:
+                    await asyncio.sleep(interval)
+
+    def update_cookie_status_batch(self, cookie_ids: List[str], enabled: bool, interval: float = 1.0) -> Dict[str, str]:
+        """批量更新账号启用状态
+
+        状态在一个事务中写入数据库，需要启停的任务交给事件循环按 interval 秒的间隔依次执行（不等待完成）
+
+        Returns:
+            {cookie_id: 'start' | 'stop' | 'unchanged' | 'not_found'}
+        """
+        results = {cid: 'not_found' for cid in cookie_ids if cid not in self.cookies}
+        valid = [cid for cid in cookie_ids if cid in self.cookies]
+        if not db_manager.update_accounts_batch('status', valid, enabled=enabled):
+            raise RuntimeError("批量保存账号状态失败")
+
+        changed = []
+        for cookie_id in valid:
+            old_status = self.cookie_status.get(cookie_id, True)
+            self.cookie_status[cookie_id] = enabled
+            if old_status != enabled:
+                changed.append(cookie_id)
+                results[cookie_id] = 'start' if enabled else 'stop'
+            else:
+                results[cookie_id] = 'unchanged'
+        logger.info(f"批量更新Cookie状态: {len(valid)} 个账号 -> {'启用' if enabled else '禁用'}, "
+                    f"待{'启动' if enabled else '停止'}任务 {len(changed)} 个")
+
+        if changed:
+            self._add_pending_task_changes(len(changed))
+            asyncio.run_coroutine_threadsafe(self._apply_task_changes(changed, enabled, interval), self.loop)
+        return results
+
     def update_auto_confirm_setting(self, cookie_id: str, auto_confirm: bool):
         """实时更新账号的自动确认发货设置"""
         try:
@@ -1,5 +1,6 @@
 import sqlite3
 import os
+import re
 import threading
 import hashlib
 import time
@@ -13,6 +14,138 @@ from PIL import Image, ImageDraw, ImageFont
 from typing import List, Tuple, Dict, Optional, Any
 from loguru import logger
 
+from utils.keyword_sync import diff_keywords
+from utils.pagination import ListSpec, PageRequest, encode_cursor, page_result
+
+_WRITE_SQL_RE = re.compile(
+    r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+[`"\[]?(\w+)',
+    re.IGNORECASE,
+)
+
+
+class TableVersions:
+    """各表的数据版本号（进程内计数器，供接口计算ETag）
+
+    经全局连接执行的每条写语句（INSERT/UPDATE/DELETE/REPLACE）执行后把对应表的版本号加一；
+    epoch 在重新连接数据库（如恢复备份）时更换，使之前发出的所有版本号一并失效
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.epoch = os.urandom(4).hex()
+
+    def note_sql(self, sql: str):
+        match = _WRITE_SQL_RE.match(sql)
+        if match:
+            self.bump(match.group(1).lower())
+
+    def bump(self, table: str):
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._versions.clear()
+            self.epoch = os.urandom(4).hex()
+
+    def get(self, *tables: str) -> Tuple[int, ...]:
+        versions = self._versions
+        return tuple(versions.get(table, 0) for table in tables)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'epoch': self.epoch, 'tables': dict(self._versions)}
+
+
+table_versions = TableVersions()
+
+
+class _TrackingCursor(sqlite3.Cursor):
+    """执行写语句后更新 table_versions"""
+
+    def execute(self, sql, parameters=()):
+        result = super().execute(sql, parameters)
+        table_versions.note_sql(sql)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        result = super().executemany(sql, seq_of_parameters)
+        table_versions.note_sql(sql)
+        return result
+
+    def executescript(self, sql_script):
+        result = super().executescript(sql_script)
+        table_versions.reset()
+        return result
+
+
+class _TrackingConnection(sqlite3.Connection):
+    """默认使用 _TrackingCursor 的连接（conn.execute 也经由 cursor() 执行）"""
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or _TrackingCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# 列表接口的查询定义（分页/过滤/投影，见 utils.pagination）
+CARD_LIST_SPEC = ListSpec(
+    source="cards",
+    columns={
+        'id': 'id', 'name': 'name', 'type': 'type', 'api_config': 'api_config',
+        'text_content': 'text_content', 'data_content': 'data_content', 'image_url': 'image_url',
+        'description': 'description', 'enabled': 'enabled', 'delay_seconds': 'delay_seconds',
+        'is_multi_spec': 'is_multi_spec', 'spec_name': 'spec_name', 'spec_value': 'spec_value',
+        'created_at': 'created_at', 'updated_at': 'updated_at',
+    },
+    key='id', default_sort='created_at',
+    sortable=('id', 'name', 'type', 'enabled', 'created_at', 'updated_at'),
+    filterable=('type', 'enabled', 'is_multi_spec'),
+    searchable=('name', 'description'),
+)
+
+DELIVERY_RULE_LIST_SPEC = ListSpec(
+    source="delivery_rules dr LEFT JOIN cards c ON dr.card_id = c.id",
+    columns={
+        'id': 'dr.id', 'keyword': 'dr.keyword', 'card_id': 'dr.card_id', 'delivery_count': 'dr.delivery_count',
+        'enabled': 'dr.enabled', 'description': 'dr.description', 'delivery_times': 'dr.delivery_times',
+        'created_at': 'dr.created_at', 'updated_at': 'dr.updated_at', 'card_name': 'c.name',
+        'card_type': 'c.type', 'is_multi_spec': 'c.is_multi_spec', 'spec_name': 'c.spec_name',
+        'spec_value': 'c.spec_value',
+    },
+    key='id', default_sort='created_at',
+    sortable=('id', 'keyword', 'enabled', 'delivery_times', 'created_at', 'updated_at'),
+    filterable=('card_id', 'enabled'),
+    searchable=('keyword', 'description'),
+)
+
+ORDER_LIST_SPEC = ListSpec(
+    source="orders",
+    columns={
+        'order_id': 'order_id', 'item_id': 'item_id', 'buyer_id': 'buyer_id', 'spec_name': 'spec_name',
+        'spec_value': 'spec_value', 'quantity': 'quantity', 'amount': 'amount',
+        'order_status': 'order_status', 'cookie_id': 'cookie_id', 'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    },
+    key='order_id', default_sort='created_at',
+    sortable=('order_id', 'created_at', 'updated_at', 'order_status'),
+    filterable=('cookie_id', 'item_id', 'buyer_id', 'order_status'),
+    searchable=('order_id', 'item_id', 'buyer_id'),
+)
+
+# 只在 fields= 明确要求时才值得跳过的大字段（供接口文档/前端参考）
+HEAVY_LIST_FIELDS = {
+    'item_info': ('item_detail', 'item_description'),
+    'cards': ('data_content', 'text_content', 'api_config'),
+    'risk_control_logs': ('event_description', 'processing_result', 'error_message'),
+}
+
+
 class DBManager:
     """SQLite数据库管理，持久化存储Cookie和关键字"""
     
@@ -67,7 +200,8 @@ class DBManager:
     def init_db(self):
         """初始化数据库表结构"""
         try:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=_TrackingConnection)
+            table_versions.reset()
             cursor = self.conn.cursor()
             
             # 创建用户表
@@ -165,6 +299,30 @@ class DBManager:
             )
             ''')
 
+            # 检查并添加 reply_cache_enabled 列（AI回复缓存，按账号开启）
+            try:
+                self._execute_sql(cursor, "SELECT reply_cache_enabled FROM ai_reply_settings LIMIT 1")
+            except sqlite3.OperationalError:
+                logger.info("正在为 ai_reply_settings 表添加 reply_cache_enabled 列...")
+                self._execute_sql(cursor, "ALTER TABLE ai_reply_settings ADD COLUMN reply_cache_enabled BOOLEAN DEFAULT FALSE")
+                logger.info("ai_reply_settings 表 reply_cache_enabled 列添加完成")
+
+            # 检查并添加大模型耗时预算与备用接口相关列
+            for column, definition in (
+                ('latency_budget_ms', 'INTEGER DEFAULT 30000'),
+                ('hedge_delay_ms', 'INTEGER DEFAULT 0'),
+                ('fallback_model_name', "TEXT DEFAULT ''"),
+                ('fallback_base_url', "TEXT DEFAULT ''"),
+                ('fallback_api_key', "TEXT DEFAULT ''"),
+                ('intent_keywords', "TEXT DEFAULT ''"),
+            ):
+                try:
+                    self._execute_sql(cursor, f"SELECT {column} FROM ai_reply_settings LIMIT 1")
+                except sqlite3.OperationalError:
+                    logger.info(f"正在为 ai_reply_settings 表添加 {column} 列...")
+                    self._execute_sql(cursor, f"ALTER TABLE ai_reply_settings ADD COLUMN {column} {definition}")
+                    logger.info(f"ai_reply_settings 表 {column} 列添加完成")
+
             # 创建AI对话历史表
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS ai_conversations (
@@ -193,6 +351,25 @@ class DBManager:
             )
             ''')
 
+            # 创建AI回复缓存表（相同商品+意图+问题的回复复用，expires_at为过期时间戳）
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ai_reply_cache (
+                cache_key TEXT PRIMARY KEY,
+                cookie_id TEXT NOT NULL,
+                item_id TEXT,
+                intent TEXT,
+                message TEXT,
+                reply TEXT NOT NULL,
+                hit_count INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at REAL NOT NULL,
+                FOREIGN KEY (cookie_id) REFERENCES cookies(id) ON DELETE CASCADE
+            )
+            ''')
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ai_reply_cache_item ON ai_reply_cache (cookie_id, item_id)
+            ''')
+
             # 创建卡券表
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS cards (
@@ -443,6 +620,9 @@ class DBManager:
             # 执行数据库迁移
             self._migrate_database(cursor)
 
+            # 列表分页使用的组合索引（迁移后列才齐全）
+            self._create_list_indexes(cursor)
+
             self.conn.commit()
             logger.info("数据库初始化完成")
         except Exception as e:
@@ -450,6 +630,22 @@ class DBManager:
             self.conn.rollback()
             raise
 
+    def _create_list_indexes(self, cursor):
+        """为列表接口的游标分页创建 (过滤列, 排序列, 主键) 组合索引"""
+        indexes = [
+            "CREATE INDEX IF NOT EXISTS idx_item_info_cookie_updated ON item_info (cookie_id, updated_at, id)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_cookie_created ON orders (cookie_id, created_at, order_id)",
+            "CREATE INDEX IF NOT EXISTS idx_cards_user_created ON cards (user_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS idx_delivery_rules_user_created ON delivery_rules (user_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS idx_risk_control_logs_cookie_created ON risk_control_logs (cookie_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS idx_risk_control_logs_created ON risk_control_logs (created_at, id)",
+        ]
+        for sql in indexes:
+            try:
+                self._execute_sql(cursor, sql)
+            except sqlite3.OperationalError as e:
+                logger.warning(f"创建列表索引失败: {e}")
+
     def _migrate_database(self, cursor):
         """执行数据库迁移"""
         try:
@@ -1102,9 +1298,25 @@ class DBManager:
     def get_connection(self):
         """获取数据库连接，如果已关闭则重新连接"""
         if self.conn is None:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=_TrackingConnection)
+            table_versions.reset()
         return self.conn
 
+    def ping(self, timeout: float = 1.0) -> bool:
+        """健康检查用的轻量探测：单独打开只读连接读取schema版本，不占用全局连接和锁"""
+        conn = None
+        try:
+            conn = sqlite3.connect(f"file:{os.path.abspath(self.db_path)}?mode=ro", uri=True,
+                                   timeout=timeout, check_same_thread=False)
+            conn.execute("PRAGMA schema_version").fetchone()
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"数据库探测失败: {e}")
+            return False
+        finally:
+            if conn is not None:
+                conn.close()
+
     def _log_sql(self, sql: str, params: tuple = None, operation: str = "EXECUTE"):
         """记录SQL执行日志"""
         if not self.sql_log_enabled:
@@ -1264,31 +1476,65 @@ class DBManager:
                 logger.error(f"根据ID获取Cookie失败: {e}")
                 return None
 
+    _COOKIE_DETAIL_COLUMNS = "c.id, c.value, c.user_id, c.auto_confirm, c.remark, c.pause_duration, c.username, c.password, c.show_browser, c.created_at"
+
+    @staticmethod
+    def _cookie_details_row(result) -> Dict[str, any]:
+        return {
+            'id': result[0],
+            'value': result[1],
+            'user_id': result[2],
+            'auto_confirm': bool(result[3]),
+            'remark': result[4] or '',
+            'pause_duration': result[5] if result[5] is not None else 10,  # 0是有效值，表示不暂停
+            'username': result[6] or '',
+            'password': result[7] or '',
+            'show_browser': bool(result[8]) if result[8] is not None else False,
+            'created_at': result[9]
+        }
+
     def get_cookie_details(self, cookie_id: str) -> Optional[Dict[str, any]]:
         """获取Cookie的详细信息，包括user_id、auto_confirm、remark、pause_duration、username、password和show_browser"""
         with self.lock:
             try:
                 cursor = self.conn.cursor()
-                self._execute_sql(cursor, "SELECT id, value, user_id, auto_confirm, remark, pause_duration, username, password, show_browser, created_at FROM cookies WHERE id = ?", (cookie_id,))
+                self._execute_sql(cursor, f"SELECT {self._COOKIE_DETAIL_COLUMNS} FROM cookies c WHERE c.id = ?", (cookie_id,))
                 result = cursor.fetchone()
                 if result:
-                    return {
-                        'id': result[0],
-                        'value': result[1],
-                        'user_id': result[2],
-                        'auto_confirm': bool(result[3]),
-                        'remark': result[4] or '',
-                        'pause_duration': result[5] if result[5] is not None else 10,  # 0是有效值，表示不暂停
-                        'username': result[6] or '',
-                        'password': result[7] or '',
-                        'show_browser': bool(result[8]) if result[8] is not None else False,
-                        'created_at': result[9]
-                    }
+                    return self._cookie_details_row(result)
                 return None
             except Exception as e:
                 logger.error(f"获取Cookie详细信息失败: {e}")
                 return None
 
+    def get_all_cookie_details(self, user_id: int = None) -> List[Dict[str, any]]:
+        """一次查询获取所有（或指定用户的）Cookie详细信息，替代逐个调用 get_cookie_details / get_auto_confirm
+
+        每项字段同 get_cookie_details，另附所属用户名 owner_username（Cookie自身的 username 为闲鱼登录账号，
+        所属用户记录不存在时为空字符串，Cookie仍会返回）
+        结果按用户创建时间倒序、同一用户内按Cookie添加顺序排列
+        """
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                sql = f"""SELECT {self._COOKIE_DETAIL_COLUMNS}, u.username
+                          FROM cookies c LEFT JOIN users u ON c.user_id = u.id"""
+                params = ()
+                if user_id is not None:
+                    sql += " WHERE c.user_id = ?"
+                    params = (user_id,)
+                sql += " ORDER BY u.created_at DESC, u.id, c.rowid"
+                self._execute_sql(cursor, sql, params)
+                details = []
+                for row in cursor.fetchall():
+                    item = self._cookie_details_row(row)
+                    item['owner_username'] = row[10] or ''
+                    details.append(item)
+                return details
+            except Exception as e:
+                logger.error(f"批量获取Cookie详细信息失败: {e}")
+                return []
+
     def update_auto_confirm(self, cookie_id: str, auto_confirm: bool) -> bool:
         """更新Cookie的自动确认发货设置"""
         with self.lock:
@@ -1461,91 +1707,74 @@ class DBManager:
         keywords_with_item_id = [(keyword, reply, None) for keyword, reply in keywords]
         return self.save_keywords_with_item_id(cookie_id, keywords_with_item_id)
 
-    def save_keywords_with_item_id(self, cookie_id: str, keywords: List[Tuple[str, str, str]]) -> bool:
-        """保存关键字列表（包含商品ID），先删除旧数据再插入新数据"""
-        with self.lock:
-            try:
-                cursor = self.conn.cursor()
-
-                # 先删除该cookie_id的所有关键字
-                self._execute_sql(cursor, "DELETE FROM keywords WHERE cookie_id = ?", (cookie_id,))
-
-                # 插入新关键字，使用INSERT OR REPLACE来处理可能的唯一约束冲突
-                for keyword, reply, item_id in keywords:
-                    # 标准化item_id：空字符串转为NULL
-                    normalized_item_id = item_id if item_id and item_id.strip() else None
+    def sync_keywords(self, cookie_id: str, keywords: List[Tuple[str, str, str]], include_images: bool = False,
+                      delete_missing: bool = True) -> Optional[Dict[str, int]]:
+        """把关键词列表同步到数据库：与现有记录比较后只新增/修改/删除有变化的行，在一个事务中批量执行
 
-                    try:
-                        self._execute_sql(cursor,
-                            "INSERT INTO keywords (cookie_id, keyword, reply, item_id) VALUES (?, ?, ?, ?)",
-                            (cookie_id, keyword, reply, normalized_item_id))
-                    except sqlite3.IntegrityError as ie:
-                        # 如果遇到唯一约束冲突，记录详细错误信息
-                        item_desc = f"商品ID: {normalized_item_id}" if normalized_item_id else "通用关键词"
-                        logger.error(f"关键词唯一约束冲突: Cookie={cookie_id}, 关键词='{keyword}', {item_desc}")
-                        raise ie
-
-                self.conn.commit()
-                logger.info(f"关键字保存成功: {cookie_id}, {len(keywords)}条")
-                return True
-            except Exception as e:
-                logger.error(f"关键字保存失败: {e}")
-                self.conn.rollback()
-                return False
-
-    def save_text_keywords_only(self, cookie_id: str, keywords: List[Tuple[str, str, str]]) -> bool:
-        """保存文本关键字列表，只删除文本类型的关键词，保留图片关键词"""
+        Args:
+            keywords: [(keyword, reply, item_id)]
+            include_images: 为True时图片关键词也参与同步（不在列表中的会被删除），否则保留图片关键词
+            delete_missing: 是否删除列表中不存在的关键词
+        Returns:
+            变更统计 {added, updated, deleted, unchanged, duplicates, total}，失败返回None
+        Raises:
+            ValueError: 文本关键词与保留的图片关键词同名
+        """
         with self.lock:
             try:
                 cursor = self.conn.cursor()
-
-                # 检查是否与现有图片关键词冲突
-                for keyword, reply, item_id in keywords:
-                    normalized_item_id = item_id if item_id and item_id.strip() else None
-
-                    # 检查是否存在同名的图片关键词
-                    if normalized_item_id:
-                        # 有商品ID的情况：检查 (cookie_id, keyword, item_id) 是否存在图片关键词
-                        self._execute_sql(cursor,
-                            "SELECT type FROM keywords WHERE cookie_id = ? AND keyword = ? AND item_id = ? AND type = 'image'",
-                            (cookie_id, keyword, normalized_item_id))
-                    else:
-                        # 通用关键词的情况：检查 (cookie_id, keyword) 是否存在图片关键词
-                        self._execute_sql(cursor,
-                            "SELECT type FROM keywords WHERE cookie_id = ? AND keyword = ? AND (item_id IS NULL OR item_id = '') AND type = 'image'",
-                            (cookie_id, keyword))
-
-                    if cursor.fetchone():
-                        # 存在同名图片关键词，抛出友好的错误信息
-                        item_desc = f"商品ID: {normalized_item_id}" if normalized_item_id else "通用关键词"
-                        error_msg = f"关键词 '{keyword}' （{item_desc}） 已存在（图片关键词），无法保存为文本关键词"
-                        logger.warning(f"文本关键词与图片关键词冲突: Cookie={cookie_id}, 关键词='{keyword}', {item_desc}")
-                        raise ValueError(error_msg)
-
-                # 只删除该cookie_id的文本类型关键字，保留图片关键词
                 self._execute_sql(cursor,
-                    "DELETE FROM keywords WHERE cookie_id = ? AND (type IS NULL OR type = 'text')",
+                    "SELECT rowid, keyword, reply, item_id, type FROM keywords WHERE cookie_id = ? ORDER BY rowid",
                     (cookie_id,))
-
-                # 插入新的文本关键字
-                for keyword, reply, item_id in keywords:
-                    # 标准化item_id：空字符串转为NULL
-                    normalized_item_id = item_id if item_id and item_id.strip() else None
-
-                    self._execute_sql(cursor,
+                diff = diff_keywords(cursor.fetchall(), keywords, include_images=include_images,
+                                     delete_missing=delete_missing)
+
+                # 改写的行先删除再按原rowid写回：顺序不变，也不会与仍在表中的关键词触发唯一索引冲突
+                deletes = diff.deletes + [rewrite[0] for rewrite in diff.rewrites]
+                if deletes:
+                    self._executemany_sql(cursor, "DELETE FROM keywords WHERE rowid = ?",
+                                          [(rowid,) for rowid in deletes])
+                if diff.updates:
+                    self._executemany_sql(cursor,
+                        "UPDATE keywords SET reply = ?, type = 'text', image_url = NULL WHERE rowid = ?",
+                        diff.updates)
+                if diff.rewrites:
+                    self._executemany_sql(cursor,
+                        "INSERT INTO keywords (rowid, cookie_id, keyword, reply, item_id, type) VALUES (?, ?, ?, ?, ?, 'text')",
+                        [(rowid, cookie_id, keyword, reply, item_id) for rowid, keyword, reply, item_id in diff.rewrites])
+                if diff.inserts:
+                    self._executemany_sql(cursor,
                         "INSERT INTO keywords (cookie_id, keyword, reply, item_id, type) VALUES (?, ?, ?, ?, 'text')",
-                        (cookie_id, keyword, reply, normalized_item_id))
+                        [(cookie_id, keyword, reply, item_id) for keyword, reply, item_id in diff.inserts])
 
-                self.conn.commit()
-                logger.info(f"文本关键字保存成功: {cookie_id}, {len(keywords)}条，图片关键词已保留")
-                return True
-            except ValueError:
-                # 重新抛出友好的错误信息
+                if diff.changed:
+                    self.conn.commit()
+                summary = diff.summary()
+                logger.info(f"关键字同步完成: {cookie_id}, 新增{summary['added']} 修改{summary['updated']} "
+                            f"删除{summary['deleted']} 未变{summary['unchanged']}")
+                return summary
+            except ValueError as e:
+                logger.warning(f"关键字同步冲突: Cookie={cookie_id}, {e}")
                 raise
             except Exception as e:
-                logger.error(f"文本关键字保存失败: {e}")
+                logger.error(f"关键字同步失败: {e}")
                 self.conn.rollback()
-                return False
+                return None
+
+    def save_keywords_with_item_id(self, cookie_id: str, keywords: List[Tuple[str, str, str]]) -> bool:
+        """保存关键字列表（包含商品ID），替换该账号的全部关键字（只写入有变化的行）"""
+        try:
+            return self.sync_keywords(cookie_id, keywords, include_images=True) is not None
+        except ValueError:
+            return False
+
+    def save_text_keywords_only(self, cookie_id: str, keywords: List[Tuple[str, str, str]]) -> bool:
+        """保存文本关键字列表，只替换文本类型的关键词，保留图片关键词（只写入有变化的行）
+
+        Raises:
+            ValueError: 与现有图片关键词同名
+        """
+        return self.sync_keywords(cookie_id, keywords) is not None
     
     def get_keywords(self, cookie_id: str) -> List[Tuple[str, str]]:
         """获取指定Cookie的关键字列表（向后兼容方法）"""
@@ -1719,6 +1948,49 @@ class DBManager:
                 logger.error(f"获取所有关键字失败: {e}")
                 return {}
 
+    def update_accounts_batch(self, operation: str, cookie_ids: List[str], **values) -> bool:
+        """在一个事务中对多个账号应用同一设置（批量接口使用）
+
+        Args:
+            operation: status(enabled) | pause_duration(pause_duration) | auto_confirm(auto_confirm) |
+                       default_reply(enabled, reply_content, reply_once) | notification(channel_id, enabled)
+        Raises:
+            ValueError: 不支持的操作
+        """
+        if operation == 'status':
+            sql = "INSERT OR REPLACE INTO cookie_status (cookie_id, enabled, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)"
+            rows = [(cid, values['enabled']) for cid in cookie_ids]
+        elif operation == 'pause_duration':
+            sql = "UPDATE cookies SET pause_duration = ? WHERE id = ?"
+            rows = [(values['pause_duration'], cid) for cid in cookie_ids]
+        elif operation == 'auto_confirm':
+            sql = "UPDATE cookies SET auto_confirm = ? WHERE id = ?"
+            rows = [(int(values['auto_confirm']), cid) for cid in cookie_ids]
+        elif operation == 'default_reply':
+            sql = '''INSERT OR REPLACE INTO default_replies (cookie_id, enabled, reply_content, reply_once, updated_at)
+                     VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)'''
+            rows = [(cid, values['enabled'], values.get('reply_content'), values.get('reply_once', False))
+                    for cid in cookie_ids]
+        elif operation == 'notification':
+            sql = "INSERT OR REPLACE INTO message_notifications (cookie_id, channel_id, enabled) VALUES (?, ?, ?)"
+            rows = [(cid, values['channel_id'], values.get('enabled', True)) for cid in cookie_ids]
+        else:
+            raise ValueError(f"不支持的批量操作: {operation}")
+
+        if not rows:
+            return True
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._executemany_sql(cursor, sql, rows)
+                self.conn.commit()
+                logger.info(f"批量更新账号设置: {operation}, {len(rows)} 个账号")
+                return True
+            except Exception as e:
+                logger.error(f"批量更新账号设置失败: {operation}, {e}")
+                self.conn.rollback()
+                return False
+
     def save_cookie_status(self, cookie_id: str, enabled: bool):
         """保存Cookie的启用状态"""
         with self.lock:
@@ -1773,8 +2045,9 @@ class DBManager:
                 INSERT OR REPLACE INTO ai_reply_settings
                 (cookie_id, ai_enabled, model_name, api_key, base_url,
                  max_discount_percent, max_discount_amount, max_bargain_rounds,
-                 custom_prompts, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                 custom_prompts, reply_cache_enabled, latency_budget_ms, hedge_delay_ms,
+                 fallback_model_name, fallback_base_url, fallback_api_key, intent_keywords, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
                 ''', (
                     cookie_id,
                     settings.get('ai_enabled', False),
@@ -1784,7 +2057,14 @@ class DBManager:
                     settings.get('max_discount_percent', 10),
                     settings.get('max_discount_amount', 100),
                     settings.get('max_bargain_rounds', 3),
-                    settings.get('custom_prompts', '')
+                    settings.get('custom_prompts', ''),
+                    settings.get('reply_cache_enabled', False),
+                    settings.get('latency_budget_ms', 30000),
+                    settings.get('hedge_delay_ms', 0),
+                    settings.get('fallback_model_name', ''),
+                    settings.get('fallback_base_url', ''),
+                    settings.get('fallback_api_key', ''),
+                    settings.get('intent_keywords', '')
                 ))
                 self.conn.commit()
                 logger.debug(f"AI回复设置保存成功: {cookie_id}")
@@ -1802,7 +2082,8 @@ class DBManager:
                 cursor.execute('''
                 SELECT ai_enabled, model_name, api_key, base_url,
                        max_discount_percent, max_discount_amount, max_bargain_rounds,
-                       custom_prompts
+                       custom_prompts, reply_cache_enabled, latency_budget_ms, hedge_delay_ms,
+                       fallback_model_name, fallback_base_url, fallback_api_key, intent_keywords
                 FROM ai_reply_settings WHERE cookie_id = ?
                 ''', (cookie_id,))
 
@@ -1816,7 +2097,14 @@ class DBManager:
                         'max_discount_percent': result[4],
                         'max_discount_amount': result[5],
                         'max_bargain_rounds': result[6],
-                        'custom_prompts': result[7]
+                        'custom_prompts': result[7],
+                        'reply_cache_enabled': bool(result[8]),
+                        'latency_budget_ms': result[9] if result[9] is not None else 30000,
+                        'hedge_delay_ms': result[10] or 0,
+                        'fallback_model_name': result[11] or '',
+                        'fallback_base_url': result[12] or '',
+                        'fallback_api_key': result[13] or '',
+                        'intent_keywords': result[14] or ''
                     }
                 else:
                     # 返回默认设置
@@ -1828,7 +2116,14 @@ class DBManager:
                         'max_discount_percent': 10,
                         'max_discount_amount': 100,
                         'max_bargain_rounds': 3,
-                        'custom_prompts': ''
+                        'custom_prompts': '',
+                        'reply_cache_enabled': False,
+                        'latency_budget_ms': 30000,
+                        'hedge_delay_ms': 0,
+                        'fallback_model_name': '',
+                        'fallback_base_url': '',
+                        'fallback_api_key': '',
+                        'intent_keywords': ''
                     }
             except Exception as e:
                 logger.error(f"获取AI回复设置失败: {e}")
@@ -1840,20 +2135,33 @@ class DBManager:
                     'max_discount_percent': 10,
                     'max_discount_amount': 100,
                     'max_bargain_rounds': 3,
-                    'custom_prompts': ''
+                    'custom_prompts': '',
+                    'reply_cache_enabled': False,
+                    'latency_budget_ms': 30000,
+                    'hedge_delay_ms': 0,
+                    'fallback_model_name': '',
+                    'fallback_base_url': '',
+                    'fallback_api_key': '',
+                    'intent_keywords': ''
                 }
 
-    def get_all_ai_reply_settings(self) -> Dict[str, dict]:
-        """获取所有账号的AI回复设置"""
+    def get_all_ai_reply_settings(self, user_id: int = None) -> Dict[str, dict]:
+        """获取所有账号的AI回复设置（传 user_id 时在同一查询中按账号归属过滤）"""
         with self.lock:
             try:
                 cursor = self.conn.cursor()
-                cursor.execute('''
-                SELECT cookie_id, ai_enabled, model_name, api_key, base_url,
-                       max_discount_percent, max_discount_amount, max_bargain_rounds,
-                       custom_prompts
-                FROM ai_reply_settings
-                ''')
+                sql = '''
+                SELECT s.cookie_id, s.ai_enabled, s.model_name, s.api_key, s.base_url,
+                       s.max_discount_percent, s.max_discount_amount, s.max_bargain_rounds,
+                       s.custom_prompts, s.reply_cache_enabled, s.latency_budget_ms, s.hedge_delay_ms,
+                       s.fallback_model_name, s.fallback_base_url, s.fallback_api_key, s.intent_keywords
+                FROM ai_reply_settings s
+                '''
+                params = ()
+                if user_id is not None:
+                    sql += " JOIN cookies c ON s.cookie_id = c.id WHERE c.user_id = ?"
+                    params = (user_id,)
+                self._execute_sql(cursor, sql, params)
 
                 result = {}
                 for row in cursor.fetchall():
@@ -1866,7 +2174,14 @@ class DBManager:
                         'max_discount_percent': row[5],
                         'max_discount_amount': row[6],
                         'max_bargain_rounds': row[7],
-                        'custom_prompts': row[8]
+                        'custom_prompts': row[8],
+                        'reply_cache_enabled': bool(row[9]),
+                        'latency_budget_ms': row[10] if row[10] is not None else 30000,
+                        'hedge_delay_ms': row[11] or 0,
+                        'fallback_model_name': row[12] or '',
+                        'fallback_base_url': row[13] or '',
+                        'fallback_api_key': row[14] or '',
+                        'intent_keywords': row[15] or ''
                     }
 
                 return result
@@ -1874,6 +2189,65 @@ class DBManager:
                 logger.error(f"获取所有AI回复设置失败: {e}")
                 return {}
 
+    # -------------------- AI回复缓存操作 --------------------
+    def get_ai_reply_cache(self, cache_key: str) -> Optional[str]:
+        """获取未过期的AI回复缓存，命中时累加命中次数"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute('''
+                SELECT reply FROM ai_reply_cache WHERE cache_key = ? AND expires_at > ?
+                ''', (cache_key, time.time()))
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                cursor.execute('UPDATE ai_reply_cache SET hit_count = hit_count + 1 WHERE cache_key = ?', (cache_key,))
+                self.conn.commit()
+                return row[0]
+            except Exception as e:
+                logger.error(f"获取AI回复缓存失败: {e}")
+                return None
+
+    def save_ai_reply_cache(self, cache_key: str, cookie_id: str, item_id: str, intent: str,
+                            message: str, reply: str, ttl: int, max_rows: int = 1000) -> bool:
+        """保存AI回复缓存，单个账号超过max_rows条时删除最早的记录"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute('''
+                INSERT OR REPLACE INTO ai_reply_cache
+                (cache_key, cookie_id, item_id, intent, message, reply, hit_count, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, 0, CURRENT_TIMESTAMP, ?)
+                ''', (cache_key, cookie_id, item_id, intent, message, reply, time.time() + ttl))
+                cursor.execute('''
+                DELETE FROM ai_reply_cache WHERE cookie_id = ? AND cache_key NOT IN (
+                    SELECT cache_key FROM ai_reply_cache WHERE cookie_id = ?
+                    ORDER BY expires_at DESC LIMIT ?
+                )
+                ''', (cookie_id, cookie_id, max_rows))
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"保存AI回复缓存失败: {e}")
+                self.conn.rollback()
+                return False
+
+    def delete_ai_reply_cache(self, cookie_id: str, item_id: str = None) -> int:
+        """删除账号（或账号下某商品）的AI回复缓存，返回删除条数"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                if item_id:
+                    cursor.execute('DELETE FROM ai_reply_cache WHERE cookie_id = ? AND item_id = ?', (cookie_id, item_id))
+                else:
+                    cursor.execute('DELETE FROM ai_reply_cache WHERE cookie_id = ?', (cookie_id,))
+                self.conn.commit()
+                return cursor.rowcount
+            except Exception as e:
+                logger.error(f"删除AI回复缓存失败: {e}")
+                self.conn.rollback()
+                return 0
+
     # -------------------- 默认回复操作 --------------------
     def save_default_reply(self, cookie_id: str, enabled: bool, reply_content: str = None, reply_once: bool = False):
         """保存默认回复设置"""
@@ -2953,6 +3327,27 @@ class DBManager:
                 logger.error(f"获取卡券列表失败: {e}")
                 return []
 
+    @staticmethod
+    def _normalize_card_row(card: Dict[str, Any]):
+        """与 get_all_cards 相同的字段转换（只处理查询到的字段）"""
+        if card.get('api_config'):
+            try:
+                card['api_config'] = json.loads(card['api_config'])
+            except (json.JSONDecodeError, TypeError):
+                # 如果解析失败，保持原始字符串
+                pass
+        if 'enabled' in card:
+            card['enabled'] = bool(card['enabled'])
+        if 'delay_seconds' in card:
+            card['delay_seconds'] = card['delay_seconds'] or 0
+        if 'is_multi_spec' in card:
+            card['is_multi_spec'] = bool(card['is_multi_spec']) if card['is_multi_spec'] is not None else False
+
+    def get_cards_page(self, user_id: int = None, page: PageRequest = None) -> Dict[str, Any]:
+        """分页获取卡券（支持用户隔离、fields投影、type/enabled过滤和名称搜索）"""
+        where, params = (["user_id = ?"], [user_id]) if user_id is not None else ([], [])
+        return self.fetch_page(CARD_LIST_SPEC, page or PageRequest(), where, params, self._normalize_card_row)
+
     def get_card_by_id(self, card_id: int, user_id: int = None):
         """根据ID获取卡券（支持用户隔离）"""
         with self.lock:
@@ -3134,6 +3529,18 @@ class DBManager:
                 logger.error(f"创建发货规则失败: {e}")
                 raise
 
+    def get_delivery_rules_page(self, user_id: int = None, page: PageRequest = None) -> Dict[str, Any]:
+        """分页获取发货规则（支持用户隔离、fields投影、card_id/enabled过滤和关键字搜索）"""
+        where, params = (["dr.user_id = ?"], [user_id]) if user_id is not None else ([], [])
+
+        def normalize(rule: Dict[str, Any]):
+            if 'enabled' in rule:
+                rule['enabled'] = bool(rule['enabled'])
+            if 'is_multi_spec' in rule:
+                rule['is_multi_spec'] = bool(rule['is_multi_spec']) if rule['is_multi_spec'] is not None else False
+
+        return self.fetch_page(DELIVERY_RULE_LIST_SPEC, page or PageRequest(), where, params, normalize)
+
     def get_all_delivery_rules(self, user_id: int = None):
         """获取所有发货规则"""
         with self.lock:
@@ -3882,6 +4289,32 @@ class DBManager:
             logger.error(f"获取商品多数量发货状态失败: {e}")
             return False
 
+    def get_items_page(self, cookie_ids: List[str], page: PageRequest = None) -> Dict[str, Any]:
+        """分页获取多个账号的商品信息（默认按更新时间倒序，item_detail 等大字段可通过 fields 省略）
+
+        Args:
+            cookie_ids: 允许访问的账号ID列表（用户隔离）
+        """
+        if not cookie_ids:
+            return page_result([], None)
+        spec = self._table_list_spec(
+            'item_info', key='id', default_sort='updated_at',
+            sortable=('id', 'item_id', 'item_title', 'item_price', 'created_at', 'updated_at'),
+            filterable=('cookie_id', 'item_id', 'item_category', 'is_multi_spec', 'multi_quantity_delivery'),
+            searchable=('item_id', 'item_title'),
+        )
+        placeholders = ','.join('?' * len(cookie_ids))
+
+        def normalize(item: Dict[str, Any]):
+            # 解析item_detail JSON
+            if item.get('item_detail'):
+                try:
+                    item['item_detail_parsed'] = json.loads(item['item_detail'])
+                except (json.JSONDecodeError, TypeError):
+                    item['item_detail_parsed'] = {}
+
+        return self.fetch_page(spec, page or PageRequest(), [f"cookie_id IN ({placeholders})"], list(cookie_ids), normalize)
+
     def get_items_by_cookie(self, cookie_id: str) -> List[Dict]:
         """获取指定Cookie的所有商品信息
 
@@ -3990,6 +4423,72 @@ class DBManager:
             self.conn.rollback()
             return False
 
+    def get_cached_item_detail(self, item_id: str, max_age_seconds: int = None) -> Optional[Dict]:
+        """从全局商品缓存表(ai_item_cache)获取商品详情（跨账号共享）
+
+        Args:
+            item_id: 商品ID
+            max_age_seconds: 最大缓存时长（秒），超过则视为未命中，None表示不限制
+
+        Returns:
+            Dict: {'item_id', 'detail', 'price', 'last_updated'}，未命中返回None
+        """
+        try:
+            with self.lock:
+                cursor = self.conn.cursor()
+                if max_age_seconds:
+                    cursor.execute('''
+                    SELECT item_id, data, price, description, last_updated FROM ai_item_cache
+                    WHERE item_id = ? AND last_updated >= datetime('now', '-' || ? || ' seconds')
+                    ''', (item_id, int(max_age_seconds)))
+                else:
+                    cursor.execute('''
+                    SELECT item_id, data, price, description, last_updated FROM ai_item_cache
+                    WHERE item_id = ?
+                    ''', (item_id,))
+
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                try:
+                    data = json.loads(row[1]) if row[1] else {}
+                except (ValueError, TypeError):
+                    data = {}
+                return {
+                    'item_id': row[0],
+                    'detail': data.get('detail') or row[3] or '',
+                    'price': row[2],
+                    'last_updated': row[4]
+                }
+        except Exception as e:
+            logger.error(f"获取商品缓存失败: {e}")
+            return None
+
+    def save_cached_item_detail(self, item_id: str, detail: str, price: float = None) -> bool:
+        """保存商品详情到全局商品缓存表(ai_item_cache)
+
+        Args:
+            item_id: 商品ID
+            detail: 商品详情文本
+            price: 商品价格（可选）
+
+        Returns:
+            bool: 操作是否成功
+        """
+        try:
+            with self.lock:
+                cursor = self.conn.cursor()
+                cursor.execute('''
+                INSERT OR REPLACE INTO ai_item_cache (item_id, data, price, description, last_updated)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (item_id, json.dumps({'detail': detail}, ensure_ascii=False), price, detail))
+                self.conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"保存商品缓存失败: {e}")
+            self.conn.rollback()
+            return False
+
     def update_item_title_only(self, cookie_id: str, item_id: str, item_title: str) -> bool:
         """仅更新商品标题（并发安全）
 
@@ -4368,6 +4867,71 @@ class DBManager:
                 logger.error(f"删除用户及相关数据失败: {e}")
                 return False
 
+    def fetch_page(self, spec: ListSpec, page: PageRequest, where=(), params=(), postprocess=None) -> Dict[str, Any]:
+        """按 ListSpec 执行一次分页/过滤/投影查询
+
+        Args:
+            where/params: 调用方附加的条件（如用户隔离）
+            postprocess: 对每行字典的就地转换（如JSON解析、布尔值转换）
+        Returns:
+            {"items": [...], "next_cursor": str|None, "has_more": bool}
+        Raises:
+            ValueError: 字段/排序/过滤参数或游标无效
+        """
+        sql, values, sort, order, fields = spec.build(page, where, params)
+        with self.lock:
+            cursor = self.conn.cursor()
+            self._execute_sql(cursor, sql, tuple(values))
+            rows = cursor.fetchall()
+
+        next_cursor = None
+        if page.paged and len(rows) > page.limit:
+            rows = rows[:page.limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(sort, order, last[-2], last[-1])
+
+        items = []
+        for row in rows:
+            item = dict(zip(fields, row[:-2]))
+            if postprocess:
+                postprocess(item)
+            items.append(item)
+        return page_result(items, next_cursor)
+
+    def _table_list_spec(self, table_name: str, alias: str = None, extra_columns: Dict[str, str] = None,
+                         source: str = None, key: str = 'rowid', default_sort: str = None, **kwargs) -> ListSpec:
+        """按表结构生成 ListSpec（列名来自 PRAGMA table_info，表名需由调用方校验）"""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute(f"PRAGMA table_info({table_name})")
+            column_names = [col[1] for col in cursor.fetchall()]
+        prefix = f"{alias}." if alias else ''
+        columns = {name: f"{prefix}{name}" for name in column_names}
+        if key == 'rowid':
+            columns.setdefault('rowid', f"{prefix}rowid")
+        columns.update(extra_columns or {})
+        return ListSpec(
+            source=source or table_name,
+            columns=columns,
+            key=key,
+            default_sort=default_sort or key,
+            filterable=kwargs.pop('filterable', column_names),
+            **kwargs,
+        )
+
+    def get_table_data_page(self, table_name: str, page: PageRequest) -> Dict[str, Any]:
+        """分页获取指定表的数据（按 rowid 游标分页，任意列可过滤/排序），结果附带 columns"""
+        spec = self._table_list_spec(table_name, default_sort='rowid', default_order='asc')
+        result = self.fetch_page(spec, page)
+        columns = spec.select_fields(page.fields)
+        if not page.fields:
+            # 与 get_table_data 一致，不返回内部的 rowid
+            columns.remove('rowid')
+            for item in result["items"]:
+                item.pop('rowid', None)
+        result["columns"] = columns
+        return result
+
     def get_table_data(self, table_name: str):
         """获取指定表的所有数据"""
         with self.lock:
@@ -4504,6 +5068,13 @@ class DBManager:
                 logger.error(f"获取订单信息失败: {order_id} - {e}")
                 return None
 
+    def get_orders_page(self, cookie_ids: List[str], page: PageRequest = None) -> Dict[str, Any]:
+        """分页获取多个账号的订单（默认按创建时间倒序，支持状态/商品/买家过滤和订单号搜索）"""
+        if not cookie_ids:
+            return page_result([], None)
+        placeholders = ','.join('?' * len(cookie_ids))
+        return self.fetch_page(ORDER_LIST_SPEC, page or PageRequest(), [f"cookie_id IN ({placeholders})"], list(cookie_ids))
+
     def get_orders_by_cookie(self, cookie_id: str, limit: int = 100):
         """根据Cookie ID获取订单列表"""
         with self.lock:
@@ -4905,6 +5476,19 @@ class DBManager:
             logger.error(f"更新风控日志失败: {e}")
             return False
 
+    def get_risk_control_logs_page(self, cookie_id: str = None, page: PageRequest = None) -> Dict[str, Any]:
+        """游标分页获取风控日志（不需要 OFFSET 扫描和 COUNT(*)）"""
+        spec = self._table_list_spec(
+            'risk_control_logs', alias='r', key='id', default_sort='created_at',
+            source="risk_control_logs r LEFT JOIN cookies c ON r.cookie_id = c.id",
+            extra_columns={'cookie_name': 'c.id'},
+            sortable=('id', 'created_at', 'updated_at'),
+            filterable=('event_type', 'processing_status'),
+            searchable=('event_description', 'error_message'),
+        )
+        where, params = (["r.cookie_id = ?"], [cookie_id]) if cookie_id else ([], [])
+        return self.fetch_page(spec, page or PageRequest(), where, params)
+
     def get_risk_control_logs(self, cookie_id: str = None, limit: int = 100, offset: int = 0) -> List[Dict]:
         """
         获取风控日志列表
@@ -5049,6 +5633,16 @@ class DBManager:
                     logger.warning(f"清理AI商品缓存失败: {e}")
                     stats['ai_item_cache'] = 0
                 
+                # 清理过期的AI回复缓存
+                try:
+                    cursor.execute("DELETE FROM ai_reply_cache WHERE expires_at <= ?", (time.time(),))
+                    stats['ai_reply_cache'] = cursor.rowcount
+                    if cursor.rowcount > 0:
+                        logger.info(f"清理了 {cursor.rowcount} 条过期的AI回复缓存")
+                except Exception as e:
+                    logger.warning(f"清理AI回复缓存失败: {e}")
+                    stats['ai_reply_cache'] = 0
+                
                 # 清理验证码记录（保留最近1天）
                 try:
                     cursor.execute(
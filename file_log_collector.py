@@ -1,240 +1,219 @@
 #!/usr/bin/env python3
 """
-基于文件监控的日志收集器
+实时日志收集器
+以 loguru sink 的方式直接接收结构化日志记录，写入有界环形缓冲，不再回读日志文件、逐行正则解析；
+客户端可通过 SSE / WebSocket 订阅，按级别/来源/账号在服务端过滤后推送
 """
 
-import os
-import re
-import time
+import asyncio
+import itertools
 import threading
 from collections import deque
-from datetime import datetime
-from typing import List, Dict, Optional
-from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 常用级别的数值（与loguru一致），订阅过滤时按"不低于该级别"处理
+LEVEL_NO = {'TRACE': 5, 'DEBUG': 10, 'INFO': 20, 'SUCCESS': 25, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+
+
+def extract_account(message: str) -> Optional[str]:
+    """取日志消息开头【cookie_id】中的账号ID（项目内账号相关日志的统一前缀）"""
+    if not message.startswith('【'):
+        return None
+    end = message.find('】', 1)
+    return message[1:end] if end > 1 else None
+
+
+class LogSubscription:
+    """一个实时日志订阅：在订阅方的事件循环上用有界队列接收推送，队列满时丢弃并计数"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, level: Optional[str] = None,
+                 source: Optional[str] = None, account: Optional[str] = None, max_queue: int = 1000):
+        self.loop = loop
+        self.min_level_no = LEVEL_NO.get(level.upper(), 0) if level else 0
+        self.source = source.lower() if source else None
+        self.account = account
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def matches(self, entry: Dict[str, Any]) -> bool:
+        if entry['level_no'] < self.min_level_no:
+            return False
+        if self.source and self.source not in entry['source'].lower():
+            return False
+        if self.account and entry['account'] != self.account:
+            return False
+        return True
+
+    def _put(self, entry: Dict[str, Any]):
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def push(self, entry: Dict[str, Any]):
+        """由sink调用（可能在任意线程）"""
+        if self.loop.is_closed():
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._put, entry)
+        except RuntimeError:
+            pass
+
 
 class FileLogCollector:
-    """基于文件监控的日志收集器"""
-    
-    def __init__(self, max_logs: int = 2000):
+    """实时日志收集器（loguru sink + 环形缓冲）"""
+
+    def __init__(self, max_logs: int = 2000, level: str = "INFO"):
         self.max_logs = max_logs
+        self.level = level
         self.logs = deque(maxlen=max_logs)
         self.lock = threading.Lock()
-        
-        # 日志文件路径
-        self.log_file = None
-        self.last_position = 0
-        
-        # 启动文件监控
-        self.setup_file_monitoring()
-    
-    def setup_file_monitoring(self):
-        """设置文件监控"""
-        # 查找日志文件
-        possible_files = [
-            "xianyu.log",
-            "app.log", 
-            "system.log",
-            "logs/xianyu.log",
-            "logs/app.log"
-        ]
-        
-        for file_path in possible_files:
-            if os.path.exists(file_path):
-                self.log_file = file_path
-                break
-        
-        if not self.log_file:
-            # 如果没有找到现有文件，创建一个新的
-            self.log_file = "realtime.log"
-            
-        # 设置loguru输出到文件
-        self.setup_loguru_file_output()
-        
-        # 启动文件监控线程
-        self.monitor_thread = threading.Thread(target=self.monitor_file, daemon=True)
-        self.monitor_thread.start()
-    
-    def setup_loguru_file_output(self):
-        """设置loguru输出到文件"""
+        self._ids = itertools.count(1)
+        self._subscribers: List[LogSubscription] = []
+        self.sink_id = None
+
+        self.setup_sink()
+
+    def setup_sink(self):
+        """注册loguru sink"""
         try:
             from loguru import logger
-            
-            # 添加文件输出
-            logger.add(
-                self.log_file,
-                format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level} | {name}:{function}:{line} - {message}",
-                level="INFO",  # 从DEBUG改为INFO，减少日志量
-                rotation="10 MB",
-                retention="3 days",  # 从7天改为3天，减少磁盘占用
-                enqueue=False,  # 改为False，避免队列延迟
-                buffering=1     # 行缓冲，立即写入
-            )
-            
-            logger.info("文件日志收集器已启动")
-            
+
+            self.sink_id = logger.add(self._sink, level=self.level, format="{message}", enqueue=False)
+            logger.info("实时日志收集器已启动")
+
         except ImportError:
             pass
-    
-    def monitor_file(self):
-        """监控日志文件变化"""
-        while True:
-            try:
-                if os.path.exists(self.log_file):
-                    # 获取文件大小
-                    file_size = os.path.getsize(self.log_file)
-                    
-                    if file_size > self.last_position:
-                        # 读取新增内容
-                        with open(self.log_file, 'r', encoding='utf-8') as f:
-                            f.seek(self.last_position)
-                            new_lines = f.readlines()
-                            self.last_position = f.tell()
-                        
-                        # 解析新增的日志行
-                        for line in new_lines:
-                            self.parse_log_line(line.strip())
-                
-                time.sleep(0.5)  # 每0.5秒检查一次
-                
-            except Exception as e:
-                time.sleep(1)  # 出错时等待1秒
-    
-    def parse_log_line(self, line: str):
-        """解析日志行"""
-        if not line:
-            return
-        
-        try:
-            # 解析loguru格式的日志
-            # 格式: 2025-07-23 15:46:03.430 | INFO | __main__:debug_collector:70 - 消息
-            pattern = r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3}) \| (\w+) \| ([^:]+):([^:]+):(\d+) - (.*)'
-            match = re.match(pattern, line)
-            
-            if match:
-                timestamp_str, level, source, function, line_num, message = match.groups()
-                
-                # 转换时间格式
-                try:
-                    timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S.%f')
-                except:
-                    timestamp = datetime.now()
-                
-                log_entry = {
-                    "timestamp": timestamp.isoformat(),
-                    "level": level,
-                    "source": source,
-                    "function": function,
-                    "line": int(line_num),
-                    "message": message
-                }
-                
-                with self.lock:
-                    self.logs.append(log_entry)
-            
-        except Exception as e:
-            # 如果解析失败，作为普通消息处理
-            log_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "level": "INFO",
-                "source": "system",
-                "function": "unknown",
-                "line": 0,
-                "message": line
-            }
-            
-            with self.lock:
-                self.logs.append(log_entry)
-    
-    def get_logs(self, lines: int = 200, level_filter: str = None, source_filter: str = None) -> List[Dict]:
-        """获取日志记录"""
+
+    def _sink(self, message):
+        """loguru回调：直接使用结构化的record字段（此处不能再调用logger，避免递归）"""
+        record = message.record
+        text = record["message"]
+        entry = {
+            "id": next(self._ids),
+            "timestamp": record["time"].isoformat(),
+            "level": record["level"].name,
+            "level_no": record["level"].no,
+            "source": record["name"] or '',
+            "function": record["function"],
+            "line": record["line"],
+            "account": extract_account(text),
+            "message": text,
+        }
+        with self.lock:
+            self.logs.append(entry)
+            subscribers = [s for s in self._subscribers if s.matches(entry)] if self._subscribers else ()
+        for subscription in subscribers:
+            subscription.push(entry)
+
+    def subscribe(self, level: str = None, source: str = None, account: str = None,
+                  max_queue: int = 1000) -> LogSubscription:
+        """订阅实时日志（需在事件循环中调用）"""
+        subscription = LogSubscription(asyncio.get_running_loop(), level=level, source=source,
+                                       account=account, max_queue=max_queue)
+        with self.lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: LogSubscription):
+        with self.lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def get_logs(self, lines: int = 200, level_filter: str = None, source_filter: str = None,
+                 account_filter: str = None, after_id: int = None) -> List[Dict]:
+        """获取日志记录（after_id 用于断线重连后补发之后的日志）"""
         with self.lock:
             logs_list = list(self.logs)
-        
+
         # 应用过滤器
+        if after_id:
+            logs_list = [log for log in logs_list if log['id'] > after_id]
+
         if level_filter:
             logs_list = [log for log in logs_list if log['level'] == level_filter]
-        
+
         if source_filter:
             logs_list = [log for log in logs_list if source_filter.lower() in log['source'].lower()]
-        
+
+        if account_filter:
+            logs_list = [log for log in logs_list if log['account'] == account_filter]
+
         # 返回最后N行
         return logs_list[-lines:] if len(logs_list) > lines else logs_list
-    
+
     def clear_logs(self):
         """清空日志"""
         with self.lock:
             self.logs.clear()
-    
+
     def get_stats(self) -> Dict:
         """获取日志统计信息"""
         with self.lock:
             total_logs = len(self.logs)
-            
+
             # 统计各级别日志数量
             level_counts = {}
             source_counts = {}
-            
+
             for log in self.logs:
                 level = log['level']
                 source = log['source']
-                
+
                 level_counts[level] = level_counts.get(level, 0) + 1
                 source_counts[source] = source_counts.get(source, 0) + 1
-            
+
             return {
                 "total_logs": total_logs,
                 "level_counts": level_counts,
                 "source_counts": source_counts,
                 "max_capacity": self.max_logs,
-                "log_file": self.log_file
+                "subscribers": len(self._subscribers),
+                "dropped": sum(s.dropped for s in self._subscribers),
             }
 
 
-# 全局文件日志收集器实例
+# 全局实时日志收集器实例
 _file_collector = None
 _file_collector_lock = threading.Lock()
 
 
 def get_file_log_collector() -> FileLogCollector:
-    """获取全局文件日志收集器实例"""
+    """获取全局实时日志收集器实例"""
     global _file_collector
-    
+
     if _file_collector is None:
         with _file_collector_lock:
             if _file_collector is None:
                 _file_collector = FileLogCollector(max_logs=2000)
-    
+
     return _file_collector
 
 
 def setup_file_logging():
-    """设置文件日志系统"""
+    """设置实时日志收集"""
     collector = get_file_log_collector()
     return collector
 
 
 if __name__ == "__main__":
-    # 测试文件日志收集器
+    # 测试实时日志收集器
     collector = setup_file_logging()
-    
-    # 生成一些测试日志
+
     from loguru import logger
-    
-    logger.info("文件日志收集器测试开始")
+
+    logger.info("实时日志收集器测试开始")
     logger.debug("这是调试信息")
-    logger.warning("这是警告信息")
+    logger.warning("【demo】这是警告信息")
     logger.error("这是错误信息")
-    logger.info("文件日志收集器测试结束")
-    
-    # 等待文件写入和监控
-    time.sleep(2)
-    
+    logger.info("实时日志收集器测试结束")
+
     # 获取日志
     logs = collector.get_logs(10)
     print(f"收集到 {len(logs)} 条日志:")
     for log in logs:
-        print(f"  [{log['level']}] {log['source']}: {log['message']}")
-    
+        print(f"  [{log['level']}] {log['source']} ({log['account']}): {log['message']}")
+
     # 获取统计信息
     stats = collector.get_stats()
     print(f"\n统计信息: {stats}")
@@ -11,6 +11,8 @@ import threading
 import asyncio
 from loguru import logger
 from typing import Optional, Dict, Any
+from config import get_memory_limit
+from utils.bounded_cache import TTLCache, container_stats
 
 # ==================== 订单状态处理器配置 ====================
 # 订单状态处理器配置
@@ -58,16 +60,21 @@ class OrderStatusHandler:
             'cancelled': '已关闭',      # 交易关闭
         }
         
+        # 待处理队列的容量上限与过期时间（见 global_config.yml 的 MEMORY_LIMITS）
+        pending_max_size, pending_ttl = get_memory_limit(
+            'pending_orders', 5000, self.config.get('max_pending_age_hours', 24) * 3600)
+        history_max_size, history_ttl = get_memory_limit('order_status_history', 10000, 7 * 86400)
+
         # 待处理的订单状态更新队列 {order_id: [update_info, ...]}
-        self.pending_updates = {}
+        self.pending_updates = TTLCache(max_size=pending_max_size, ttl=pending_ttl)
         # 待处理的系统消息队列（用于延迟处理）{cookie_id: [message_info, ...]}
-        self._pending_system_messages = {}
+        self._pending_system_messages = TTLCache(max_size=pending_max_size, ttl=pending_ttl)
         # 待处理的红色提醒消息队列（用于延迟处理）{cookie_id: [message_info, ...]}
-        self._pending_red_reminder_messages = {}
+        self._pending_red_reminder_messages = TTLCache(max_size=pending_max_size, ttl=pending_ttl)
         
         # 订单状态历史记录 {order_id: [status_history, ...]}
         # 用于退款撤销时回退到上一次状态
-        self._order_status_history = {}
+        self._order_status_history = TTLCache(max_size=history_max_size, ttl=history_ttl)
         
         # 使用threading.RLock保护并发访问
         # 注意：虽然在async环境中asyncio.Lock更理想，但本类的所有方法都是同步的
@@ -543,6 +550,17 @@ class OrderStatusHandler:
         
         return processed_orders
     
+    def get_memory_report(self) -> dict:
+        """获取待处理队列和状态历史的内存统计"""
+        structures = {
+            'pending_updates': self.pending_updates,
+            '_pending_system_messages': self._pending_system_messages,
+            '_pending_red_reminder_messages': self._pending_red_reminder_messages,
+            '_order_status_history': self._order_status_history,
+        }
+        with self._lock:
+            return {name: container_stats(name, container) for name, container in structures.items()}
+
     def get_pending_updates_count(self) -> int:
         """获取待处理更新的数量
         
@@ -1,6 +1,6 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import List, Tuple, Optional, Dict, Any
@@ -11,10 +11,10 @@ import secrets
 import time
 import json
 import os
-import re
 import uvicorn
 import pandas as pd
 import io
+import zipfile
 import asyncio
 from collections import defaultdict
 
@@ -27,6 +27,7 @@ from utils.xianyu_utils import trans_cookies
 from utils.image_utils import image_manager
 
 from loguru import logger
+from openpyxl.utils.exceptions import InvalidFileException
 
 # 刮刮乐远程控制路由
 try:
@@ -327,34 +328,107 @@ setup_file_logging()
 from loguru import logger
 logger.info("Web服务器启动，文件日志收集器已初始化")
 
-# 添加请求日志中间件
-@app.middleware("http")
-async def log_requests(request, call_next):
-    start_time = time.time()
-
-    # 获取用户信息
-    user_info = "未登录"
-    try:
-        # 从请求头中获取Authorization
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            token = auth_header.split(" ")[1]
-            if token in SESSION_TOKENS:
-                token_data = SESSION_TOKENS[token]
-                # 检查token是否过期
-                if time.time() - token_data['timestamp'] <= TOKEN_EXPIRE_TIME:
-                    user_info = f"【{token_data['username']}#{token_data['user_id']}】"
-    except Exception:
-        pass
+# 条件GET：按表版本号计算ETag，未变化时直接返回304，并缓存热点GET的响应体（见 utils.conditional_get）
+from utils.conditional_get import get_conditional_get_cache
+http_cache = get_conditional_get_cache()
+for _path, _tables in (
+    ('/keywords/{cid}', ('keywords', 'cookies')),
+    ('/keywords-with-item-id/{cid}', ('keywords', 'cookies')),
+    ('/keywords-with-type/{cid}', ('keywords', 'cookies')),
+    ('/items', ('item_info', 'cookies')),
+    ('/items/{cid}', ('item_info', 'cookies')),
+    ('/items/cookie/{cookie_id}', ('item_info', 'cookies')),
+    ('/cards', ('cards',)),
+    ('/cards/{card_id}', ('cards',)),
+    ('/delivery-rules', ('delivery_rules', 'cards')),
+    ('/delivery-rules/{rule_id}', ('delivery_rules', 'cards')),
+    ('/ai-reply-settings', ('ai_reply_settings', 'cookies')),
+    ('/ai-reply-settings/{cookie_id}', ('ai_reply_settings', 'cookies')),
+    ('/default-replies', ('default_replies', 'cookies')),
+    ('/default-replies/{cid}', ('default_replies', 'cookies')),
+    ('/notification-channels', ('notification_channels',)),
+    ('/message-notifications', ('message_notifications', 'notification_channels', 'cookies')),
+    ('/user-settings', ('user_settings',)),
+    ('/user-settings/{key}', ('user_settings',)),
+    ('/system-settings', ('system_settings',)),
+):
+    http_cache.register(_path, _tables)
 
-    logger.info(f"🌐 {user_info} API请求: {request.method} {request.url.path}")
+
+@app.middleware("http")
+async def conditional_get(request, call_next):
+    if request.method != 'GET' or not http_cache.enabled:
+        return await call_next(request)
+    matched = http_cache.match(request.url.path)
+    auth_header = request.headers.get("Authorization") or ''
+    user = _verify_token_value(auth_header[7:]) if matched and auth_header.startswith("Bearer ") else None
+    if not user:
+        # 未登记的路由或未登录（交由接口本身返回401）
+        return await call_next(request)
+
+    route, tables = matched
+    # 304/缓存命中时不会进入路由，记下路由模板供指标中间件使用
+    request.scope['metrics_route'] = route
+
+    http_cache.count('requests')
+    url = f"{request.url.path}?{request.url.query}"
+    etag = http_cache.etag(user['user_id'], url, tables)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if http_cache.etag_matches(request.headers.get('If-None-Match'), etag):
+        http_cache.count('not_modified')
+        return Response(status_code=304, headers=headers)
+
+    cached = http_cache.get(etag)
+    if cached is not None:
+        body, media_type = cached
+        return Response(content=body, media_type=media_type, headers=headers)
 
     response = await call_next(request)
+    if response.status_code != 200 or not response.headers.get('content-type', '').startswith('application/json'):
+        return response
+    body = b''.join([chunk async for chunk in response.body_iterator])
+    if http_cache.etag(user['user_id'], url, tables) == etag:
+        http_cache.put(etag, body, 'application/json')
+    else:
+        # 处理期间表有写入，本次结果不缓存（ETag仍为请求开始时的版本，下次请求会重新校验）
+        http_cache.count('changed_during_request')
+    # 按原始列表复制响应头，保留重复的头（如多个 set-cookie）；长度和缓存相关的头由新响应重新设置
+    result = Response(content=body, status_code=200, headers=headers)
+    result.raw_headers.extend((key, value) for key, value in response.headers.raw
+                              if key.lower() not in (b'content-length', b'etag', b'cache-control'))
+    return result
+
+
+# API指标与采样访问日志（见 utils.api_metrics）：静态资源直接跳过，其余按路由模板记录耗时直方图和状态码
+from utils.api_metrics import get_api_metrics
+api_metrics = get_api_metrics()
+
 
-    process_time = time.time() - start_time
-    logger.info(f"✅ {user_info} API响应: {request.method} {request.url.path} - {response.status_code} ({process_time:.3f}s)")
+def _request_user_prefix(request) -> str:
+    auth_header = request.headers.get("Authorization") or ''
+    token_data = _verify_token_value(auth_header[7:]) if auth_header.startswith("Bearer ") else None
+    return f"【{token_data['username']}#{token_data['user_id']}】" if token_data else "未登录"
+
+
+@app.middleware("http")
+async def log_requests(request, call_next):
+    if api_metrics.skip(request.url.path):
+        return await call_next(request)
 
-    return response
+    start_time = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        route = request.scope.get('route')
+        route_path = getattr(route, 'path', None) or request.scope.get('metrics_route') or '<unmatched>'
+        api_metrics.record(request.method, route_path, status_code, duration_ms)
+        if api_metrics.should_log(status_code, duration_ms):
+            logger.info(f"✅ {_request_user_prefix(request)} API响应: {request.method} {request.url.path} - "
+                        f"{status_code} ({duration_ms / 1000:.3f}s)")
 
 # 提供前端静态文件
 import os
@@ -362,7 +436,42 @@ static_dir = os.path.join(os.path.dirname(__file__), 'static')
 if not os.path.exists(static_dir):
     os.makedirs(static_dir, exist_ok=True)
 
-app.mount('/static', StaticFiles(directory=static_dir), name='static')
+# 静态资源常驻内存并预压缩（见 utils.static_assets），上传的图片等不在管线中的文件仍由 StaticFiles 从磁盘读取
+from utils.static_assets import get_static_assets
+static_assets = get_static_assets(static_dir)
+
+
+def _asset_response(asset, request_headers, version: str = None) -> Response:
+    status_code, headers, body = static_assets.respond(
+        asset,
+        accept_encoding=request_headers.get('accept-encoding'),
+        if_none_match=request_headers.get('if-none-match'),
+        version=version,
+    )
+    return Response(content=body, status_code=status_code, headers=headers)
+
+
+class AssetStaticFiles(StaticFiles):
+    async def get_response(self, path: str, scope):
+        from urllib.parse import parse_qs
+        from starlette.datastructures import Headers
+
+        asset = static_assets.asset(path.replace(os.sep, '/'))
+        if asset is None or scope['method'] not in ('GET', 'HEAD'):
+            return await super().get_response(path, scope)
+        version = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('v', [None])[0]
+        return _asset_response(asset, Headers(scope=scope), version)
+
+
+def _page_response(request: Request, name: str, missing: str) -> Response:
+    """返回内存中渲染好的页面（引用已改写为带指纹的静态资源地址）"""
+    page = static_assets.page(name)
+    if page is None:
+        return HTMLResponse(missing)
+    return _asset_response(page, request.headers)
+
+
+app.mount('/static', AssetStaticFiles(directory=static_dir), name='static')
 
 # 确保图片上传目录存在
 uploads_dir = os.path.join(static_dir, 'uploads', 'images')
@@ -370,79 +479,74 @@ if not os.path.exists(uploads_dir):
     os.makedirs(uploads_dir, exist_ok=True)
     logger.info(f"创建图片上传目录: {uploads_dir}")
 
-# 健康检查端点
+# 健康检查端点（读取后台采样结果，不阻塞事件循环，见 utils.health）
+from utils.health import get_health_monitor
+health_monitor = get_health_monitor()
+
+from utils.pagination import PageRequest, page_params, paged_response
+from utils.bulk_accounts import get_bulk_settings, resolve_operation
+
+
+@app.get('/health/live')
+async def health_live():
+    """存活探针：进程能响应即视为存活"""
+    return {"status": "alive", "timestamp": time.time()}
+
+
+@app.get('/health/ready')
+async def health_ready():
+    """就绪探针：Cookie管理器已初始化且数据库可用时返回200，否则503"""
+    result = health_monitor.ready(cookie_manager.manager is not None)
+    body = {
+        "status": "ready" if result["ready"] else "not_ready",
+        "timestamp": time.time(),
+        "services": result["services"],
+    }
+    return JSONResponse(status_code=200 if result["ready"] else 503, content=body)
+
+
 @app.get('/health')
 async def health_check():
     """健康检查端点，用于Docker健康检查和负载均衡器"""
     try:
-        # 检查Cookie管理器状态
-        manager_status = "ok" if cookie_manager.manager is not None else "error"
-
-        # 检查数据库连接
-        from db_manager import db_manager
-        try:
-            db_manager.get_all_cookies()
-            db_status = "ok"
-        except Exception:
-            db_status = "error"
-
-        # 获取系统状态
-        import psutil
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory_info = psutil.virtual_memory()
-
+        result = health_monitor.ready(cookie_manager.manager is not None)
+        snapshot = result["snapshot"]
         status = {
-            "status": "healthy" if manager_status == "ok" and db_status == "ok" else "unhealthy",
+            "status": "healthy" if result["ready"] else "unhealthy",
             "timestamp": time.time(),
-            "services": {
-                "cookie_manager": manager_status,
-                "database": db_status
-            },
-            "system": {
-                "cpu_percent": cpu_percent,
-                "memory_percent": memory_info.percent,
-                "memory_available": memory_info.available
-            }
+            "services": result["services"],
+            "system": snapshot["system"],
+            "sampled_at": snapshot["sampled_at"],
+            "sample_age_seconds": snapshot["age_seconds"],
+            "database_latency_ms": snapshot.get("database_latency_ms"),
+            # 该接口无需登录，只返回汇总数量，各账号明细见 /admin/health/accounts
+            "accounts": health_monitor.account_summary(),
         }
-
-        if status["status"] == "unhealthy":
-            raise HTTPException(status_code=503, detail=status)
-
-        return status
+        return JSONResponse(status_code=200 if result["ready"] else 503, content=status)
 
     except Exception as e:
-        return {
+        return JSONResponse(status_code=503, content={
             "status": "unhealthy",
             "timestamp": time.time(),
             "error": str(e)
-        }
+        })
 
 
 # 重定向根路径到登录页面
 @app.get('/', response_class=HTMLResponse)
-async def root():
-    login_path = os.path.join(static_dir, 'login.html')
-    if os.path.exists(login_path):
-        with open(login_path, 'r', encoding='utf-8') as f:
-            return HTMLResponse(f.read())
-    else:
-        return HTMLResponse('<h3>Login page not found</h3>')
+async def root(request: Request):
+    return _page_response(request, 'login.html', '<h3>Login page not found</h3>')
 
 
 # 登录页面路由
 @app.get('/login.html', response_class=HTMLResponse)
-async def login_page():
-    login_path = os.path.join(static_dir, 'login.html')
-    if os.path.exists(login_path):
-        with open(login_path, 'r', encoding='utf-8') as f:
-            return HTMLResponse(f.read())
-    else:
-        return HTMLResponse('<h3>Login page not found</h3>')
+async def login_page(request: Request):
+    return _page_response(request, 'login.html', '<h3>Login page not found</h3>')
 
 
 # 注册页面路由
 @app.get('/register.html', response_class=HTMLResponse)
-async def register_page():
+async def register_page(request: Request):
     # 检查注册是否开启
     from db_manager import db_manager
     registration_enabled = db_manager.get_system_setting('registration_enabled')
@@ -470,72 +574,14 @@ async def register_page():
         </html>
         ''', status_code=403)
 
-    register_path = os.path.join(static_dir, 'register.html')
-    if os.path.exists(register_path):
-        with open(register_path, 'r', encoding='utf-8') as f:
-            return HTMLResponse(f.read())
-    else:
-        return HTMLResponse('<h3>Register page not found</h3>')
+    return _page_response(request, 'register.html', '<h3>Register page not found</h3>')
 
 
 # 管理页面（不需要服务器端认证，由前端JavaScript处理）
 @app.get('/admin', response_class=HTMLResponse)
-async def admin_page():
-    index_path = os.path.join(static_dir, 'index.html')
-    if not os.path.exists(index_path):
-        return HTMLResponse('<h3>No front-end found</h3>')
-    
-    # 获取静态文件的修改时间作为版本号，解决浏览器缓存问题
-    def get_file_version(file_path, default='1.0.0'):
-        """获取文件的版本号（基于修改时间）"""
-        if os.path.exists(file_path):
-            try:
-                mtime = os.path.getmtime(file_path)
-                return str(int(mtime))
-            except Exception as e:
-                logger.warning(f"获取文件 {file_path} 修改时间失败: {e}")
-        return default
-    
-    app_js_path = os.path.join(static_dir, 'js', 'app.js')
-    app_css_path = os.path.join(static_dir, 'css', 'app.css')
-    
-    js_version = get_file_version(app_js_path, '2.2.0')
-    css_version = get_file_version(app_css_path, '1.0.0')
-    
-    try:
-        with open(index_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-            
-            # 替换 app.js 的版本号参数
-            js_pattern = r'/static/js/app\.js\?v=[^"\'\s>]+'
-            js_new_url = f'/static/js/app.js?v={js_version}'
-            if re.search(js_pattern, html_content):
-                html_content = re.sub(js_pattern, js_new_url, html_content)
-                logger.debug(f"已替换 app.js 版本号: {js_version}")
-            
-            # 为 app.css 添加或更新版本号参数
-            css_pattern = r'/static/css/app\.css(\?v=[^"\'\s>]+)?'
-            css_new_url = f'/static/css/app.css?v={css_version}'
-            html_content = re.sub(css_pattern, css_new_url, html_content)
-            
-            return HTMLResponse(html_content)
-    except Exception as e:
-        logger.error(f"读取或处理 index.html 失败: {e}")
-        return HTMLResponse('<h3>Error loading page</h3>')
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+async def admin_page(request: Request):
+    # app.js/app.css 等引用已按内容指纹改写，文件变化后指纹随之变化，浏览器会重新获取
+    return _page_response(request, 'index.html', '<h3>No front-end found</h3>')
 
 
 # 登录接口
@@ -1101,6 +1147,17 @@ class CookieStatusIn(BaseModel):
     enabled: bool
 
 
+class CookieBatchIn(BaseModel):
+    cookie_ids: List[str]
+    operation: str  # enable | disable | pause_duration | auto_confirm | default_reply | notification
+    pause_duration: Optional[int] = None
+    auto_confirm: Optional[bool] = None
+    enabled: Optional[bool] = None
+    reply_content: Optional[str] = None
+    reply_once: bool = False
+    channel_id: Optional[int] = None
+
+
 class DefaultReplyIn(BaseModel):
     enabled: bool
     reply_content: Optional[str] = None
@@ -1156,26 +1213,20 @@ def get_cookies_details(current_user: Dict[str, Any] = Depends(get_current_user)
     if cookie_manager.manager is None:
         return []
 
-    # 获取当前用户的cookies
+    # 一次查询取出当前用户所有cookie的详细信息
     user_id = current_user['user_id']
     from db_manager import db_manager
-    user_cookies = db_manager.get_all_cookies(user_id)
 
     result = []
-    for cookie_id, cookie_value in user_cookies.items():
-        cookie_enabled = cookie_manager.manager.get_cookie_status(cookie_id)
-        auto_confirm = db_manager.get_auto_confirm(cookie_id)
-        # 获取备注信息
-        cookie_details = db_manager.get_cookie_details(cookie_id)
-        remark = cookie_details.get('remark', '') if cookie_details else ''
-
+    for details in db_manager.get_all_cookie_details(user_id):
+        cookie_id = details['id']
         result.append({
             'id': cookie_id,
-            'value': cookie_value,
-            'enabled': cookie_enabled,
-            'auto_confirm': auto_confirm,
-            'remark': remark,
-            'pause_duration': cookie_details.get('pause_duration', 10) if cookie_details else 10
+            'value': details['value'],
+            'enabled': cookie_manager.manager.get_cookie_status(cookie_id),
+            'auto_confirm': details['auto_confirm'],
+            'remark': details['remark'],
+            'pause_duration': details['pause_duration']
         })
     return result
 
@@ -2356,6 +2407,77 @@ def update_cookie_status(cid: str, status_data: CookieStatusIn, current_user: Di
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.post('/cookies/batch')
+def batch_update_cookies(batch: CookieBatchIn, current_user: Dict[str, Any] = Depends(get_current_user)):
+    """批量操作账号
+
+    数据库修改在一个事务中完成；启用/禁用涉及的任务启停由 CookieManager 按 task_interval 间隔依次执行，
+    接口不等待其完成（剩余数量见 pending_task_changes），每个账号的结果见 results
+    """
+    if cookie_manager.manager is None:
+        raise HTTPException(status_code=500, detail='CookieManager 未就绪')
+    from db_manager import db_manager
+
+    settings = get_bulk_settings()
+    cookie_ids = list(dict.fromkeys(batch.cookie_ids))  # 去重并保持顺序
+    if not cookie_ids:
+        raise HTTPException(status_code=400, detail='cookie_ids 不能为空')
+    if len(cookie_ids) > settings['max_batch']:
+        raise HTTPException(status_code=400, detail=f"单次最多操作 {settings['max_batch']} 个账号")
+    try:
+        db_operation, values = resolve_operation(
+            batch.operation, pause_duration=batch.pause_duration, auto_confirm=batch.auto_confirm,
+            enabled=batch.enabled, reply_content=batch.reply_content, reply_once=batch.reply_once,
+            channel_id=batch.channel_id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if db_operation == 'notification':
+        channel = db_manager.get_notification_channel(batch.channel_id)
+        if not channel:
+            raise HTTPException(status_code=404, detail='通知渠道不存在')
+
+    user_cookies = db_manager.get_all_cookies(current_user['user_id'])
+    results = {cid: {'cookie_id': cid, 'success': False, 'message': '无权限操作该Cookie'}
+               for cid in cookie_ids if cid not in user_cookies}
+    owned = [cid for cid in cookie_ids if cid in user_cookies]
+
+    try:
+        if db_operation == 'status':
+            task_results = cookie_manager.manager.update_cookie_status_batch(
+                owned, values['enabled'], settings['task_interval'])
+            for cid, task in task_results.items():
+                if task == 'not_found':
+                    results[cid] = {'cookie_id': cid, 'success': False, 'message': '账号未加载'}
+                else:
+                    results[cid] = {'cookie_id': cid, 'success': True, 'task': task}
+        else:
+            if not db_manager.update_accounts_batch(db_operation, owned, **values):
+                raise HTTPException(status_code=500, detail='批量更新失败')
+            for cid in owned:
+                if db_operation == 'auto_confirm':
+                    # 通知CookieManager更新设置（如果账号正在运行）
+                    cookie_manager.manager.update_auto_confirm_setting(cid, values['auto_confirm'])
+                results[cid] = {'cookie_id': cid, 'success': True}
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_with_user('error', f"批量操作账号失败: {batch.operation}, {e}", current_user)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    ordered = [results[cid] for cid in cookie_ids]
+    succeeded = sum(1 for r in ordered if r['success'])
+    log_with_user('info', f"批量操作账号: {batch.operation}, 成功 {succeeded}/{len(ordered)}", current_user)
+    return {
+        'success': succeeded == len(ordered),
+        'operation': batch.operation,
+        'results': ordered,
+        'succeeded': succeeded,
+        'failed': len(ordered) - succeeded,
+        'pending_task_changes': cookie_manager.manager.pending_task_changes,
+    }
+
+
 # ------------------------- 默认回复管理接口 -------------------------
 
 @app.get('/default-replies/{cid}')
@@ -3132,11 +3254,13 @@ def update_keywords_with_item_id(cid: str, body: KeywordWithItemIdIn, current_us
 
         keywords_to_save.append((keyword, reply, item_id))
 
-    # 保存关键词（只保存文本关键词，保留图片关键词）
+    # 保存关键词（只保存文本关键词，保留图片关键词；与现有记录比较后只写入变化的行）
     try:
-        success = db_manager.save_text_keywords_only(cid, keywords_to_save)
-        if not success:
+        summary = db_manager.sync_keywords(cid, keywords_to_save)
+        if summary is None:
             raise HTTPException(status_code=500, detail="保存关键词失败")
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = str(e)
 
@@ -3177,8 +3301,8 @@ def update_keywords_with_item_id(cid: str, body: KeywordWithItemIdIn, current_us
             log_with_user('error', f"保存关键词时发生未知错误: {error_msg}", current_user)
             raise HTTPException(status_code=500, detail="保存关键词失败")
 
-    log_with_user('info', f"更新Cookie关键字(含商品ID): {cid}, 数量: {len(keywords_to_save)}", current_user)
-    return {"msg": "updated", "count": len(keywords_to_save)}
+    log_with_user('info', f"更新Cookie关键字(含商品ID): {cid}, 数量: {len(keywords_to_save)}, 变更: {summary}", current_user)
+    return {"msg": "updated", "count": len(keywords_to_save), "changes": summary}
 
 
 @app.get("/items/{cid}")
@@ -3328,72 +3452,28 @@ async def import_keywords(cid: str, file: UploadFile = File(...), current_user:
         raise HTTPException(status_code=400, detail="请上传Excel文件(.xlsx或.xls)")
 
     try:
-        # 读取Excel文件
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-
-        # 检查必要的列
-        required_columns = ['关键词', '商品ID', '关键词内容']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            raise HTTPException(status_code=400, detail=f"Excel文件缺少必要的列: {', '.join(missing_columns)}")
-
-        # 获取现有的文本类型关键词（用于比较更新/新增）
-        existing_keywords = db_manager.get_keywords_with_type(cid)
-        existing_dict = {}
-        for keyword_data in existing_keywords:
-            # 只考虑文本类型的关键词
-            if keyword_data.get('type', 'text') == 'text':
-                keyword = keyword_data['keyword']
-                reply = keyword_data['reply']
-                item_id = keyword_data['item_id']
-                key = f"{keyword}|{item_id or ''}"
-                existing_dict[key] = (keyword, reply, item_id)
-
-        # 处理导入数据
-        import_data = []
-        update_count = 0
-        add_count = 0
-
-        for index, row in df.iterrows():
-            keyword = str(row['关键词']).strip()
-            item_id = str(row['商品ID']).strip() if pd.notna(row['商品ID']) and str(row['商品ID']).strip() else None
-            reply = str(row['关键词内容']).strip()
-
-            if not keyword:
-                continue  # 跳过没有关键词的行
-
-            # 检查是否重复
-            key = f"{keyword}|{item_id or ''}"
-            if key in existing_dict:
-                # 更新现有关键词
-                update_count += 1
-            else:
-                # 新增关键词
-                add_count += 1
-
-            import_data.append((keyword, reply, item_id))
+        # 流式解析Excel（不再整表读入DataFrame），解析与入库都放到线程中执行，避免阻塞事件循环
+        from utils.keyword_sync import iter_excel_keywords
+        import_data = await asyncio.to_thread(lambda: list(iter_excel_keywords(file.file, file.filename)))
 
         if not import_data:
             raise HTTPException(status_code=400, detail="Excel文件中没有有效的关键词数据")
 
-        # 保存到数据库（只影响文本关键词，保留图片关键词）
-        success = db_manager.save_text_keywords_only(cid, import_data)
-        if not success:
+        # 与现有文本关键词比较后只写入变化的行（保留图片关键词）
+        summary = await asyncio.to_thread(db_manager.sync_keywords, cid, import_data)
+        if summary is None:
             raise HTTPException(status_code=500, detail="保存关键词到数据库失败")
 
-        log_with_user('info', f"导入关键词成功: {cid}, 新增: {add_count}, 更新: {update_count}", current_user)
+        log_with_user('info', f"导入关键词成功: {cid}, 新增: {summary['added']}, 更新: {summary['updated']}, "
+                              f"删除: {summary['deleted']}, 未变: {summary['unchanged']}", current_user)
 
-        return {
-            "msg": "导入成功",
-            "total": len(import_data),
-            "added": add_count,
-            "updated": update_count
-        }
+        return {"msg": "导入成功", **summary}
 
-    except pd.errors.EmptyDataError:
-        raise HTTPException(status_code=400, detail="Excel文件为空")
-    except pd.errors.ParserError:
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (zipfile.BadZipFile, InvalidFileException):
         raise HTTPException(status_code=400, detail="Excel文件格式错误")
     except Exception as e:
         logger.error(f"导入关键词失败: {e}")
@@ -3606,13 +3686,21 @@ def debug_keywords_table_info(current_user: Dict[str, Any] = Depends(get_current
 
 # 卡券管理API
 @app.get("/cards")
-def get_cards(current_user: Dict[str, Any] = Depends(get_current_user)):
-    """获取当前用户的卡券列表"""
+def get_cards(current_user: Dict[str, Any] = Depends(get_current_user),
+              limit: int = None, cursor: str = None, fields: str = None, sort: str = None, order: str = None,
+              search: str = None, type: str = None, enabled: bool = None):
+    """获取当前用户的卡券列表
+
+    传 limit/cursor 时按游标分页返回 {items, next_cursor, has_more}；fields 可省略 data_content 等大字段
+    """
     try:
         from db_manager import db_manager
         user_id = current_user['user_id']
-        cards = db_manager.get_all_cards(user_id)
-        return cards
+        page = page_params(limit, cursor, fields, sort, order, search, type=type, enabled=enabled)
+        result = db_manager.get_cards_page(user_id, page)
+        return paged_response(page, result, result["items"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -3777,13 +3865,18 @@ async def update_card_with_image(
 
 # 自动发货规则API
 @app.get("/delivery-rules")
-def get_delivery_rules(current_user: Dict[str, Any] = Depends(get_current_user)):
-    """获取发货规则列表"""
+def get_delivery_rules(current_user: Dict[str, Any] = Depends(get_current_user),
+                       limit: int = None, cursor: str = None, fields: str = None, sort: str = None,
+                       order: str = None, search: str = None, card_id: int = None, enabled: bool = None):
+    """获取发货规则列表（传 limit/cursor 时按游标分页）"""
     try:
         from db_manager import db_manager
         user_id = current_user['user_id']
-        rules = db_manager.get_all_delivery_rules(user_id)
-        return rules
+        page = page_params(limit, cursor, fields, sort, order, search, card_id=card_id, enabled=enabled)
+        result = db_manager.get_delivery_rules_page(user_id, page)
+        return paged_response(page, result, result["items"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -3920,6 +4013,8 @@ def import_backup(file: UploadFile = File(...), current_user: Dict[str, Any] = D
         success = db_manager.import_backup(backup_data, user_id)
 
         if success:
+            ai_reply_engine.reset_conversation_states()
+
             # 备份导入成功后，刷新 CookieManager 的内存缓存
             import cookie_manager
             if cookie_manager.manager:
@@ -3959,20 +4054,26 @@ def reload_cache(_: None = Depends(require_auth)):
 # ==================== 商品管理 API ====================
 
 @app.get("/items")
-def get_all_items(current_user: Dict[str, Any] = Depends(get_current_user)):
-    """获取当前用户的所有商品信息"""
+def get_all_items(current_user: Dict[str, Any] = Depends(get_current_user),
+                  limit: int = None, cursor: str = None, fields: str = None, sort: str = None,
+                  order: str = None, search: str = None, cookie_id: str = None, item_category: str = None,
+                  is_multi_spec: bool = None):
+    """获取当前用户的所有商品信息
+
+    传 limit/cursor 时按游标分页，并返回 next_cursor/has_more；fields 可省略 item_detail 等大字段
+    """
     try:
         # 只返回当前用户的商品信息
         user_id = current_user['user_id']
         from db_manager import db_manager
         user_cookies = db_manager.get_all_cookies(user_id)
 
-        all_items = []
-        for cookie_id in user_cookies.keys():
-            items = db_manager.get_items_by_cookie(cookie_id)
-            all_items.extend(items)
-
-        return {"items": all_items}
+        page = page_params(limit, cursor, fields, sort, order, search, cookie_id=cookie_id,
+                           item_category=item_category, is_multi_spec=is_multi_spec)
+        result = db_manager.get_items_page(list(user_cookies.keys()), page)
+        return paged_response(page, result, {"items": result["items"]})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取商品信息失败: {str(e)}")
 
@@ -4138,8 +4239,11 @@ async def search_multiple_pages(
 
 
 @app.get("/items/cookie/{cookie_id}")
-def get_items_by_cookie(cookie_id: str, current_user: Dict[str, Any] = Depends(get_current_user)):
-    """获取指定Cookie的商品信息"""
+def get_items_by_cookie(cookie_id: str, current_user: Dict[str, Any] = Depends(get_current_user),
+                        limit: int = None, cursor: str = None, fields: str = None, sort: str = None,
+                        order: str = None, search: str = None, item_category: str = None,
+                        is_multi_spec: bool = None):
+    """获取指定Cookie的商品信息（传 limit/cursor 时按游标分页）"""
     try:
         # 检查cookie是否属于当前用户
         user_id = current_user['user_id']
@@ -4149,10 +4253,14 @@ def get_items_by_cookie(cookie_id: str, current_user: Dict[str, Any] = Depends(g
         if cookie_id not in user_cookies:
             raise HTTPException(status_code=403, detail="无权限访问该Cookie")
 
-        items = db_manager.get_items_by_cookie(cookie_id)
-        return {"items": items}
+        page = page_params(limit, cursor, fields, sort, order, search, item_category=item_category,
+                           is_multi_spec=is_multi_spec)
+        result = db_manager.get_items_page([cookie_id], page)
+        return paged_response(page, result, {"items": result["items"]})
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取商品信息失败: {str(e)}")
 
@@ -4202,6 +4310,8 @@ def update_item_detail(
 
         success = db_manager.update_item_detail(cookie_id, item_id, update_data.item_detail)
         if success:
+            # 商品详情变更后，该商品之前缓存的AI回复不再适用
+            ai_reply_engine.invalidate_reply_cache(cookie_id, item_id)
             return {"message": "商品详情更新成功"}
         else:
             raise HTTPException(status_code=400, detail="更新失败")
@@ -4252,6 +4362,13 @@ class AIReplySettings(BaseModel):
     max_discount_amount: int = 100
     max_bargain_rounds: int = 3
     custom_prompts: str = ""
+    reply_cache_enabled: bool = False
+    latency_budget_ms: int = 30000
+    hedge_delay_ms: int = 0
+    fallback_model_name: str = ""
+    fallback_base_url: str = ""
+    fallback_api_key: str = ""
+    intent_keywords: str = ""
 
 
 @app.delete("/items/batch")
@@ -4322,6 +4439,10 @@ def update_ai_reply_settings(cookie_id: str, settings: AIReplySettings, current_
         success = db_manager.save_ai_reply_settings(cookie_id, settings_dict)
 
         if success:
+            # 设置变更后失效该账号复用的大模型客户端，下次回复按新设置重建
+            ai_reply_engine.invalidate_clients(cookie_id)
+            # 提示词/议价设置可能已变更，清理该账号的AI回复缓存
+            ai_reply_engine.invalidate_reply_cache(cookie_id)
 
             # 如果启用了AI回复，记录日志
             if settings.ai_enabled:
@@ -4346,19 +4467,14 @@ def get_all_ai_reply_settings(current_user: Dict[str, Any] = Depends(get_current
         # 只返回当前用户的AI回复设置
         user_id = current_user['user_id']
         from db_manager import db_manager
-        user_cookies = db_manager.get_all_cookies(user_id)
-
-        all_settings = db_manager.get_all_ai_reply_settings()
-        # 过滤只属于当前用户的设置
-        user_settings = {cid: settings for cid, settings in all_settings.items() if cid in user_cookies}
-        return user_settings
+        return db_manager.get_all_ai_reply_settings(user_id)
     except Exception as e:
         logger.error(f"获取所有AI回复设置异常: {e}")
         raise HTTPException(status_code=500, detail=f"服务器错误: {str(e)}")
 
 
 @app.post("/ai-reply-test/{cookie_id}")
-def test_ai_reply(cookie_id: str, test_data: dict, _: None = Depends(require_auth)):
+async def test_ai_reply(cookie_id: str, test_data: dict, _: None = Depends(require_auth)):
     """测试AI回复功能"""
     try:
         # 检查账号是否存在
@@ -4381,7 +4497,7 @@ def test_ai_reply(cookie_id: str, test_data: dict, _: None = Depends(require_aut
         }
 
         # 生成测试回复
-        reply = ai_reply_engine.generate_reply(
+        reply = await ai_reply_engine.generate_reply_async(
             message=test_message,
             item_info=test_item_info,
             chat_id=f"test_{int(time.time())}",
@@ -4405,14 +4521,15 @@ def test_ai_reply(cookie_id: str, test_data: dict, _: None = Depends(require_aut
 # ==================== 日志管理API ====================
 
 @app.get("/logs")
-async def get_logs(lines: int = 200, level: str = None, source: str = None, _: None = Depends(require_auth)):
+async def get_logs(lines: int = 200, level: str = None, source: str = None, account: str = None,
+                   _: None = Depends(require_auth)):
     """获取实时系统日志"""
     try:
-        # 获取文件日志收集器
+        # 获取实时日志收集器
         collector = get_file_log_collector()
 
         # 获取日志
-        logs = collector.get_logs(lines=lines, level_filter=level, source_filter=source)
+        logs = collector.get_logs(lines=lines, level_filter=level, source_filter=source, account_filter=account)
 
         return {"success": True, "logs": logs}
 
@@ -4420,31 +4537,139 @@ async def get_logs(lines: int = 200, level: str = None, source: str = None, _: N
         return {"success": False, "message": f"获取日志失败: {str(e)}", "logs": []}
 
 
+def _verify_token_value(token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """校验查询参数中的token（EventSource/WebSocket 无法设置 Authorization 请求头）"""
+    if not token:
+        return None
+    return verify_token(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+
+
+@app.get("/logs/stream")
+async def stream_logs(request: Request, level: str = None, source: str = None, account: str = None,
+                      token: str = None, credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
+    """以 Server-Sent Events 推送实时日志（level 为最低级别，source/account 为来源模块/账号过滤）
+
+    断线重连时浏览器会带上 Last-Event-ID，先补发环形缓冲中该ID之后的日志
+    """
+    if not (verify_token(credentials) or _verify_token_value(token)):
+        raise HTTPException(status_code=401, detail="未授权访问")
+
+    collector = get_file_log_collector()
+    subscription = collector.subscribe(level=level, source=source, account=account)
+    last_id = request.headers.get('last-event-id')
+
+    async def event_stream():
+        # 订阅先于补发建立（避免两者之间的日志丢失），补发期间产生的日志会同时进入队列，按ID跳过已补发的部分
+        # 只按实际补发的日志推进：服务重启后ID从1重新计数，浏览器带来的更大ID不能用来过滤新日志
+        replayed_id = 0
+        try:
+            if last_id and last_id.isdigit():
+                for entry in collector.get_logs(lines=collector.max_logs, after_id=int(last_id)):
+                    replayed_id = max(replayed_id, entry['id'])
+                    if subscription.matches(entry):
+                        yield f"id: {entry['id']}\ndata: {json.dumps(entry, ensure_ascii=False)}\n\n"
+            while True:
+                try:
+                    entry = await asyncio.wait_for(subscription.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # 心跳，防止代理断开空闲连接
+                    yield ": keep-alive\n\n"
+                    continue
+                if entry['id'] <= replayed_id:
+                    continue
+                yield f"id: {entry['id']}\ndata: {json.dumps(entry, ensure_ascii=False)}\n\n"
+        finally:
+            collector.unsubscribe(subscription)
+
+    return StreamingResponse(event_stream(), media_type='text/event-stream',
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.websocket("/ws/logs")
+async def websocket_logs(websocket: WebSocket, token: str = None, level: str = None,
+                         source: str = None, account: str = None):
+    """以 WebSocket 推送实时日志，过滤参数与 /logs/stream 相同"""
+    if not _verify_token_value(token):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    collector = get_file_log_collector()
+    subscription = collector.subscribe(level=level, source=source, account=account)
+
+    async def wait_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    # 同时等待新日志和客户端断开，没有日志时也能及时释放订阅
+    disconnected = asyncio.ensure_future(wait_disconnect())
+    try:
+        while True:
+            getter = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait({getter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                getter.cancel()
+                break
+            await websocket.send_text(json.dumps(getter.result(), ensure_ascii=False))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        disconnected.cancel()
+        collector.unsubscribe(subscription)
+
+
+def _query_risk_control_logs(cookie_id: str, limit: int, offset: int, cursor: str, fields: str,
+                             event_type: str, processing_status: str, with_total: bool) -> Dict[str, Any]:
+    """风控日志查询：首页和带游标的翻页走 keyset 分页，offset>0 时兼容旧的 OFFSET 查询"""
+    if cursor or offset <= 0:
+        page = page_params(limit, cursor, fields, event_type=event_type, processing_status=processing_status)
+        result = db_manager.get_risk_control_logs_page(cookie_id=cookie_id, page=page)
+        logs, next_cursor = result["items"], result["next_cursor"]
+        # 过滤条件下的总数无法从旧接口得到，此时不返回总数
+        with_total = with_total and not page.filters
+    else:
+        logs = db_manager.get_risk_control_logs(cookie_id=cookie_id, limit=limit, offset=offset)
+        next_cursor = None
+    total_count = db_manager.get_risk_control_logs_count(cookie_id=cookie_id) if with_total else None
+    return {
+        "success": True,
+        "data": logs,
+        "total": total_count,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor,
+    }
+
+
 @app.get("/risk-control-logs")
 async def get_risk_control_logs(
     cookie_id: str = None,
     limit: int = 100,
     offset: int = 0,
+    cursor: str = None,
+    fields: str = None,
+    event_type: str = None,
+    processing_status: str = None,
+    with_total: bool = True,
     admin_user: Dict[str, Any] = Depends(require_admin)
 ):
-    """获取风控日志（管理员专用）"""
+    """获取风控日志（管理员专用）
+
+    翻页时传上一页返回的 next_cursor 即可，不需要 offset；with_total=false 时不统计总数
+    """
     try:
         log_with_user('info', f"查询风控日志: cookie_id={cookie_id}, limit={limit}, offset={offset}", admin_user)
 
-        # 获取风控日志
-        logs = db_manager.get_risk_control_logs(cookie_id=cookie_id, limit=limit, offset=offset)
-        total_count = db_manager.get_risk_control_logs_count(cookie_id=cookie_id)
+        response = _query_risk_control_logs(cookie_id, limit, offset, cursor, fields, event_type,
+                                            processing_status, with_total)
 
-        log_with_user('info', f"风控日志查询成功，共 {len(logs)} 条记录，总计 {total_count} 条", admin_user)
+        log_with_user('info', f"风控日志查询成功，共 {len(response['data'])} 条记录，总计 {response['total']} 条", admin_user)
 
-        return {
-            "success": True,
-            "data": logs,
-            "total": total_count,
-            "limit": limit,
-            "offset": offset
-        }
+        return response
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         log_with_user('error', f"获取风控日志失败: {str(e)}", admin_user)
         return {
@@ -4735,26 +4960,26 @@ async def get_admin_risk_control_logs(
     cookie_id: str = None,
     limit: int = 100,
     offset: int = 0,
+    cursor: str = None,
+    fields: str = None,
+    event_type: str = None,
+    processing_status: str = None,
+    with_total: bool = True,
     admin_user: Dict[str, Any] = Depends(require_admin)
 ):
-    """获取风控日志（管理员专用）"""
+    """获取风控日志（管理员专用，参数同 /risk-control-logs）"""
     try:
         log_with_user('info', f"查询风控日志: cookie_id={cookie_id}, limit={limit}, offset={offset}", admin_user)
 
-        # 获取风控日志
-        logs = db_manager.get_risk_control_logs(cookie_id=cookie_id, limit=limit, offset=offset)
-        total_count = db_manager.get_risk_control_logs_count(cookie_id=cookie_id)
+        response = _query_risk_control_logs(cookie_id, limit, offset, cursor, fields, event_type,
+                                            processing_status, with_total)
 
-        log_with_user('info', f"风控日志查询成功，共 {len(logs)} 条记录，总计 {total_count} 条", admin_user)
+        log_with_user('info', f"风控日志查询成功，共 {len(response['data'])} 条记录，总计 {response['total']} 条", admin_user)
 
-        return {
-            "success": True,
-            "data": logs,
-            "total": total_count,
-            "limit": limit,
-            "offset": offset
-        }
+        return response
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         log_with_user('error', f"查询风控日志失败: {str(e)}", admin_user)
         return {"success": False, "message": f"查询失败: {str(e)}", "data": [], "total": 0}
@@ -4773,25 +4998,19 @@ def get_admin_cookies(admin_user: Dict[str, Any] = Depends(require_admin)):
                 "message": "CookieManager 未就绪"
             }
 
-        # 获取所有用户的cookies
+        # 一次联表查询获取所有用户的cookies
         from db_manager import db_manager
-        all_users = db_manager.get_all_users()
         all_cookies = []
 
-        for user in all_users:
-            user_id = user['id']
-            user_cookies = db_manager.get_all_cookies(user_id)
-            for cookie_id, cookie_value in user_cookies.items():
-                # 获取cookie详细信息
-                cookie_details = db_manager.get_cookie_details(cookie_id)
-                cookie_info = {
-                    'cookie_id': cookie_id,
-                    'user_id': user_id,
-                    'username': user['username'],
-                    'nickname': cookie_details.get('remark', '') if cookie_details else '',
-                    'enabled': cookie_manager.manager.get_cookie_status(cookie_id)
-                }
-                all_cookies.append(cookie_info)
+        for details in db_manager.get_all_cookie_details():
+            cookie_id = details['id']
+            all_cookies.append({
+                'cookie_id': cookie_id,
+                'user_id': details['user_id'],
+                'username': details['owner_username'],
+                'nickname': details['remark'],
+                'enabled': cookie_manager.manager.get_cookie_status(cookie_id)
+            })
 
         log_with_user('info', f"获取到 {len(all_cookies)} 个Cookie", admin_user)
         return {
@@ -4812,62 +5031,46 @@ def get_admin_cookies(admin_user: Dict[str, Any] = Depends(require_admin)):
 @app.get('/admin/logs')
 def get_system_logs(admin_user: Dict[str, Any] = Depends(require_admin),
                    lines: int = 100,
-                   level: str = None):
-    """获取系统日志（管理员专用）"""
-    import os
-    import glob
-    from datetime import datetime
+                   level: str = None,
+                   file: str = None,
+                   before: int = None,
+                   since: str = None,
+                   until: str = None,
+                   stream: bool = False):
+    """获取系统日志（管理员专用）
+
+    从文件末尾反向读取，不再整文件读入内存；before 为翻页游标（取上一页返回的 next_before），
+    since/until 为时间范围，stream=true 时按时间正序流式返回该范围内的全部日志（纯文本）
+    """
+    from utils.log_reader import get_log_reader
 
     try:
-        log_with_user('info', f"查询系统日志，行数: {lines}, 级别: {level}", admin_user)
-
-        # 查找日志文件
-        log_files = glob.glob("logs/xianyu_*.log")
-        logger.info(f"找到日志文件: {log_files}")
-
-        if not log_files:
+        log_with_user('info', f"查询系统日志，文件: {file or '最新'}, 行数: {lines}, 级别: {level}, 游标: {before}", admin_user)
+        reader = get_log_reader()
+
+        if stream:
+            def iter_lines():
+                for entry in reader.iter_range(file, level=level, since=since, until=until):
+                    yield entry + "\n"
+            return StreamingResponse(iter_lines(), media_type='text/plain; charset=utf-8')
+
+        result = reader.read(file, lines=min(max(lines, 1), 5000), level=level,
+                             before=before, since=since, until=until)
+        if not result["log_file"]:
             logger.warning("未找到日志文件")
             return {"logs": [], "message": "未找到日志文件", "success": False}
 
-        # 获取最新的日志文件
-        latest_log_file = max(log_files, key=os.path.getctime)
-        logger.info(f"使用最新日志文件: {latest_log_file}")
-
-        logs = []
-        try:
-            with open(latest_log_file, 'r', encoding='utf-8') as f:
-                all_lines = f.readlines()
-                logger.info(f"读取到 {len(all_lines)} 行日志")
-
-                # 如果指定了日志级别，进行过滤
-                if level:
-                    filtered_lines = [line for line in all_lines if f"| {level.upper()} |" in line]
-                    logger.info(f"按级别 {level} 过滤后剩余 {len(filtered_lines)} 行")
-                else:
-                    filtered_lines = all_lines
-
-                # 获取最后N行
-                recent_lines = filtered_lines[-lines:] if len(filtered_lines) > lines else filtered_lines
-                logger.info(f"取最后 {len(recent_lines)} 行日志")
-
-                for line in recent_lines:
-                    logs.append(line.strip())
-
-        except Exception as e:
-            logger.error(f"读取日志文件失败: {str(e)}")
-            log_with_user('error', f"读取日志文件失败: {str(e)}", admin_user)
-            return {"logs": [], "message": f"读取日志文件失败: {str(e)}", "success": False}
-
-        log_with_user('info', f"返回日志记录 {len(logs)} 条", admin_user)
-        logger.info(f"成功返回 {len(logs)} 条日志记录")
-
+        log_with_user('info', f"返回日志记录 {len(result['logs'])} 条", admin_user)
         return {
-            "logs": logs,
-            "log_file": latest_log_file,
-            "total_lines": len(logs),
+            **result,
+            "total_lines": len(result["logs"]),
             "success": True
         }
 
+    except FileNotFoundError:
+        return {"logs": [], "message": "日志文件不存在", "success": False}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"获取系统日志失败: {str(e)}")
         log_with_user('error', f"获取系统日志失败: {str(e)}", admin_user)
@@ -4875,37 +5078,16 @@ def get_system_logs(admin_user: Dict[str, Any] = Depends(require_admin),
 
 @app.get('/admin/log-files')
 def list_log_files(admin_user: Dict[str, Any] = Depends(require_admin)):
-    """列出所有可用的系统日志文件"""
-    import os
-    import glob
+    """列出所有可用的系统日志文件（含轮转后的 .zip 归档）"""
     from datetime import datetime
+    from utils.log_reader import get_log_reader
 
     try:
         log_with_user('info', "查询日志文件列表", admin_user)
 
-        log_dir = "logs"
-        if not os.path.exists(log_dir):
-            logger.warning("日志目录不存在")
-            return {"success": True, "files": []}
-
-        log_pattern = os.path.join(log_dir, "xianyu_*.log")
-        log_files = glob.glob(log_pattern)
-
-        files_info = []
-        for file_path in log_files:
-            try:
-                stat_info = os.stat(file_path)
-                files_info.append({
-                    "name": os.path.basename(file_path),
-                    "size": stat_info.st_size,
-                    "modified_at": datetime.fromtimestamp(stat_info.st_mtime).isoformat(),
-                    "modified_ts": stat_info.st_mtime
-                })
-            except OSError as e:
-                logger.warning(f"读取日志文件信息失败 {file_path}: {e}")
-
-        # 按修改时间倒序排序
-        files_info.sort(key=lambda item: item.get("modified_ts", 0), reverse=True)
+        files_info = get_log_reader().list_files()
+        for item in files_info:
+            item["modified_at"] = datetime.fromtimestamp(item["modified_ts"]).isoformat()
 
         logger.info(f"返回日志文件列表，共 {len(files_info)} 个文件")
         return {"success": True, "files": files_info}
@@ -4955,7 +5137,7 @@ def export_log_file(file: str, admin_user: Dict[str, Any] = Depends(require_admi
         }
         return StreamingResponse(
             iter_file(target_path),
-            media_type='text/plain; charset=utf-8',
+            media_type='application/zip' if safe_name.endswith('.zip') else 'text/plain; charset=utf-8',
             headers=headers
         )
 
@@ -5013,6 +5195,144 @@ def get_system_stats(admin_user: Dict[str, Any] = Depends(require_admin)):
         log_with_user('error', f"获取系统统计信息失败: {str(e)}", admin_user)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get('/admin/browser-pool')
+def get_browser_pool_stats(admin_user: Dict[str, Any] = Depends(require_admin)):
+    """获取浏览器池状态（管理员专用）"""
+    try:
+        from utils.browser_pool import get_all_pool_stats, is_browser_pool_enabled
+        from utils.order_detail_provider import get_order_detail_provider_stats
+        from utils.single_flight import get_all_single_flight_stats
+        return {
+            "success": True,
+            "enabled": is_browser_pool_enabled(),
+            "pools": get_all_pool_stats(),
+            "order_detail_providers": get_order_detail_provider_stats(),
+            "single_flight": get_all_single_flight_stats(),
+        }
+    except Exception as e:
+        log_with_user('error', f"获取浏览器池状态失败: {str(e)}", admin_user)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get('/admin/health/accounts')
+def get_account_health(admin_user: Dict[str, Any] = Depends(require_admin)):
+    """获取各账号的连接状态、心跳和待处理消息数（管理员专用）"""
+    return {"success": True, "accounts": health_monitor.accounts()}
+
+@app.get('/admin/item-catalog')
+def get_item_catalog_stats(admin_user: Dict[str, Any] = Depends(require_admin)):
+    """获取商品详情分层缓存的各层命中率（管理员专用）"""
+    try:
+        from utils.item_catalog import get_item_catalog
+        return {"success": True, "stats": get_item_catalog().stats()}
+    except Exception as e:
+        log_with_user('error', f"获取商品目录统计失败: {str(e)}", admin_user)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get('/admin/reply-api')
+def get_reply_api_stats(admin_user: Dict[str, Any] = Depends(require_admin)):
+    """获取外部回复接口的耗时、缓存命中和熔断状态（管理员专用）"""
+    try:
+        from utils.reply_api_client import get_reply_api_client
+        return {"success": True, "stats": get_reply_api_client().stats()}
+    except Exception as e:
+        log_with_user('error', f"获取回复API统计失败: {str(e)}", admin_user)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get('/metrics')
+def get_metrics(format: str = 'prometheus', credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
+    """API耗时直方图与状态码计数
+
+    需要管理员token，或 Authorization: Bearer <API_METRICS.scrape_token>（供Prometheus抓取）；
+    format=json 时返回JSON。清零见 POST /metrics/reset（仅管理员）
+    """
+    scrape_token = api_metrics.scrape_token
+    user_info = verify_token(credentials)
+    is_admin = bool(user_info) and user_info['username'] == ADMIN_USERNAME
+    if not is_admin and not (scrape_token and credentials and secrets.compare_digest(credentials.credentials, scrape_token)):
+        raise HTTPException(status_code=401, detail="未授权访问")
+
+    if format == 'json':
+        return {"success": True, "metrics": api_metrics.snapshot()}
+    return Response(content=api_metrics.prometheus(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.post('/metrics/reset')
+def reset_metrics(admin_user: Dict[str, Any] = Depends(require_admin)):
+    """返回当前指标后清零（管理员专用，scrape_token 不能清零）"""
+    body = api_metrics.snapshot()
+    api_metrics.reset()
+    log_with_user('info', "API指标已清零", admin_user)
+    return {"success": True, "metrics": body}
+
+@app.get('/admin/http-cache')
+def get_http_cache_stats(admin_user: Dict[str, Any] = Depends(require_admin)):
+    """获取条件GET的304比例、响应缓存命中率和各表版本号（管理员专用）"""
+    try:
+        return {"success": True, "stats": http_cache.stats()}
+    except Exception as e:
+        log_with_user('error', f"获取HTTP缓存统计失败: {str(e)}", admin_user)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get('/admin/ai-stats')
+def get_ai_stats(admin_user: Dict[str, Any] = Depends(require_admin)):
+    """获取AI回复引擎运行统计（管理员专用）"""
+    try:
+        return {
+            "success": True,
+            "client_pool": ai_reply_engine.get_client_pool_stats(),
+            "reply_cache": ai_reply_engine.get_reply_cache_stats(),
+            "providers": ai_reply_engine.get_provider_stats(),
+            "governor": ai_reply_engine.get_governor_stats(),
+            "intent": ai_reply_engine.get_intent_stats(),
+            "prompt": ai_reply_engine.get_prompt_stats(),
+            "streaming": ai_reply_engine.get_streaming_stats(),
+        }
+    except Exception as e:
+        log_with_user('error', f"获取AI统计失败: {str(e)}", admin_user)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get('/admin/memory')
+def get_memory_report(admin_user: Dict[str, Any] = Depends(require_admin)):
+    """获取各账号及全局内存结构的条目数和近似字节数（管理员专用）"""
+    try:
+        from XianyuAutoAsync import XianyuLive
+        from order_status_handler import order_status_handler
+
+        accounts = {}
+        for cookie_id, instance in XianyuLive.get_all_instances().items():
+            try:
+                accounts[cookie_id] = instance.get_memory_report()
+            except Exception as e:
+                accounts[cookie_id] = {"cookie_id": cookie_id, "error": str(e)}
+
+        shared = {
+            "xianyu_live": XianyuLive.get_shared_memory_report(),
+            "ai_reply_engine": ai_reply_engine.get_memory_report(),
+            "order_status_handler": order_status_handler.get_memory_report(),
+        }
+
+        total_bytes = sum(report.get("total_approx_bytes", 0) for report in accounts.values())
+        for group in shared.values():
+            total_bytes += sum(item.get("approx_bytes", 0) for item in group.values())
+
+        try:
+            import psutil
+            rss = psutil.Process().memory_info().rss
+        except Exception:
+            rss = None
+
+        return {
+            "success": True,
+            "timestamp": time.time(),
+            "process_rss": rss,
+            "total_approx_bytes": total_bytes,
+            "accounts": accounts,
+            "shared": shared,
+        }
+
+    except Exception as e:
+        log_with_user('error', f"获取内存报告失败: {str(e)}", admin_user)
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ------------------------- 指定商品回复接口 -------------------------
 
 @app.get("/itemReplays")
@@ -5283,6 +5603,7 @@ async def upload_database_backup(admin_user: Dict[str, Any] = Depends(require_ad
         # 重新初始化数据库连接（使用原有的db_path）
         db_manager.__init__(db_manager.db_path)
         log_with_user('info', "数据库连接已重新初始化", admin_user)
+        ai_reply_engine.reset_conversation_states()
 
         # 验证新数据库
         try:
@@ -5358,8 +5679,13 @@ def list_backup_files(admin_user: Dict[str, Any] = Depends(require_admin)):
 # ------------------------- 数据管理接口 -------------------------
 
 @app.get('/admin/data/{table_name}')
-def get_table_data(table_name: str, admin_user: Dict[str, Any] = Depends(require_admin)):
-    """获取指定表的所有数据（管理员专用）"""
+def get_table_data(table_name: str, admin_user: Dict[str, Any] = Depends(require_admin),
+                   limit: int = None, cursor: str = None, fields: str = None, sort: str = None,
+                   order: str = None, filters: str = None):
+    """获取指定表的数据（管理员专用）
+
+    不带参数时返回全部数据；传 limit/cursor/fields/sort/filters（JSON对象，按列等值过滤）时在SQL中分页过滤
+    """
     from db_manager import db_manager
     try:
         log_with_user('info', f"查询表数据: {table_name}", admin_user)
@@ -5376,6 +5702,32 @@ def get_table_data(table_name: str, admin_user: Dict[str, Any] = Depends(require
             log_with_user('warning', f"尝试访问不允许的表: {table_name}", admin_user)
             raise HTTPException(status_code=400, detail="不允许访问该表")
 
+        if any(v is not None for v in (limit, cursor, fields, sort, order, filters)):
+            try:
+                filter_dict = json.loads(filters) if filters else {}
+            except json.JSONDecodeError:
+                raise ValueError("filters 必须是JSON对象")
+            if not isinstance(filter_dict, dict):
+                raise ValueError("filters 必须是JSON对象")
+            if any(isinstance(v, (dict, list)) for v in filter_dict.values()):
+                raise ValueError("filters 的值只能是字符串、数字、布尔值或null")
+            # 过滤列名可能与分页参数同名（如 limit），不能作为关键字参数传给 page_params
+            page = PageRequest(limit=limit, cursor=cursor, fields=fields, sort=sort, order=order, filters=filter_dict)
+            result = db_manager.get_table_data_page(table_name, page)
+            data = result["items"]
+            columns = result["columns"]
+
+            log_with_user('info', f"表 {table_name} 分页查询成功，本页 {len(data)} 条记录", admin_user)
+
+            return {
+                "success": True,
+                "data": data,
+                "columns": columns,
+                "count": len(data),
+                "next_cursor": result["next_cursor"],
+                "has_more": result["has_more"]
+            }
+
         # 获取表数据
         data, columns = db_manager.get_table_data(table_name)
 
@@ -5390,6 +5742,8 @@ def get_table_data(table_name: str, admin_user: Dict[str, Any] = Depends(require
 
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         log_with_user('error', f"查询表数据失败: {table_name} - {str(e)}", admin_user)
         raise HTTPException(status_code=500, detail=str(e))
@@ -5420,6 +5774,8 @@ def delete_table_record(table_name: str, record_id: str, admin_user: Dict[str, A
 
         # 删除记录
         success = db_manager.delete_table_record(table_name, record_id)
+        if success and table_name == 'ai_conversations':
+            ai_reply_engine.reset_conversation_states()
 
         if success:
             log_with_user('info', f"表记录删除成功: {table_name}.{record_id}", admin_user)
@@ -5462,6 +5818,9 @@ def clear_table_data(table_name: str, admin_user: Dict[str, Any] = Depends(requi
         # 清空表数据
         success = db_manager.clear_table_data(table_name)
 
+        if success and table_name in ('ai_conversations', 'cookies'):
+            ai_reply_engine.reset_conversation_states()
+
         if success:
             log_with_user('info', f"表数据清空成功: {table_name}", admin_user)
             return {"success": True, "message": "清空成功"}
@@ -5522,8 +5881,11 @@ def update_item_multi_quantity_delivery(cookie_id: str, item_id: str, delivery_d
 # ==================== 订单管理接口 ====================
 
 @app.get('/api/orders')
-def get_user_orders(current_user: Dict[str, Any] = Depends(get_current_user)):
-    """获取当前用户的订单信息"""
+def get_user_orders(current_user: Dict[str, Any] = Depends(get_current_user),
+                    limit: int = None, cursor: str = None, fields: str = None, sort: str = None,
+                    order: str = None, search: str = None, cookie_id: str = None, order_status: str = None,
+                    item_id: str = None):
+    """获取当前用户的订单信息（默认按创建时间倒序；传 limit/cursor 时按游标分页）"""
     try:
         from db_manager import db_manager
 
@@ -5533,21 +5895,19 @@ def get_user_orders(current_user: Dict[str, Any] = Depends(get_current_user)):
         # 获取用户的所有Cookie
         user_cookies = db_manager.get_all_cookies(user_id)
 
-        # 获取所有订单数据
-        all_orders = []
-        for cookie_id in user_cookies.keys():
-            orders = db_manager.get_orders_by_cookie(cookie_id, limit=1000)  # 增加限制数量
-            # 为每个订单添加cookie_id信息
-            for order in orders:
-                order['cookie_id'] = cookie_id
-                all_orders.append(order)
-
-        # 按创建时间倒序排列
-        all_orders.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        page = page_params(limit, cursor, fields, sort, order, search, cookie_id=cookie_id,
+                           order_status=order_status, item_id=item_id)
+        result = db_manager.get_orders_page(list(user_cookies.keys()), page)
+        all_orders = result["items"]
 
         log_with_user('info', f"用户订单查询成功，共 {len(all_orders)} 条记录", current_user)
-        return {"success": True, "data": all_orders}
+        response = {"success": True, "data": all_orders}
+        if page.paged:
+            response.update(next_cursor=result["next_cursor"], has_more=result["has_more"])
+        return response
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         log_with_user('error', f"查询用户订单失败: {str(e)}", current_user)
         raise HTTPException(status_code=500, detail=f"查询订单失败: {str(e)}")
@@ -132,9 +132,8 @@ function showSection(sectionName) {
     }
 
     // 如果切换到非日志页面，停止自动刷新
-    if (sectionName !== 'logs' && window.autoRefreshInterval) {
-    clearInterval(window.autoRefreshInterval);
-    window.autoRefreshInterval = null;
+    if (sectionName !== 'logs' && (window.autoRefreshInterval || window.logEventSource)) {
+    stopLogStream();
     const button = document.querySelector('#autoRefreshText');
     const icon = button?.previousElementSibling;
     if (button) {
@@ -231,6 +230,9 @@ async function loadDashboard() {
         // 更新仪表盘显示
         updateDashboardStats(accountsWithKeywords.length, totalKeywords, enabledAccounts);
         updateDashboardAccountsList(accountsWithKeywords);
+
+        // 加载AI调度状态（非管理员无权限时保持隐藏）
+        loadAIDispatchStatus();
     }
     } catch (error) {
     console.error('加载仪表盘数据失败:', error);
@@ -264,6 +266,55 @@ async function loadOrdersCount() {
     }
 }
 
+// 加载AI调度状态（排队与熔断）
+async function loadAIDispatchStatus() {
+    const card = document.getElementById('aiDispatchCard');
+    try {
+        const response = await fetch(`${apiBase}/admin/ai-stats`, {
+            headers: {
+                'Authorization': `Bearer ${authToken}`
+            }
+        });
+        if (!response.ok) {
+            card.style.display = 'none';
+            return;
+        }
+
+        const data = await response.json();
+        const governor = data.governor || {};
+        const providers = governor.providers || [];
+        const stateBadges = {
+            closed: '<span class="badge bg-success">正常</span>',
+            half_open: '<span class="badge bg-warning">探测恢复</span>',
+            open: '<span class="badge bg-danger">熔断</span>'
+        };
+
+        document.getElementById('aiDispatchSummary').textContent =
+            `排队 ${governor.queue_length || 0}/${governor.max_queue || 0}，已降级 ${(governor.shed_queue_full || 0) + (governor.shed_deadline || 0)} 次，熔断拒绝 ${governor.rejected_circuit || 0} 次`;
+
+        const tbody = document.getElementById('aiDispatchList');
+        if (providers.length === 0) {
+            tbody.innerHTML = '<tr><td colspan="5" class="text-center text-muted py-3">暂无AI请求</td></tr>';
+        } else {
+            tbody.innerHTML = providers.map(provider => {
+                const openInfo = provider.state === 'open' ? ` <small class="text-muted">${provider.open_remaining_seconds}秒后重试</small>` : '';
+                return `
+                <tr>
+                    <td>${escapeHtml(provider.name)}</td>
+                    <td>${provider.active}/${provider.limit}</td>
+                    <td>${provider.waiting}</td>
+                    <td>${stateBadges[provider.state] || provider.state}${openInfo}</td>
+                    <td>${provider.latency_ewma_ms}ms</td>
+                </tr>`;
+            }).join('');
+        }
+        card.style.display = 'block';
+    } catch (error) {
+        console.error('加载AI调度状态失败:', error);
+        card.style.display = 'none';
+    }
+}
+
 // 更新仪表盘统计数据
 function updateDashboardStats(totalAccounts, totalKeywords, enabledAccounts) {
     document.getElementById('totalAccounts').textContent = totalAccounts;
@@ -2358,6 +2409,13 @@ async function configAIReply(accountId) {
     document.getElementById('maxDiscountAmount').value = settings.max_discount_amount;
     document.getElementById('maxBargainRounds').value = settings.max_bargain_rounds;
     document.getElementById('customPrompts').value = settings.custom_prompts;
+    document.getElementById('intentKeywords').value = settings.intent_keywords || '';
+    document.getElementById('aiReplyCacheEnabled').checked = !!settings.reply_cache_enabled;
+    document.getElementById('aiLatencyBudget').value = settings.latency_budget_ms || 30000;
+    document.getElementById('aiHedgeDelay').value = settings.hedge_delay_ms || 0;
+    document.getElementById('aiFallbackModelName').value = settings.fallback_model_name || '';
+    document.getElementById('aiFallbackBaseUrl').value = settings.fallback_base_url || '';
+    document.getElementById('aiFallbackApiKey').value = settings.fallback_api_key || '';
 
     // 切换设置显示状态
     toggleAIReplySettings();
@@ -2417,6 +2475,17 @@ async function saveAIReplyConfig() {
             return;
         }
         }
+
+        // 验证自定义意图关键词格式
+        const intentKeywords = document.getElementById('intentKeywords').value.trim();
+        if (intentKeywords) {
+        try {
+            JSON.parse(intentKeywords);
+        } catch (e) {
+            showToast('自定义意图关键词格式错误，请检查JSON格式', 'warning');
+            return;
+        }
+        }
     }
 // 获取模型名称
     let modelName = document.getElementById('aiModelName').value;
@@ -2437,7 +2506,14 @@ async function saveAIReplyConfig() {
         max_discount_percent: parseInt(document.getElementById('maxDiscountPercent').value),
         max_discount_amount: parseInt(document.getElementById('maxDiscountAmount').value),
         max_bargain_rounds: parseInt(document.getElementById('maxBargainRounds').value),
-        custom_prompts: document.getElementById('customPrompts').value
+        custom_prompts: document.getElementById('customPrompts').value,
+        intent_keywords: document.getElementById('intentKeywords').value.trim(),
+        reply_cache_enabled: document.getElementById('aiReplyCacheEnabled').checked,
+        latency_budget_ms: parseInt(document.getElementById('aiLatencyBudget').value) || 30000,
+        hedge_delay_ms: parseInt(document.getElementById('aiHedgeDelay').value) || 0,
+        fallback_model_name: document.getElementById('aiFallbackModelName').value.trim(),
+        fallback_base_url: document.getElementById('aiFallbackBaseUrl').value.trim(),
+        fallback_api_key: document.getElementById('aiFallbackApiKey').value
     };
 
     // 保存设置
@@ -6779,22 +6855,73 @@ function toggleAutoRefresh() {
     const button = document.querySelector('#autoRefreshText');
     const icon = button.previousElementSibling;
 
-    if (window.autoRefreshInterval) {
+    if (window.autoRefreshInterval || window.logEventSource) {
     // 停止自动刷新
-    clearInterval(window.autoRefreshInterval);
-    window.autoRefreshInterval = null;
+    stopLogStream();
     button.textContent = '开启自动刷新';
     icon.className = 'bi bi-play-circle me-1';
     showToast('自动刷新已停止', 'info');
     } else {
-    // 开启自动刷新
-    window.autoRefreshInterval = setInterval(refreshLogs, 5000); // 每5秒刷新一次
+    // 先加载一次当前日志，之后由服务端推送新日志
+    refreshLogs();
+    if (window.EventSource) {
+        startLogStream();
+        showToast('实时日志推送已开启', 'success');
+    } else {
+        // 浏览器不支持SSE时退回轮询
+        window.autoRefreshInterval = setInterval(refreshLogs, 5000);
+        showToast('自动刷新已开启（每5秒）', 'success');
+    }
     button.textContent = '停止自动刷新';
     icon.className = 'bi bi-pause-circle me-1';
-    showToast('自动刷新已开启（每5秒）', 'success');
+    }
+}
 
-    // 立即刷新一次
-    refreshLogs();
+// 订阅服务端实时日志推送（SSE）
+function startLogStream() {
+    const source = new EventSource(`${apiBase}/logs/stream?token=${encodeURIComponent(authToken)}`);
+    let renderPending = false;
+
+    source.onmessage = (event) => {
+    const log = JSON.parse(event.data);
+    const logLinesElement = document.getElementById('logLines');
+    const maxLogs = parseInt(logLinesElement ? logLinesElement.value : 200, 10) || 200;
+
+    window.allLogs.push(log);
+    if (window.allLogs.length > maxLogs) {
+        window.allLogs.splice(0, window.allLogs.length - maxLogs);
+    }
+    window.filteredLogs = window.allLogs;
+
+    // 日志密集时合并到下一帧统一渲染
+    if (!renderPending) {
+        renderPending = true;
+        requestAnimationFrame(() => {
+        renderPending = false;
+        displayLogs();
+        updateLogStats();
+        });
+    }
+    };
+
+    source.onerror = () => {
+    // EventSource 会自动重连并带上 Last-Event-ID；连接被关闭（如token失效）时停止
+    if (source.readyState === EventSource.CLOSED) {
+        stopLogStream();
+    }
+    };
+
+    window.logEventSource = source;
+}
+
+function stopLogStream() {
+    if (window.logEventSource) {
+    window.logEventSource.close();
+    window.logEventSource = null;
+    }
+    if (window.autoRefreshInterval) {
+    clearInterval(window.autoRefreshInterval);
+    window.autoRefreshInterval = null;
     }
 }
 
@@ -7046,7 +7173,7 @@ async function importKeywords() {
         // 重新加载关键词列表
         loadAccountKeywords(currentCookieId);
 
-        showToast(`导入成功！新增: ${result.added}, 更新: ${result.updated}`, 'success');
+        showToast(`导入成功！新增: ${result.added}, 更新: ${result.updated}, 删除: ${result.deleted || 0}, 未变: ${result.unchanged || 0}`, 'success');
         }, 500);
     } else {
         const error = await response.json();
@@ -0,0 +1,26 @@
+"""
+测试公共配置：把项目根目录加入 sys.path，并让模块级的 db_manager 使用临时数据库
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# 必须在导入 db_manager 之前设置，避免测试写入 data/xianyu_data.db
+os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(prefix='xianyu-test-'), 'xianyu_data.db'))
+
+
+@pytest.fixture
+def db(tmp_path):
+    """独立的临时数据库"""
+    from db_manager import DBManager
+
+    manager = DBManager(str(tmp_path / 'test.db'))
+    yield manager
+    manager.conn.close()
@@ -0,0 +1,74 @@
+"""账号列表：每个请求的SQL条数与账号数量无关，所属用户记录缺失的Cookie不被丢弃"""
+
+import pytest
+
+import cookie_manager
+import db_manager as db_module
+
+
+class _StubCookieManager:
+    def get_cookie_status(self, cookie_id):
+        return True
+
+
+def _seed(db, accounts: int):
+    """创建一个用户及其 accounts 个账号（每个账号都有AI设置），返回用户ID"""
+    db.create_user(f'u{accounts}', f'u{accounts}@example.com', 'pw')
+    user_id = db.get_user_by_username(f'u{accounts}')['id']
+    for index in range(accounts):
+        cookie_id = f'u{accounts}-c{index}'
+        db.save_cookie(cookie_id, f'value-{index}', user_id)
+        db.save_ai_reply_settings(cookie_id, {'ai_enabled': True, 'model_name': 'qwen-plus'})
+    return user_id
+
+
+@pytest.fixture
+def statements(db, monkeypatch):
+    """把 reply_server 使用的 db_manager 换成临时数据库，并统计执行的SQL条数"""
+    executed = []
+    original = db._execute_sql
+
+    def counting(cursor, sql, params=None):
+        executed.append(sql)
+        return original(cursor, sql, params)
+
+    monkeypatch.setattr(db, '_execute_sql', counting)
+    monkeypatch.setattr(db_module, 'db_manager', db)
+    monkeypatch.setattr(cookie_manager, 'manager', _StubCookieManager())
+    return executed
+
+
+def _count(executed, func, *args, **kwargs):
+    executed.clear()
+    result = func(*args, **kwargs)
+    return len(executed), result
+
+
+def test_query_count_independent_of_account_count(db, statements):
+    import reply_server
+
+    one, many = _seed(db, 1), _seed(db, 25)
+    admin = {'user_id': 1, 'username': 'admin'}
+
+    for user_id, accounts in ((one, 1), (many, 25)):
+        user = {'user_id': user_id, 'username': f'u{accounts}'}
+        count, details = _count(statements, reply_server.get_cookies_details, current_user=user)
+        assert (count, len(details)) == (1, accounts)
+        count, settings = _count(statements, reply_server.get_all_ai_reply_settings, current_user=user)
+        assert (count, len(settings)) == (1, accounts)
+
+    count, result = _count(statements, reply_server.get_admin_cookies, admin_user=admin)
+    assert count == 1
+    assert len(result['cookies']) == 26
+
+
+def test_cookie_without_owner_row_is_kept(db):
+    user_id = _seed(db, 2)
+    db.save_cookie('orphan', 'orphan-value', 9999)
+
+    assert [item['id'] for item in db.get_all_cookie_details(9999)] == ['orphan']
+    details = {item['id']: item for item in db.get_all_cookie_details()}
+    assert set(details) == {'u2-c0', 'u2-c1', 'orphan'}
+    assert details['orphan']['owner_username'] == ''
+    assert details['u2-c0']['owner_username'] == 'u2'
+    assert details['u2-c0']['user_id'] == user_id
@@ -0,0 +1,77 @@
+"""AI请求调度器：熔断打开/半开时排队请求的处理"""
+
+import asyncio
+
+import pytest
+
+from utils.ai_governor import AIDispatchRejected, AIGovernor
+
+
+async def _hold(governor, provider, account, started: asyncio.Event, finish: asyncio.Event, fail: bool = False):
+    async with governor.slot(provider, account):
+        started.set()
+        await finish.wait()
+        if fail:
+            raise RuntimeError('upstream error')
+
+
+def test_queued_waiters_rejected_when_failure_opens_circuit():
+    async def scenario():
+        governor = AIGovernor(provider_concurrency=1, failure_threshold=1, open_seconds=30)
+        started, finish = asyncio.Event(), asyncio.Event()
+        leader = asyncio.create_task(_hold(governor, 'p', 'a1', started, finish, fail=True))
+        await started.wait()
+
+        entered = []
+
+        async def queued(account):
+            async with governor.slot('p', account):
+                entered.append(account)
+
+        waiters = [asyncio.create_task(queued(f"b{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        assert governor.stats()['queue_length'] == 3
+
+        finish.set()
+        with pytest.raises(RuntimeError):
+            await leader
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert entered == []
+        assert all(isinstance(r, AIDispatchRejected) and r.reason == 'circuit_open' for r in results)
+        stats = governor.stats()
+        assert stats['queue_length'] == 0
+        assert stats['providers'][0]['active'] == 0
+
+    asyncio.run(scenario())
+
+
+def test_half_open_wakes_only_one_probe():
+    async def scenario():
+        governor = AIGovernor(provider_concurrency=2, account_concurrency=5, failure_threshold=1, open_seconds=30)
+        state = governor._provider('p')
+        state.state, state.open_until = 'half_open', 0
+
+        started, finish = asyncio.Event(), asyncio.Event()
+        blocker = asyncio.create_task(_hold(governor, 'other', 'a1', started, finish))
+        await started.wait()
+
+        # 占满 a1 的账号并发，让后续请求排队
+        governor.account_concurrency = 1
+        entered = []
+
+        async def queued():
+            async with governor.slot('p', 'a1'):
+                entered.append(1)
+                await asyncio.sleep(0.01)
+
+        probe = asyncio.create_task(queued())
+        await asyncio.sleep(0)
+        assert state.probe_in_flight  # 排队的第一个请求即探测请求
+        finish.set()
+        await blocker
+        await probe
+        assert entered == [1]
+        assert state.state == 'closed'
+
+    asyncio.run(scenario())
+
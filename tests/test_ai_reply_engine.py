@@ -0,0 +1,91 @@
+"""AI回复引擎：同一对话按 chat_id 串行，出锁后发现有更新的用户消息时跳过当前消息"""
+
+import asyncio
+import time
+
+import pytest
+
+import ai_reply_engine as engine_module
+import db_manager as db_module
+
+
+@pytest.fixture
+def engine(db, monkeypatch):
+    """使用临时数据库的引擎，大模型调用只做记录"""
+    db.create_user('u1', 'u1@example.com', 'pw')
+    db.save_cookie('c1', 'value', db.get_user_by_username('u1')['id'])
+    db.save_ai_reply_settings('c1', {'ai_enabled': True, 'api_key': 'k', 'model_name': 'm', 'base_url': 'http://llm'})
+    monkeypatch.setattr(db_module, 'db_manager', db)
+    monkeypatch.setattr(engine_module, 'db_manager', db)
+
+    instance = engine_module.AIReplyEngine()
+    instance.llm_calls = []
+
+    async def call_llm(cookie_id, settings, messages, *args):
+        instance.llm_calls.append(messages[-1]['content'].rsplit('用户消息：', 1)[1].split('\n', 1)[0])
+        return f"回复{len(instance.llm_calls)}"
+
+    instance._call_llm = call_llm
+    yield instance
+    instance._db_executor.shutdown(wait=True)
+
+
+def _contents(engine, chat_id):
+    return [(turn['role'], turn['content']) for turn in engine.get_conversation_context(chat_id, 'c1')]
+
+
+async def _wait_saved(engine, chat_id, count):
+    """等待引擎在锁外保存完用户消息"""
+    deadline = time.monotonic() + 5
+    while len(_contents(engine, chat_id)) < count:
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+def _save_newer(engine, db, chat_id, content):
+    """写入一条创建时间晚于当前时刻的用户消息（CURRENT_TIMESTAMP 只精确到秒）"""
+    created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() + 2))
+    with db.lock:
+        db.conn.execute('INSERT INTO ai_conversations (cookie_id, chat_id, user_id, item_id, role, content, created_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)', ('c1', chat_id, 'buyer', 'item-1', 'user', content, created_at))
+        db.conn.commit()
+    engine._conversations.append('c1', chat_id, 'user', content, None, created_at)
+
+
+def test_same_chat_waits_for_lock_other_chats_do_not(engine):
+    async def run():
+        async with engine._get_chat_lock('chat-1'):
+            blocked = asyncio.create_task(
+                engine.generate_reply_async('在吗', {}, 'chat-1', 'c1', 'buyer', 'item-1', skip_wait=True))
+            other = await engine.generate_reply_async('你好', {}, 'chat-2', 'c1', 'buyer', 'item-1', skip_wait=True)
+            await _wait_saved(engine, 'chat-1', 1)
+            await asyncio.sleep(0.05)
+            assert not blocked.done()
+            assert engine.llm_calls == ['你好']
+        return other, await blocked
+
+    assert asyncio.run(run()) == ('回复1', '回复2')
+    assert engine.llm_calls == ['你好', '在吗']
+    assert _contents(engine, 'chat-1') == [('user', '在吗'), ('assistant', '回复2')]
+
+
+def test_newer_message_skips_current(engine, db):
+    async def run():
+        async with engine._get_chat_lock('chat-1'):
+            first = asyncio.create_task(
+                engine.generate_reply_async('在吗', {}, 'chat-1', 'c1', 'buyer', 'item-1', skip_wait=True))
+            await _wait_saved(engine, 'chat-1', 1)
+            # 等锁期间买家又发了一条
+            _save_newer(engine, db, 'chat-1', '多少钱')
+        return await first
+
+    assert asyncio.run(run()) is None
+    assert engine.llm_calls == []
+    assert _contents(engine, 'chat-1') == [('user', '在吗'), ('user', '多少钱')]
+
+
+def test_disabled_account_returns_none_without_saving(engine, db):
+    db.save_ai_reply_settings('c1', {'ai_enabled': False})
+    assert asyncio.run(engine.generate_reply_async('在吗', {}, 'chat-1', 'c1', 'buyer', 'item-1', skip_wait=True)) is None
+    assert engine.llm_calls == []
+    assert _contents(engine, 'chat-1') == []
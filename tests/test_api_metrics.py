@@ -0,0 +1,81 @@
+"""API指标：按路由模板归类、Prometheus文本输出，清零只允许管理员"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import reply_server
+from utils.api_metrics import APIMetrics
+
+SCRAPE = {'Authorization': 'Bearer scrape-secret'}
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    instance = APIMetrics(sample_rate=0, buckets=(10, 100), scrape_token='scrape-secret')
+    monkeypatch.setattr(reply_server, 'api_metrics', instance)
+    yield instance
+    reply_server.app.dependency_overrides.clear()
+
+
+def _routes(metrics):
+    return {(r['method'], r['route']): r['statuses'] for r in metrics.snapshot()['routes']}
+
+
+def test_requests_attributed_to_route_template(metrics):
+    client = TestClient(reply_server.app)
+    client.get('/keywords/c1')
+    client.get('/keywords/c2')
+    client.get('/no-such-path/1')
+    client.get('/no-such-path/2')
+
+    assert _routes(metrics) == {
+        ('GET', '/keywords/{cid}'): {'401': 2},
+        ('GET', '<unmatched>'): {'404': 2},
+    }
+
+
+def test_prometheus_output(metrics):
+    metrics.record('GET', '/keywords/{cid}', 200, 5)
+    metrics.record('GET', '/keywords/{cid}', 200, 50)
+    metrics.record('GET', '/keywords/{cid}', 500, 500)
+    metrics.record('GET', 'a"b', 200, 1)
+
+    client = TestClient(reply_server.app)
+    assert client.get('/metrics').status_code == 401
+    response = client.get('/metrics', headers=SCRAPE)
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    lines = response.text.splitlines()
+    labels = 'method="GET",route="/keywords/{cid}"'
+    for line in (
+        '# TYPE http_request_duration_seconds histogram',
+        f'http_request_duration_seconds_bucket{{{labels},le="0.01"}} 1',
+        f'http_request_duration_seconds_bucket{{{labels},le="0.1"}} 2',
+        f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3',
+        f'http_request_duration_seconds_sum{{{labels}}} 0.555000',
+        f'http_request_duration_seconds_count{{{labels}}} 3',
+        f'http_requests_total{{{labels},status="200"}} 2',
+        f'http_requests_total{{{labels},status="500"}} 1',
+        'http_request_duration_seconds_count{method="GET",route="a\\"b"} 1',
+    ):
+        assert line in lines
+
+    body = client.get('/metrics', params={'format': 'json'}, headers=SCRAPE).json()
+    assert body['metrics']['routes'][0]['count'] == 3
+
+
+def test_reset_requires_admin(metrics):
+    metrics.record('GET', '/items', 200, 5)
+    client = TestClient(reply_server.app)
+
+    # 抓取token只能读取，GET 上的 reset 参数不再生效
+    client.get('/metrics', params={'reset': 'true'}, headers=SCRAPE)
+    assert client.post('/metrics/reset', headers=SCRAPE).status_code == 401
+    assert ('GET', '/items') in _routes(metrics)
+
+    reply_server.app.dependency_overrides[reply_server.require_admin] = lambda: {'user_id': 1, 'username': 'admin'}
+    response = client.post('/metrics/reset')
+    assert response.status_code == 200
+    assert '/items' in [r['route'] for r in response.json()['metrics']['routes']]
+    # 清零后只剩清零请求本身（中间件在响应后记录）
+    assert list(_routes(metrics)) == [('POST', '/metrics/reset')]
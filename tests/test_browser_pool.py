@@ -0,0 +1,147 @@
+"""浏览器池：回收与启动的并发、损坏上下文的关闭（使用假的 Playwright 对象）"""
+
+import asyncio
+
+from utils.browser_pool import BrowserPool
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+    async def goto(self, url):
+        pass
+
+    async def set_extra_http_headers(self, headers):
+        pass
+
+
+class FakeContext:
+    def __init__(self):
+        self.closed = False
+
+    async def add_cookies(self, cookies):
+        pass
+
+    async def clear_cookies(self):
+        pass
+
+    async def new_page(self):
+        return FakePage()
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.contexts = []
+
+    def is_connected(self):
+        return self.connected
+
+    def on(self, event, callback):
+        pass
+
+    async def new_context(self, **kwargs):
+        context = FakeContext()
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.connected = False
+
+
+class FakeChromium:
+    def __init__(self, gate: asyncio.Event = None):
+        self.gate = gate
+        self.browsers = []
+
+    async def launch(self, **kwargs):
+        if self.gate is not None:
+            await self.gate.wait()
+        browser = FakeBrowser()
+        self.browsers.append(browser)
+        return browser
+
+
+class FakePlaywright:
+    def __init__(self, chromium):
+        self.chromium = chromium
+        self.stopped = False
+
+    async def stop(self):
+        self.stopped = True
+
+
+def _pool_with(playwright) -> BrowserPool:
+    pool = BrowserPool(reap_interval=3600)
+
+    async def ensure():
+        if pool._playwright is None:
+            pool._playwright = playwright
+        return pool._playwright
+
+    pool._ensure_playwright = ensure
+    return pool
+
+
+def test_reaper_does_not_stop_playwright_during_launch():
+    async def scenario():
+        gate = asyncio.Event()
+        playwright = FakePlaywright(FakeChromium(gate))
+        pool = _pool_with(playwright)
+
+        getting = asyncio.create_task(pool._get_context('acc', 'a=1', True))
+        await asyncio.sleep(0)  # _get_context 持有锁并等待浏览器启动
+        reaping = asyncio.create_task(pool._reap_once())
+        await asyncio.sleep(0)
+        assert not reaping.done()
+
+        gate.set()
+        await getting
+        assert await reaping is False
+        assert not playwright.stopped
+        assert pool._playwright is playwright
+
+    asyncio.run(scenario())
+
+
+def test_reaper_stops_playwright_when_empty():
+    async def scenario():
+        playwright = FakePlaywright(FakeChromium())
+        pool = _pool_with(playwright)
+        await pool._ensure_playwright()
+        assert await pool._reap_once() is True
+        assert playwright.stopped
+        assert pool._playwright is None
+
+    asyncio.run(scenario())
+
+
+def test_broken_context_is_closed():
+    async def scenario():
+        chromium = FakeChromium()
+        pool = _pool_with(FakePlaywright(chromium))
+        try:
+            async with pool.page('acc', 'a=1'):
+                raise RuntimeError('Target closed')
+        except RuntimeError:
+            pass
+        assert pool._closing
+        await asyncio.gather(*pool._closing)
+        context = chromium.browsers[0].contexts[0]
+        assert context.closed
+        assert pool._contexts == {}
+        assert chromium.browsers[0].connected  # 浏览器仍保留供其它账号使用
+        assert not pool._closing
+        await pool.close()
+
+    asyncio.run(scenario())
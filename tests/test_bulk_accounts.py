@@ -0,0 +1,142 @@
+"""账号批量操作：单事务写入、无权限账号单独报错、任务按队列启停并在出队时复核状态"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import cookie_manager as cm_module
+import db_manager as db_module
+from config import config
+
+
+def _wait(predicate, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+@pytest.fixture
+def setup(db, loop, monkeypatch):
+    """两个用户：u1 拥有 a、b、c，u2 拥有 x；CookieManager 的任务启停只做记录"""
+    for name in ('u1', 'u2'):
+        db.create_user(name, f'{name}@example.com', 'pw')
+    owner = db.get_user_by_username('u1')['id']
+    other = db.get_user_by_username('u2')['id']
+    for cid in ('a', 'b', 'c'):
+        db.save_cookie(cid, f'value-{cid}', owner)
+    db.save_cookie('x', 'value-x', other)
+
+    monkeypatch.setattr(db_module, 'db_manager', db)
+    monkeypatch.setattr(cm_module, 'db_manager', db)
+    manager = cm_module.CookieManager(loop)
+    calls = []
+
+    async def start(cookie_id):
+        calls.append(('start', cookie_id))
+        return True
+
+    async def stop(cookie_id):
+        calls.append(('stop', cookie_id))
+        return True
+
+    manager._start_task_async = start
+    manager._stop_task_async = stop
+    monkeypatch.setattr(cm_module, 'manager', manager)
+
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    yield manager, calls, statements, owner
+    db.conn.set_trace_callback(None)
+
+
+@pytest.fixture
+def client(setup, monkeypatch):
+    import reply_server
+
+    manager, calls, statements, owner = setup
+    monkeypatch.setitem(config._config, 'BULK_ACCOUNTS', {'max_batch': 10, 'task_interval': 0})
+    reply_server.app.dependency_overrides[reply_server.get_current_user] = lambda: {'user_id': owner, 'username': 'u1'}
+    yield TestClient(reply_server.app)
+    reply_server.app.dependency_overrides.clear()
+
+
+def _writes(statements):
+    """本次请求中的写事务数和写入语句"""
+    commits = sum(1 for sql in statements if sql.strip().upper() == 'COMMIT')
+    writes = [sql for sql in statements if sql.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))]
+    return commits, writes
+
+
+def test_non_owned_ids_fail_without_aborting_batch(setup, client):
+    manager, calls, statements, owner = setup
+    statements.clear()
+    response = client.post('/cookies/batch', json={'cookie_ids': ['a', 'x', 'missing', 'b', 'a'],
+                                                    'operation': 'pause_duration', 'pause_duration': 5})
+    body = response.json()
+    assert response.status_code == 200
+    assert [(r['cookie_id'], r['success']) for r in body['results']] == [
+        ('a', True), ('x', False), ('missing', False), ('b', True)]
+    assert (body['succeeded'], body['failed'], body['success']) == (2, 2, False)
+
+    commits, writes = _writes(statements)
+    assert commits == 1
+    assert len(writes) == 2 and all('pause_duration' in sql for sql in writes)
+    db = db_module.db_manager
+    assert [db.get_cookie_details(cid)['pause_duration'] for cid in ('a', 'b', 'c', 'x')] == [5, 5, 10, 10]
+
+
+def test_disable_batch_single_transaction_and_queue_drains(setup, client):
+    manager, calls, statements, owner = setup
+    statements.clear()
+    body = client.post('/cookies/batch', json={'cookie_ids': ['a', 'b', 'x'], 'operation': 'disable'}).json()
+    assert [r.get('task') for r in body['results']] == ['stop', 'stop', None]
+    assert _writes(statements)[0] == 1
+    assert _wait(lambda: manager.pending_task_changes == 0)
+    assert sorted(calls) == [('stop', 'a'), ('stop', 'b')]
+    assert db_module.db_manager.get_cookie_status('a') is False
+    assert db_module.db_manager.get_cookie_status('x') is True
+
+    # 状态未变化的账号不再排队
+    body = client.post('/cookies/batch', json={'cookie_ids': ['a'], 'operation': 'disable'}).json()
+    assert body['results'][0]['task'] == 'unchanged'
+
+
+def test_status_rechecked_when_queue_drains(setup):
+    manager, calls, statements, owner = setup
+    results = manager.update_cookie_status_batch(['a', 'b', 'c', 'nope'], False, interval=0.3)
+    assert results == {'a': 'stop', 'b': 'stop', 'c': 'stop', 'nope': 'not_found'}
+    assert manager.pending_task_changes >= 2  # 第一个可能已经出队
+    # 排队期间 b 又被重新启用：出队时以当前状态为准，不再停止
+    manager.cookie_status['b'] = True
+    assert _wait(lambda: manager.pending_task_changes == 0)
+    assert calls == [('stop', 'a'), ('stop', 'c')]
+
+
+def test_pending_counter_survives_concurrent_updates(setup):
+    manager = setup[0]
+    threads = [threading.Thread(target=lambda: [manager._add_pending_task_changes(1) for _ in range(10000)])
+               for _ in range(4)]
+    threads += [threading.Thread(target=lambda: [manager._add_pending_task_changes(-1) for _ in range(10000)])
+                for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert manager.pending_task_changes == 0
@@ -0,0 +1,114 @@
+"""条件GET：按表版本号计算的ETag在写入后改变、按用户区分，处理期间有写入的响应不缓存"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import db_manager as db_module
+import reply_server
+from utils.conditional_get import ConditionalGetCache
+
+USERS = {'token-1': {'user_id': 1}, 'token-2': {'user_id': 2}}
+
+
+@pytest.fixture
+def setup(db, monkeypatch):
+    """挂载 reply_server.conditional_get 中间件的最小应用，/keywords/{cid} 依赖 keywords 表"""
+    cache = ConditionalGetCache(db_module.table_versions)
+    cache.register('/keywords/{cid}', ('keywords',))
+    monkeypatch.setattr(reply_server, 'http_cache', cache)
+    monkeypatch.setattr(reply_server, '_verify_token_value', USERS.get)
+
+    app = FastAPI()
+    app.middleware('http')(reply_server.conditional_get)
+    calls = []
+
+    @app.get('/keywords/{cid}')
+    def get_keywords(cid: str, write: str = ''):
+        calls.append(cid)
+        keywords = db.get_keywords(cid)
+        if write and write not in [row[0] for row in keywords]:
+            db.save_keywords(cid, keywords + [(write, 'reply')])
+        response = JSONResponse([list(row) for row in keywords])
+        response.set_cookie('a', '1')
+        response.set_cookie('b', '2')
+        return response
+
+    db.save_keywords('c1', [('价格', '不议价')])
+    return TestClient(app), cache, calls, db
+
+
+def _get(client, token='token-1', url='/keywords/c1', etag=None):
+    headers = {'Authorization': f'Bearer {token}'}
+    if etag:
+        headers['If-None-Match'] = etag
+    return client.get(url, headers=headers)
+
+
+def test_matching_if_none_match_returns_304(setup):
+    client, cache, calls, db = setup
+    response = _get(client)
+    assert response.status_code == 200 and response.json() == [['价格', '不议价']]
+    etag = response.headers['etag']
+
+    response = _get(client, etag=etag)
+    assert response.status_code == 304 and response.content == b''
+    assert response.headers['etag'] == etag
+    assert calls == ['c1']
+    assert cache.stats()['not_modified'] == 1
+
+
+def test_write_through_db_manager_changes_etag(setup):
+    client, cache, calls, db = setup
+    etag = _get(client).headers['etag']
+    db.save_keywords('c1', [('价格', '可以小刀')])
+
+    response = _get(client, etag=etag)
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+    assert response.json() == [['价格', '可以小刀']]
+    assert calls == ['c1', 'c1']
+
+
+def test_etag_differs_per_user(setup):
+    client, cache, calls, db = setup
+    etag = _get(client, 'token-1').headers['etag']
+    response = _get(client, 'token-2', etag=etag)
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+    # 另一用户也不会命中第一个用户缓存的响应体
+    assert calls == ['c1', 'c1']
+
+
+def test_cached_body_served_until_write(setup):
+    client, cache, calls, db = setup
+    first = _get(client)
+    second = _get(client)
+    assert second.json() == first.json()
+    assert calls == ['c1']
+    assert cache.stats()['cache_hits'] == 1
+
+
+def test_write_during_handler_is_not_cached(setup):
+    client, cache, calls, db = setup
+    response = _get(client, url='/keywords/c1?write=新词')
+    assert response.status_code == 200
+    assert response.json() == [['价格', '不议价']]
+    stats = cache.stats()
+    assert (stats['changed_during_request'], stats['stored']) == (1, 0)
+
+    # 请求开始时的ETag已经过期，再次请求会重新执行接口拿到新数据
+    response = _get(client, url='/keywords/c1?write=新词', etag=response.headers['etag'])
+    assert response.status_code == 200
+    assert response.json() == [['价格', '不议价'], ['新词', 'reply']]
+    assert cache.stats()['stored'] == 1
+
+
+def test_repeated_headers_are_preserved(setup):
+    client, cache, calls, db = setup
+    response = _get(client)
+    cookies = [value for key, value in response.headers.multi_items() if key == 'set-cookie']
+    assert len(cookies) == 2
+    assert response.headers['cache-control'] == 'private, no-cache'
+    assert response.headers['content-type'] == 'application/json'
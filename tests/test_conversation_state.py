@@ -0,0 +1,93 @@
+"""AI对话状态：首次使用时从 ai_conversations 冷加载，之后只在内存中追加，不再查询数据库"""
+
+import time
+
+import pytest
+
+import ai_reply_engine as engine_module
+import db_manager as db_module
+from utils.conversation_state import ConversationStateStore
+
+
+@pytest.fixture
+def store(db, monkeypatch):
+    monkeypatch.setattr(db_module, 'db_manager', db)
+    return ConversationStateStore(max_size=10, ttl=3600, max_turns=4)
+
+
+def _insert(db, rows, chat_id='chat-1'):
+    """rows: [(role, content, intent)]，创建时间按顺序递增"""
+    base = time.time() - 600
+    with db.lock:
+        for index, (role, content, intent) in enumerate(rows):
+            created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(base + index))
+            db.conn.execute('INSERT INTO ai_conversations (cookie_id, chat_id, user_id, item_id, role, content, intent, '
+                            'created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            ('c1', chat_id, 'buyer', 'item-1', role, content, intent, created_at))
+        db.conn.commit()
+
+
+def _selects(db, action):
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    try:
+        action()
+    finally:
+        db.conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+
+
+def test_cold_load_reads_latest_turns_and_full_bargain_count(db, store):
+    _insert(db, [('user', '能便宜吗', 'price'), ('assistant', '不行', 'price'), ('user', '再便宜点', 'price'),
+                 ('assistant', '最低95', 'price'), ('user', '90行吗', 'price'), ('assistant', '好吧', 'price')])
+    _insert(db, [('user', '别的对话', 'price')], chat_id='chat-2')
+
+    state = store.get('c1', 'chat-1')
+    # 环形缓冲只保留最近 max_turns 轮，议价次数按全量历史统计
+    assert [content for _, content, _, _, _ in state.turns] == ['再便宜点', '最低95', '90行吗', '好吧']
+    assert state.bargain_count == 3
+    assert store.counters['cold_loads'] == 1
+
+    assert _selects(db, lambda: store.get('c1', 'chat-1')) == []
+    assert store.counters['hits'] == 1
+
+
+def test_append_updates_loaded_state_without_sql(db, store):
+    _insert(db, [('user', '在吗', 'default')])
+    state = store.get('c1', 'chat-1')
+
+    created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    selects = _selects(db, lambda: [
+        store.append('c1', 'chat-1', 'user', '能便宜吗', 'price', created_at),
+        store.get('c1', 'chat-1'),
+    ])
+    assert selects == []
+    assert state.context(10) == [{'role': 'user', 'content': '在吗'}, {'role': 'user', 'content': '能便宜吗'}]
+    assert state.bargain_count == 1
+    assert [m['content'] for m in state.recent_user_messages(60)] == ['能便宜吗']
+
+
+def test_append_to_unloaded_chat_is_ignored(db, store):
+    store.append('c1', 'chat-1', 'user', '只在内存', None, None)
+    _insert(db, [('user', '在数据库', None)])
+    assert store.get('c1', 'chat-1').context(10) == [{'role': 'user', 'content': '在数据库'}]
+
+
+def test_engine_state_matches_cold_reload(db, monkeypatch):
+    monkeypatch.setattr(db_module, 'db_manager', db)
+    monkeypatch.setattr(engine_module, 'db_manager', db)
+    engine = engine_module.AIReplyEngine()
+    try:
+        engine.save_conversation('chat-1', 'c1', 'buyer', 'item-1', 'user', '在吗', 'default')
+        assert engine.get_bargain_count('chat-1', 'c1') == 0
+        engine.save_conversation('chat-1', 'c1', 'buyer', 'item-1', 'user', '能便宜吗', 'price')
+        engine.save_conversation('chat-1', 'c1', 'buyer', 'item-1', 'assistant', '最低95', 'price')
+        warm = (engine.get_conversation_context('chat-1', 'c1'), engine.get_bargain_count('chat-1', 'c1'))
+
+        engine.reset_conversation_states()
+        cold = (engine.get_conversation_context('chat-1', 'c1'), engine.get_bargain_count('chat-1', 'c1'))
+        assert warm == cold
+        assert cold[1] == 1
+        assert engine._conversations.counters['cold_loads'] == 2
+    finally:
+        engine._db_executor.shutdown(wait=True)
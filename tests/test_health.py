@@ -0,0 +1,37 @@
+"""健康检查：/health 无需登录，只返回账号汇总；各账号明细仅管理员可见"""
+
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import reply_server
+import XianyuAutoAsync as xianyu
+
+
+@pytest.fixture
+def client(monkeypatch):
+    instances = {
+        'secret-cookie-1': SimpleNamespace(connection_state=xianyu.ConnectionState.CONNECTED,
+                                           last_heartbeat_response=0, active_message_tasks=1),
+        'secret-cookie-2': SimpleNamespace(connection_state=xianyu.ConnectionState.RECONNECTING,
+                                           last_heartbeat_response=0, active_message_tasks=0),
+    }
+    monkeypatch.setattr(xianyu.XianyuLive, 'get_all_instances', classmethod(lambda cls: instances))
+    yield TestClient(reply_server.app)
+    reply_server.app.dependency_overrides.clear()
+
+
+def test_health_exposes_only_account_counts(client):
+    response = client.get('/health')
+    assert response.json()['accounts'] == {'total': 2, 'connected': 1}
+    assert 'secret-cookie' not in response.text
+
+
+def test_account_detail_requires_admin(client):
+    assert client.get('/admin/health/accounts').status_code in (401, 403)
+
+    reply_server.app.dependency_overrides[reply_server.require_admin] = lambda: {'user_id': 1, 'username': 'admin'}
+    accounts = client.get('/admin/health/accounts').json()['accounts']
+    assert accounts['secret-cookie-1']['connection_state'] == 'connected'
+    assert accounts['secret-cookie-2']['active_message_tasks'] == 0
@@ -0,0 +1,50 @@
+"""意图分类：内置关键词与模型结果的优先级"""
+
+from utils.intent_classifier import (BUILTIN_LEXICON, DEFAULT_SEEDS, IntentClassifier, NaiveBayesIntentModel,
+                                     _seed_samples)
+
+
+def _classifier(samples, **kwargs) -> IntentClassifier:
+    classifier = IntentClassifier(model_path='/nonexistent/intent_model.json', **kwargs)
+    classifier.model = NaiveBayesIntentModel().fit(samples)
+    return classifier
+
+
+def _biased_samples():
+    # 少量 default 样本 + 只有关键词的种子：模型容易把短的议价消息判为 default
+    defaults = [('好的谢谢', 'default'), ('在吗在吗', 'default'), ('能发顺丰吗', 'default'),
+                ('点吗', 'default'), ('能拍吗', 'default')]
+    keyword_seeds = [(k, intent) for intent, keywords in BUILTIN_LEXICON.items() for k in keywords]
+    return keyword_seeds + defaults
+
+
+def test_builtin_keyword_wins_over_confident_model():
+    classifier = _classifier(_biased_samples())
+    predicted, confidence = classifier.model.predict('能便宜点吗')
+    assert predicted == 'default' and confidence >= classifier.min_confidence  # 前提：模型自信地判错
+    assert classifier.classify('能便宜点吗') == 'price'
+    assert classifier.counters['builtin_lexicon'] == 1
+
+
+def test_model_overrides_lexicon_only_by_margin():
+    samples = [('坏了能便宜吗不要了换新', 'tech')] * 50 + [('好的', 'default'), ('多少钱', 'price')]
+    classifier = _classifier(samples, lexicon_margin=0.2)
+    assert classifier.classify('坏了能便宜吗不要了换新') == 'tech'
+    assert _classifier(samples, lexicon_margin=1.01).classify('坏了能便宜吗不要了换新') == 'price'
+
+
+def test_model_never_overrides_lexicon_to_default():
+    classifier = _classifier(_biased_samples(), lexicon_margin=0.0)
+    assert classifier.classify('包邮吗') == 'price'
+
+
+def test_account_lexicon_first_and_model_used_without_keywords():
+    classifier = _classifier(_seed_samples() + [('发个链接看看', 'default')] * 5)
+    assert classifier.classify('便宜点', cookie_id='c1', lexicon={'tech': ['便宜点']}) == 'tech'
+    assert classifier.classify('发个链接看看') == 'default'
+
+
+def test_seed_samples_include_default_class():
+    labels = {label for _, label in _seed_samples()}
+    assert labels == {'price', 'tech', 'default'}
+    assert all((text, 'default') in _seed_samples() for text in DEFAULT_SEEDS)
@@ -0,0 +1,74 @@
+"""关键词回复：与API请求并发时只做匹配，图片关键词在确定采用关键词回复后才上传"""
+
+import asyncio
+
+import pytest
+
+import XianyuAutoAsync as xianyu
+from db_manager import db_manager
+
+KEYWORDS = [
+    {'keyword': '图片', 'reply': '', 'item_id': None, 'type': 'image', 'image_url': '/static/uploads/a.jpg'},
+    {'keyword': '价格', 'reply': '{send_user_name}你好，价格已是最低', 'item_id': None, 'type': 'text', 'image_url': None},
+    {'keyword': '价格', 'reply': '这件不议价', 'item_id': 'item-1', 'type': 'text', 'image_url': None},
+]
+
+
+@pytest.fixture
+def live(monkeypatch):
+    """不建立连接的 XianyuLive：记录图片处理和发出的消息"""
+    instance = object.__new__(xianyu.XianyuLive)
+    instance.cookie_id = 'c1'
+    instance.images_handled = []
+    instance.sent = []
+
+    async def handle_image(keyword, image_url, *args):
+        instance.images_handled.append(image_url)
+        return f"__IMAGE_SEND__https://img.alicdn.com/{keyword}.jpg"
+
+    async def send_msg(websocket, chat_id, user_id, text):
+        instance.sent.append(('text', text))
+
+    async def send_image_msg(websocket, chat_id, user_id, image_url):
+        instance.sent.append(('image', image_url))
+
+    instance._handle_image_keyword = handle_image
+    instance.send_msg = send_msg
+    instance.send_image_msg = send_image_msg
+    monkeypatch.setattr(db_manager, 'get_keywords_with_type', lambda cookie_id: KEYWORDS)
+    monkeypatch.setitem(xianyu.AUTO_REPLY, 'enabled', True)
+    return instance
+
+
+def _reply(live, monkeypatch, message, api_reply):
+    async def get_api_reply(*args):
+        await asyncio.sleep(0.01)
+        return api_reply
+
+    live.get_api_reply = get_api_reply
+    monkeypatch.setitem(xianyu.AUTO_REPLY, 'api', {'enabled': True})
+    asyncio.run(live._process_chat_message_reply({}, None, '买家', 'u1', message, 'item-2', 'chat-1', '00:00'))
+
+
+def test_match_keyword_is_side_effect_free(live):
+    assert live.match_keyword('有图片吗')['type'] == 'image'
+    assert live.match_keyword('价格多少', 'item-1')['reply'] == '这件不议价'
+    assert live.match_keyword('价格多少', 'item-2')['item_id'] is None
+    assert live.match_keyword('你好') is None
+    assert live.images_handled == []
+
+
+def test_api_reply_wins_without_uploading_image(live, monkeypatch):
+    _reply(live, monkeypatch, '有图片吗', 'API回复')
+    assert live.sent == [('text', 'API回复')]
+    assert live.images_handled == []
+
+
+def test_image_keyword_resolved_when_api_fails(live, monkeypatch):
+    _reply(live, monkeypatch, '有图片吗', None)
+    assert live.images_handled == ['/static/uploads/a.jpg']
+    assert live.sent == [('image', 'https://img.alicdn.com/图片.jpg')]
+
+
+def test_text_keyword_reply_formats_variables(live):
+    assert asyncio.run(live.get_keyword_reply('买家', 'u1', '价格多少')) == '买家你好，价格已是最低'
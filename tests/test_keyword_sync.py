@@ -0,0 +1,132 @@
+"""关键词同步：差异计算、保持提交顺序、图片关键词冲突，以及Excel流式解析"""
+
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from openpyxl import Workbook
+
+import cookie_manager
+import db_manager as db_module
+from utils.keyword_sync import diff_keywords, iter_excel_keywords, normalize_item_id
+
+
+def _existing(*rows):
+    """[(keyword, reply, item_id[, type])] -> 带rowid的现有记录"""
+    return [(index + 1, row[0], row[1], row[2], row[3] if len(row) > 3 else 'text') for index, row in enumerate(rows)]
+
+
+def _keywords(db, cookie_id='c1'):
+    return [(row['keyword'], row['reply'], row['item_id']) for row in db.get_keywords_with_type(cookie_id)]
+
+
+def _xlsx(rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def test_diff_counts():
+    existing = _existing(('a', '1', None), ('b', '2', None), ('c', '3', 'item-1'), ('d', '4', None))
+    diff = diff_keywords(existing, [('a', '1', None), ('b', '2-new', None), ('x', '9', None), ('d', '4', None),
+                                    ('e', '5', None), ('a', '1', None)])
+    assert diff.summary() == {'added': 1, 'updated': 2, 'deleted': 0, 'unchanged': 2, 'duplicates': 1, 'total': 5}
+    assert diff.updates == [('2-new', 2)]
+    assert diff.rewrites == [(3, 'x', '9', None)]  # 第3个位置换成了新关键词，沿用原rowid
+    assert diff.inserts == [('e', '5', None)]
+
+    diff = diff_keywords(existing, [('a', '1', None)])
+    assert diff.summary()['deleted'] == 3
+    assert sorted(diff.deletes) == [2, 3, 4]
+
+
+def test_diff_without_delete_missing_matches_by_key():
+    existing = _existing(('a', '1', None), ('b', '2', None))
+    diff = diff_keywords(existing, [('b', '2-new', None), ('c', '3', None)], delete_missing=False)
+    assert (diff.updates, diff.inserts, diff.deletes, diff.rewrites) == ([('2-new', 2)], [('c', '3', None)], [], [])
+
+
+def test_image_keyword_conflict_raises():
+    existing = _existing(('图片', '', None, 'image'), ('a', '1', None))
+    with pytest.raises(ValueError, match='图片关键词'):
+        diff_keywords(existing, [('图片', '文字回复', None)])
+    # 商品ID不同则不冲突；图片关键词不参与文本同步，不会被删除
+    diff = diff_keywords(existing, [('图片', '文字回复', 'item-1')])
+    assert diff.deletes == []
+    assert diff.rewrites == [(2, '图片', '文字回复', 'item-1')]
+
+
+def test_normalize_item_id():
+    assert normalize_item_id(123456.0) == '123456'
+    assert normalize_item_id(' 123456 ') == '123456'
+    assert normalize_item_id(float('nan')) is None
+    assert normalize_item_id('') is None
+    assert normalize_item_id(None) is None
+
+
+def test_sync_keeps_submitted_order(db):
+    db.sync_keywords('c1', [('a', '1', None), ('b', '2', None), ('c', '3', None)])
+    summary = db.sync_keywords('c1', [('a2', '1', None), ('b', '2', None), ('c', '3', None)])
+    assert (summary['updated'], summary['unchanged']) == (1, 2)
+    assert [row[0] for row in _keywords(db)] == ['a2', 'b', 'c']
+
+    # 交换顺序、删除中间一项：不触发唯一索引冲突，读回顺序与提交一致
+    db.sync_keywords('c1', [('c', '3', None), ('a2', '1', None)])
+    assert _keywords(db) == [('c', '3', None), ('a2', '1', None)]
+    db.sync_keywords('c1', [('c', '3', None), ('n', '4', 123456.0), ('a2', '1', None)])
+    assert _keywords(db) == [('c', '3', None), ('n', '4', '123456'), ('a2', '1', None)]
+
+
+def test_sync_preserves_image_keywords(db):
+    db.sync_keywords('c1', [('a', '1', None)])
+    db.save_image_keyword('c1', '图片', '/static/uploads/a.jpg')
+    with pytest.raises(ValueError):
+        db.sync_keywords('c1', [('图片', '文字', None)])
+    db.sync_keywords('c1', [('b', '2', None)])
+    assert [(row['keyword'], row['type']) for row in db.get_keywords_with_type('c1')] == [('b', 'text'), ('图片', 'image')]
+
+
+def test_excel_skips_blank_rows_and_normalizes_item_id():
+    buffer = _xlsx([
+        ['商品ID', '关键词', '关键词内容', '备注'],
+        [123456.0, '价格', '不议价', 'x'],
+        [None, None, '没有关键词的行', None],
+        [None, '   ', '空白关键词', None],
+        [None, '发货', None, None],
+        [],
+    ])
+    assert list(iter_excel_keywords(buffer, 'keywords.xlsx')) == [('价格', '不议价', '123456'), ('发货', '', None)]
+
+
+def test_excel_missing_column():
+    buffer = _xlsx([['关键词', '关键词内容'], ['价格', '不议价']])
+    with pytest.raises(ValueError, match='商品ID'):
+        list(iter_excel_keywords(buffer, 'keywords.xlsx'))
+
+
+def test_import_rejects_invalid_excel(db, monkeypatch):
+    import reply_server
+
+    db.create_user('u1', 'u1@example.com', 'pw')
+    user_id = db.get_user_by_username('u1')['id']
+    db.save_cookie('c1', 'value', user_id)
+    monkeypatch.setattr(db_module, 'db_manager', db)
+    monkeypatch.setattr(cookie_manager, 'manager', object())
+    reply_server.app.dependency_overrides[reply_server.get_current_user] = lambda: {'user_id': user_id, 'username': 'u1'}
+    try:
+        client = TestClient(reply_server.app)
+        response = client.post('/keywords-import/c1', files={'file': ('k.xlsx', b'not a zip', 'application/octet-stream')})
+        assert response.status_code == 400
+        assert response.json()['detail'] == 'Excel文件格式错误'
+
+        buffer = _xlsx([['关键词', '商品ID', '关键词内容'], ['价格', None, '不议价']])
+        response = client.post('/keywords-import/c1', files={'file': ('k.xlsx', buffer.getvalue(), 'application/octet-stream')})
+        assert response.status_code == 200
+        assert response.json()['added'] == 1
+    finally:
+        reply_server.app.dependency_overrides.clear()
@@ -0,0 +1,124 @@
+"""大模型对冲：主接口(Gemini)与备用接口(DashScope)各起一个本地模拟服务，注入延迟/错误"""
+
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import ai_reply_engine as engine_module
+from config import config
+from utils import ai_governor
+from utils.llm_client_pool import llm_client_pool
+from utils.llm_hedging import HedgedLLMCaller
+from utils.llm_streaming import get_streaming
+
+MESSAGES = [{'role': 'system', 'content': '你是客服'}, {'role': 'user', 'content': '在吗'}]
+
+
+class _StubLLM:
+    """模拟大模型接口：按设定的延迟和状态码返回，并统计收到的请求数"""
+
+    def __init__(self, body, delay: float = 0, status: int = 200):
+        self.body = body
+        self.delay = delay
+        self.status = status
+        self.requests = 0
+
+    async def handle(self, request: web.Request):
+        self.requests += 1
+        await request.json()
+        await asyncio.sleep(self.delay)
+        if self.status != 200:
+            return web.json_response({'error': 'stub failure'}, status=self.status)
+        return web.json_response(self.body)
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    caller = HedgedLLMCaller(default_hedge_delay_ms=8000)
+    monkeypatch.setattr(engine_module, 'get_hedged_caller', lambda: caller)
+    monkeypatch.setattr(ai_governor, '_governor', None)
+    monkeypatch.setattr(get_streaming(), 'enabled', False)
+    monkeypatch.setitem(config._config.setdefault('AI_REPLY', {}), 'endpoints', {})
+    return caller
+
+
+async def _call(primary: _StubLLM, fallback: _StubLLM, budget_ms: int, hedge_delay_ms: int = 0):
+    gemini_app = web.Application()
+    gemini_app.router.add_post('/v1beta/models/{model}', primary.handle)
+    dashscope_app = web.Application()
+    dashscope_app.router.add_post('/api/v1/apps/{app_id}/completion', fallback.handle)
+    gemini, dashscope = TestServer(gemini_app), TestServer(dashscope_app)
+    await gemini.start_server()
+    await dashscope.start_server()
+    try:
+        config.set('AI_REPLY.endpoints.gemini', str(gemini.make_url('/v1beta')))
+        config.set('AI_REPLY.endpoints.dashscope', str(dashscope.make_url('/api/v1')))
+        settings = {
+            'model_name': 'gemini-stub',
+            'base_url': '',
+            'api_key': 'primary-key',
+            'fallback_model_name': 'custom',
+            'fallback_base_url': str(dashscope.make_url('/api/v1/apps/app1/completion')),
+            'fallback_api_key': 'fallback-key',
+            'latency_budget_ms': budget_ms,
+            'hedge_delay_ms': hedge_delay_ms,
+        }
+        started = time.monotonic()
+        reply = await engine_module.AIReplyEngine()._call_llm('c1', settings, MESSAGES)
+        return reply, time.monotonic() - started
+    finally:
+        await llm_client_pool.close_loop_clients()
+        await gemini.close()
+        await dashscope.close()
+
+
+def _gemini(text):
+    return _StubLLM({'candidates': [{'content': {'parts': [{'text': text}]}}]})
+
+
+def _dashscope(text):
+    return _StubLLM({'output': {'text': text}})
+
+
+def test_fast_primary_does_not_hedge(hedging):
+    primary, fallback = _gemini('主接口回复'), _dashscope('备用接口回复')
+    reply, _ = asyncio.run(_call(primary, fallback, budget_ms=5000, hedge_delay_ms=1000))
+    assert reply == '主接口回复'
+    assert fallback.requests == 0
+    assert hedging.counters['hedges'] == 0
+
+
+def test_slow_primary_is_hedged(hedging):
+    primary, fallback = _gemini('主接口回复'), _dashscope('备用接口回复')
+    primary.delay = 2
+    reply, elapsed = asyncio.run(_call(primary, fallback, budget_ms=5000, hedge_delay_ms=200))
+    assert reply == '备用接口回复'
+    assert elapsed < 1.5
+    assert (primary.requests, fallback.requests) == (1, 1)
+    assert hedging.counters['hedges'] == 1
+    assert hedging.counters['fallbacks'] == 0
+
+
+def test_failing_primary_falls_back_immediately(hedging):
+    primary, fallback = _gemini('主接口回复'), _dashscope('备用接口回复')
+    primary.status = 500
+    reply, elapsed = asyncio.run(_call(primary, fallback, budget_ms=5000, hedge_delay_ms=3000))
+    assert reply == '备用接口回复'
+    assert elapsed < 2  # 不等对冲时间
+    assert hedging.counters['fallbacks'] == 1
+    assert hedging.counters['hedges'] == 0
+    primary_stats = next(p for p in hedging.stats()['providers'] if p['name'].startswith('gemini-stub'))
+    assert primary_stats['errors'] == 1
+
+
+def test_budget_exceeded_returns_none(hedging):
+    primary, fallback = _gemini('主接口回复'), _dashscope('备用接口回复')
+    primary.delay = fallback.delay = 2
+    reply, elapsed = asyncio.run(_call(primary, fallback, budget_ms=400, hedge_delay_ms=100))
+    assert reply is None
+    assert elapsed < 1.5
+    assert hedging.counters['budget_exceeded'] == 1
+    assert fallback.requests == 1
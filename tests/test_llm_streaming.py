@@ -0,0 +1,148 @@
+"""流式输出：本地SSE模拟服务上的解析、DashScope增量输出和提前截断"""
+
+import asyncio
+import json
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import ai_reply_engine as engine_module
+from config import config
+from utils import llm_streaming
+from utils.llm_client_pool import llm_client_pool
+from utils.llm_streaming import StreamingConfig, dashscope_delta, iter_sse_data
+
+MESSAGES = [{'role': 'system', 'content': '你是客服'}, {'role': 'user', 'content': '这个还在吗'}]
+
+
+class _SSEStub:
+    """模拟SSE接口：逐个发送预设的原始行（每行之间注入延迟），记录实际发出的行数和连接是否被客户端关闭"""
+
+    def __init__(self, lines, delay: float = 0.02):
+        self.lines = lines
+        self.delay = delay
+        self.sent = 0
+        self.done = asyncio.Event()
+
+    async def handle(self, request: web.Request):
+        await request.read()
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        try:
+            for line in self.lines:
+                await response.write(f'{line}\n'.encode('utf-8'))
+                self.sent += 1
+                await asyncio.sleep(self.delay)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self.done.set()
+        return response
+
+
+async def _serve(stub: _SSEStub, coro_factory):
+    app = web.Application()
+    app.router.add_post('/{tail:.*}', stub.handle)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        result = await coro_factory(server)
+        await asyncio.wait_for(stub.done.wait(), 5)
+        return result
+    finally:
+        await llm_client_pool.close_loop_clients()
+        await server.close()
+
+
+def _dashscope_events(texts):
+    lines = []
+    for index, text in enumerate(texts):
+        lines += [f'id:{index}', 'event:result', f'data:{json.dumps({"output": {"text": text}}, ensure_ascii=False)}', '']
+    return lines
+
+
+@pytest.fixture
+def streaming(monkeypatch):
+    conf = StreamingConfig()
+    conf.enabled, conf.min_chars, conf.max_chars = True, 5, 60
+    monkeypatch.setattr(llm_streaming, '_streaming', conf)
+    monkeypatch.setitem(config._config.setdefault('AI_REPLY', {}), 'endpoints', {})
+    return conf
+
+
+def test_streaming_is_opt_in(monkeypatch):
+    assert config.get('AI_REPLY.streaming.enabled') is False
+    monkeypatch.setitem(config._config['AI_REPLY'], 'streaming', {})
+    assert StreamingConfig().enabled is False
+
+
+def test_dashscope_delta():
+    assert dashscope_delta('{"output": {"text": "你好"}}') == '你好'
+    assert dashscope_delta('{"output": {}}') == ''
+    assert dashscope_delta('{"code": "Throttling"}') == ''
+    assert dashscope_delta('not json') == ''
+
+
+def test_iter_sse_data_over_http():
+    stub = _SSEStub([': keep-alive', 'event:result', 'data: {"a": 1}', '', 'data:', 'id:2',
+                     'data:second', '', 'data: [DONE]', '', 'data: after-done'], delay=0)
+
+    async def read(server):
+        async with aiohttp.ClientSession() as session, session.post(server.make_url('/sse')) as response:
+            return [data async for data in iter_sse_data(response.content)]
+
+    assert asyncio.run(_serve(stub, read)) == ['{"a": 1}', 'second']
+
+
+def test_dashscope_stream_cuts_at_sentence_and_closes(streaming):
+    texts = ['您好，', '宝贝还在', '的。', '可以直接拍下', '，我们当天发货', '。'] + ['后续内容'] * 20
+    stub = _SSEStub(_dashscope_events(texts))
+
+    async def call(server):
+        config.set('AI_REPLY.endpoints.dashscope', str(server.make_url('/api/v1')))
+        settings = {'model_name': 'custom', 'api_key': 'k',
+                    'base_url': str(server.make_url('/api/v1/apps/app1/completion'))}
+        return await engine_module.AIReplyEngine()._call_dashscope_api(settings, MESSAGES, max_tokens=100)
+
+    reply = asyncio.run(_serve(stub, call))
+    assert reply == '您好，宝贝还在的。'
+    assert stub.sent < len(stub.lines)  # 截断后连接被关闭，剩余事件没有发出
+    stats = streaming.stats()
+    assert (stats['early_cutoffs'], stats['completed']) == (1, 0)
+    assert 0 < stats['tokens_saved_upper_bound'] <= 100
+
+
+def test_dashscope_stream_without_boundary_completes(streaming):
+    stub = _SSEStub(_dashscope_events(['好的', '稍等']), delay=0)
+
+    async def call(server):
+        config.set('AI_REPLY.endpoints.dashscope', str(server.make_url('/api/v1')))
+        settings = {'model_name': 'custom', 'api_key': 'k',
+                    'base_url': str(server.make_url('/api/v1/apps/app1/completion'))}
+        return await engine_module.AIReplyEngine()._call_dashscope_api(settings, MESSAGES, max_tokens=100)
+
+    assert asyncio.run(_serve(stub, call)) == '好的稍等'
+    stats = streaming.stats()
+    assert (stats['early_cutoffs'], stats['completed'], stats['tokens_saved_upper_bound']) == (0, 1, 0)
+
+
+def test_openai_stream_hard_cut_at_max_chars(streaming):
+    streaming.max_chars = 10
+
+    def chunk(text):
+        return 'data: ' + json.dumps({'id': 'c1', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'm',
+                                      'choices': [{'index': 0, 'delta': {'content': text}, 'finish_reason': None}]},
+                                     ensure_ascii=False)
+
+    stub = _SSEStub([line for _ in range(30) for line in (chunk('一二三四'), '')] + ['data: [DONE]', ''])
+
+    async def call(server):
+        settings = {'model_name': 'm', 'api_key': 'k', 'base_url': str(server.make_url('/v1'))}
+        async with llm_client_pool.openai_client('c1', settings['base_url'], 'k') as client:
+            return await engine_module.AIReplyEngine()._call_openai_api(client, settings, MESSAGES, max_tokens=100)
+
+    assert asyncio.run(_serve(stub, call)) == '一二三四一二三四一二'
+    assert stub.sent < len(stub.lines)
+    assert streaming.stats()['early_cutoffs'] == 1
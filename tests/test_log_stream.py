@@ -0,0 +1,63 @@
+"""实时日志SSE：带 Last-Event-ID 重连时，补发过的日志不会再从订阅队列重复推送"""
+
+import asyncio
+import json
+
+import pytest
+from loguru import logger
+
+import reply_server
+from file_log_collector import FileLogCollector
+
+
+class _Request:
+    def __init__(self, last_event_id):
+        self.headers = {'last-event-id': last_event_id}
+
+    async def is_disconnected(self):
+        return False
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    instance = FileLogCollector(max_logs=100)
+    monkeypatch.setattr(reply_server, 'get_file_log_collector', lambda: instance)
+    monkeypatch.setattr(reply_server, '_verify_token_value', lambda token: {'user_id': 1})
+    yield instance
+    logger.remove(instance.sink_id)
+
+
+async def _stream(last_event_id, count):
+    """以 Last-Event-ID 重连，订阅建立后、开始补发前写一条 between，收到前两条后再写一条 after"""
+    response = await reply_server.stream_logs(_Request(last_event_id), source='test_log_stream',
+                                              token='t', credentials=None)
+    # 订阅已建立、尚未开始补发时产生的日志：既在环形缓冲中，也已进入订阅队列
+    logger.info('between')
+    await asyncio.sleep(0)
+    events = response.body_iterator
+    messages = []
+    try:
+        while len(messages) < count:
+            if len(messages) == count - 1:
+                logger.info('after')
+            chunk = await asyncio.wait_for(events.__anext__(), 2)
+            data = chunk.split('data: ', 1)[1]
+            messages.append(json.loads(data)['message'])
+    finally:
+        await events.aclose()
+    return messages
+
+
+def test_reconnect_replay_is_not_duplicated(collector):
+    logger.info('before-1')
+    logger.info('before-2')
+    last_seen = collector.get_logs(source_filter='test_log_stream')[0]['id']
+
+    assert asyncio.run(_stream(str(last_seen), 3)) == ['before-2', 'between', 'after']
+
+
+def test_last_event_id_from_before_restart_does_not_mute_stream(collector):
+    """服务重启后日志ID从1重新计数，浏览器带来的旧ID大于当前所有ID"""
+    logger.info('before-1')
+
+    assert asyncio.run(_stream('100000', 2)) == ['between', 'after']
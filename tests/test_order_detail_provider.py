@@ -0,0 +1,148 @@
+"""订单详情：mtop 响应解析（录制的JSON样本）与本地模拟 mtop 网关"""
+
+import asyncio
+import json
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from utils import order_detail_provider as odp
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'mtop_order_detail.json')
+COOKIE = '_m_h5_tk=oldtoken_1700000000000; _m_h5_tk_enc=enc; unb=2200000000'
+
+
+def _fixture():
+    with open(FIXTURE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_parse_prefers_paid_amount_over_item_price():
+    result = odp.parse_order_detail_json('4012345678901234567', _fixture()['data'])
+    assert result['amount'] == '159.00'  # 商品标价 199.00 在 itemInfo 下，不能作为实付金额
+    assert result['spec_name'] == '颜色'
+    assert result['spec_value'] == '黑色'
+    assert result['quantity'] == '1'  # itemInfo.quantity 是库存
+
+
+def test_parse_explicit_paid_field_wins():
+    data = _fixture()['data']
+    data['actualPayFee'] = '149.00'
+    assert odp.parse_order_detail_json('1', data)['amount'] == '149.00'
+
+
+def test_parse_without_amount_returns_none():
+    data = _fixture()['data']
+    del data['payInfo']
+    assert odp.parse_order_detail_json('1', data) is None
+
+
+class _StubGateway:
+    """模拟 mtop 网关：按顺序返回预设响应，并记录收到的请求"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def handle(self, request: web.Request):
+        form = await request.post()
+        self.requests.append({'path': request.path, 'query': dict(request.query),
+                              'data': form.get('data'), 'cookie': request.headers.get('cookie', '')})
+        body, headers = self.responses.pop(0)
+        return web.json_response(body, headers=headers)
+
+
+async def _run_provider(responses, cookie=COOKIE):
+    gateway = _StubGateway(responses)
+    app = web.Application()
+    app.router.add_post('/h5/{api}/{version}/', gateway.handle)
+    server = TestServer(app)
+    await server.start_server()
+    provider = odp.MtopOrderDetailProvider(base_url=str(server.make_url('/h5')), timeout=5)
+    try:
+        result = await provider.fetch('4012345678901234567', cookie, cookie_id='acc')
+    finally:
+        await provider.close()
+        await server.close()
+    return result, gateway
+
+
+def test_mtop_provider_against_stub_gateway():
+    result, gateway = asyncio.run(_run_provider([(_fixture(), {})]))
+    assert result['amount'] == '159.00'
+    assert 'refreshed_cookies' not in result
+    assert len(gateway.requests) == 1
+    request = gateway.requests[0]
+    assert request['path'] == '/h5/mtop.idle.web.trade.order.detail/1.0/'
+    assert json.loads(request['data']) == {'tid': '4012345678901234567'}
+    assert request['query']['sign']
+    assert '_m_h5_tk=oldtoken_1700000000000' in request['cookie']
+
+
+def test_mtop_provider_retries_with_refreshed_token():
+    expired = ({'ret': ['FAIL_SYS_TOKEN_EXOIRED::令牌过期'], 'data': {}},
+               {'Set-Cookie': '_m_h5_tk=newtoken_1700000009999; Path=/'})
+    result, gateway = asyncio.run(_run_provider([expired, (_fixture(), {})]))
+    assert result['amount'] == '159.00'
+    assert len(gateway.requests) == 2
+    assert '_m_h5_tk=newtoken_1700000009999' in gateway.requests[1]['cookie']
+    # 新token随结果返回，供调用方写回账号Cookie
+    assert result['refreshed_cookies'] == {'_m_h5_tk': 'newtoken_1700000009999'}
+
+
+def test_refreshed_token_persisted_to_account(db, monkeypatch):
+    import db_manager as db_module
+    import XianyuAutoAsync as xianyu
+    from utils import order_detail_fetcher
+
+    db.create_user('u1', 'u1@example.com', 'pw')
+    db.save_cookie('acc', COOKIE, db.get_user_by_username('u1')['id'])
+    monkeypatch.setattr(db_module, 'db_manager', db)
+
+    async def fetch(order_id, cookie_string, headless=True, cookie_id=None):
+        return {'order_id': order_id, 'amount': '159.00',
+                'refreshed_cookies': {'_m_h5_tk': 'newtoken_1700000009999'}}
+
+    monkeypatch.setattr(order_detail_fetcher, 'fetch_order_detail_simple', fetch)
+    live = object.__new__(xianyu.XianyuLive)
+    live.cookie_id = 'acc'
+    live.cookies_str = COOKIE
+    live.cookies = xianyu.trans_cookies(COOKIE)
+
+    result = asyncio.run(live._fetch_order_detail_remote('4012345678901234567'))
+    assert result == {'order_id': '4012345678901234567', 'amount': '159.00'}
+    expected = '_m_h5_tk=newtoken_1700000009999; _m_h5_tk_enc=enc; unb=2200000000'
+    assert live.cookies_str == expected
+    assert db.get_cookie('acc') == expected
+
+
+def test_mtop_provider_failure_and_missing_token():
+    failed = ({'ret': ['FAIL_SYS_USER_VALIDATE::被挤爆啦'], 'data': {}}, {})
+    result, gateway = asyncio.run(_run_provider([failed]))
+    assert result is None and len(gateway.requests) == 1
+
+    result, gateway = asyncio.run(_run_provider([], cookie='unb=2200000000'))
+    assert result is None and gateway.requests == []
+
+
+def test_providers_fall_back_in_order(monkeypatch):
+    class Failing(odp.OrderDetailProvider):
+        name = 'failing'
+
+        async def fetch(self, order_id, cookie_string, cookie_id=None, headless=True):
+            raise RuntimeError('boom')
+
+    class Fixture(odp.OrderDetailProvider):
+        name = 'fixture'
+
+        async def fetch(self, order_id, cookie_string, cookie_id=None, headless=True):
+            return odp.parse_order_detail_json(order_id, _fixture()['data'])
+
+    odp.register_order_detail_provider('failing', Failing)
+    odp.register_order_detail_provider('fixture', Fixture)
+    monkeypatch.setattr(odp, 'get_order_detail_providers',
+                        lambda: [odp._create_provider('failing'), odp._create_provider('fixture')])
+    result = asyncio.run(odp.fetch_order_detail_with_providers('1', COOKIE, cookie_id='acc'))
+    assert result['source'] == 'fixture'
+    assert result['amount'] == '159.00'
@@ -0,0 +1,78 @@
+"""提示词组装：对话历史按token预算选取，预算外的轮次折叠进滚动摘要；商品片段按内容缓存"""
+
+import json
+
+from utils.conversation_state import ConversationState
+from utils.prompt_builder import PromptBuilder, estimate_tokens, normalize_price, summarize_turn, trim_detail
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('你好') == 2
+    assert estimate_tokens('abcdefgh') == 2
+    assert estimate_tokens('你好abcd') == 3
+
+
+def test_history_keeps_newest_turns_within_budget():
+    builder = PromptBuilder(history_token_budget=20, summary_token_budget=100, max_history_turns=10)
+    # 买家每轮约 8 token、卖家约 9 token，预算内只放得下最近两轮
+    turns = [turn for i in range(3) for turn in (('user', f'消息消息消息{i}'), ('assistant', f'回复回复回复{i}'))]
+    assert [estimate_tokens(f'{role}: {content}') for role, content in turns[-2:]] == [8, 9]
+
+    context, summary = builder.history(turns, ['买家:最早的问题'])
+    assert context == 'user: 消息消息消息2\nassistant: 回复回复回复2'
+    # 预算外的轮次按从旧到新接在已有摘要之后
+    assert summary == '；'.join(['买家:最早的问题'] + [summarize_turn(role, content) for role, content in turns[:4]])
+    assert builder.metrics.counters['summarized_turns'] == 4
+
+
+def test_history_always_keeps_latest_turn_and_caps_turn_count():
+    builder = PromptBuilder(history_token_budget=5, max_history_turns=2)
+    long_turn = ('user', '很长的消息' * 10)
+    context, summary = builder.history([('assistant', '早'), long_turn], [])
+    assert context == f'user: {long_turn[1]}'
+    assert summary == '卖家:早'
+
+    builder = PromptBuilder(history_token_budget=1000, max_history_turns=2)
+    context, _ = builder.history([('user', 'a'), ('user', 'b'), ('user', 'c')], [])
+    assert context == 'user: b\nuser: c'
+
+
+def test_summary_budget_keeps_newest_snippets():
+    builder = PromptBuilder(history_token_budget=1, summary_token_budget=15)
+    older = ['买家:一二三四', '买家:五六七八', '买家:九十百千']  # 各约 7 token
+    _, summary = builder.history([('user', '最新')], older)
+    assert summary == '买家:五六七八；买家:九十百千'
+
+
+def test_evicted_turns_roll_into_state_summary():
+    state = ConversationState(max_turns=2)
+    for content in ('第一句', '第二句', '第三句', '第四句'):
+        state.append('user', content, None, None)
+    turns, summary = state.prompt_history()
+    assert turns == [('user', '第三句'), ('user', '第四句')]
+    assert summary == ['买家:第一句', '买家:第二句']
+
+
+def test_summarize_turn_truncates():
+    assert summarize_turn('assistant', '  好的\n马上发货  ') == '卖家:好的 马上发货'
+    assert summarize_turn('user', '字' * 30) == '买家:' + '字' * 24 + '…'
+
+
+def test_item_fragment_cached_by_content():
+    builder = PromptBuilder(max_detail_chars=20)
+    detail = json.dumps({'title': '相机', 'desc': '<b>九成新</b> 见 https://example.com/a', 'id': 123})
+    item = {'title': '相机', 'price': '99.00', 'desc': detail}
+    fragment = builder.item_fragment(item)
+    assert fragment == '商品标题: 相机\n商品价格: 99元\n商品描述: 相机； 九成新 见'
+    assert builder.item_fragment(dict(item)) is fragment
+    builder.item_fragment({**item, 'price': '89.50'})
+    assert builder.metrics.counters['fragment_hits'] == 1
+    assert builder.metrics.counters['fragment_misses'] == 2
+
+
+def test_trim_detail_and_price():
+    assert trim_detail('', 10) == '无'
+    assert trim_detail('第一句很长。第二句也很长很长', 10) == '第一句很长。…'
+    assert normalize_price('¥99.50') == '99.5'
+    assert normalize_price(None) == '未知'
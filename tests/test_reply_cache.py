@@ -0,0 +1,88 @@
+"""AI回复缓存：缓存键的归一化与议价分桶，AI设置保存、商品详情更新后清理缓存"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import cookie_manager
+import db_manager as db_module
+from utils import reply_cache as reply_cache_module
+from utils.reply_cache import ReplyCache, normalize_message
+
+SETTINGS = {'model_name': 'm', 'custom_prompts': '', 'max_discount_percent': 10,
+            'max_discount_amount': 100, 'max_bargain_rounds': 3}
+ITEM = {'title': '相机', 'price': '99', 'desc': '九成新'}
+
+
+@pytest.fixture
+def cache(db, monkeypatch):
+    instance = ReplyCache(ttl=3600)
+    monkeypatch.setattr(db_module, 'db_manager', db)
+    monkeypatch.setattr(reply_cache_module, '_reply_cache', instance)
+    return instance
+
+
+def _key(cache, message='能便宜点吗', intent='price', bargain_count=0, item=ITEM, settings=SETTINGS, item_id='item-1'):
+    return cache.build_key('c1', item_id, intent, message, item, settings, bargain_count)
+
+
+def test_message_normalization():
+    assert normalize_message('  能便宜点吗？？ ') == normalize_message('能便宜点吗') == '能便宜点吗'
+    assert normalize_message('ＯＫ！') == 'ok'
+
+
+def test_key_buckets(cache):
+    assert _key(cache, '能便宜点吗？') == _key(cache, '能 便宜 点吗')
+    assert _key(cache, '？') is None
+
+    # 议价按轮次分桶，超过最大轮数的归为同一桶
+    buckets = [_key(cache, bargain_count=n) for n in range(6)]
+    assert len(set(buckets[:4])) == 4
+    assert buckets[3] == buckets[4] == buckets[5]
+    # 其它意图不区分议价轮次
+    assert _key(cache, '包邮吗', 'default', 0) == _key(cache, '包邮吗', 'default', 2)
+
+    # 商品信息、提示词设置、商品ID变化后不再命中
+    assert _key(cache) != _key(cache, item={**ITEM, 'price': '89'})
+    assert _key(cache) != _key(cache, settings={**SETTINGS, 'custom_prompts': '{"price": "坚持原价"}'})
+    assert _key(cache) != _key(cache, item_id='item-2')
+
+
+def test_memory_then_sqlite(cache):
+    key = _key(cache)
+    assert cache.get(key) is None
+    cache.put(key, 'c1', 'item-1', 'price', '能便宜点吗', '最低95', llm_latency_ms=800)
+    assert cache.get(key) == '最低95'
+    cache.memory.clear()
+    assert cache.get(key) == '最低95'
+    stats = cache.stats()
+    assert (stats['misses'], stats['memory_hits'], stats['db_hits']) == (1, 1, 1)
+    assert stats['saved_latency_ms'] == 1600
+
+
+def test_invalidate_on_settings_and_item_detail_change(db, cache, monkeypatch):
+    import reply_server
+
+    db.create_user('u1', 'u1@example.com', 'pw')
+    user_id = db.get_user_by_username('u1')['id']
+    db.save_cookie('c1', 'value', user_id)
+    db.save_item_basic_info('c1', 'item-1', item_title='相机')
+    monkeypatch.setattr(cookie_manager, 'manager', object())
+    reply_server.app.dependency_overrides[reply_server.get_current_user] = lambda: {'user_id': user_id, 'username': 'u1'}
+
+    item_1 = _key(cache)
+    item_2 = _key(cache, item_id='item-2')
+    for key, item_id in ((item_1, 'item-1'), (item_2, 'item-2')):
+        cache.put(key, 'c1', item_id, 'price', '能便宜点吗', '最低95')
+    try:
+        client = TestClient(reply_server.app)
+        # 商品详情更新只清理该商品的缓存
+        assert client.put('/items/c1/item-1', json={'item_detail': '换了新镜头'}).status_code == 200
+        assert (cache.get(item_1), cache.get(item_2)) == (None, '最低95')
+
+        # AI设置保存后清理整个账号的缓存
+        response = client.put('/ai-reply-settings/c1', json={'ai_enabled': True, 'reply_cache_enabled': True})
+        assert response.status_code == 200
+        assert cache.get(item_2) is None
+        assert cache.stats()['invalidations'] == 2
+    finally:
+        reply_server.app.dependency_overrides.clear()
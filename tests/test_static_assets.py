@@ -0,0 +1,82 @@
+"""静态资源管线：文件变化在后台线程中重建，重建完成前继续使用旧快照"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from utils import static_assets as sa
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'uploads').mkdir()
+    (tmp_path / 'js' / 'app.js').write_text('console.log(1);' * 200, encoding='utf-8')
+    (tmp_path / 'uploads' / 'a.jpg').write_bytes(b'jpg')
+    (tmp_path / 'index.html').write_text('<script src="/static/js/app.js"></script>', encoding='utf-8')
+    return tmp_path
+
+
+def _touch(path, text):
+    path.write_text(text, encoding='utf-8')
+    stat = path.stat()
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+
+def test_build_fingerprints_and_compresses(static_dir):
+    pipeline = sa.StaticAssetPipeline(str(static_dir), check_interval=3600)
+    pipeline.build()
+    asset = pipeline.asset('js/app.js')
+    assert pipeline.asset('uploads/a.jpg') is None
+    assert 'gzip' in asset.variants
+    assert pipeline.page('index.html').body.decode() == f'<script src="/static/js/app.js?v={asset.hash}"></script>'
+
+    status, headers, body = pipeline.respond(asset, accept_encoding='gzip', if_none_match=asset.etag)
+    assert status == 304 and body == b''
+    status, headers, _ = pipeline.respond(asset, accept_encoding='gzip, br;q=0', version=asset.hash)
+    assert (status, headers['Content-Encoding'], headers['Cache-Control']) == (200, 'gzip', sa.IMMUTABLE_CACHE)
+
+
+def test_refresh_rebuilds_in_background_and_serves_old_snapshot(static_dir, monkeypatch):
+    pipeline = sa.StaticAssetPipeline(str(static_dir), check_interval=0)
+    pipeline.build()
+    old_asset = pipeline.asset('js/app.js')
+    old_page = pipeline.page('index.html')
+
+    loaded_in = []
+    release = threading.Event()
+    original_load = pipeline._load
+
+    def slow_load(rel, mtime):
+        loaded_in.append(threading.current_thread().name)
+        release.wait(5)
+        return original_load(rel, mtime)
+
+    monkeypatch.setattr(pipeline, '_load', slow_load)
+    _touch(static_dir / 'js' / 'app.js', 'console.log(2);' * 200)
+
+    started = time.monotonic()
+    # 请求线程只触发后台重建，立即返回旧快照
+    assert pipeline.asset('js/app.js') is old_asset
+    assert pipeline.page('index.html') is old_page
+    assert time.monotonic() - started < 1
+    release.set()
+    pipeline._refresh_thread.join(5)
+
+    assert loaded_in == ['static-assets-refresh']
+    new_asset = pipeline._assets['js/app.js']
+    assert new_asset.hash != old_asset.hash
+    # 已渲染过的页面在后台重建时一并用新指纹重新渲染
+    assert pipeline._pages['index.html'].body.decode() == f'<script src="/static/js/app.js?v={new_asset.hash}"></script>'
+    assert pipeline.stats['rebuilds'] == 2
+
+
+def test_removed_file_drops_out_of_snapshot(static_dir):
+    pipeline = sa.StaticAssetPipeline(str(static_dir), check_interval=3600)
+    pipeline.build()
+    os.remove(static_dir / 'js' / 'app.js')
+    assert pipeline.rebuild() is True
+    assert pipeline.asset('js/app.js') is None
+    assert pipeline.page('index.html').body.decode() == '<script src="/static/js/app.js"></script>'
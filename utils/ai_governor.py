@@ -0,0 +1,370 @@
+"""
+AI请求调度器（并发闸门）
+所有大模型请求在发出前都要在这里取得执行名额：
+- 每个接口(模型@地址)、每个账号各有并发上限，超出时进入有界等待队列（先进先出）
+- 排队前按接口近期耗时估算等待时间，超过本次调用剩余预算或队列已满时直接拒绝（降级为关键词/默认回复）
+- 接口返回429时按 Retry-After 暂停该接口；连续失败达到阈值时熔断，冷却后放行一个探测请求
+事件循环/线程无关：名额计数由线程锁保护，等待者在自己的事件循环上被唤醒
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from config import config
+
+
+class AIDispatchRejected(Exception):
+    """请求被调度器拒绝（排队超时/队列已满/熔断中），不计入接口的错误统计"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class RateLimitedError(Exception):
+    """接口返回429（限流），retry_after 为建议的等待秒数"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或HTTP日期）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _ProviderState:
+    """单个接口的并发、熔断和耗时统计"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.state = 'closed'  # closed / open / half_open
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self.latency_ewma_ms = 0.0
+        self.counters = {'granted': 0, 'successes': 0, 'failures': 0, 'rate_limited': 0, 'opened': 0}
+
+
+class _Waiter:
+    __slots__ = ('provider', 'account', 'loop', 'future', 'granted', 'probe')
+
+    def __init__(self, provider: str, account: str, loop: asyncio.AbstractEventLoop, probe: bool = False):
+        self.provider = provider
+        self.account = account
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+        self.probe = probe  # 半开状态下作为探测请求排队
+
+
+class AIGovernor:
+    """进程级AI请求调度器（见 get_ai_governor）"""
+
+    def __init__(self, provider_concurrency: int = 8, account_concurrency: int = 2, max_queue: int = 100,
+                 failure_threshold: int = 5, open_seconds: float = 30, default_latency_ms: float = 3000,
+                 max_retry_after: float = 300):
+        self.provider_concurrency = provider_concurrency
+        self.account_concurrency = account_concurrency
+        self.max_queue = max_queue
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.default_latency_ms = default_latency_ms
+        self.max_retry_after = max_retry_after
+        self._providers: Dict[str, _ProviderState] = {}
+        self._accounts: Dict[str, int] = {}
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+        self.counters = {
+            'granted': 0,
+            'queued': 0,
+            'shed_queue_full': 0,
+            'shed_deadline': 0,
+            'rejected_circuit': 0,
+        }
+
+    def _provider(self, name: str) -> _ProviderState:
+        state = self._providers.get(name)
+        if state is None:
+            state = _ProviderState(name, self.provider_concurrency)
+            self._providers[name] = state
+        return state
+
+    @staticmethod
+    def account_key(cookie_id: str) -> str:
+        """备用接口使用 '<cookie_id>#fallback' 登记客户端，并发按真实账号计算"""
+        return (cookie_id or '').split('#', 1)[0]
+
+    @asynccontextmanager
+    async def slot(self, provider: str, cookie_id: str, deadline: Optional[float] = None):
+        """取得一个执行名额，退出时归还并记录结果
+
+        Args:
+            provider: 接口统计名
+            cookie_id: 账号ID
+            deadline: 本次调用的截止时间（time.monotonic()），None表示不限制
+        """
+        account = self.account_key(cookie_id)
+        await self._acquire(provider, account, deadline)
+        started = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            # 被对冲的另一路请求抢先返回而取消，不影响熔断状态
+            self._release(provider, account, None, None)
+            raise
+        except Exception as e:
+            self._release(provider, account, False, e)
+            raise
+        else:
+            self._release(provider, account, True, (time.monotonic() - started) * 1000)
+
+    async def _acquire(self, provider: str, account: str, deadline: Optional[float]):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._provider(provider)
+            self._check_circuit(state)
+            if self._has_capacity(state, account) and not self._blocked_by_waiters(provider, account):
+                self._grant(state, account)
+                return
+
+            if len(self._waiters) >= self.max_queue:
+                self.counters['shed_queue_full'] += 1
+                self._undo_probe(state)
+                raise AIDispatchRejected('queue_full', f"AI请求队列已满({self.max_queue})")
+
+            if deadline is not None:
+                # 估算排队时间：同接口前面排队的请求按并发数分批，每批耗时按接口近期耗时估计
+                ahead = sum(1 for w in self._waiters if w.provider == provider) + 1
+                latency_ms = state.latency_ewma_ms or self.default_latency_ms
+                estimated = (ahead / max(1, state.limit)) * latency_ms / 1000
+                if time.monotonic() + estimated > deadline:
+                    self.counters['shed_deadline'] += 1
+                    self._undo_probe(state)
+                    raise AIDispatchRejected('deadline', f"预计排队{estimated:.1f}秒，超出剩余耗时预算")
+
+            waiter = _Waiter(provider, account, loop, probe=state.state == 'half_open')
+            self._waiters.append(waiter)
+            self.counters['queued'] += 1
+
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+                    if waiter.probe:
+                        self._undo_probe(self._provider(provider))
+            if granted:
+                # 超时与分配名额同时发生：名额已归本请求，直接归还
+                self._release(provider, account, None, None)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.counters['shed_deadline'] += 1
+            raise AIDispatchRejected('deadline', "排队等待超出耗时预算")
+
+    @staticmethod
+    def _refresh_circuit(state: _ProviderState) -> str:
+        """冷却结束时由 open 转为 half_open（持有锁时调用），返回当前状态"""
+        if state.state == 'open' and time.time() >= state.open_until:
+            state.state = 'half_open'
+            state.probe_in_flight = False
+        return state.state
+
+    def _check_circuit(self, state: _ProviderState):
+        """熔断检查（持有锁时调用）：冷却期内拒绝；冷却结束后只放行一个探测请求"""
+        if self._refresh_circuit(state) == 'closed':
+            return
+        now = time.time()
+        if state.state == 'open':
+            self.counters['rejected_circuit'] += 1
+            raise AIDispatchRejected('circuit_open', f"接口 {state.name} 熔断中，{state.open_until - now:.0f}秒后重试")
+        if state.probe_in_flight:
+            self.counters['rejected_circuit'] += 1
+            raise AIDispatchRejected('circuit_open', f"接口 {state.name} 正在探测恢复")
+        state.probe_in_flight = True
+
+    @staticmethod
+    def _undo_probe(state: _ProviderState):
+        if state.state == 'half_open':
+            state.probe_in_flight = False
+
+    def _has_capacity(self, state: _ProviderState, account: str) -> bool:
+        return state.active < state.limit and self._accounts.get(account, 0) < self.account_concurrency
+
+    def _blocked_by_waiters(self, provider: str, account: str) -> bool:
+        """同接口或同账号已有人排队时不插队"""
+        return any(w.provider == provider or w.account == account for w in self._waiters)
+
+    def _grant(self, state: _ProviderState, account: str):
+        state.active += 1
+        state.counters['granted'] += 1
+        self._accounts[account] = self._accounts.get(account, 0) + 1
+        self.counters['granted'] += 1
+
+    def _release(self, provider: str, account: str, success: Optional[bool], detail: Any):
+        to_wake = []
+        to_reject = []
+        with self._lock:
+            state = self._provider(provider)
+            state.active = max(0, state.active - 1)
+            remaining = self._accounts.get(account, 0) - 1
+            if remaining > 0:
+                self._accounts[account] = remaining
+            else:
+                self._accounts.pop(account, None)
+
+            if success is True:
+                self._record_success(state, detail)
+            elif success is False:
+                self._record_failure(state, detail)
+            else:
+                self._undo_probe(state)
+
+            # 按先进先出唤醒当前有名额的等待者；接口熔断中的等待者直接拒绝，
+            # 半开状态只放行一个探测请求，其余继续排队等待探测结果
+            for waiter in list(self._waiters):
+                waiter_state = self._provider(waiter.provider)
+                circuit = self._refresh_circuit(waiter_state)
+                if circuit == 'open':
+                    self._waiters.remove(waiter)
+                    self.counters['rejected_circuit'] += 1
+                    to_reject.append((waiter, AIDispatchRejected(
+                        'circuit_open', f"接口 {waiter_state.name} 熔断中，{waiter_state.open_until - time.time():.0f}秒后重试")))
+                    continue
+                if not self._has_capacity(waiter_state, waiter.account):
+                    continue
+                if circuit == 'half_open' and not waiter.probe:
+                    if waiter_state.probe_in_flight:
+                        continue
+                    waiter_state.probe_in_flight = True
+                    waiter.probe = True
+                self._waiters.remove(waiter)
+                waiter.granted = True
+                self._grant(waiter_state, waiter.account)
+                to_wake.append(waiter)
+
+        for waiter in to_wake:
+            if not waiter.loop.is_closed():
+                waiter.loop.call_soon_threadsafe(self._wake, waiter.future)
+        for waiter, error in to_reject:
+            if not waiter.loop.is_closed():
+                waiter.loop.call_soon_threadsafe(self._wake, waiter.future, error)
+
+    @staticmethod
+    def _wake(future: asyncio.Future, error: Optional[Exception] = None):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(True)
+
+    def _record_success(self, state: _ProviderState, latency_ms: float):
+        state.counters['successes'] += 1
+        state.consecutive_failures = 0
+        state.latency_ewma_ms = latency_ms if not state.latency_ewma_ms else 0.8 * state.latency_ewma_ms + 0.2 * latency_ms
+        if state.state != 'closed':
+            logger.info(f"大模型接口 {state.name} 已恢复，关闭熔断")
+        state.state = 'closed'
+        state.probe_in_flight = False
+
+    def _record_failure(self, state: _ProviderState, error: Exception):
+        state.counters['failures'] += 1
+        state.consecutive_failures += 1
+        state.probe_in_flight = False
+        now = time.time()
+
+        retry_after = self._retry_after_of(error)
+        if retry_after is not None:
+            state.counters['rate_limited'] += 1
+            retry_after = min(retry_after, self.max_retry_after) or self.open_seconds
+            self._open(state, now + retry_after, f"接口限流(429)，{retry_after:.0f}秒后重试")
+        elif state.state == 'half_open' or state.consecutive_failures >= self.failure_threshold:
+            self._open(state, now + self.open_seconds, f"连续失败{state.consecutive_failures}次")
+
+    def _open(self, state: _ProviderState, until: float, reason: str):
+        if state.state != 'open':
+            state.counters['opened'] += 1
+        state.state = 'open'
+        state.open_until = max(state.open_until, until)
+        logger.warning(f"大模型接口 {state.name} 熔断: {reason}")
+
+    @staticmethod
+    def _retry_after_of(error: Exception) -> Optional[float]:
+        """从异常中识别429限流并取出建议等待时间（没有 Retry-After 时返回0）"""
+        if isinstance(error, RateLimitedError):
+            return error.retry_after or 0.0
+        # openai 等SDK的异常：status_code/response.headers
+        status = getattr(error, 'status_code', None) or getattr(error, 'status', None)
+        if status != 429:
+            return None
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None) or {}
+        return parse_retry_after(headers.get('retry-after') or headers.get('Retry-After')) or 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """队列与熔断状态"""
+        now = time.time()
+        with self._lock:
+            providers = [{
+                'name': s.name,
+                'state': s.state if not (s.state == 'open' and now >= s.open_until) else 'half_open',
+                'active': s.active,
+                'limit': s.limit,
+                'waiting': sum(1 for w in self._waiters if w.provider == s.name),
+                'consecutive_failures': s.consecutive_failures,
+                'open_remaining_seconds': round(max(0.0, s.open_until - now), 1) if s.state == 'open' else 0,
+                'latency_ewma_ms': round(s.latency_ewma_ms, 1),
+                **s.counters,
+            } for s in self._providers.values()]
+            return {
+                **self.counters,
+                'queue_length': len(self._waiters),
+                'max_queue': self.max_queue,
+                'provider_concurrency': self.provider_concurrency,
+                'account_concurrency': self.account_concurrency,
+                'active_accounts': dict(self._accounts),
+                'providers': providers,
+            }
+
+
+_governor: Optional[AIGovernor] = None
+
+
+def get_ai_governor() -> AIGovernor:
+    """获取进程级AI请求调度器，首次调用时按 AI_REPLY.governor 配置创建"""
+    global _governor
+    if _governor is None:
+        conf = config.get('AI_REPLY.governor', {}) or {}
+        _governor = AIGovernor(
+            provider_concurrency=conf.get('provider_concurrency', 8),
+            account_concurrency=conf.get('account_concurrency', 2),
+            max_queue=conf.get('max_queue', 100),
+            failure_threshold=conf.get('failure_threshold', 5),
+            open_seconds=conf.get('open_seconds', 30),
+            default_latency_ms=conf.get('default_latency_ms', 3000),
+            max_retry_after=conf.get('max_retry_after', 300),
+        )
+    return _governor
@@ -0,0 +1,183 @@
+"""
+API请求指标
+- 按 (方法, 路由模板) 记录耗时直方图和状态码计数，常驻内存，路由模板来自FastAPI匹配到的路由（如 /keywords/{cid}），
+  未匹配到路由的请求统一归为 <unmatched>，避免任意路径撑大统计表
+- 访问日志按比例采样，错误（5xx）和慢请求总是记录
+- 静态资源等前缀的请求直接跳过
+- 以 JSON 或 Prometheus 文本格式导出（/metrics）
+"""
+
+import random
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import config
+
+# 直方图桶上限（毫秒）
+DEFAULT_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """固定桶的耗时直方图（非线程安全，由 APIMetrics 加锁）"""
+
+    __slots__ = ('buckets', 'counts', 'count', 'total_ms', 'max_ms')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float):
+        self.counts[bisect_left(self.buckets, value_ms)] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶估算分位数（返回所在桶的上限，落在 +Inf 桶时返回最大值）"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return float(self.buckets[i]) if i < len(self.buckets) else round(self.max_ms, 2)
+        return round(self.max_ms, 2)
+
+
+class RouteStats:
+    __slots__ = ('histogram', 'statuses')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.histogram = LatencyHistogram(buckets)
+        self.statuses: Dict[int, int] = {}
+
+
+class APIMetrics:
+    """进程级API请求指标（见 get_api_metrics）"""
+
+    def __init__(self, sample_rate: float = 0.01, slow_ms: float = 1000,
+                 skip_prefixes: Sequence[str] = ('/static/',), buckets: Sequence[float] = DEFAULT_BUCKETS_MS,
+                 scrape_token: Optional[str] = None):
+        self.scrape_token = scrape_token or None
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.skip_prefixes = tuple(skip_prefixes)
+        self.buckets = tuple(sorted(buckets))
+        self.started_at = time.time()
+        self._routes: Dict[Tuple[str, str], RouteStats] = {}
+        self._lock = threading.Lock()
+        self.skipped = 0
+
+    def skip(self, path: str) -> bool:
+        if path.startswith(self.skip_prefixes):
+            self.skipped += 1
+            return True
+        return False
+
+    def record(self, method: str, route: str, status_code: int, duration_ms: float):
+        key = (method, route)
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = RouteStats(self.buckets)
+            stats.histogram.observe(duration_ms)
+            stats.statuses[status_code] = stats.statuses.get(status_code, 0) + 1
+
+    def should_log(self, status_code: int, duration_ms: float) -> bool:
+        """错误和慢请求总是记录，其它请求按 sample_rate 采样"""
+        if status_code >= 500 or duration_ms >= self.slow_ms:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _items(self) -> List[Tuple[Tuple[str, str], LatencyHistogram, Dict[int, int]]]:
+        with self._lock:
+            items = []
+            for key, stats in self._routes.items():
+                hist = stats.histogram
+                copy = LatencyHistogram(hist.buckets)
+                copy.counts, copy.count, copy.total_ms, copy.max_ms = list(hist.counts), hist.count, hist.total_ms, hist.max_ms
+                items.append((key, copy, dict(stats.statuses)))
+        return items
+
+    def snapshot(self) -> Dict[str, Any]:
+        routes = []
+        for (method, route), hist, statuses in self._items():
+            routes.append({
+                'method': method,
+                'route': route,
+                'count': hist.count,
+                'avg_ms': round(hist.total_ms / hist.count, 2) if hist.count else 0.0,
+                'p50_ms': hist.quantile(0.5),
+                'p95_ms': hist.quantile(0.95),
+                'p99_ms': hist.quantile(0.99),
+                'max_ms': round(hist.max_ms, 2),
+                'statuses': {str(code): n for code, n in sorted(statuses.items())},
+            })
+        routes.sort(key=lambda r: r['count'], reverse=True)
+        return {
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'sample_rate': self.sample_rate,
+            'slow_ms': self.slow_ms,
+            'skipped': self.skipped,
+            'routes': routes,
+        }
+
+    def prometheus(self) -> str:
+        """Prometheus 文本格式"""
+        lines = [
+            '# HELP http_request_duration_seconds API request latency by route',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        status_lines = [
+            '# HELP http_requests_total API requests by route and status',
+            '# TYPE http_requests_total counter',
+        ]
+        for (method, route), hist, statuses in self._items():
+            labels = f'method="{method}",route="{_escape(route)}"'
+            cumulative = 0
+            for bound, n in zip(hist.buckets, hist.counts):
+                cumulative += n
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound / 1000:g}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {hist.total_ms / 1000:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {hist.count}')
+            for code, n in sorted(statuses.items()):
+                status_lines.append(f'http_requests_total{{{labels},status="{code}"}} {n}')
+        return '\n'.join(lines + status_lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self.skipped = 0
+            self.started_at = time.time()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+_metrics: Optional[APIMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_api_metrics() -> APIMetrics:
+    """获取进程级API指标（首次调用时按 API_METRICS 配置创建）"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                conf = config.get('API_METRICS', {}) or {}
+                _metrics = APIMetrics(
+                    sample_rate=float(conf.get('access_log_sample_rate', 0.01)),
+                    slow_ms=float(conf.get('slow_request_ms', 1000)),
+                    skip_prefixes=tuple(conf.get('skip_prefixes', ['/static/', '/favicon.ico'])),
+                    scrape_token=conf.get('scrape_token'),
+                )
+    return _metrics
@@ -0,0 +1,292 @@
+"""
+有界缓存容器
+提供带容量上限和TTL的字典/集合/锁注册表，替代长期运行中只增不减的普通dict/set，
+并支持统计条目数与近似内存占用，用于 /admin/memory 内存报告
+"""
+
+import sys
+import time
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+
+
+def approx_sizeof(obj: Any, depth: int = 3, _seen: set = None) -> int:
+    """估算对象占用的字节数（递归统计容器内元素，depth限制递归深度）"""
+    if _seen is None:
+        _seen = set()
+    obj_id = id(obj)
+    if obj_id in _seen:
+        return 0
+    _seen.add(obj_id)
+
+    size = sys.getsizeof(obj, 0)
+    if depth <= 0:
+        return size
+
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += approx_sizeof(key, depth - 1, _seen)
+            size += approx_sizeof(value, depth - 1, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += approx_sizeof(item, depth - 1, _seen)
+    return size
+
+
+def container_stats(name: str, container: Any, sample_size: int = 50) -> Dict[str, Any]:
+    """统计任意容器的条目数和近似字节数（条目过多时抽样估算）"""
+    if hasattr(container, 'stats'):
+        return container.stats(name)
+
+    try:
+        entries = len(container)
+    except TypeError:
+        entries = 0
+
+    if isinstance(container, dict):
+        items = list(container.items())
+    elif isinstance(container, (list, tuple, set, frozenset)):
+        items = list(container)
+    else:
+        items = []
+
+    return {
+        'name': name,
+        'entries': entries,
+        'max_size': None,
+        'ttl': None,
+        'evictions': 0,
+        'approx_bytes': _estimate_bytes(container, items, sample_size),
+    }
+
+
+def _estimate_bytes(container: Any, items: list, sample_size: int) -> int:
+    """按抽样元素的平均大小估算容器总字节数"""
+    base = sys.getsizeof(container, 0)
+    if not items:
+        return base
+    step = max(1, len(items) // sample_size)
+    sample = items[::step][:sample_size]
+    sampled_bytes = sum(approx_sizeof(item) for item in sample)
+    return base + int(sampled_bytes / len(sample) * len(items))
+
+
+class TTLCache(MutableMapping):
+    """带容量上限（LRU淘汰）和过期时间的线程安全字典
+
+    - 写入时刷新过期时间，读取时刷新LRU顺序
+    - 超过 max_size 时淘汰最久未访问的条目
+    - ttl 为 None 或 0 表示不过期
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: Optional[float] = None,
+                 on_evict: Callable[[Hashable, Any], None] = None):
+        self.max_size = max(1, int(max_size))
+        self.ttl = ttl or None
+        self.on_evict = on_evict
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # {key: (value, expire_at)}
+        self._lock = threading.RLock()
+
+    def _expire_at(self) -> Optional[float]:
+        return time.time() + self.ttl if self.ttl else None
+
+    @staticmethod
+    def _is_expired(expire_at: Optional[float], now: float) -> bool:
+        return expire_at is not None and now >= expire_at
+
+    def _evict(self, key: Hashable, value: Any):
+        self.evictions += 1
+        if self.on_evict:
+            try:
+                self.on_evict(key, value)
+            except Exception:
+                pass
+
+    def _can_evict(self, key: Hashable, value: Any) -> bool:
+        """子类可覆盖，用于保护仍在使用中的条目不被淘汰"""
+        return True
+
+    def _enforce_size(self):
+        if len(self._data) <= self.max_size:
+            return
+        for key in list(self._data.keys()):
+            if len(self._data) <= self.max_size:
+                break
+            value, _ = self._data[key]
+            if self._can_evict(key, value):
+                del self._data[key]
+                self._evict(key, value)
+
+    def __getitem__(self, key: Hashable) -> Any:
+        with self._lock:
+            value, expire_at = self._data[key]
+            if self._is_expired(expire_at, time.time()):
+                del self._data[key]
+                self._evict(key, value)
+                raise KeyError(key)
+            self._data.move_to_end(key)
+            return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (value, self._expire_at())
+            self._data.move_to_end(key)
+            self._enforce_size()
+
+    def __delitem__(self, key: Hashable):
+        with self._lock:
+            del self._data[key]
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False
+            if self._is_expired(entry[1], time.time()):
+                del self._data[key]
+                self._evict(key, entry[0])
+                return False
+            return True
+
+    def __iter__(self) -> Iterator[Hashable]:
+        # 返回快照，允许调用方在遍历过程中增删条目
+        self.purge_expired()
+        with self._lock:
+            return iter(list(self._data.keys()))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def items(self):
+        """返回未过期条目的快照列表（不影响LRU顺序）"""
+        self.purge_expired()
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._data.items()]
+
+    def values(self):
+        """返回未过期值的快照列表（不影响LRU顺序）"""
+        return [value for _, value in self.items()]
+
+    def keys(self):
+        """返回未过期键的快照列表"""
+        return [key for key, _ in self.items()]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                return self[key]
+            except KeyError:
+                self[key] = default
+                return default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def purge_expired(self) -> int:
+        """清理所有已过期条目，返回清理数量"""
+        if not self.ttl:
+            return 0
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expire_at) in self._data.items()
+                       if self._is_expired(expire_at, now)]
+            for key in expired:
+                value, _ = self._data.pop(key)
+                if self._can_evict(key, value):
+                    self._evict(key, value)
+                else:
+                    # 仍在使用中的条目延长有效期
+                    self._data[key] = (value, self._expire_at())
+            return len(expired)
+
+    def stats(self, name: str = '', sample_size: int = 50) -> Dict[str, Any]:
+        """返回条目数、容量、淘汰次数与近似字节数"""
+        with self._lock:
+            items = [(key, entry[0]) for key, entry in self._data.items()]
+        return {
+            'name': name,
+            'entries': len(items),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'evictions': self.evictions,
+            'approx_bytes': _estimate_bytes(self._data, items, sample_size),
+        }
+
+
+class TTLSet:
+    """带容量上限和过期时间的集合，接口与set常用方法保持一致"""
+
+    def __init__(self, max_size: int = 1000, ttl: Optional[float] = None):
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    def add(self, item: Hashable):
+        self._cache[item] = True
+
+    def discard(self, item: Hashable):
+        self._cache.pop(item, None)
+
+    def remove(self, item: Hashable):
+        if item not in self._cache:
+            raise KeyError(item)
+        del self._cache[item]
+
+    def clear(self):
+        self._cache.clear()
+
+    def purge_expired(self) -> int:
+        return self._cache.purge_expired()
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._cache
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._cache)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def stats(self, name: str = '', sample_size: int = 50) -> Dict[str, Any]:
+        return self._cache.stats(name, sample_size)
+
+
+class KeyedLocks(TTLCache):
+    """按key惰性创建锁的有界注册表，替代 defaultdict(lambda: asyncio.Lock())
+
+    被持有的锁不会被淘汰，避免破坏互斥语义
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: Optional[float] = None,
+                 factory: Callable[[], Any] = None):
+        super().__init__(max_size=max_size, ttl=ttl)
+        if factory is None:
+            import asyncio
+            factory = asyncio.Lock
+        self.factory = factory
+
+    def _can_evict(self, key: Hashable, value: Any) -> bool:
+        locked = getattr(value, 'locked', None)
+        return not (locked and locked())
+
+    def __getitem__(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                lock = self.factory()
+                self._data[key] = (lock, self._expire_at())
+                self._enforce_size()
+                return lock
+            # 访问即续期，空闲超过ttl的锁才会被清理
+            self._data[key] = (entry[0], self._expire_at())
+            self._data.move_to_end(key)
+            return entry[0]
@@ -0,0 +1,481 @@
+"""
+Playwright浏览器池
+进程级共享少量常驻浏览器，按账号复用BrowserContext（注入Cookie）和Page，
+支持空闲回收、崩溃恢复和全局并发上限，供订单详情和商品详情获取复用
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from config import config
+
+
+BROWSER_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-accelerated-2d-canvas',
+    '--no-first-run',
+    '--no-zygote',
+    '--disable-gpu',
+    '--disable-background-timer-throttling',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-renderer-backgrounding',
+    '--disable-features=TranslateUI',
+    '--disable-ipc-flooding-protection',
+    '--disable-extensions',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-translate',
+    '--hide-scrollbars',
+    '--mute-audio',
+    '--no-default-browser-check',
+    '--no-pings'
+]
+
+# Docker环境中额外添加的参数
+DOCKER_BROWSER_ARGS = [
+    '--disable-background-networking',
+    '--disable-client-side-phishing-detection',
+    '--disable-hang-monitor',
+    '--disable-popup-blocking',
+    '--disable-prompt-on-repost',
+    '--disable-web-resources',
+    '--metrics-recording-only',
+    '--safebrowsing-disable-auto-update',
+    '--enable-automation',
+    '--password-store=basic',
+    '--use-mock-keychain',
+    '--memory-pressure-off',
+    '--disable-component-extensions-with-background-pages',
+    '--disable-logging',
+    '--disable-permissions-api',
+    '--disable-notifications'
+]
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36'
+
+# 页面/浏览器已关闭时Playwright抛出的异常特征
+_CLOSED_ERROR_MARKERS = ('has been closed', 'Target closed', 'Browser closed', 'Connection closed')
+
+
+def get_browser_args() -> List[str]:
+    """获取浏览器启动参数（Docker环境追加稳定性参数）"""
+    args = list(BROWSER_ARGS)
+    if os.getenv('DOCKER_ENV'):
+        args.extend(arg for arg in DOCKER_BROWSER_ARGS if arg not in args)
+    return args
+
+
+def parse_cookie_string(cookie_string: str, domain: str = '.goofish.com') -> List[Dict[str, str]]:
+    """将Cookie字符串转换为Playwright的Cookie列表"""
+    cookies = []
+    for cookie_pair in (cookie_string or '').split('; '):
+        if '=' in cookie_pair:
+            name, value = cookie_pair.split('=', 1)
+            cookies.append({
+                'name': name.strip(),
+                'value': value.strip(),
+                'domain': domain,
+                'path': '/'
+            })
+    return cookies
+
+
+class _PooledBrowser:
+    """池中的浏览器实例"""
+
+    def __init__(self, browser, headless: bool):
+        self.browser = browser
+        self.headless = headless
+        self.created_at = time.time()
+        self.last_used = time.time()
+        self.contexts = 0
+        self.crashed = False
+
+    @property
+    def alive(self) -> bool:
+        try:
+            return not self.crashed and self.browser.is_connected()
+        except Exception:
+            return False
+
+
+class _PooledContext:
+    """池中按账号复用的浏览器上下文"""
+
+    def __init__(self, context, owner: _PooledBrowser, cookie_hash: str):
+        self.context = context
+        self.owner = owner
+        self.cookie_hash = cookie_hash
+        self.idle_pages: List[Any] = []
+        self.active_pages = 0
+        self.created_at = time.time()
+        self.last_used = time.time()
+
+
+class BrowserPool:
+    """进程级浏览器池（绑定创建它的事件循环）"""
+
+    def __init__(self, max_browsers: int = 2, max_concurrency: int = 4,
+                 max_idle_pages: int = 2, context_idle_ttl: float = 600,
+                 browser_idle_ttl: float = 1800, reap_interval: float = 60):
+        self.max_browsers = max(1, int(max_browsers))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_idle_pages = max(0, int(max_idle_pages))
+        self.context_idle_ttl = context_idle_ttl
+        self.browser_idle_ttl = browser_idle_ttl
+        self.reap_interval = reap_interval
+
+        self._playwright = None
+        self._browsers: List[_PooledBrowser] = []
+        self._contexts: Dict[tuple, _PooledContext] = {}  # {(account_key, headless): _PooledContext}
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._lock = asyncio.Lock()
+        self._reaper_task: Optional[asyncio.Task] = None
+        self._closing: set = set()  # 后台关闭中的上下文任务（保留引用，避免被回收）
+        self._waiting = 0
+        self._in_use = 0
+
+        self.counters = {
+            'browser_launches': 0,
+            'browser_crashes': 0,
+            'context_creates': 0,
+            'cookie_refreshes': 0,
+            'page_creates': 0,
+            'page_reuses': 0,
+            'leases': 0,
+            'lease_errors': 0,
+            'evicted_contexts': 0,
+            'evicted_browsers': 0,
+        }
+
+    async def _ensure_playwright(self):
+        if self._playwright is None:
+            from playwright.async_api import async_playwright
+            self._playwright = await async_playwright().start()
+            logger.info("浏览器池: Playwright已启动")
+        return self._playwright
+
+    def _ensure_reaper(self):
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.get_running_loop().create_task(self._reap_loop())
+
+    async def _reap_loop(self):
+        try:
+            while True:
+                await asyncio.sleep(self.reap_interval)
+                if await self._reap_once():
+                    break
+        except asyncio.CancelledError:
+            raise
+
+    async def _reap_once(self) -> bool:
+        """回收一次空闲资源，全部回收后停止Playwright（下次使用时再启动），已停止时返回True"""
+        try:
+            await self.evict_idle()
+        except Exception as e:
+            logger.warning(f"浏览器池空闲回收失败: {e}")
+        # 与 _get_context 持有同一把锁检查并停止，避免在启动浏览器的过程中停止Playwright
+        async with self._lock:
+            if self._browsers or self._contexts:
+                return False
+            await self._stop_playwright()
+            return True
+
+    def _on_browser_disconnected(self, entry: _PooledBrowser):
+        if not entry.crashed:
+            entry.crashed = True
+            self.counters['browser_crashes'] += 1
+            logger.warning("浏览器池: 检测到浏览器断开连接，将在下次使用时重建")
+
+    async def _launch_browser(self, headless: bool) -> _PooledBrowser:
+        playwright = await self._ensure_playwright()
+        browser = await playwright.chromium.launch(headless=headless, args=get_browser_args())
+        entry = _PooledBrowser(browser, headless)
+        try:
+            browser.on('disconnected', lambda _: self._on_browser_disconnected(entry))
+        except Exception:
+            pass
+        self._browsers.append(entry)
+        self.counters['browser_launches'] += 1
+        logger.info(f"浏览器池: 启动新浏览器 (headless={headless})，当前浏览器数: {len(self._browsers)}")
+        return entry
+
+    def _drop_dead(self):
+        """移除已崩溃的浏览器及其上下文"""
+        dead = [entry for entry in self._browsers if not entry.alive]
+        if not dead:
+            return
+        for key, ctx in list(self._contexts.items()):
+            if ctx.owner in dead:
+                del self._contexts[key]
+        self._browsers = [entry for entry in self._browsers if entry not in dead]
+
+    async def _get_browser(self, headless: bool) -> _PooledBrowser:
+        self._drop_dead()
+        candidates = [entry for entry in self._browsers if entry.headless == headless]
+        # 所有浏览器都已承载上下文且未达上限时启动新浏览器，否则选负载最低的
+        if len(candidates) < self.max_browsers and all(entry.contexts > 0 for entry in candidates):
+            return await self._launch_browser(headless)
+        return min(candidates, key=lambda entry: entry.contexts)
+
+    async def _get_context(self, account_key: str, cookie_string: str, headless: bool) -> _PooledContext:
+        cookie_hash = hashlib.md5((cookie_string or '').encode('utf-8')).hexdigest()
+        key = (account_key, headless)
+
+        async with self._lock:
+            ctx = self._contexts.get(key)
+            if ctx and not ctx.owner.alive:
+                del self._contexts[key]
+                ctx = None
+
+            if ctx is None:
+                owner = await self._get_browser(headless)
+                context = await owner.browser.new_context(
+                    viewport={'width': 1920, 'height': 1080},
+                    user_agent=DEFAULT_USER_AGENT
+                )
+                await context.add_cookies(parse_cookie_string(cookie_string))
+                ctx = _PooledContext(context, owner, cookie_hash)
+                owner.contexts += 1
+                self._contexts[key] = ctx
+                self.counters['context_creates'] += 1
+                logger.info(f"浏览器池: 为账号 {account_key} 创建浏览器上下文")
+            elif ctx.cookie_hash != cookie_hash:
+                # 账号Cookie已更新，重新注入
+                await ctx.context.clear_cookies()
+                await ctx.context.add_cookies(parse_cookie_string(cookie_string))
+                ctx.cookie_hash = cookie_hash
+                self.counters['cookie_refreshes'] += 1
+                logger.info(f"浏览器池: 账号 {account_key} 的Cookie已更新，重新注入")
+
+            ctx.last_used = time.time()
+            ctx.owner.last_used = time.time()
+            ctx.active_pages += 1
+            return ctx
+
+    async def _acquire_page(self, ctx: _PooledContext):
+        while ctx.idle_pages:
+            page = ctx.idle_pages.pop()
+            if not page.is_closed():
+                self.counters['page_reuses'] += 1
+                return page
+        page = await ctx.context.new_page()
+        self.counters['page_creates'] += 1
+        return page
+
+    async def _release_page(self, ctx: _PooledContext, page, broken: bool):
+        ctx.active_pages = max(0, ctx.active_pages - 1)
+        ctx.last_used = time.time()
+        if broken or page.is_closed() or len(ctx.idle_pages) >= self.max_idle_pages:
+            try:
+                if not page.is_closed():
+                    await page.close()
+            except Exception:
+                pass
+            return
+        try:
+            # 释放前跳转到空白页，停止后台请求和脚本
+            await page.goto('about:blank')
+            ctx.idle_pages.append(page)
+        except Exception:
+            try:
+                await page.close()
+            except Exception:
+                pass
+
+    @asynccontextmanager
+    async def page(self, account_key: str, cookie_string: str, headless: bool = True,
+                   extra_headers: Optional[Dict[str, str]] = None):
+        """借用指定账号的页面，用完自动归还
+
+        Args:
+            account_key: 账号标识（用于复用BrowserContext）
+            cookie_string: 账号Cookie字符串
+            headless: 是否无头模式
+            extra_headers: 页面级额外HTTP头
+        """
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._in_use += 1
+
+        ctx = None
+        page = None
+        broken = False
+        try:
+            self._ensure_reaper()
+            ctx = await self._get_context(account_key, cookie_string, headless)
+            page = await self._acquire_page(ctx)
+            await page.set_extra_http_headers(extra_headers or {})
+            self.counters['leases'] += 1
+            yield page
+        except Exception as e:
+            broken = True
+            self.counters['lease_errors'] += 1
+            if any(marker in str(e) for marker in _CLOSED_ERROR_MARKERS) and ctx:
+                # 浏览器或上下文已崩溃，丢弃该上下文，下次重建
+                self._on_context_broken(account_key, headless, ctx)
+            raise
+        finally:
+            try:
+                if ctx is not None and page is not None:
+                    await self._release_page(ctx, page, broken)
+                elif ctx is not None:
+                    ctx.active_pages = max(0, ctx.active_pages - 1)
+            finally:
+                self._in_use -= 1
+                self._semaphore.release()
+
+    def _on_context_broken(self, account_key: str, headless: bool, ctx: _PooledContext):
+        key = (account_key, headless)
+        if self._contexts.get(key) is ctx:
+            del self._contexts[key]
+            ctx.owner.contexts = max(0, ctx.owner.contexts - 1)
+        if not ctx.owner.alive:
+            self._drop_dead()
+        else:
+            # 浏览器仍在运行时上下文需要关闭，否则一直占用浏览器资源；后台关闭，不阻塞抛出异常
+            task = asyncio.get_running_loop().create_task(self._close_context(ctx))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close_context(ctx: _PooledContext, timeout: float = 10):
+        try:
+            await asyncio.wait_for(ctx.context.close(), timeout=timeout)
+        except Exception as e:
+            logger.debug(f"浏览器池: 关闭损坏的上下文失败: {e}")
+
+    async def evict_idle(self) -> int:
+        """关闭空闲超时的上下文和浏览器，返回回收数量"""
+        now = time.time()
+        evicted = 0
+        async with self._lock:
+            self._drop_dead()
+            for key, ctx in list(self._contexts.items()):
+                if ctx.active_pages == 0 and now - ctx.last_used > self.context_idle_ttl:
+                    del self._contexts[key]
+                    ctx.owner.contexts = max(0, ctx.owner.contexts - 1)
+                    try:
+                        await ctx.context.close()
+                    except Exception:
+                        pass
+                    evicted += 1
+                    self.counters['evicted_contexts'] += 1
+
+            for entry in list(self._browsers):
+                if entry.contexts == 0 and now - entry.last_used > self.browser_idle_ttl:
+                    self._browsers.remove(entry)
+                    try:
+                        await entry.browser.close()
+                    except Exception:
+                        pass
+                    evicted += 1
+                    self.counters['evicted_browsers'] += 1
+
+        if evicted:
+            logger.info(f"浏览器池: 回收 {evicted} 个空闲资源，剩余浏览器 {len(self._browsers)}，上下文 {len(self._contexts)}")
+        return evicted
+
+    async def _stop_playwright(self):
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+            logger.info("浏览器池: Playwright已停止")
+
+    async def close(self):
+        """关闭池中所有资源"""
+        if self._reaper_task and not self._reaper_task.done():
+            self._reaper_task.cancel()
+        async with self._lock:
+            for ctx in self._contexts.values():
+                try:
+                    await ctx.context.close()
+                except Exception:
+                    pass
+            self._contexts.clear()
+            for entry in self._browsers:
+                try:
+                    await entry.browser.close()
+                except Exception:
+                    pass
+            self._browsers.clear()
+            await self._stop_playwright()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回池状态统计"""
+        browsers = list(self._browsers)
+        contexts = list(self._contexts.items())
+        now = time.time()
+        return {
+            'max_browsers': self.max_browsers,
+            'max_concurrency': self.max_concurrency,
+            'in_use': self._in_use,
+            'waiting': self._waiting,
+            'browsers': [
+                {
+                    'headless': entry.headless,
+                    'alive': entry.alive,
+                    'contexts': entry.contexts,
+                    'age_seconds': int(now - entry.created_at),
+                    'idle_seconds': int(now - entry.last_used),
+                }
+                for entry in browsers
+            ],
+            'contexts': [
+                {
+                    'account': key[0],
+                    'headless': key[1],
+                    'active_pages': ctx.active_pages,
+                    'idle_pages': len(ctx.idle_pages),
+                    'idle_seconds': int(now - ctx.last_used),
+                }
+                for key, ctx in contexts
+            ],
+            'counters': dict(self.counters),
+        }
+
+
+# 每个事件循环一个浏览器池（Playwright对象不能跨事件循环使用）
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, BrowserPool]" = weakref.WeakKeyDictionary()
+
+
+def is_browser_pool_enabled() -> bool:
+    """是否启用浏览器池（BROWSER_POOL.enabled）"""
+    return bool(config.get('BROWSER_POOL.enabled', True))
+
+
+def get_browser_pool() -> BrowserPool:
+    """获取当前事件循环的浏览器池，不存在时按配置创建"""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool_conf = config.get('BROWSER_POOL', {}) or {}
+        pool = BrowserPool(
+            max_browsers=pool_conf.get('max_browsers', 2),
+            max_concurrency=pool_conf.get('max_concurrency', 4),
+            max_idle_pages=pool_conf.get('max_idle_pages', 2),
+            context_idle_ttl=pool_conf.get('context_idle_ttl', 600),
+            browser_idle_ttl=pool_conf.get('browser_idle_ttl', 1800),
+        )
+        _pools[loop] = pool
+    return pool
+
+
+def get_all_pool_stats() -> List[Dict[str, Any]]:
+    """获取所有事件循环中浏览器池的统计"""
+    return [pool.stats() for pool in list(_pools.values())]
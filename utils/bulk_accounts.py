@@ -0,0 +1,56 @@
+"""
+账号批量操作：校验批量请求的参数并转换为 DBManager.update_accounts_batch 的操作，
+批量大小和任务启停间隔来自 BULK_ACCOUNTS 配置
+"""
+
+from typing import Any, Dict, Optional, Tuple
+
+from config import config
+
+# 接口操作 -> update_accounts_batch 的操作
+OPERATIONS = {
+    'enable': 'status',
+    'disable': 'status',
+    'pause_duration': 'pause_duration',
+    'auto_confirm': 'auto_confirm',
+    'default_reply': 'default_reply',
+    'notification': 'notification',
+}
+
+
+def get_bulk_settings() -> Dict[str, Any]:
+    """批量操作配置 {max_batch, task_interval}"""
+    conf = config.get('BULK_ACCOUNTS', {}) or {}
+    return {
+        'max_batch': int(conf.get('max_batch', 500)),
+        'task_interval': max(0.0, float(conf.get('task_interval', 1.0))),
+    }
+
+
+def resolve_operation(operation: str, pause_duration: Optional[int] = None, auto_confirm: Optional[bool] = None,
+                      enabled: Optional[bool] = None, reply_content: Optional[str] = None,
+                      reply_once: bool = False, channel_id: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """校验请求参数，返回 (数据库操作, 参数)
+
+    Raises:
+        ValueError: 操作不支持或缺少/超出范围的参数
+    """
+    if operation not in OPERATIONS:
+        raise ValueError(f"不支持的操作: {operation}，可选: {', '.join(OPERATIONS)}")
+    if operation in ('enable', 'disable'):
+        return 'status', {'enabled': operation == 'enable'}
+    if operation == 'pause_duration':
+        if pause_duration is None or not 0 <= pause_duration <= 60:
+            raise ValueError("暂停时间必须在0-60分钟之间（0表示不暂停）")
+        return 'pause_duration', {'pause_duration': pause_duration}
+    if operation == 'auto_confirm':
+        if auto_confirm is None:
+            raise ValueError("缺少参数 auto_confirm")
+        return 'auto_confirm', {'auto_confirm': auto_confirm}
+    if operation == 'default_reply':
+        if enabled is None:
+            raise ValueError("缺少参数 enabled")
+        return 'default_reply', {'enabled': enabled, 'reply_content': reply_content, 'reply_once': reply_once}
+    if channel_id is None:
+        raise ValueError("缺少参数 channel_id")
+    return 'notification', {'channel_id': channel_id, 'enabled': True if enabled is None else enabled}
@@ -0,0 +1,119 @@
+"""
+接口的条件GET（ETag / If-None-Match）与响应缓存
+- ETag 由 数据库epoch + 用户ID + 请求URL + 相关表的版本号（db_manager.table_versions）计算，
+  不需要查询数据库；客户端带上相同的 If-None-Match 时直接返回 304
+- 可选缓存热点GET的序列化响应体（按 ETag 存取，表有写入后 ETag 改变，旧条目自然不再命中，按LRU淘汰）
+- 只处理在 ConditionalGetCache.register 中登记过的路由，其它请求原样放行
+"""
+
+import hashlib
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import config
+from utils.bounded_cache import TTLCache
+
+
+class ConditionalGetCache:
+    """条件GET的路由表、ETag计算与响应缓存（见 get_conditional_get_cache）"""
+
+    def __init__(self, versions, enabled: bool = True, cache_enabled: bool = True,
+                 max_entries: int = 256, max_body_bytes: int = 512 * 1024):
+        self.versions = versions
+        self.enabled = enabled
+        self.cache_enabled = cache_enabled
+        self.max_body_bytes = max_body_bytes
+        self._routes: List[Tuple[re.Pattern, str, Tuple[str, ...]]] = []
+        self._cache = TTLCache(max_size=max_entries)
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'not_modified': 0, 'cache_hits': 0, 'cache_misses': 0,
+                          'stored': 0, 'too_large': 0, 'changed_during_request': 0}
+
+    def register(self, path: str, tables: Sequence[str]):
+        """登记路由，path 为FastAPI路由模板（如 /keywords/{cid}），tables 为响应依赖的表"""
+        pattern = re.sub(r'\\\{\w+\\\}', r'[^/]+', re.escape(path))
+        self._routes.append((re.compile(f'^{pattern}$'), path, tuple(tables)))
+
+    def match(self, path: str) -> Optional[Tuple[str, Tuple[str, ...]]]:
+        """返回匹配的 (路由模板, 依赖的表)"""
+        for pattern, template, tables in self._routes:
+            if pattern.match(path):
+                return template, tables
+        return None
+
+    def etag(self, user_id: Any, url: str, tables: Sequence[str]) -> str:
+        raw = f"{self.versions.epoch}|{user_id}|{url}|{self.versions.get(*tables)}"
+        return 'W/"' + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24] + '"'
+
+    @staticmethod
+    def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        # 弱比较：忽略 W/ 前缀
+        target = etag[2:] if etag.startswith('W/') else etag
+        for candidate in if_none_match.split(','):
+            candidate = candidate.strip()
+            if candidate.startswith('W/'):
+                candidate = candidate[2:]
+            if candidate == target:
+                return True
+        return False
+
+    def count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, etag: str) -> Optional[Tuple[bytes, str]]:
+        """取缓存的 (响应体, media_type)"""
+        if not self.cache_enabled:
+            return None
+        entry = self._cache.get(etag)
+        self.count('cache_hits' if entry is not None else 'cache_misses')
+        return entry
+
+    def put(self, etag: str, body: bytes, media_type: str):
+        if not self.cache_enabled:
+            return
+        if len(body) > self.max_body_bytes:
+            self.count('too_large')
+            return
+        self._cache[etag] = (body, media_type)
+        self.count('stored')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters['cache_hits'] + counters['cache_misses']
+        return {
+            'enabled': self.enabled,
+            'cache_enabled': self.cache_enabled,
+            'routes': len(self._routes),
+            **counters,
+            'not_modified_rate': round(counters['not_modified'] / counters['requests'], 4) if counters['requests'] else 0.0,
+            'cache_hit_rate': round(counters['cache_hits'] / lookups, 4) if lookups else 0.0,
+            'cache': self._cache.stats('http_response_cache'),
+            'table_versions': self.versions.snapshot(),
+        }
+
+
+_cache: Optional[ConditionalGetCache] = None
+
+
+def get_conditional_get_cache() -> ConditionalGetCache:
+    """获取进程级条件GET缓存（首次调用时按 HTTP_CACHE 配置创建）"""
+    global _cache
+    if _cache is None:
+        from db_manager import table_versions
+
+        conf = config.get('HTTP_CACHE', {}) or {}
+        _cache = ConditionalGetCache(
+            table_versions,
+            enabled=conf.get('enabled', True),
+            cache_enabled=conf.get('response_cache', True),
+            max_entries=conf.get('max_entries', 256),
+            max_body_bytes=int(conf.get('max_body_kb', 512)) * 1024,
+        )
+    return _cache
@@ -0,0 +1,147 @@
+"""
+AI对话状态
+每个 (cookie_id, chat_id) 在内存中维护一份对话状态：最近若干轮消息的环形缓冲、
+被缓冲淘汰的轮次折叠成的滚动摘要、累计议价次数和最后一条消息时间。首次使用时从 ai_conversations 表懒加载，之后由
+save_conversation 增量更新，作为生成回复时读取上下文/议价次数/最近消息的唯一来源，
+SQL 只在冷启动（首次加载或被LRU淘汰后）时执行
+
+注意：状态保存在进程内，多进程同时处理同一账号时各进程的状态互不可见
+"""
+
+import calendar
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from utils.bounded_cache import TTLCache
+from utils.prompt_builder import summarize_turn
+
+
+def _parse_created_at(created_at: Optional[str]) -> float:
+    """把SQLite的 CURRENT_TIMESTAMP（UTC, 'YYYY-MM-DD HH:MM:SS'）转换为时间戳"""
+    if not created_at:
+        return time.time()
+    try:
+        return calendar.timegm(time.strptime(str(created_at)[:19], '%Y-%m-%d %H:%M:%S'))
+    except ValueError:
+        return time.time()
+
+
+class ConversationState:
+    """单个对话的状态"""
+
+    __slots__ = ('turns', 'summary', 'bargain_count', 'last_message_at')
+
+    def __init__(self, max_turns: int):
+        # 每轮: (role, content, intent, created_at字符串, 时间戳)
+        self.turns: deque = deque(maxlen=max_turns)
+        # 被环形缓冲淘汰的轮次折叠成的摘要片段（滚动保留最近若干条）
+        self.summary: deque = deque(maxlen=max_turns)
+        self.bargain_count = 0
+        self.last_message_at = 0.0
+
+    def append(self, role: str, content: str, intent: Optional[str], created_at: Optional[str]):
+        ts = _parse_created_at(created_at)
+        if len(self.turns) == self.turns.maxlen:
+            old_role, old_content = self.turns[0][:2]
+            self.summary.append(summarize_turn(old_role, old_content))
+        self.turns.append((role, content, intent, created_at, ts))
+        if role == 'user' and intent == 'price':
+            self.bargain_count += 1
+        self.last_message_at = max(self.last_message_at, ts)
+
+    def context(self, limit: int) -> List[Dict]:
+        turns = list(self.turns)[-limit:] if limit else []
+        return [{"role": role, "content": content} for role, content, _, _, _ in turns]
+
+    def prompt_history(self) -> Tuple[List[Tuple[str, str]], List[str]]:
+        """提示词组装用的对话快照：([(role, content)] 从旧到新, 摘要片段)"""
+        return [(role, content) for role, content, _, _, _ in self.turns], list(self.summary)
+
+    def recent_user_messages(self, seconds: float) -> List[Dict]:
+        threshold = time.time() - seconds
+        return [
+            {"content": content, "created_at": created_at}
+            for role, content, _, created_at, ts in self.turns
+            if role == 'user' and ts > threshold
+        ]
+
+
+class ConversationStateStore:
+    """对话状态存储（LRU + 空闲过期），读写都需要持有 self.lock"""
+
+    def __init__(self, max_size: int = 5000, ttl: float = 3600, max_turns: int = 20):
+        self.max_turns = max_turns
+        self.lock = threading.RLock()
+        self._states = TTLCache(max_size=max_size, ttl=ttl)
+        self.counters = {'hits': 0, 'cold_loads': 0, 'appends': 0}
+
+    def get(self, cookie_id: str, chat_id: str) -> ConversationState:
+        """获取对话状态，不在内存中时从数据库加载（调用方需在线程池中调用）"""
+        key = (cookie_id, chat_id)
+        with self.lock:
+            state = self._states.get(key)
+            if state is not None:
+                self.counters['hits'] += 1
+                # 重新写入以刷新LRU顺序和空闲过期时间
+                self._states[key] = state
+                return state
+            state = self._load(cookie_id, chat_id)
+            self.counters['cold_loads'] += 1
+            self._states[key] = state
+            return state
+
+    def append(self, cookie_id: str, chat_id: str, role: str, content: str,
+               intent: Optional[str], created_at: Optional[str]):
+        """对话记录写入数据库后调用；未加载的对话不处理，下次使用时会从数据库加载到最新数据"""
+        with self.lock:
+            state = self._states.get((cookie_id, chat_id))
+            if state is not None:
+                state.append(role, content, intent, created_at)
+                self.counters['appends'] += 1
+
+    def _load(self, cookie_id: str, chat_id: str) -> ConversationState:
+        from db_manager import db_manager
+        state = ConversationState(self.max_turns)
+        try:
+            rows, bargain_count = self._query(db_manager, cookie_id, chat_id)
+        except Exception as e:
+            logger.error(f"加载对话状态失败: {e}")
+            return state
+        for role, content, intent, created_at in rows:
+            state.append(role, content, intent, created_at)
+        # 议价次数以全量历史为准（环形缓冲只保留最近几轮）
+        state.bargain_count = bargain_count
+        return state
+
+    def _query(self, db_manager, cookie_id: str, chat_id: str) -> Tuple[List[tuple], int]:
+        with db_manager.lock:
+            cursor = db_manager.conn.cursor()
+            cursor.execute('''
+            SELECT role, content, intent, created_at FROM ai_conversations
+            WHERE chat_id = ? AND cookie_id = ?
+            ORDER BY created_at DESC, id DESC LIMIT ?
+            ''', (chat_id, cookie_id, self.max_turns))
+            rows = list(reversed(cursor.fetchall()))
+            cursor.execute('''
+            SELECT COUNT(*) FROM ai_conversations
+            WHERE chat_id = ? AND cookie_id = ? AND intent = 'price' AND role = 'user'
+            ''', (chat_id, cookie_id))
+            result = cursor.fetchone()
+        return rows, result[0] if result else 0
+
+    def clear(self):
+        """丢弃全部状态（对话表被外部修改后调用，之后按需重新加载）"""
+        with self.lock:
+            self._states.clear()
+
+    def purge_expired(self) -> int:
+        with self.lock:
+            return self._states.purge_expired()
+
+    def stats(self, name: str = 'conversation_states') -> Dict[str, Any]:
+        with self.lock:
+            return {**self._states.stats(name), **self.counters, 'max_turns': self.max_turns}
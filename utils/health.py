@@ -0,0 +1,151 @@
+"""
+健康检查
+后台线程定时采样CPU/内存并探测数据库（只读连接），健康检查接口只读取缓存的采样结果，
+不会阻塞API事件循环，也不会占用数据库全局锁
+- /health/live：进程存活即返回200
+- /health/ready：Cookie管理器已初始化、数据库探测成功且采样未过期时返回200，否则503
+- /health：汇总信息（无需登录），账号只给出已连接数/总数
+- /admin/health/accounts：各账号的连接状态、最近心跳响应和待处理消息数（管理员专用）
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from config import config
+
+
+class HealthMonitor:
+    """进程级健康状态采样器（见 get_health_monitor）"""
+
+    def __init__(self, interval: float = 5, stale_after: float = 30):
+        self.interval = interval
+        self.stale_after = stale_after
+        self._snapshot: Dict[str, Any] = {'sampled_at': 0.0, 'database': 'unknown', 'system': {}}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动后台采样线程（重复调用无影响）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        try:
+            import psutil
+            # 首次调用只建立基准，返回值无意义
+            psutil.cpu_percent(interval=None)
+        except ImportError:
+            psutil = None
+            logger.warning("未安装psutil，健康检查不包含CPU/内存信息")
+
+        while not self._stop.is_set():
+            try:
+                self.sample(psutil)
+            except Exception as e:
+                logger.warning(f"健康状态采样失败: {e}")
+            self._stop.wait(self.interval)
+
+    def sample(self, psutil=None):
+        """采样一次（在后台线程中执行）"""
+        from db_manager import db_manager
+
+        started = time.monotonic()
+        db_ok = db_manager.ping()
+        db_latency_ms = (time.monotonic() - started) * 1000
+
+        system: Dict[str, Any] = {}
+        if psutil is not None:
+            memory_info = psutil.virtual_memory()
+            system = {
+                # interval=None 返回距上次采样以来的CPU占用，不阻塞
+                "cpu_percent": psutil.cpu_percent(interval=None),
+                "memory_percent": memory_info.percent,
+                "memory_available": memory_info.available,
+                "process_rss": psutil.Process().memory_info().rss,
+            }
+
+        snapshot = {
+            'sampled_at': time.time(),
+            'database': 'ok' if db_ok else 'error',
+            'database_latency_ms': round(db_latency_ms, 2),
+            'system': system,
+        }
+        with self._lock:
+            self._snapshot = snapshot
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = dict(self._snapshot)
+        snapshot['age_seconds'] = round(time.time() - snapshot['sampled_at'], 1) if snapshot['sampled_at'] else None
+        snapshot['stale'] = snapshot['age_seconds'] is None or snapshot['age_seconds'] > self.stale_after
+        return snapshot
+
+    def ready(self, manager_ok: bool) -> Dict[str, Any]:
+        """就绪判断：Cookie管理器、数据库探测和采样线程都正常"""
+        snapshot = self.snapshot()
+        services = {
+            "cookie_manager": "ok" if manager_ok else "error",
+            "database": snapshot['database'] if not snapshot['stale'] else 'stale',
+        }
+        return {
+            "ready": all(value == "ok" for value in services.values()),
+            "services": services,
+            "snapshot": snapshot,
+        }
+
+    @staticmethod
+    def accounts() -> Dict[str, Dict[str, Any]]:
+        """各账号的连接状态（只读取实例属性，不访问数据库）"""
+        try:
+            from XianyuAutoAsync import XianyuLive
+        except Exception:
+            return {}
+        now = time.time()
+        result = {}
+        for cookie_id, instance in XianyuLive.get_all_instances().items():
+            state = getattr(instance, 'connection_state', None)
+            last_heartbeat = getattr(instance, 'last_heartbeat_response', 0) or 0
+            debounce_tasks = getattr(instance, 'message_debounce_tasks', None) or {}
+            result[cookie_id] = {
+                "connection_state": getattr(state, 'value', str(state)),
+                "last_heartbeat_response": last_heartbeat or None,
+                "heartbeat_age_seconds": round(now - last_heartbeat, 1) if last_heartbeat else None,
+                # 正在处理的消息数 + 防抖等待中的会话数
+                "active_message_tasks": getattr(instance, 'active_message_tasks', 0),
+                "pending_debounce": len(debounce_tasks),
+            }
+        return result
+
+    @classmethod
+    def account_summary(cls) -> Dict[str, int]:
+        """账号连接汇总（不含账号ID，供无需登录的 /health 使用）"""
+        accounts = cls.accounts()
+        connected = sum(1 for item in accounts.values() if item['connection_state'] == 'connected')
+        return {"total": len(accounts), "connected": connected}
+
+
+_monitor: Optional[HealthMonitor] = None
+
+
+def get_health_monitor() -> HealthMonitor:
+    """获取进程级健康状态采样器，首次调用时按 HEALTH 配置创建并启动后台采样"""
+    global _monitor
+    if _monitor is None:
+        conf = config.get('HEALTH', {}) or {}
+        _monitor = HealthMonitor(
+            interval=conf.get('sample_interval', 5),
+            stale_after=conf.get('stale_after', 30),
+        )
+        _monitor.start()
+    return _monitor
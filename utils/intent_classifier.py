@@ -0,0 +1,432 @@
+"""
+本地意图分类器
+字符 n-gram 多项式朴素贝叶斯，从 ai_conversations 中已标注意图的用户消息离线训练，纯CPU、无网络依赖，
+单条消息推理在亚毫秒级。检测顺序：
+1. 账号自定义关键词（卖家明确配置的规则，优先级最高）
+2. 内置关键词（与原 detect_intent 的关键词一致）；命中时模型不能改判为 default，
+   只有在另一个 price/tech 意图的概率高出 lexicon_margin 时才能改判
+3. 已训练的模型（置信度不足时跳过）
+每个账号的自定义关键词与内置关键词编译成一个正则，一次扫描得到所有命中
+
+命令行（在项目根目录执行）：
+    python -m utils.intent_classifier train [--db data/xianyu_data.db] [--model data/intent_model.json] [--cookie-id xxx]
+    python -m utils.intent_classifier eval  [--db ...] [--model ...] [--cookie-id xxx]
+    python -m utils.intent_classifier predict "能便宜点吗"
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from utils.bounded_cache import TTLCache
+
+INTENTS = ('price', 'tech', 'default')
+
+# 内置关键词（来自原 detect_intent），按优先级排列：同时命中时 price 优先
+BUILTIN_LEXICON: Dict[str, List[str]] = {
+    'price': ['便宜', '优惠', '刀', '降价', '包邮', '价格', '多少钱', '能少', '还能', '最低', '底价',
+              '实诚价', '到100', '能到', '包个邮', '给个价', '什么价'],
+    'tech': ['怎么用', '参数', '坏了', '故障', '设置', '说明书', '功能', '用法', '教程', '驱动'],
+}
+
+# default 意图的种子样本（常见的非议价、非技术咨询消息），避免只用关键词做种子时模型偏向 price/tech
+DEFAULT_SEEDS = ['你好', '在吗', '还在吗', '在不在', '有货吗', '还有吗', '发货了吗', '什么时候发货', '几天能到',
+                 '发什么快递', '好的', '谢谢', '收到', '已拍', '拍了', '可以', '嗯嗯', '好评', '确认收货了', '是正品吗']
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.getenv('DB_PATH', 'data/xianyu_data.db')) or '.',
+                                  'intent_model.json')
+
+
+def normalize_text(text: str) -> str:
+    """全角转半角、转小写、压缩空白"""
+    return ' '.join(unicodedata.normalize('NFKC', text or '').lower().split())
+
+
+def extract_ngrams(text: str, n_min: int = 1, n_max: int = 3) -> List[str]:
+    """提取字符 n-gram（首尾加边界符，使短消息和词首/词尾也有区分度）"""
+    padded = f"^{normalize_text(text)}$"
+    grams = []
+    for n in range(n_min, n_max + 1):
+        grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+class NaiveBayesIntentModel:
+    """多项式朴素贝叶斯（拉普拉斯平滑），训练后预先计算对数概率以加速推理"""
+
+    def __init__(self, n_min: int = 1, n_max: int = 3, alpha: float = 1.0):
+        self.n_min = n_min
+        self.n_max = n_max
+        self.alpha = alpha
+        self.class_counts: Dict[str, int] = {}
+        self.token_counts: Dict[str, Dict[str, int]] = {}
+        self.trained_at: Optional[float] = None
+        self.samples = 0
+        self._log_prior: Dict[str, float] = {}
+        self._log_likelihood: Dict[str, Dict[str, float]] = {}
+        self._log_unseen: Dict[str, float] = {}
+
+    def fit(self, samples: Iterable[Tuple[str, str]]) -> 'NaiveBayesIntentModel':
+        class_counts: Counter = Counter()
+        token_counts: Dict[str, Counter] = defaultdict(Counter)
+        for text, label in samples:
+            if label not in INTENTS or not text:
+                continue
+            class_counts[label] += 1
+            token_counts[label].update(extract_ngrams(text, self.n_min, self.n_max))
+        self.class_counts = dict(class_counts)
+        self.token_counts = {label: dict(counts) for label, counts in token_counts.items()}
+        self.samples = sum(class_counts.values())
+        self.trained_at = time.time()
+        self._prepare()
+        return self
+
+    def _prepare(self):
+        vocabulary = set()
+        for counts in self.token_counts.values():
+            vocabulary.update(counts)
+        vocab_size = max(1, len(vocabulary))
+        total = sum(self.class_counts.values()) or 1
+        self._log_prior = {label: math.log(count / total) for label, count in self.class_counts.items()}
+        self._log_likelihood = {}
+        self._log_unseen = {}
+        for label, counts in self.token_counts.items():
+            denominator = sum(counts.values()) + self.alpha * vocab_size
+            self._log_likelihood[label] = {
+                token: math.log((count + self.alpha) / denominator) for token, count in counts.items()
+            }
+            self._log_unseen[label] = math.log(self.alpha / denominator)
+
+    @property
+    def is_trained(self) -> bool:
+        return bool(self._log_prior)
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        grams = extract_ngrams(text, self.n_min, self.n_max)
+        scores = {}
+        for label, prior in self._log_prior.items():
+            likelihood = self._log_likelihood[label]
+            unseen = self._log_unseen[label]
+            scores[label] = prior + sum(likelihood.get(gram, unseen) for gram in grams)
+        if not scores:
+            return {}
+        top = max(scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        proba = self.predict_proba(text)
+        if not proba:
+            return 'default', 0.0
+        label = max(proba, key=proba.get)
+        return label, proba[label]
+
+    def to_dict(self) -> dict:
+        return {
+            'version': 1,
+            'n_min': self.n_min,
+            'n_max': self.n_max,
+            'alpha': self.alpha,
+            'samples': self.samples,
+            'trained_at': self.trained_at,
+            'class_counts': self.class_counts,
+            'token_counts': self.token_counts,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'NaiveBayesIntentModel':
+        model = cls(n_min=data.get('n_min', 1), n_max=data.get('n_max', 3), alpha=data.get('alpha', 1.0))
+        model.class_counts = data.get('class_counts', {})
+        model.token_counts = data.get('token_counts', {})
+        model.samples = data.get('samples', 0)
+        model.trained_at = data.get('trained_at')
+        model._prepare()
+        return model
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['NaiveBayesIntentModel']:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+class LexiconMatcher:
+    """把 {意图: [关键词]} 编译成一个正则，一次扫描返回命中的意图（按意图优先级）"""
+
+    def __init__(self, lexicon: Dict[str, List[str]]):
+        self._intent_of: Dict[str, str] = {}
+        for intent in INTENTS:
+            for keyword in lexicon.get(intent, []) or []:
+                keyword = normalize_text(keyword)
+                if keyword and keyword not in self._intent_of:
+                    self._intent_of[keyword] = intent
+        keywords = sorted(self._intent_of, key=len, reverse=True)
+        self._pattern = re.compile('|'.join(map(re.escape, keywords))) if keywords else None
+
+    def match(self, text: str) -> Optional[str]:
+        if self._pattern is None:
+            return None
+        hits = {self._intent_of[m.group(0)] for m in self._pattern.finditer(normalize_text(text))}
+        for intent in INTENTS:
+            if intent in hits:
+                return intent
+        return None
+
+
+def parse_lexicon(raw) -> Dict[str, List[str]]:
+    """解析账号的自定义关键词配置（JSON：{"price": [...], "tech": [...], "default": [...]}，也接受逗号分隔的字符串）"""
+    if not raw:
+        return {}
+    data = json.loads(raw) if isinstance(raw, str) else raw
+    lexicon = {}
+    for intent, keywords in (data or {}).items():
+        if intent not in INTENTS:
+            continue
+        if isinstance(keywords, str):
+            keywords = re.split(r'[,，\s]+', keywords)
+        lexicon[intent] = [str(k).strip() for k in keywords if str(k).strip()]
+    return lexicon
+
+
+class IntentClassifier:
+    """意图检测入口（进程内单例，见 get_intent_classifier）"""
+
+    def __init__(self, model_path: str = DEFAULT_MODEL_PATH, min_confidence: float = 0.6,
+                 reload_interval: float = 60, matcher_cache_size: int = 2000, lexicon_margin: float = 0.5):
+        self.model_path = model_path
+        self.min_confidence = min_confidence
+        self.lexicon_margin = lexicon_margin
+        self.reload_interval = reload_interval
+        self.model: Optional[NaiveBayesIntentModel] = None
+        self._model_mtime: Optional[float] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._builtin_matcher = LexiconMatcher(BUILTIN_LEXICON)
+        self._account_matchers = TTLCache(max_size=matcher_cache_size, ttl=3600)
+        self.counters = {'account_lexicon': 0, 'model': 0, 'builtin_lexicon': 0, 'model_override': 0,
+                         'fallback_default': 0}
+        self._maybe_reload(force=True)
+
+    def _maybe_reload(self, force: bool = False):
+        """按间隔检查模型文件，重新训练后无需重启即可生效"""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.model_path)
+        except OSError:
+            return
+        if mtime == self._model_mtime:
+            return
+        with self._lock:
+            try:
+                self.model = NaiveBayesIntentModel.load(self.model_path)
+                self._model_mtime = mtime
+                logger.info(f"意图分类模型已加载: {self.model_path} (样本数: {self.model.samples})")
+            except Exception as e:
+                logger.error(f"加载意图分类模型失败: {self.model_path}, 错误: {e}")
+
+    def _account_matcher(self, cookie_id: str, raw_lexicon) -> Optional[LexiconMatcher]:
+        if not raw_lexicon:
+            return None
+        key = (cookie_id, hashlib.md5(str(raw_lexicon).encode('utf-8')).hexdigest())
+        matcher = self._account_matchers.get(key)
+        if matcher is None:
+            try:
+                matcher = LexiconMatcher(parse_lexicon(raw_lexicon))
+            except (ValueError, TypeError) as e:
+                logger.warning(f"【{cookie_id}】自定义意图关键词格式错误: {e}")
+                matcher = LexiconMatcher({})
+            self._account_matchers[key] = matcher
+        return matcher
+
+    def classify(self, message: str, cookie_id: str = None, lexicon=None) -> str:
+        """返回 price / tech / default"""
+        matcher = self._account_matcher(cookie_id, lexicon)
+        intent = matcher.match(message) if matcher else None
+        if intent:
+            self.counters['account_lexicon'] += 1
+            return intent
+
+        self._maybe_reload()
+        model = self.model
+        proba = model.predict_proba(message) if model is not None and model.is_trained else {}
+        predicted = max(proba, key=proba.get) if proba else None
+
+        lexicon_intent = self._builtin_matcher.match(message)
+        if lexicon_intent:
+            # 明确的议价/技术关键词优先：模型不能改判为 default，改判为另一意图时需要足够大的概率差
+            if (predicted not in (None, 'default', lexicon_intent) and proba[predicted] >= self.min_confidence
+                    and proba[predicted] - proba.get(lexicon_intent, 0.0) >= self.lexicon_margin):
+                self.counters['model_override'] += 1
+                return predicted
+            self.counters['builtin_lexicon'] += 1
+            return lexicon_intent
+
+        if predicted and proba[predicted] >= self.min_confidence:
+            self.counters['model'] += 1
+            return predicted
+        self.counters['fallback_default'] += 1
+        return 'default'
+
+    def stats(self) -> dict:
+        model = self.model
+        return {
+            **self.counters,
+            'model_path': self.model_path,
+            'model_loaded': bool(model and model.is_trained),
+            'model_samples': model.samples if model else 0,
+            'model_trained_at': model.trained_at if model else None,
+            'min_confidence': self.min_confidence,
+            'lexicon_margin': self.lexicon_margin,
+            'account_matchers': len(self._account_matchers),
+        }
+
+
+_classifier: Optional[IntentClassifier] = None
+
+
+def get_intent_classifier() -> IntentClassifier:
+    """获取进程级意图分类器，首次调用时按 AI_REPLY.intent 配置创建"""
+    global _classifier
+    if _classifier is None:
+        from config import config
+        conf = config.get('AI_REPLY.intent', {}) or {}
+        _classifier = IntentClassifier(
+            model_path=conf.get('model_path') or DEFAULT_MODEL_PATH,
+            min_confidence=conf.get('min_confidence', 0.6),
+            reload_interval=conf.get('reload_interval', 60),
+            lexicon_margin=conf.get('lexicon_margin', 0.5),
+        )
+    return _classifier
+
+
+# -------------------- 离线训练/评估 --------------------
+
+def load_labeled_samples(db_path: str, cookie_id: str = None) -> List[Tuple[str, str]]:
+    """从 ai_conversations 读取已标注意图的用户消息（只读连接，不依赖 db_manager）"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        sql = '''
+        SELECT content, intent FROM ai_conversations
+        WHERE role = 'user' AND intent IN ('price', 'tech', 'default') AND content IS NOT NULL
+        '''
+        params: tuple = ()
+        if cookie_id:
+            sql += ' AND cookie_id = ?'
+            params = (cookie_id,)
+        return [(row[0], row[1]) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def split_samples(samples: List[Tuple[str, str]], holdout: float = 0.2):
+    """按消息内容哈希确定性地划分训练/验证集（相同消息总落在同一侧，避免泄漏）"""
+    train, test = [], []
+    for text, label in samples:
+        bucket = int(hashlib.md5(normalize_text(text).encode('utf-8')).hexdigest()[:8], 16) / 0xFFFFFFFF
+        (test if bucket < holdout else train).append((text, label))
+    return train, test
+
+
+def evaluate(model: NaiveBayesIntentModel, samples: List[Tuple[str, str]]) -> dict:
+    """计算准确率、各意图的精确率/召回率、混淆矩阵和平均推理耗时"""
+    confusion = {actual: {predicted: 0 for predicted in INTENTS} for actual in INTENTS}
+    started = time.perf_counter()
+    for text, label in samples:
+        predicted, _ = model.predict(text)
+        confusion[label][predicted] += 1
+    elapsed = time.perf_counter() - started
+    correct = sum(confusion[i][i] for i in INTENTS)
+    per_intent = {}
+    for intent in INTENTS:
+        predicted_total = sum(confusion[a][intent] for a in INTENTS)
+        actual_total = sum(confusion[intent].values())
+        per_intent[intent] = {
+            'precision': round(confusion[intent][intent] / predicted_total, 4) if predicted_total else 0.0,
+            'recall': round(confusion[intent][intent] / actual_total, 4) if actual_total else 0.0,
+            'support': actual_total,
+        }
+    return {
+        'samples': len(samples),
+        'accuracy': round(correct / len(samples), 4) if samples else 0.0,
+        'per_intent': per_intent,
+        'confusion': confusion,
+        'avg_inference_ms': round(elapsed * 1000 / len(samples), 4) if samples else 0.0,
+    }
+
+
+def _seed_samples() -> List[Tuple[str, str]]:
+    """内置关键词和 default 种子作为种子样本，保证冷启动时模型至少认识这些说法"""
+    seeds = [(keyword, intent) for intent, keywords in BUILTIN_LEXICON.items() for keyword in keywords]
+    return seeds + [(text, 'default') for text in DEFAULT_SEEDS]
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='本地意图分类模型训练/评估')
+    parser.add_argument('command', choices=['train', 'eval', 'predict'])
+    parser.add_argument('text', nargs='?', help='predict 时要分类的消息')
+    parser.add_argument('--db', default=os.getenv('DB_PATH', 'data/xianyu_data.db'), help='数据库路径')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='模型文件路径')
+    parser.add_argument('--cookie-id', default=None, help='只使用指定账号的对话训练')
+    parser.add_argument('--holdout', type=float, default=0.2, help='验证集比例')
+    args = parser.parse_args(argv)
+
+    if args.command == 'predict':
+        model = NaiveBayesIntentModel.load(args.model)
+        if model is None:
+            parser.error(f"模型文件不存在: {args.model}")
+        started = time.perf_counter()
+        print(json.dumps({
+            'intent': model.predict(args.text or '')[0],
+            'proba': {k: round(v, 4) for k, v in model.predict_proba(args.text or '').items()},
+            'inference_ms': round((time.perf_counter() - started) * 1000, 4),
+        }, ensure_ascii=False, indent=2))
+        return
+
+    samples = load_labeled_samples(args.db, args.cookie_id)
+    train, test = split_samples(samples, args.holdout)
+    print(f"已标注样本: {len(samples)} (训练 {len(train)} / 验证 {len(test)})")
+
+    if args.command == 'eval':
+        model = NaiveBayesIntentModel.load(args.model)
+        if model is None:
+            parser.error(f"模型文件不存在: {args.model}")
+        # 评估已保存的模型在全部样本上的表现，同时给出按训练集重新训练后的验证集结果作对比
+        print(json.dumps({'saved_model': evaluate(model, samples),
+                          'holdout': evaluate(NaiveBayesIntentModel().fit(train + _seed_samples()), test)},
+                         ensure_ascii=False, indent=2))
+        return
+
+    holdout_report = evaluate(NaiveBayesIntentModel().fit(train + _seed_samples()), test)
+    model = NaiveBayesIntentModel().fit(samples + _seed_samples())
+    model.save(args.model)
+    print(json.dumps({'holdout': holdout_report, 'model': args.model, 'samples': model.samples},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
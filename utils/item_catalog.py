@@ -0,0 +1,166 @@
+"""
+商品目录服务
+统一的分层商品详情缓存：内存LRU → SQLite(ai_item_cache, 带TTL) → 远程获取（浏览器等），
+同一商品的并发查询（跨所有账号）只触发一次远程获取，获取失败的结果短暂负缓存，并统计各层命中率
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+from config import config
+from utils.bounded_cache import TTLCache
+
+# 负缓存占位值（区别于正常的详情文本）
+_MISSING = object()
+
+
+class ItemCatalog:
+    """分层商品详情缓存（进程内单例，见 get_item_catalog）"""
+
+    def __init__(self, memory_max_size: int = 1000, memory_ttl: float = 24 * 60 * 60,
+                 db_ttl: float = 7 * 24 * 60 * 60, negative_ttl: float = 300):
+        self.db_ttl = db_ttl
+        self.memory = TTLCache(max_size=memory_max_size, ttl=memory_ttl)
+        self.negative = TTLCache(max_size=memory_max_size, ttl=negative_ttl)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.counters = {
+            'lookups': 0,
+            'memory_hits': 0,
+            'db_hits': 0,
+            'negative_hits': 0,
+            'remote_fetches': 0,
+            'remote_failures': 0,
+            'coalesced': 0,
+        }
+
+    async def get_detail(self, item_id: str, fetcher: Callable[[str], Awaitable[str]],
+                         cookie_id: str = None) -> str:
+        """按 内存 → SQLite → 远程 的顺序获取商品详情，失败返回空字符串
+
+        Args:
+            item_id: 商品ID
+            fetcher: 远程获取函数（通常是调用方账号的浏览器获取方法），仅在前两层均未命中时调用
+            cookie_id: 发起查询的账号ID（仅用于日志）
+        """
+        self.counters['lookups'] += 1
+
+        detail = self.memory.get(item_id)
+        if detail is not None:
+            self.counters['memory_hits'] += 1
+            return detail
+
+        if item_id in self.negative:
+            self.counters['negative_hits'] += 1
+            logger.debug(f"【{cookie_id}】商品 {item_id} 近期获取失败，命中负缓存")
+            return ""
+
+        detail = self._load_from_db(item_id)
+        if detail:
+            self.counters['db_hits'] += 1
+            self.memory[item_id] = detail
+            return detail
+
+        # 同一商品已有远程获取在进行中，直接等待其结果
+        future = self._inflight.get(item_id)
+        if future is not None and future.get_loop() is asyncio.get_running_loop():
+            self.counters['coalesced'] += 1
+            logger.info(f"【{cookie_id}】商品 {item_id} 详情正在由其他请求获取，等待结果")
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[item_id] = future
+        detail = ""
+        try:
+            detail = await self._fetch_remote(item_id, fetcher, cookie_id)
+            return detail
+        finally:
+            # 无论成功、失败还是被取消，都要唤醒等待中的其他请求
+            self._inflight.pop(item_id, None)
+            future.set_result(detail)
+
+    async def _fetch_remote(self, item_id: str, fetcher: Callable[[str], Awaitable[str]],
+                            cookie_id: str = None) -> str:
+        self.counters['remote_fetches'] += 1
+        try:
+            detail = await fetcher(item_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"【{cookie_id}】远程获取商品详情异常: {item_id}, 错误: {e}")
+            detail = ""
+
+        if not detail:
+            self.counters['remote_failures'] += 1
+            self.negative[item_id] = _MISSING
+            return ""
+
+        self.put(item_id, detail)
+        return detail
+
+    def _load_from_db(self, item_id: str) -> str:
+        try:
+            from db_manager import db_manager
+            cached = db_manager.get_cached_item_detail(item_id, max_age_seconds=self.db_ttl)
+            return cached.get('detail', '') if cached else ''
+        except Exception as e:
+            logger.warning(f"读取商品缓存表失败: {item_id}, 错误: {e}")
+            return ''
+
+    def put(self, item_id: str, detail: str):
+        """写入内存和SQLite两层缓存（外部获取到详情后也可直接调用）"""
+        if not detail:
+            return
+        self.memory[item_id] = detail
+        self.negative.pop(item_id, None)
+        try:
+            from db_manager import db_manager
+            db_manager.save_cached_item_detail(item_id, detail)
+        except Exception as e:
+            logger.warning(f"写入商品缓存表失败: {item_id}, 错误: {e}")
+
+    def invalidate(self, item_id: str):
+        """使某商品的内存缓存和负缓存失效（SQLite层在下次写入时覆盖）"""
+        self.memory.pop(item_id, None)
+        self.negative.pop(item_id, None)
+
+    def purge_expired(self) -> int:
+        """清理内存层过期条目，返回清理数量"""
+        return self.memory.purge_expired() + self.negative.purge_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回各层命中次数与命中率"""
+        lookups = self.counters['lookups']
+
+        def ratio(count: int) -> float:
+            return round(count / lookups, 4) if lookups else 0.0
+
+        return {
+            **self.counters,
+            'inflight': len(self._inflight),
+            'memory_hit_ratio': ratio(self.counters['memory_hits']),
+            'db_hit_ratio': ratio(self.counters['db_hits']),
+            'negative_hit_ratio': ratio(self.counters['negative_hits']),
+            'coalesced_ratio': ratio(self.counters['coalesced']),
+            'remote_ratio': ratio(self.counters['remote_fetches']),
+            'memory': self.memory.stats('memory'),
+            'negative': self.negative.stats('negative'),
+        }
+
+
+_catalog: Optional[ItemCatalog] = None
+
+
+def get_item_catalog() -> ItemCatalog:
+    """获取进程级商品目录实例，首次调用时按 ITEM_DETAIL.catalog 配置创建"""
+    global _catalog
+    if _catalog is None:
+        catalog_conf = config.get('ITEM_DETAIL.catalog', {}) or {}
+        _catalog = ItemCatalog(
+            memory_max_size=catalog_conf.get('memory_max_size', 1000),
+            memory_ttl=catalog_conf.get('memory_ttl', 24 * 60 * 60),
+            db_ttl=catalog_conf.get('db_ttl', 7 * 24 * 60 * 60),
+            negative_ttl=catalog_conf.get('negative_ttl', 300),
+        )
+    return _catalog
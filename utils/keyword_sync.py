@@ -0,0 +1,179 @@
+"""
+关键词同步：把提交/导入的关键词与数据库现有记录做差异比较，只对新增、修改、删除的行执行SQL
+（由 DBManager.sync_keywords 在一个事务中用 executemany 批量应用），并提供 Excel 的流式解析
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+KEYWORD_COLUMNS = ('关键词', '商品ID', '关键词内容')
+
+
+def normalize_item_id(value: Any) -> Optional[str]:
+    """商品ID标准化：空值转为None，Excel中按数字存储的ID（如 123456.0）转为整数字符串"""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return None
+        if value.is_integer():
+            value = int(value)
+    text = str(value).strip()
+    return text or None
+
+
+def _cell_text(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float) and value != value:
+        return ''
+    return str(value).strip()
+
+
+class KeywordDiff:
+    """关键词差异
+
+    Attributes:
+        inserts: [(keyword, reply, item_id)]，追加到末尾
+        updates: [(reply, rowid)]，关键词不变、只改回复
+        rewrites: [(rowid, keyword, reply, item_id)]，该位置换成了另一个关键词，沿用原rowid改写以保持顺序
+        deletes: [rowid]
+    """
+
+    def __init__(self):
+        self.inserts: List[Tuple[str, str, Optional[str]]] = []
+        self.updates: List[Tuple[str, int]] = []
+        self.rewrites: List[Tuple[int, str, str, Optional[str]]] = []
+        self.deletes: List[int] = []
+        self.unchanged = 0
+        self.duplicates = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserts or self.updates or self.rewrites or self.deletes)
+
+    def summary(self) -> Dict[str, int]:
+        updated = len(self.updates) + len(self.rewrites)
+        return {
+            'added': len(self.inserts),
+            'updated': updated,
+            'deleted': len(self.deletes),
+            'unchanged': self.unchanged,
+            'duplicates': self.duplicates,
+            'total': len(self.inserts) + updated + self.unchanged,
+        }
+
+
+def diff_keywords(existing: Iterable[Sequence[Any]], incoming: Iterable[Tuple[str, str, Any]],
+                  include_images: bool = False, delete_missing: bool = True) -> KeywordDiff:
+    """计算关键词差异
+
+    关键词按rowid顺序展示和匹配（先匹配到的优先），替换整个列表时第i个提交的关键词对应第i条现有记录，
+    同一关键词原地更新回复，换成其他关键词时沿用该rowid改写，多出的追加到末尾或删除，结果顺序与提交顺序一致
+
+    Args:
+        existing: 现有记录 [(rowid, keyword, reply, item_id, type)]，按rowid升序
+        incoming: 新的关键词 [(keyword, reply, item_id)]，同一 (关键词, 商品ID) 重复出现时以最后一条为准
+        include_images: 图片关键词是否参与同步（为False时保留图片关键词，与之同名的文本关键词视为冲突）
+        delete_missing: 是否删除新列表中不存在的记录（为False时只按关键词更新已有记录、追加新关键词）
+    Raises:
+        ValueError: 文本关键词与保留的图片关键词同名
+    """
+    managed: List[Tuple[int, Tuple[str, str], str, bool]] = []
+    seen = set()
+    images: Dict[Tuple[str, str], int] = {}
+    diff = KeywordDiff()
+    for rowid, keyword, reply, item_id, kw_type in existing:
+        key = (keyword, normalize_item_id(item_id) or '')
+        is_image = (kw_type or 'text') == 'image'
+        if is_image and not include_images:
+            images[key] = rowid
+        elif key in seen:
+            # 没有唯一索引的旧库中可能存在重复记录，只保留一条
+            diff.deletes.append(rowid)
+        else:
+            seen.add(key)
+            managed.append((rowid, key, reply or '', is_image))
+
+    wanted: Dict[Tuple[str, str], Tuple[str, str, Optional[str]]] = {}
+    for keyword, reply, item_id in incoming:
+        item_id = normalize_item_id(item_id)
+        key = (keyword, item_id or '')
+        if key in images:
+            item_desc = f"商品ID: {item_id}" if item_id else "通用关键词"
+            raise ValueError(f"关键词 '{keyword}' （{item_desc}） 已存在（图片关键词），无法保存为文本关键词")
+        if key in wanted:
+            diff.duplicates += 1
+        wanted[key] = (keyword, reply or '', item_id)
+
+    if not delete_missing:
+        current = {key: (rowid, reply, is_image) for rowid, key, reply, is_image in managed}
+        for key, (keyword, reply, item_id) in wanted.items():
+            if key not in current:
+                diff.inserts.append((keyword, reply, item_id))
+            else:
+                _compare(diff, current[key], reply)
+        return diff
+
+    entries = list(wanted.items())
+    for (rowid, key, reply, is_image), (new_key, (keyword, new_reply, item_id)) in zip(managed, entries):
+        if key != new_key:
+            diff.rewrites.append((rowid, keyword, new_reply, item_id))
+        else:
+            _compare(diff, (rowid, reply, is_image), new_reply)
+    diff.deletes.extend(rowid for rowid, _, _, _ in managed[len(entries):])
+    diff.inserts.extend(value for _, value in entries[len(managed):])
+    return diff
+
+
+def _compare(diff: KeywordDiff, current: Tuple[int, str, bool], reply: str):
+    rowid, current_reply, is_image = current
+    if current_reply != reply or is_image:
+        # 回复内容变化，或原来是图片关键词（include_images 时改写为文本关键词）
+        diff.updates.append((reply, rowid))
+    else:
+        diff.unchanged += 1
+
+
+def iter_excel_keywords(fileobj, filename: str = '') -> Iterator[Tuple[str, str, Optional[str]]]:
+    """流式读取关键词Excel（.xlsx 用 openpyxl 只读模式逐行读取，不把整个表载入内存）
+
+    Yields:
+        (keyword, reply, item_id)，跳过关键词为空的行
+    Raises:
+        ValueError: 缺少必要的列
+    """
+    if filename.lower().endswith('.xls'):
+        # 旧格式不支持流式读取，仍由 pandas 整表读取
+        import pandas as pd
+
+        df = pd.read_excel(fileobj, dtype=object)
+        missing = [col for col in KEYWORD_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f"Excel文件缺少必要的列: {', '.join(missing)}")
+        rows = df[list(KEYWORD_COLUMNS)].itertuples(index=False, name=None)
+    else:
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            row_iter = sheet.iter_rows(values_only=True)
+            header = [_cell_text(value) for value in next(row_iter, ())]
+            missing = [col for col in KEYWORD_COLUMNS if col not in header]
+            if missing:
+                raise ValueError(f"Excel文件缺少必要的列: {', '.join(missing)}")
+            indexes = [header.index(col) for col in KEYWORD_COLUMNS]
+            rows = (tuple(row[i] if i < len(row) else None for i in indexes) for row in row_iter)
+            yield from _keyword_rows(rows)
+            return
+        finally:
+            workbook.close()
+    yield from _keyword_rows(rows)
+
+
+def _keyword_rows(rows: Iterable[Tuple[Any, Any, Any]]) -> Iterator[Tuple[str, str, Optional[str]]]:
+    for keyword, item_id, reply in rows:
+        keyword = _cell_text(keyword)
+        if not keyword:
+            continue  # 跳过没有关键词的行
+        yield keyword, _cell_text(reply), normalize_item_id(item_id)
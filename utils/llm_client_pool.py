@@ -0,0 +1,217 @@
+"""
+大模型客户端连接池
+按 (接口类型, base_url, api_key哈希, 事件循环) 复用 AsyncOpenAI 客户端和 aiohttp 会话，
+保持长连接（安装了 h2 时对OpenAI兼容接口启用HTTP/2），空闲超时/超过容量时按LRU关闭，
+账号AI设置变更时可按账号失效对应客户端
+
+缓存键包含凭据哈希，且每次调用前都会从数据库读取最新设置，因此多进程部署时
+不会出现某个进程继续使用旧凭据的问题，旧客户端只会在空闲后被回收
+"""
+
+import asyncio
+import hashlib
+import importlib.util
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+import aiohttp
+from loguru import logger
+
+from config import config
+from utils.bounded_cache import TTLCache
+
+# HTTP/2 支持为可选依赖，只检查 h2 是否安装，不导入
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+class _PooledClient:
+    """池中的客户端条目，记录所属事件循环和使用中的请求数"""
+
+    def __init__(self, client: Any, loop: asyncio.AbstractEventLoop, closer: Callable[[Any], Awaitable[None]]):
+        self.client = client
+        self.loop = loop
+        self.closer = closer
+        self.in_use = 0
+        self.retired = False
+        self.closed = False
+
+
+class _ClientCache(TTLCache):
+    """使用中的客户端不会因容量或空闲被淘汰"""
+
+    def _can_evict(self, key: Hashable, value: Any) -> bool:
+        return value.in_use == 0
+
+
+class LLMClientPool:
+    """进程级大模型客户端池（见 llm_client_pool 全局实例）"""
+
+    def __init__(self, max_size: int = 64, idle_ttl: float = 600, http2: bool = True):
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._clients = _ClientCache(max_size=max_size, ttl=idle_ttl, on_evict=self._on_evict)
+        self._account_keys: Dict[str, Hashable] = {}  # {cookie_id: 最近使用的OpenAI客户端key}
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'closed': 0, 'invalidations': 0}
+
+    @staticmethod
+    def _credential_hash(api_key: str) -> str:
+        return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]
+
+    @asynccontextmanager
+    async def openai_client(self, cookie_id: str, base_url: str, api_key: str):
+        """借用指定接口和凭据的 AsyncOpenAI 客户端"""
+        loop = asyncio.get_running_loop()
+        key = ('openai', base_url or '', self._credential_hash(api_key), id(loop))
+        with self._lock:
+            self._account_keys[cookie_id] = key
+
+        def factory():
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+            logger.info(f"创建OpenAI客户端 {cookie_id}: base_url={base_url}, api_key={'***' + api_key[-4:] if api_key else 'None'}, http2={self.http2}")
+            return AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=30,
+                http_client=DefaultAsyncHttpxClient(http2=self.http2),
+            )
+
+        async def closer(client):
+            await client.close()
+
+        async with self._lease(key, factory, closer) as client:
+            yield client
+
+    @asynccontextmanager
+    async def http_session(self):
+        """借用当前事件循环的 aiohttp 会话（DashScope/Gemini等REST接口共用，按主机复用连接）"""
+        loop = asyncio.get_running_loop()
+        key = ('aiohttp', id(loop))
+
+        def factory():
+            return aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=30),
+                connector=aiohttp.TCPConnector(limit_per_host=20, keepalive_timeout=60),
+            )
+
+        async def closer(session):
+            await session.close()
+
+        async with self._lease(key, factory, closer) as session:
+            yield session
+
+    @asynccontextmanager
+    async def _lease(self, key: Hashable, factory: Callable[[], Any], closer: Callable[[Any], Awaitable[None]]):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None or entry.retired or entry.loop is not loop:
+                self.counters['misses'] += 1
+                # 顺带回收空闲超时的客户端
+                self._clients.purge_expired()
+                entry = _PooledClient(factory(), loop, closer)
+            else:
+                self.counters['hits'] += 1
+            entry.in_use += 1
+            # 重新写入以刷新空闲过期时间
+            self._clients[key] = entry
+        try:
+            yield entry.client
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                should_close = entry.retired and entry.in_use == 0
+            if should_close:
+                self._schedule_close(entry)
+
+    def _on_evict(self, key: Hashable, entry: _PooledClient):
+        """容量/空闲淘汰回调（此时 in_use 必为0）"""
+        entry.retired = True
+        self._schedule_close(entry)
+
+    def _retire(self, key: Hashable):
+        with self._lock:
+            entry = self._clients.pop(key, None)
+            if entry is None:
+                return
+            entry.retired = True
+            should_close = entry.in_use == 0
+        if should_close:
+            self._schedule_close(entry)
+
+    def _schedule_close(self, entry: _PooledClient):
+        """在客户端所属的事件循环中关闭客户端（可能从其他线程调用）"""
+        if entry.closed:
+            return
+        entry.closed = True
+        self.counters['closed'] += 1
+        loop = entry.loop
+        if loop.is_closed():
+            return
+
+        async def _close():
+            try:
+                await entry.closer(entry.client)
+            except Exception as e:
+                logger.debug(f"关闭大模型客户端失败: {e}")
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            loop.create_task(_close())
+        else:
+            loop.call_soon_threadsafe(lambda: loop.create_task(_close()))
+
+    def invalidate_account(self, cookie_id: str):
+        """账号AI设置变更时调用：关闭该账号最近使用的客户端（若无其他账号共用同一凭据）"""
+        with self._lock:
+            key = self._account_keys.pop(cookie_id, None)
+            shared = key is not None and key in self._account_keys.values()
+        self.counters['invalidations'] += 1
+        if key is not None and not shared:
+            self._retire(key)
+            logger.info(f"账号 {cookie_id} 的AI设置已变更，已失效对应的大模型客户端")
+
+    async def close_loop_clients(self):
+        """关闭当前事件循环创建的所有客户端（用于临时事件循环结束前清理）"""
+        loop = asyncio.get_running_loop()
+        entries = []
+        with self._lock:
+            for key, entry in self._clients.items():
+                if entry.loop is loop:
+                    self._clients.pop(key, None)
+                    entry.retired = entry.closed = True
+                    entries.append(entry)
+        for entry in entries:
+            self.counters['closed'] += 1
+            try:
+                await entry.closer(entry.client)
+            except Exception as e:
+                logger.debug(f"关闭大模型客户端失败: {e}")
+
+    def purge_expired(self) -> int:
+        return self._clients.purge_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            'http2': self.http2,
+            'clients': len(self._clients),
+            'accounts': len(self._account_keys),
+            'cache': self._clients.stats('llm_clients'),
+        }
+
+
+def _create_pool() -> LLMClientPool:
+    pool_conf = config.get('AI_REPLY.client_pool', {}) or {}
+    return LLMClientPool(
+        max_size=pool_conf.get('max_size', 64),
+        idle_ttl=pool_conf.get('idle_ttl', 600),
+        http2=pool_conf.get('http2', True),
+    )
+
+
+# 全局大模型客户端池
+llm_client_pool = _create_pool()
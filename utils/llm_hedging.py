@@ -0,0 +1,242 @@
+"""
+大模型请求对冲与降级
+按接口(base_url + 模型)统计耗时/错误率的指数移动平均和最近耗时的p95：
+- 主接口超过其p95仍未返回时，并行发出备用接口请求（对冲），取最先返回的有效结果
+- 主接口报错时立即改用备用接口
+- 整个调用受账号设置的总耗时预算约束，超出预算返回None（由调用方走默认回复）
+- 配置了备用接口时，按两者的耗时/错误率动态选择谁作为主接口
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from config import config
+from utils.ai_governor import AIDispatchRejected
+
+
+class ProviderHealth:
+    """单个接口的耗时/错误率统计"""
+
+    def __init__(self, name: str, window: int = 100, alpha: float = 0.2):
+        self.name = name
+        self.alpha = alpha
+        self._latencies: deque = deque(maxlen=window)
+        self.latency_ewma_ms = 0.0
+        self.error_ewma = 0.0
+        self.counters = {'requests': 0, 'successes': 0, 'errors': 0, 'cancelled': 0, 'hedged': 0, 'wins': 0}
+
+    def record_success(self, latency_ms: float):
+        self.counters['successes'] += 1
+        self._latencies.append(latency_ms)
+        self.latency_ewma_ms = (latency_ms if not self.latency_ewma_ms
+                                else (1 - self.alpha) * self.latency_ewma_ms + self.alpha * latency_ms)
+        self.error_ewma = (1 - self.alpha) * self.error_ewma
+
+    def record_error(self, latency_ms: float):
+        self.counters['errors'] += 1
+        self.error_ewma = (1 - self.alpha) * self.error_ewma + self.alpha
+
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    def p95_ms(self) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def score(self, default_latency_ms: float, min_samples: int) -> float:
+        """越小越好：耗时EWMA按错误率放大，样本不足时用默认耗时"""
+        latency = self.latency_ewma_ms if self.samples() >= min_samples else default_latency_ms
+        return latency * (1 + 4 * self.error_ewma)
+
+    def stats(self) -> Dict[str, Any]:
+        p95 = self.p95_ms()
+        return {
+            'name': self.name,
+            **self.counters,
+            'samples': self.samples(),
+            'latency_ewma_ms': round(self.latency_ewma_ms, 1),
+            'latency_p95_ms': round(p95, 1) if p95 is not None else None,
+            'error_ewma': round(self.error_ewma, 4),
+        }
+
+
+class HedgedLLMCaller:
+    """对冲调用器（进程内单例，见 get_hedged_caller）"""
+
+    def __init__(self, default_hedge_delay_ms: float = 8000, min_hedge_delay_ms: float = 500,
+                 min_samples: int = 5, window: int = 100, alpha: float = 0.2,
+                 switch_ratio: float = 0.8, max_providers: int = 200):
+        self.default_hedge_delay_ms = default_hedge_delay_ms
+        self.min_hedge_delay_ms = min_hedge_delay_ms
+        self.min_samples = min_samples
+        self.window = window
+        self.alpha = alpha
+        self.switch_ratio = switch_ratio
+        self.max_providers = max_providers
+        self._providers: Dict[str, ProviderHealth] = {}
+        self._lock = threading.Lock()
+        self.counters = {'calls': 0, 'hedges': 0, 'fallbacks': 0, 'swaps': 0, 'budget_exceeded': 0}
+
+    def health(self, name: str) -> ProviderHealth:
+        with self._lock:
+            entry = self._providers.get(name)
+            if entry is None:
+                if len(self._providers) >= self.max_providers:
+                    # 丢弃最早登记的接口统计，避免接口地址频繁变化时无限增长
+                    self._providers.pop(next(iter(self._providers)))
+                entry = ProviderHealth(name, window=self.window, alpha=self.alpha)
+                self._providers[name] = entry
+            return entry
+
+    def hedge_delay_ms(self, name: str) -> float:
+        """主接口的对冲等待时间：样本足够时取p95，否则用默认值"""
+        entry = self.health(name)
+        p95 = entry.p95_ms() if entry.samples() >= self.min_samples else None
+        if p95 is None:
+            return self.default_hedge_delay_ms
+        return max(self.min_hedge_delay_ms, p95)
+
+    def order(self, names: List[str]) -> List[str]:
+        """按健康度决定主备顺序；备用接口明显更好（低于主接口得分*switch_ratio）时才交换，避免来回抖动"""
+        if len(names) < 2:
+            return names
+        primary, secondary = names[0], names[1]
+        primary_score = self.health(primary).score(self.default_hedge_delay_ms, self.min_samples)
+        secondary_score = self.health(secondary).score(self.default_hedge_delay_ms, self.min_samples)
+        if secondary_score < primary_score * self.switch_ratio:
+            self.counters['swaps'] += 1
+            return [secondary, primary] + names[2:]
+        return names
+
+    async def call(self, providers: List[Dict[str, Any]], budget_ms: float,
+                   hedge_delay_ms: float = 0, cookie_id: str = None) -> Optional[str]:
+        """按对冲策略调用接口，返回最先得到的有效回复
+
+        Args:
+            providers: [{'name': 统计用的接口名, 'call': 无参协程函数}]，第一个为配置的主接口
+            budget_ms: 总耗时预算（毫秒），<=0 表示不限制
+            hedge_delay_ms: 固定的对冲等待时间，<=0 时按主接口p95自适应
+        """
+        self.counters['calls'] += 1
+        by_name = {p['name']: p for p in providers}
+        order = self.order([p['name'] for p in providers])
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + budget_ms / 1000 if budget_ms and budget_ms > 0 else None
+        pending: Dict[asyncio.Task, str] = {}
+
+        def launch(name: str):
+            entry = self.health(name)
+            entry.counters['requests'] += 1
+            task = asyncio.ensure_future(self._timed(entry, by_name[name]['call']))
+            pending[task] = name
+
+        def remaining() -> Optional[float]:
+            return None if deadline is None else max(0.0, deadline - loop.time())
+
+        next_index = 1
+        launch(order[0])
+        try:
+            while pending:
+                # 还有备用接口未发出时，最多等到对冲时间
+                wait_timeout = remaining()
+                if next_index < len(order):
+                    delay = (hedge_delay_ms if hedge_delay_ms and hedge_delay_ms > 0
+                             else self.hedge_delay_ms(order[0])) / 1000
+                    wait_timeout = delay if wait_timeout is None else min(delay, wait_timeout)
+
+                done, _ = await asyncio.wait(list(pending), timeout=wait_timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = pending.pop(task)
+                    reply = task.result()
+                    if reply:
+                        entry = self.health(name)
+                        entry.counters['wins'] += 1
+                        if name != order[0]:
+                            logger.info(f"【{cookie_id}】备用大模型接口先返回: {name}")
+                        return reply
+
+                if done:
+                    # 有接口失败，立即改用下一个
+                    if next_index < len(order):
+                        self.counters['fallbacks'] += 1
+                        logger.warning(f"【{cookie_id}】大模型接口 {order[next_index - 1]} 调用失败，改用 {order[next_index]}")
+                        launch(order[next_index])
+                        next_index += 1
+                    continue
+
+                if deadline is not None and remaining() <= 0:
+                    self.counters['budget_exceeded'] += 1
+                    logger.warning(f"【{cookie_id}】大模型调用超出耗时预算 {budget_ms}ms")
+                    return None
+
+                if next_index < len(order):
+                    # 主接口超过对冲时间仍未返回，并行发出备用请求
+                    self.counters['hedges'] += 1
+                    self.health(order[next_index]).counters['hedged'] += 1
+                    logger.info(f"【{cookie_id}】大模型接口 {order[0]} 响应较慢，并行请求 {order[next_index]}")
+                    launch(order[next_index])
+                    next_index += 1
+            return None
+        finally:
+            for task, name in pending.items():
+                task.cancel()
+                self.health(name).counters['cancelled'] += 1
+
+    @staticmethod
+    async def _timed(entry: ProviderHealth, func: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        started = time.monotonic()
+        try:
+            reply = await func()
+        except asyncio.CancelledError:
+            raise
+        except AIDispatchRejected as e:
+            # 被调度器拒绝（排队超预算/熔断），接口本身并未出错，不计入错误率
+            logger.warning(f"大模型接口 {entry.name} 请求未发出: {e}")
+            return None
+        except Exception as e:
+            entry.record_error((time.monotonic() - started) * 1000)
+            logger.warning(f"大模型接口 {entry.name} 调用异常: {e}")
+            return None
+        latency_ms = (time.monotonic() - started) * 1000
+        if reply:
+            entry.record_success(latency_ms)
+        else:
+            entry.record_error(latency_ms)
+        return reply
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            providers = [entry.stats() for entry in self._providers.values()]
+        return {
+            **self.counters,
+            'default_hedge_delay_ms': self.default_hedge_delay_ms,
+            'min_samples': self.min_samples,
+            'providers': providers,
+        }
+
+
+_caller: Optional[HedgedLLMCaller] = None
+
+
+def get_hedged_caller() -> HedgedLLMCaller:
+    """获取进程级对冲调用器，首次调用时按 AI_REPLY.hedging 配置创建"""
+    global _caller
+    if _caller is None:
+        hedge_conf = config.get('AI_REPLY.hedging', {}) or {}
+        _caller = HedgedLLMCaller(
+            default_hedge_delay_ms=hedge_conf.get('default_hedge_delay_ms', 8000),
+            min_hedge_delay_ms=hedge_conf.get('min_hedge_delay_ms', 500),
+            min_samples=hedge_conf.get('min_samples', 5),
+            window=hedge_conf.get('window', 100),
+            alpha=hedge_conf.get('ewma_alpha', 0.2),
+            switch_ratio=hedge_conf.get('switch_ratio', 0.8),
+        )
+    return _caller
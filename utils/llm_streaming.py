@@ -0,0 +1,175 @@
+"""
+大模型流式输出与提前截断
+OpenAI兼容接口(SSE)和DashScope增量输出边收边拼接，满足以下任一条件即停止接收并取消流，立即返回已生成的内容：
+- 已生成不少于 min_chars 个字符，且刚好结束一个完整句子
+- 达到 max_chars 字符上限（在最后一个句子边界截断，没有边界时硬截断）
+统计首字耗时、完整回复耗时、提前截断次数和节省输出token数的上界
+默认关闭（会截短回复），需在 AI_REPLY.streaming.enabled 中显式开启
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Optional
+
+from config import config
+from utils.prompt_builder import estimate_tokens
+
+SENTENCE_ENDINGS = '。！？!?~～\n'
+
+
+async def iter_sse_data(lines: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """从按行迭代的SSE响应体中取出每个 data 字段（忽略注释/事件名，遇到 [DONE] 结束）"""
+    async for raw in lines:
+        line = raw.decode('utf-8', errors='ignore').strip() if isinstance(raw, bytes) else str(raw).strip()
+        if not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return
+        if data:
+            yield data
+
+
+def dashscope_delta(payload: str) -> str:
+    """DashScope增量输出（incremental_output=true）每个事件的 output.text 即为新增文本"""
+    try:
+        result = json.loads(payload)
+    except ValueError:
+        return ''
+    output = result.get('output') or {}
+    return output.get('text') or ''
+
+
+class StreamCutter:
+    """拼接流式片段并判断何时可以提前结束"""
+
+    def __init__(self, max_chars: int = 60, min_chars: int = 20):
+        self.max_chars = max_chars
+        self.min_chars = min_chars
+        self.text = ''
+        self.cut = False
+
+    def feed(self, delta: str) -> bool:
+        """追加一个片段，返回True表示应停止接收"""
+        if not delta:
+            return False
+        start = max(len(self.text), self.min_chars - 1)
+        self.text += delta
+        # 片段中间出现句子结尾（且已满足最少字数）时，在该处截断
+        end = self._first_boundary(start)
+        if end is not None and (not self.max_chars or end < self.max_chars):
+            self.text = self.text[:end + 1].rstrip()
+            self.cut = True
+            return True
+        stripped = self.text.rstrip()
+        if self.max_chars and len(stripped) >= self.max_chars:
+            self.text = self._truncate(stripped[:self.max_chars])
+            self.cut = True
+            return True
+        return False
+
+    def _first_boundary(self, start: int) -> Optional[int]:
+        for index in range(start, len(self.text)):
+            if self.text[index] in SENTENCE_ENDINGS and self.text[:index].strip():
+                return index
+        return None
+
+    def _truncate(self, text: str) -> str:
+        boundary = max(text.rfind(mark) for mark in SENTENCE_ENDINGS)
+        if boundary >= self.min_chars - 1:
+            return text[:boundary + 1]
+        return text
+
+    def result(self) -> str:
+        return self.text.strip()
+
+
+class StreamingMetrics:
+    """流式回复统计"""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._first_token_ms: deque = deque(maxlen=window)
+        self._reply_ms: deque = deque(maxlen=window)
+        self.counters = {'streams': 0, 'early_cutoffs': 0, 'completed': 0, 'failures': 0,
+                         'tokens_saved_upper_bound': 0}
+
+    def record(self, first_token_ms: Optional[float], reply_ms: float, cut: bool, tokens_saved: int):
+        with self._lock:
+            self.counters['streams'] += 1
+            self.counters['early_cutoffs' if cut else 'completed'] += 1
+            self.counters['tokens_saved_upper_bound'] += max(0, tokens_saved)
+            if first_token_ms is not None:
+                self._first_token_ms.append(first_token_ms)
+            self._reply_ms.append(reply_ms)
+
+    def record_failure(self):
+        with self._lock:
+            self.counters['failures'] += 1
+
+    @staticmethod
+    def _avg(values: deque) -> float:
+        return round(sum(values) / len(values), 1) if values else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.counters,
+                'avg_time_to_first_token_ms': self._avg(self._first_token_ms),
+                'avg_time_to_reply_ms': self._avg(self._reply_ms),
+            }
+
+
+class StreamSession:
+    """一次流式调用的计时与截断状态（调用方依次 feed 片段，结束后 finish）"""
+
+    def __init__(self, metrics: StreamingMetrics, max_chars: int, min_chars: int, max_tokens: int):
+        self.metrics = metrics
+        self.max_tokens = max_tokens
+        self.cutter = StreamCutter(max_chars=max_chars, min_chars=min_chars)
+        self.started = time.monotonic()
+        self.first_token_ms: Optional[float] = None
+
+    def feed(self, delta: str) -> bool:
+        if delta and self.first_token_ms is None:
+            self.first_token_ms = (time.monotonic() - self.started) * 1000
+        return self.cutter.feed(delta)
+
+    def finish(self) -> str:
+        text = self.cutter.result()
+        # 按模型会一直生成到 max_tokens 计算，实际可能本来就会提前结束，因此只是节省量的上界
+        tokens_saved = self.max_tokens - estimate_tokens(text) if self.cutter.cut else 0
+        self.metrics.record(self.first_token_ms, (time.monotonic() - self.started) * 1000,
+                            self.cutter.cut, tokens_saved)
+        return text
+
+
+class StreamingConfig:
+    """流式输出配置（AI_REPLY.streaming）"""
+
+    def __init__(self):
+        conf = config.get('AI_REPLY.streaming', {}) or {}
+        self.enabled = conf.get('enabled', False)
+        self.max_chars = conf.get('max_chars', 60)
+        self.min_chars = conf.get('min_chars', 20)
+        self.metrics = StreamingMetrics()
+
+    def session(self, max_tokens: int) -> StreamSession:
+        return StreamSession(self.metrics, self.max_chars, self.min_chars, max_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'enabled': self.enabled, 'max_chars': self.max_chars, 'min_chars': self.min_chars,
+                **self.metrics.stats()}
+
+
+_streaming: Optional[StreamingConfig] = None
+
+
+def get_streaming() -> StreamingConfig:
+    """获取进程级流式输出配置与统计"""
+    global _streaming
+    if _streaming is None:
+        _streaming = StreamingConfig()
+    return _streaming
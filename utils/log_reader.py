@@ -0,0 +1,420 @@
+"""
+系统日志读取
+- 从文件末尾按块反向读取，取最近N条日志不需要读入整个文件
+- 可选为每个日志文件建立稀疏索引：按固定字节间隔切块，记录每块的起始偏移、时间范围和出现过的日志级别，
+  按级别/时间范围查询时跳过不可能命中的块；正在写入的文件只对新增部分增量建索引
+- 按字节偏移游标向前翻页，按时间范围顺序输出（流式响应）
+- 支持读取轮转后压缩的 .zip 归档（顺序解压扫描，内存只保留当前页）
+
+日志条目以 "YYYY-MM-DD HH:MM:SS.mmm | LEVEL | ..." 开头，之后不带时间前缀的行（如异常堆栈）归属上一条
+"""
+
+import bisect
+import glob
+import os
+import re
+import threading
+import zipfile
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from config import config
+from utils.bounded_cache import TTLCache
+
+HEADER_PATTERN = re.compile(rb'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})(?:\.\d+)? \| (\w+)')
+
+# (起始偏移, 时间, 级别, 原始字节)
+Record = Tuple[int, Optional[str], Optional[str], bytes]
+
+
+def parse_header(line: bytes) -> Tuple[Optional[str], Optional[str]]:
+    """解析日志行开头的时间和级别，不是日志条目开头时返回 (None, None)"""
+    match = HEADER_PATTERN.match(line)
+    if not match:
+        return None, None
+    return match.group(1).decode('ascii'), match.group(2).decode('ascii').upper()
+
+
+def decode_record(raw: bytes) -> str:
+    return raw.decode('utf-8', errors='replace').rstrip('\r\n')
+
+
+def _upper_bound(until: Optional[str]) -> Optional[str]:
+    """结束时间只写了前缀时（如 '2025-01-01 10'）包含该前缀下的所有时间"""
+    return until + '~' if until and len(until) < 19 else until
+
+
+def _matches(record: Record, level: Optional[str], since: Optional[str], until: Optional[str]) -> bool:
+    _, ts, record_level, _ = record
+    if level and record_level != level:
+        return False
+    if since and (ts is None or ts < since):
+        return False
+    if until and (ts is None or ts > until):
+        return False
+    return True
+
+
+class _Block:
+    """稀疏索引中的一块：[start, end) 字节范围内的条目时间范围与级别"""
+
+    __slots__ = ('start', 'end', 'first_ts', 'last_ts', 'levels')
+
+    def __init__(self, start: int):
+        self.start = start
+        self.end = start
+        self.first_ts: Optional[str] = None
+        self.last_ts: Optional[str] = None
+        self.levels = set()
+
+    def may_match(self, level: Optional[str], since: Optional[str], until: Optional[str]) -> bool:
+        if level and level not in self.levels:
+            return False
+        if since and self.last_ts and self.last_ts < since:
+            return False
+        if until and self.first_ts and self.first_ts > until:
+            return False
+        return True
+
+
+class LogIndex:
+    """单个日志文件的稀疏索引（块边界对齐到条目开头，条目不会跨块）"""
+
+    def __init__(self, path: str, interval: int):
+        self.path = path
+        self.interval = interval
+        self.blocks: List[_Block] = []
+        self.inode = None
+        self.indexed_size = 0
+        self.lock = threading.Lock()
+
+    def refresh(self) -> List[_Block]:
+        """对文件新增的部分增量建索引；文件被截断或替换时重建"""
+        with self.lock:
+            stat = os.stat(self.path)
+            if stat.st_ino != self.inode or stat.st_size < self.indexed_size:
+                self.inode = stat.st_ino
+                self.indexed_size = 0
+                self.blocks = []
+            if stat.st_size > self.indexed_size:
+                self._extend(stat.st_size)
+            return list(self.blocks)
+
+    def _extend(self, size: int):
+        with open(self.path, 'rb') as f:
+            f.seek(self.indexed_size)
+            offset = self.indexed_size
+            block = self.blocks[-1] if self.blocks else None
+            while offset < size:
+                line = f.readline()
+                if not line:
+                    break
+                # 写入中的半行留到下次
+                if not line.endswith(b'\n') and offset + len(line) >= size:
+                    break
+                ts, level = parse_header(line)
+                if block is None or (ts is not None and offset - block.start >= self.interval):
+                    block = _Block(offset)
+                    self.blocks.append(block)
+                if ts is not None:
+                    block.first_ts = block.first_ts or ts
+                    block.last_ts = ts
+                    block.levels.add(level)
+                offset += len(line)
+                block.end = offset
+            self.indexed_size = offset
+
+
+class LogReader:
+    """日志目录读取器（进程内单例，见 get_log_reader）"""
+
+    def __init__(self, log_dir: str = 'logs', prefix: str = 'xianyu_', block_size: int = 65536,
+                 index_enabled: bool = True, index_interval: int = 1024 * 1024, max_indexes: int = 32):
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.block_size = block_size
+        self.index_enabled = index_enabled
+        self.index_interval = index_interval
+        self._indexes = TTLCache(max_size=max_indexes)
+        self._indexes_lock = threading.Lock()
+        self._listing: Optional[Tuple[float, List[Dict[str, Any]]]] = None
+        self._listing_lock = threading.Lock()
+
+    # ---------- 文件列表 ----------
+
+    def list_files(self) -> List[Dict[str, Any]]:
+        """日志文件列表（含 .zip 归档），按修改时间倒序
+
+        目录未变化（没有新建/删除/轮转）时复用上次的列表，只重新获取最新文件的大小和修改时间
+        """
+        if not os.path.isdir(self.log_dir):
+            return []
+        dir_mtime = os.stat(self.log_dir).st_mtime
+        with self._listing_lock:
+            if self._listing is None or self._listing[0] != dir_mtime:
+                files = []
+                for path in glob.glob(os.path.join(self.log_dir, f"{self.prefix}*")):
+                    if not (path.endswith('.log') or path.endswith('.zip')):
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append({"name": os.path.basename(path), "size": stat.st_size,
+                                  "modified_ts": stat.st_mtime, "archived": path.endswith('.zip')})
+                files.sort(key=lambda item: item["modified_ts"], reverse=True)
+                self._listing = (dir_mtime, files)
+            files = [dict(item) for item in self._listing[1]]
+        # 正在写入的文件大小随时变化，单独刷新
+        for item in files:
+            if not item["archived"]:
+                try:
+                    stat = os.stat(os.path.join(self.log_dir, item["name"]))
+                    item["size"], item["modified_ts"] = stat.st_size, stat.st_mtime
+                except OSError:
+                    pass
+                break
+        return files
+
+    def latest(self) -> Optional[str]:
+        for item in self.list_files():
+            if not item["archived"]:
+                return item["name"]
+        return None
+
+    def resolve(self, name: str) -> str:
+        """把文件名解析为日志目录下的路径（防止目录遍历），文件不存在时抛 FileNotFoundError"""
+        safe_name = os.path.basename(name or '')
+        log_dir = os.path.abspath(self.log_dir)
+        path = os.path.abspath(os.path.join(log_dir, safe_name))
+        if not safe_name or os.path.dirname(path) != log_dir:
+            raise ValueError("非法的日志文件路径")
+        if not os.path.isfile(path):
+            raise FileNotFoundError(safe_name)
+        return path
+
+    # ---------- 查询 ----------
+
+    def read(self, name: Optional[str] = None, lines: int = 100, level: Optional[str] = None,
+             before: Optional[int] = None, since: Optional[str] = None, until: Optional[str] = None) -> Dict[str, Any]:
+        """按从新到旧取一页日志（返回结果按时间正序）
+
+        Args:
+            name: 日志文件名，默认最新的日志文件
+            lines: 本页最多返回的日志条数
+            level: 只返回该级别
+            before: 翻页游标（字节偏移），只返回在该位置之前开始的条目；取上一页返回的 next_before
+            since/until: 时间范围，格式 'YYYY-MM-DD HH:MM:SS'（可只写前缀，如 '2025-01-01 10'）
+        """
+        name = name or self.latest()
+        if not name:
+            return {"logs": [], "log_file": None, "next_before": None, "has_more": False}
+        path = self.resolve(name)
+        level = level.upper() if level else None
+        until = _upper_bound(until)
+        lines = max(1, lines)
+        if path.endswith('.zip'):
+            records, has_more = self._read_archive(path, lines, level, before, since, until)
+        else:
+            records, has_more = self._read_plain(path, lines, level, before, since, until)
+        records.reverse()
+        return {
+            "logs": [decode_record(raw) for _, _, _, raw in records],
+            "log_file": os.path.join(self.log_dir, os.path.basename(path)),
+            "next_before": records[0][0] if records and has_more else None,
+            "has_more": has_more,
+        }
+
+    def iter_range(self, name: Optional[str] = None, level: Optional[str] = None,
+                   since: Optional[str] = None, until: Optional[str] = None) -> Iterator[str]:
+        """按时间正序逐条输出匹配的日志（用于流式响应，不在内存中累积）"""
+        name = name or self.latest()
+        if not name:
+            return
+        path = self.resolve(name)
+        level = level.upper() if level else None
+        until = _upper_bound(until)
+        if path.endswith('.zip'):
+            with self._open_archive(path) as f:
+                for record in self._iter_forward(f, 0, None):
+                    if until and record[1] and record[1] > until:
+                        return
+                    if _matches(record, level, since, until):
+                        yield decode_record(record[3])
+            return
+
+        size = os.path.getsize(path)
+        blocks = self._blocks(path) if (level or since or until) else None
+        ranges = ([(b.start, b.end) for b in blocks if b.may_match(level, since, until)]
+                  if blocks else [(0, size)])
+        with open(path, 'rb') as f:
+            for start, end in ranges:
+                f.seek(start)
+                for record in self._iter_forward(f, start, end):
+                    if until and record[1] and record[1] > until:
+                        return
+                    if _matches(record, level, since, until):
+                        yield decode_record(record[3])
+
+    def _blocks(self, path: str) -> Optional[List[_Block]]:
+        if not self.index_enabled:
+            return None
+        with self._indexes_lock:
+            index = self._indexes.get(path)
+            if index is None:
+                index = LogIndex(path, self.index_interval)
+                self._indexes[path] = index
+        return index.refresh()
+
+    def _read_plain(self, path: str, lines: int, level: Optional[str], before: Optional[int],
+                    since: Optional[str], until: Optional[str]) -> Tuple[List[Record], bool]:
+        size = os.path.getsize(path)
+        end = size if before is None else max(0, min(before, size))
+        # 只有带过滤条件时才需要索引；单纯取末尾N条直接反向读取
+        blocks = self._blocks(path) if (level or since or until) else None
+        if blocks:
+            # 从包含 end 的块开始向前，跳过不可能命中的块
+            starts = [b.start for b in blocks]
+            position = bisect.bisect_left(starts, end) - 1
+            ranges = []
+            while position >= 0:
+                block = blocks[position]
+                if since and block.last_ts and block.last_ts < since:
+                    break
+                if block.may_match(level, since, until):
+                    ranges.append((block.start, min(block.end, end)))
+                position -= 1
+            # 索引尚未覆盖的尾部（索引之后新写入的内容）
+            if blocks[-1].end < end:
+                ranges.insert(0, (blocks[-1].end, end))
+        else:
+            ranges = [(0, end)]
+
+        result: List[Record] = []
+        with open(path, 'rb') as f:
+            for start, stop in ranges:
+                for record in self._iter_backward(f, start, stop):
+                    if since and record[1] and record[1] < since:
+                        return result, False
+                    if _matches(record, level, since, until):
+                        result.append(record)
+                        if len(result) >= lines:
+                            return result, record[0] > 0
+        return result, False
+
+    def _iter_backward(self, f, start: int, end: int) -> Iterator[Record]:
+        """在 [start, end) 范围内从后往前按块读取，逐条返回日志条目（续行合并到所属条目）"""
+        position = end      # buffer 对应文件中的 [position, position + cursor)
+        buffer = b''
+        cursor = 0
+        pending: List[bytes] = []  # 尚未遇到条目开头的续行（倒序）
+        while True:
+            # 最后一行之前的换行符；行尾的换行不算
+            newline = buffer.rfind(b'\n', 0, max(0, cursor - 1))
+            if newline == -1:
+                if position > start:
+                    read_size = min(self.block_size, position - start)
+                    position -= read_size
+                    f.seek(position)
+                    buffer = f.read(read_size) + buffer[:cursor]
+                    cursor = len(buffer)
+                    continue
+                if cursor:
+                    record = self._complete(buffer[:cursor].rstrip(b'\r\n'), start, pending)
+                    if record is not None:
+                        yield record
+                break
+            record = self._complete(buffer[newline + 1:cursor].rstrip(b'\r\n'), position + newline + 1, pending)
+            cursor = newline + 1
+            if record is not None:
+                yield record
+        if pending:
+            # 范围开头的续行没有所属条目，单独返回
+            yield start, None, None, b'\n'.join(reversed(pending))
+
+    @staticmethod
+    def _complete(line: bytes, offset: int, pending: List[bytes]) -> Optional[Record]:
+        ts, level = parse_header(line)
+        if ts is None:
+            pending.append(line)
+            return None
+        raw = line if not pending else line + b'\n' + b'\n'.join(reversed(pending))
+        pending.clear()
+        return offset, ts, level, raw
+
+    @staticmethod
+    def _iter_forward(f, start: int, end: Optional[int]) -> Iterator[Record]:
+        """从当前位置顺序读取到 end（None表示文件末尾），逐条返回日志条目"""
+        offset = start
+        current: Optional[List[Any]] = None
+        while end is None or offset < end:
+            line = f.readline()
+            if not line:
+                break
+            ts, level = parse_header(line)
+            if ts is not None or current is None:
+                if current is not None:
+                    yield current[0], current[1], current[2], b''.join(current[3])
+                current = [offset, ts, level, [line]]
+            else:
+                current[3].append(line)
+            offset += len(line)
+        if current is not None:
+            yield current[0], current[1], current[2], b''.join(current[3])
+
+    @staticmethod
+    def _open_archive(path: str):
+        archive = zipfile.ZipFile(path)
+        members = [n for n in archive.namelist() if not n.endswith('/')]
+        if not members:
+            archive.close()
+            raise FileNotFoundError(f"{os.path.basename(path)} 中没有日志文件")
+        handle = archive.open(members[0])
+        # 关闭成员文件时一并关闭归档
+        original_close = handle.close
+
+        def close():
+            original_close()
+            archive.close()
+        handle.close = close
+        return handle
+
+    def _read_archive(self, path: str, lines: int, level: Optional[str], before: Optional[int],
+                      since: Optional[str], until: Optional[str]) -> Tuple[List[Record], bool]:
+        """压缩归档只能顺序解压：扫描一遍，只保留最近 lines 条匹配的条目"""
+        window: Deque[Record] = deque(maxlen=lines)
+        skipped = False
+        with self._open_archive(path) as f:
+            for record in self._iter_forward(f, 0, before):
+                if until and record[1] and record[1] > until:
+                    break
+                if _matches(record, level, since, until):
+                    if len(window) == lines:
+                        skipped = True
+                    window.append(record)
+        return list(reversed(window)), skipped
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'index_enabled': self.index_enabled,
+            'index_interval': self.index_interval,
+            'indexes': self._indexes.stats('log_indexes'),
+        }
+
+
+_reader: Optional[LogReader] = None
+
+
+def get_log_reader() -> LogReader:
+    """获取进程级日志读取器，首次调用时按 LOG_VIEWER 配置创建"""
+    global _reader
+    if _reader is None:
+        conf = config.get('LOG_VIEWER', {}) or {}
+        _reader = LogReader(
+            log_dir=conf.get('log_dir', 'logs'),
+            block_size=conf.get('block_size', 65536),
+            index_enabled=conf.get('index_enabled', True),
+            index_interval=conf.get('index_interval', 1024 * 1024),
+            max_indexes=conf.get('max_indexes', 32),
+        )
+    return _reader
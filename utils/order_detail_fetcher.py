@@ -1,6 +1,7 @@
 """
 闲鱼订单详情获取工具
-基于Playwright实现订单详情页面访问和数据提取
+优先通过mtop接口获取订单详情（见 utils/order_detail_provider.py），
+失败时基于Playwright实现订单详情页面访问和数据提取
 """
 
 import asyncio
@@ -12,8 +13,12 @@ from playwright.async_api import async_playwright, Browser, BrowserContext, Page
 from loguru import logger
 import re
 import json
+import hashlib
 from threading import Lock
-from collections import defaultdict
+from config import get_memory_limit
+from utils.bounded_cache import KeyedLocks
+from utils.browser_pool import get_browser_pool, is_browser_pool_enabled
+from utils.order_detail_provider import fetch_order_detail_with_providers
 
 # 修复Docker环境中的asyncio事件循环策略问题
 if sys.platform.startswith('linux') or os.getenv('DOCKER_ENV'):
@@ -37,8 +42,8 @@ if os.getenv('DOCKER_ENV'):
 class OrderDetailFetcher:
     """闲鱼订单详情获取器"""
 
-    # 类级别的锁字典，为每个order_id维护一个锁
-    _order_locks = defaultdict(lambda: asyncio.Lock())
+    # 类级别的锁注册表，为每个order_id维护一个锁（有容量上限，空闲超过TTL自动清理）
+    _order_locks = KeyedLocks(*get_memory_limit('order_detail_locks', 2000, 86400))
 
     def __init__(self, cookie_string: str = None, headless: bool = True):
         self.browser: Optional[Browser] = None
@@ -66,6 +71,16 @@ class OrderDetailFetcher:
         # Cookie配置 - 支持动态传入
         self.cookie = cookie_string
 
+        # 是否使用浏览器池借用的页面（借用模式下不自行启动/关闭浏览器）
+        self.pooled = False
+
+    def attach_page(self, page: Page):
+        """使用浏览器池借出的页面，替代自行启动浏览器"""
+        self.page = page
+        self.context = page.context
+        self.browser = page.context.browser
+        self.pooled = True
+
     async def init_browser(self, headless: bool = None):
         """初始化浏览器"""
         try:
@@ -578,6 +593,11 @@ class OrderDetailFetcher:
             if await self._check_browser_status():
                 return True
 
+            if self.pooled:
+                # 借用的页面不可用时由浏览器池负责重建，这里直接失败
+                logger.warning("借用的浏览器页面不可用")
+                return False
+
             logger.info("浏览器状态异常，尝试重新初始化...")
 
             # 先尝试关闭现有的浏览器实例
@@ -630,6 +650,12 @@ class OrderDetailFetcher:
 
     async def close(self):
         """关闭浏览器"""
+        if self.pooled:
+            # 借用的页面由浏览器池回收
+            self.page = None
+            self.context = None
+            self.browser = None
+            return
         try:
             if self.page:
                 await self.page.close()
@@ -654,14 +680,16 @@ class OrderDetailFetcher:
 
 
 # 便捷函数
-async def fetch_order_detail_simple(order_id: str, cookie_string: str = None, headless: bool = True) -> Optional[Dict[str, Any]]:
+async def fetch_order_detail_simple(order_id: str, cookie_string: str = None, headless: bool = True,
+                                    cookie_id: str = None) -> Optional[Dict[str, Any]]:
     """
-    简单的订单详情获取函数（优化版：先检查数据库，再初始化浏览器）
+    简单的订单详情获取函数（优化版：先检查数据库，再依次尝试mtop接口和浏览器获取）
 
     Args:
         order_id: 订单ID
         cookie_string: Cookie字符串，如果不提供则使用默认值
         headless: 是否无头模式
+        cookie_id: 账号ID，用于在浏览器池中复用该账号的浏览器上下文
 
     Returns:
         订单详情字典，包含以下字段：
@@ -724,11 +752,35 @@ async def fetch_order_detail_simple(order_id: str, cookie_string: str = None, he
     except Exception as e:
         logger.warning(f"检查数据库缓存失败: {e}")
 
-    # 数据库中没有有效数据，使用浏览器获取
-    logger.info(f"🌐 订单 {order_id} 需要浏览器获取，开始初始化浏览器...")
+    # 数据库中没有有效数据，按提供者顺序获取（默认先mtop接口，失败再用浏览器）
+    if not cookie_string:
+        return await fetch_order_detail_via_browser(order_id, cookie_string, headless=headless, cookie_id=cookie_id)
+
+    logger.info(f"🌐 订单 {order_id} 需要远程获取详情...")
+    return await fetch_order_detail_with_providers(order_id, cookie_string, cookie_id=cookie_id, headless=headless)
+
+
+async def fetch_order_detail_via_browser(order_id: str, cookie_string: str = None, headless: bool = True,
+                                         cookie_id: str = None) -> Optional[Dict[str, Any]]:
+    """通过浏览器打开订单详情页获取详情（优先从浏览器池借用页面）"""
+    logger.info(f"🌐 订单 {order_id} 使用浏览器获取，开始初始化浏览器...")
     print(f"🔍 订单 {order_id} 开始浏览器获取详情...")
 
     fetcher = OrderDetailFetcher(cookie_string, headless)
+
+    if is_browser_pool_enabled() and cookie_string:
+        account_key = cookie_id or hashlib.md5(cookie_string.encode('utf-8')).hexdigest()
+        try:
+            async with get_browser_pool().page(account_key, cookie_string, headless=headless,
+                                               extra_headers=fetcher.headers) as page:
+                fetcher.attach_page(page)
+                return await fetcher.fetch_order_detail(order_id)
+        except Exception as e:
+            logger.error(f"浏览器池获取订单详情失败: {order_id}, 错误: {e}")
+            return None
+        finally:
+            await fetcher.close()
+
     try:
         if await fetcher.init_browser(headless=headless):
             return await fetcher.fetch_order_detail(order_id)
@@ -0,0 +1,365 @@
+"""
+订单详情提供者
+按配置顺序依次尝试多个订单详情获取方式：优先使用签名的mtop JSON接口（复用aiohttp会话，无需浏览器），
+失败时回退到Playwright浏览器页面抓取。提供者可通过 register_order_detail_provider 扩展
+"""
+
+import asyncio
+import json
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import aiohttp
+from loguru import logger
+
+from config import config, DEFAULT_HEADERS
+from utils.xianyu_utils import generate_sign, trans_cookies
+
+
+ORDER_DETAIL_URL = "https://www.goofish.com/order-detail?orderId={order_id}&role=seller"
+MTOP_BASE_URL = "https://h5api.m.goofish.com/h5"
+
+# 订单详情JSON中可能出现的字段名（按优先级）
+SKU_KEYS = ('skuInfo', 'skuText', 'skuDesc', 'skuName', 'sku')
+QUANTITY_KEYS = ('buyAmount', 'buyQuantity', 'quantity', 'itemNum', 'num')
+# 明确表示实付金额的字段，在整个响应中查找
+PAID_AMOUNT_KEYS = ('actualPayFee', 'actualFee', 'payAmount', 'totalPayFee', 'totalFee')
+# 含义较泛的金额字段，商品信息（键名含 item）下的同名字段是商品标价，不是实付金额，跳过
+GENERIC_AMOUNT_KEYS = ('totalPrice', 'amount', 'price')
+AMOUNT_KEYS = PAID_AMOUNT_KEYS + GENERIC_AMOUNT_KEYS
+
+
+def split_spec(text: str) -> Dict[str, str]:
+    """按第一个冒号（兼容全角）拆分规格名称和规格值"""
+    if not text:
+        return {}
+    normalized = str(text).replace('：', ':')
+    if ':' not in normalized:
+        return {}
+    spec_name, spec_value = (part.strip() for part in normalized.split(':', 1))
+    if spec_name and spec_value:
+        return {'spec_name': spec_name, 'spec_value': spec_value}
+    return {}
+
+
+def normalize_quantity(value: Any) -> str:
+    """统一数量格式，去掉"数量:"前缀和"x"符号（如 "数量: x2" -> "2"）"""
+    text = str(value).replace('：', ':').strip()
+    if ':' in text:
+        text = text.split(':', 1)[1].strip()
+    if text[:1] in ('x', 'X', '×'):
+        text = text[1:].strip()
+    return text
+
+
+def _amount_text(value: Any) -> str:
+    """金额字段可能是数字、字符串或 {"value": "12.00"} 结构"""
+    if isinstance(value, dict):
+        for key in ('value', 'amount', 'price', 'text'):
+            if key in value:
+                return _amount_text(value[key])
+        return ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if isinstance(value, str):
+        cleaned = value.replace('¥', '').replace('￥', '').strip()
+        try:
+            float(cleaned)
+            return cleaned
+        except ValueError:
+            return ''
+    return ''
+
+
+def _sku_text(value: Any) -> str:
+    """规格字段可能是 "颜色:红色" 字符串，也可能是 [{"name":..,"value":..}] 列表"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        parts = []
+        for entry in value:
+            if isinstance(entry, dict):
+                name = entry.get('name') or entry.get('propertyName') or entry.get('key')
+                val = entry.get('value') or entry.get('valueName') or entry.get('text')
+                if name and val:
+                    parts.append(f"{name}:{val}")
+            elif isinstance(entry, str):
+                parts.append(entry)
+        return ';'.join(parts)
+    return ''
+
+
+def _find_first(obj: Any, keys: Tuple[str, ...], convert, depth: int = 12, skip_item: bool = False) -> str:
+    """在嵌套JSON中按优先级查找第一个可转换为有效值的字段（同一字段名按层级由浅到深查找）
+
+    skip_item 为True时不进入键名含 item 的子结构（商品信息）
+    """
+    for key in keys:
+        found = _search(obj, key, convert, depth, skip_item)
+        if found:
+            return found
+    return ''
+
+
+def _search(obj: Any, key: str, convert, depth: int, skip_item: bool = False) -> str:
+    level = [obj]
+    for _ in range(depth):
+        next_level = []
+        for node in level:
+            if isinstance(node, dict):
+                if key in node:
+                    value = convert(node[key])
+                    if value:
+                        return value
+                next_level.extend(child for name, child in node.items()
+                                  if isinstance(child, (dict, list))
+                                  and not (skip_item and 'item' in str(name).lower()))
+            elif isinstance(node, list):
+                next_level.extend(child for child in node if isinstance(child, (dict, list)))
+        if not next_level:
+            break
+        level = next_level
+    return ''
+
+
+def parse_order_detail_json(order_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """从mtop订单详情的data字段中解析规格、数量和金额，返回与浏览器抓取一致的结果结构
+
+    未解析到有效金额时返回None，由调用方回退到其他提供者
+    """
+    if not isinstance(data, dict):
+        return None
+
+    amount = (_find_first(data, PAID_AMOUNT_KEYS, _amount_text)
+              or _find_first(data, GENERIC_AMOUNT_KEYS, _amount_text, skip_item=True))
+    try:
+        if not amount or float(amount) <= 0:
+            return None
+    except ValueError:
+        return None
+
+    sku_info: Dict[str, str] = {'amount': amount}
+    sku_info.update(split_spec(_find_first(data, SKU_KEYS, _sku_text)))
+
+    quantity = _find_first(data, QUANTITY_KEYS,
+                           lambda v: normalize_quantity(v) if isinstance(v, (int, str)) and not isinstance(v, bool) else '')
+    sku_info['quantity'] = quantity if quantity.isdigit() else '1'
+
+    return {
+        'order_id': order_id,
+        'url': ORDER_DETAIL_URL.format(order_id=order_id),
+        'title': f"订单详情 - {order_id}",
+        'sku_info': sku_info,
+        'spec_name': sku_info.get('spec_name', ''),
+        'spec_value': sku_info.get('spec_value', ''),
+        'quantity': sku_info.get('quantity', ''),
+        'amount': sku_info.get('amount', ''),
+        'timestamp': time.time(),
+        'from_cache': False,
+    }
+
+
+class OrderDetailProvider:
+    """订单详情提供者基类，子类实现 fetch 并返回结果字典，失败返回None
+
+    请求过程中服务端下发了新Cookie（如刷新的_m_h5_tk）时，结果中的 refreshed_cookies 为新Cookie字典
+    """
+
+    name = 'base'
+
+    def __init__(self):
+        self.counters = {'attempts': 0, 'successes': 0, 'failures': 0, 'total_ms': 0.0}
+
+    async def fetch(self, order_id: str, cookie_string: str, cookie_id: str = None,
+                    headless: bool = True) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        attempts = self.counters['attempts']
+        return {
+            'name': self.name,
+            **{key: value for key, value in self.counters.items() if key != 'total_ms'},
+            'avg_ms': round(self.counters['total_ms'] / attempts, 1) if attempts else 0,
+        }
+
+
+class MtopOrderDetailProvider(OrderDetailProvider):
+    """通过签名的mtop JSON接口获取订单详情
+
+    每个事件循环复用一个aiohttp会话；会话不保存Cookie（DummyCookieJar），
+    每次请求携带对应账号的Cookie头，避免多账号之间串号
+    """
+
+    name = 'mtop'
+
+    def __init__(self, api: str = 'mtop.idle.web.trade.order.detail', version: str = '1.0',
+                 timeout: float = 10, base_url: str = MTOP_BASE_URL):
+        super().__init__()
+        self.api = api
+        self.base_url = (base_url or MTOP_BASE_URL).rstrip('/')
+        self.version = version
+        self.timeout = timeout
+        self._sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = \
+            weakref.WeakKeyDictionary()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                headers=DEFAULT_HEADERS.copy(),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+            self._sessions[loop] = session
+        return session
+
+    async def close(self):
+        """关闭当前事件循环的会话"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.pop(loop, None)
+        if session and not session.closed:
+            await session.close()
+
+    async def _request(self, order_id: str, cookies: Dict[str, str]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """发送一次签名请求，返回 (响应JSON, 响应中下发的新Cookie)"""
+        params = {
+            'jsv': '2.7.2',
+            'appKey': '34839810',
+            't': str(int(time.time()) * 1000),
+            'sign': '',
+            'v': self.version,
+            'type': 'originaljson',
+            'accountSite': 'xianyu',
+            'dataType': 'json',
+            'timeout': '20000',
+            'api': self.api,
+            'sessionOption': 'AutoLoginOnly',
+        }
+        data_val = json.dumps({'tid': order_id}, separators=(',', ':'))
+        token = cookies.get('_m_h5_tk', '').split('_')[0]
+        params['sign'] = generate_sign(params['t'], token, data_val)
+
+        headers = {'cookie': '; '.join(f"{k}={v}" for k, v in cookies.items())}
+        async with self._get_session().post(
+            f'{self.base_url}/{self.api}/{self.version}/',
+            params=params,
+            data={'data': data_val},
+            headers=headers
+        ) as response:
+            res_json = await response.json(content_type=None)
+            new_cookies = {}
+            for cookie in response.headers.getall('set-cookie', []):
+                if '=' in cookie:
+                    name, value = cookie.split(';')[0].split('=', 1)
+                    new_cookies[name.strip()] = value.strip()
+            return res_json, new_cookies
+
+    async def fetch(self, order_id: str, cookie_string: str, cookie_id: str = None,
+                    headless: bool = True) -> Optional[Dict[str, Any]]:
+        cookies = trans_cookies(cookie_string) if cookie_string else {}
+        if not cookies.get('_m_h5_tk'):
+            logger.debug(f"【{cookie_id}】Cookie中缺少_m_h5_tk，跳过mtop订单详情接口")
+            return None
+
+        # token过期时接口会下发新的_m_h5_tk，用新Cookie重试一次
+        refreshed_cookies: Dict[str, str] = {}
+        for attempt in range(2):
+            res_json, new_cookies = await self._request(order_id, cookies)
+            ret_value = res_json.get('ret', []) if isinstance(res_json, dict) else []
+            if any('SUCCESS' in ret for ret in ret_value):
+                result = parse_order_detail_json(order_id, res_json.get('data', {}))
+                if result is None:
+                    logger.warning(f"【{cookie_id}】mtop订单详情未解析到有效金额: {order_id}")
+                elif refreshed_cookies:
+                    # 新下发的Cookie随结果返回，由调用方更新账号Cookie并写回数据库
+                    result['refreshed_cookies'] = refreshed_cookies
+                return result
+            if attempt == 0 and new_cookies.get('_m_h5_tk') and any('TOKEN' in ret for ret in ret_value):
+                cookies.update(new_cookies)
+                refreshed_cookies = new_cookies
+                continue
+            logger.warning(f"【{cookie_id}】mtop订单详情接口调用失败: {order_id}, {ret_value}")
+            return None
+        return None
+
+
+class BrowserOrderDetailProvider(OrderDetailProvider):
+    """通过Playwright打开订单详情页抓取（浏览器池或独立浏览器）"""
+
+    name = 'browser'
+
+    async def fetch(self, order_id: str, cookie_string: str, cookie_id: str = None,
+                    headless: bool = True) -> Optional[Dict[str, Any]]:
+        from utils.order_detail_fetcher import fetch_order_detail_via_browser
+        return await fetch_order_detail_via_browser(order_id, cookie_string, headless=headless,
+                                                    cookie_id=cookie_id)
+
+
+_provider_classes: Dict[str, Type[OrderDetailProvider]] = {
+    MtopOrderDetailProvider.name: MtopOrderDetailProvider,
+    BrowserOrderDetailProvider.name: BrowserOrderDetailProvider,
+}
+_providers: Dict[str, OrderDetailProvider] = {}
+
+
+def register_order_detail_provider(name: str, provider_cls: Type[OrderDetailProvider]):
+    """注册自定义订单详情提供者，随后可在 ORDER_DETAIL.providers 中按名称启用"""
+    _provider_classes[name] = provider_cls
+    _providers.pop(name, None)
+
+
+def _create_provider(name: str) -> OrderDetailProvider:
+    if name == MtopOrderDetailProvider.name:
+        return MtopOrderDetailProvider(
+            api=config.get('ORDER_DETAIL.mtop_api', 'mtop.idle.web.trade.order.detail'),
+            version=config.get('ORDER_DETAIL.mtop_version', '1.0'),
+            timeout=config.get('ORDER_DETAIL.mtop_timeout', 10),
+            base_url=config.get('ORDER_DETAIL.mtop_base_url', MTOP_BASE_URL),
+        )
+    return _provider_classes[name]()
+
+
+def get_order_detail_providers() -> List[OrderDetailProvider]:
+    """按 ORDER_DETAIL.providers 配置顺序返回提供者实例（进程内单例）"""
+    names = config.get('ORDER_DETAIL.providers', ['mtop', 'browser']) or ['browser']
+    providers = []
+    for name in names:
+        if name not in _provider_classes:
+            logger.warning(f"未知的订单详情提供者: {name}")
+            continue
+        if name not in _providers:
+            _providers[name] = _create_provider(name)
+        providers.append(_providers[name])
+    return providers
+
+
+async def fetch_order_detail_with_providers(order_id: str, cookie_string: str, cookie_id: str = None,
+                                            headless: bool = True) -> Optional[Dict[str, Any]]:
+    """依次尝试各提供者，返回第一个成功的结果（结果中 source 字段标记来源）"""
+    for provider in get_order_detail_providers():
+        provider.counters['attempts'] += 1
+        start = time.time()
+        try:
+            result = await provider.fetch(order_id, cookie_string, cookie_id=cookie_id, headless=headless)
+        except Exception as e:
+            logger.warning(f"【{cookie_id}】订单详情提供者 {provider.name} 异常: {order_id}, {e}")
+            result = None
+        finally:
+            provider.counters['total_ms'] += (time.time() - start) * 1000
+
+        if result:
+            provider.counters['successes'] += 1
+            result.setdefault('source', provider.name)
+            logger.info(f"【{cookie_id}】订单详情由 {provider.name} 获取成功: {order_id}")
+            return result
+
+        provider.counters['failures'] += 1
+        logger.info(f"【{cookie_id}】订单详情提供者 {provider.name} 未获取到结果，尝试下一个: {order_id}")
+    return None
+
+
+def get_order_detail_provider_stats() -> List[Dict[str, Any]]:
+    """返回已创建提供者的调用统计"""
+    return [provider.stats() for provider in _providers.values()]
@@ -0,0 +1,185 @@
+"""
+列表接口的分页、过滤与字段投影
+- 游标（keyset）分页：按 (排序列, 主键) 记住上一页最后一行，下一页用 WHERE (排序列, 主键) < (?, ?) 续查，
+  不再 OFFSET 扫描，也不需要每次 COUNT(*)；排序和比较都直接使用列本身（不包函数），
+  这样 (过滤列, 排序列, 主键) 索引可以同时用于定位和排序。排序列为NULL的行按SQLite的规则排在最小一端
+- fields= 只查询需要的列，大字段（商品详情、卡券数据、日志内容等）按需获取
+- 过滤（等值）、模糊搜索和排序都在SQL中完成，列名只允许使用白名单中的字段
+
+不传 limit/cursor 时不分页，保持原接口返回全部数据的行为
+"""
+
+import base64
+import json
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class PageRequest:
+    """一次列表查询的分页/过滤/投影参数（由接口的查询参数构造）"""
+
+    def __init__(self, limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None,
+                 sort: Optional[str] = None, order: Optional[str] = None, filters: Optional[Dict[str, Any]] = None,
+                 search: Optional[str] = None):
+        if cursor and limit is None:
+            limit = DEFAULT_LIMIT
+        self.limit = min(max(1, int(limit)), MAX_LIMIT) if limit is not None else None
+        self.cursor = cursor or None
+        self.fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+        self.sort = sort or None
+        if order and order.lower() not in ('asc', 'desc'):
+            raise ValueError(f"不支持的排序方向: {order}")
+        self.order = order.lower() if order else None
+        self.filters = {k: v for k, v in (filters or {}).items() if v is not None and v != ''}
+        self.search = search or None
+
+    @property
+    def paged(self) -> bool:
+        return self.limit is not None
+
+
+def encode_cursor(sort: str, order: str, sort_value: Any, key_value: Any) -> str:
+    raw = json.dumps([sort, order, sort_value, key_value], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str, Any, Any]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort, order, sort_value, key_value = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError("无效的分页游标")
+    return sort, order, sort_value, key_value
+
+
+class ListSpec:
+    """一个列表查询的可用列、排序、过滤定义
+
+    Args:
+        source: FROM 子句（可包含JOIN）
+        columns: {输出字段名: SQL表达式}，按输出顺序排列
+        key: 唯一键字段名（游标分页的第二排序键）
+        default_sort: 默认排序字段
+        default_order: 默认排序方向
+        sortable: 允许排序的字段（默认全部）
+        filterable: 允许等值过滤的字段
+        searchable: search 参数模糊匹配的字段
+    """
+
+    def __init__(self, source: str, columns: Dict[str, str], key: str, default_sort: str,
+                 default_order: str = 'desc', sortable: Optional[Iterable[str]] = None,
+                 filterable: Iterable[str] = (), searchable: Iterable[str] = ()):
+        self.source = source
+        self.columns = dict(columns)
+        self.key = key
+        self.default_sort = default_sort
+        self.default_order = default_order
+        self.sortable = set(sortable) if sortable is not None else set(self.columns)
+        self.filterable = set(filterable)
+        self.searchable = tuple(searchable)
+
+    def _column(self, name: str, kind: str) -> str:
+        if name not in self.columns:
+            raise ValueError(f"不支持的{kind}字段: {name}")
+        return self.columns[name]
+
+    def select_fields(self, fields: Optional[Sequence[str]]) -> List[str]:
+        if not fields or fields == ['*']:
+            return list(self.columns)
+        for name in fields:
+            self._column(name, '查询')
+        return list(dict.fromkeys(fields))
+
+    def build(self, page: PageRequest, where: Sequence[str] = (), params: Sequence[Any] = ()) -> Tuple[str, List[Any], str, str, List[str]]:
+        """生成查询SQL
+
+        Returns:
+            (sql, params, 排序字段, 排序方向, 输出字段)
+        """
+        fields = self.select_fields(page.fields)
+        sort = page.sort or self.default_sort
+        if sort not in self.sortable:
+            raise ValueError(f"不支持的排序字段: {sort}")
+        order = page.order or self.default_order
+        sort_expr = self._column(sort, '排序')
+        key_expr = self.columns[self.key]
+
+        clauses = list(where)
+        values = list(params)
+        for name, value in page.filters.items():
+            if name not in self.filterable:
+                raise ValueError(f"不支持的过滤字段: {name}")
+            clauses.append(f"{self.columns[name]} = ?")
+            values.append(value)
+        if page.search and self.searchable:
+            clauses.append('(' + ' OR '.join(f"{self.columns[name]} LIKE ?" for name in self.searchable) + ')')
+            values.extend([f"%{page.search}%"] * len(self.searchable))
+        seeks: List[Tuple[Optional[str], List[Any]]] = [(None, [])]
+        if page.cursor:
+            cursor_sort, cursor_order, sort_value, key_value = decode_cursor(page.cursor)
+            if cursor_sort != sort or cursor_order != order:
+                raise ValueError("分页游标与排序参数不一致")
+            seeks = self._seek(sort_expr, key_expr, order, sort_value, key_value)
+
+        select = ', '.join(f"{self.columns[name]} AS {name}" for name in fields)
+        direction = 'DESC' if order == 'desc' else 'ASC'
+        parts = []
+        all_values: List[Any] = []
+        for index, (seek, seek_values) in enumerate(seeks):
+            part_clauses = clauses + ([seek] if seek else [])
+            sql = f"SELECT {select}, {sort_expr} AS __sort, {key_expr} AS __key"
+            if len(seeks) > 1:
+                sql += f", {index} AS __part"
+            sql += f" FROM {self.source}"
+            if part_clauses:
+                sql += " WHERE " + " AND ".join(part_clauses)
+            sql += f" ORDER BY {sort_expr} {direction}, {key_expr} {direction}"
+            all_values.extend(values + seek_values)
+            if page.paged:
+                sql += " LIMIT ?"
+                all_values.append(page.limit + 1)
+            parts.append(sql)
+
+        if len(parts) == 1:
+            return parts[0], all_values, sort, order, fields
+        # 游标落在 NULL 与非 NULL 的分界两侧时，两段分别走索引定位并各自 LIMIT，再按段号合并
+        names = ', '.join(fields)
+        union = ' UNION ALL '.join(f"SELECT * FROM ({part})" for part in parts)
+        sql = (f"SELECT {names}, __sort, __key FROM ({union}) "
+               f"ORDER BY __part, __sort {direction}, __key {direction} LIMIT ?")
+        all_values.append(page.limit + 1)
+        return sql, all_values, sort, order, fields
+
+    @staticmethod
+    def _seek(sort_expr: str, key_expr: str, order: str, sort_value: Any,
+              key_value: Any) -> List[Tuple[str, List[Any]]]:
+        """游标之后的行的条件，按先后顺序返回一段或两段（NULL 在升序时排最前、降序时排最后）"""
+        op = '<' if order == 'desc' else '>'
+        if sort_value is None:
+            seeks = [(f"{sort_expr} IS NULL AND {key_expr} {op} ?", [key_value])]
+            if order == 'asc':
+                seeks.append((f"{sort_expr} IS NOT NULL", []))
+            return seeks
+        seeks = [(f"({sort_expr}, {key_expr}) {op} (?, ?)", [sort_value, key_value])]
+        if order == 'desc':
+            seeks.append((f"{sort_expr} IS NULL", []))
+        return seeks
+
+
+def page_result(items: List[Dict[str, Any]], next_cursor: Optional[str]) -> Dict[str, Any]:
+    return {"items": items, "next_cursor": next_cursor, "has_more": next_cursor is not None}
+
+
+def page_params(limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None,
+                sort: Optional[str] = None, order: Optional[str] = None, search: Optional[str] = None,
+                **filters: Any) -> PageRequest:
+    """接口查询参数 -> PageRequest（参数格式错误时抛 ValueError）"""
+    return PageRequest(limit=limit, cursor=cursor, fields=fields, sort=sort, order=order,
+                       filters=filters, search=search)
+
+
+def paged_response(page: PageRequest, result: Dict[str, Any], legacy: Any) -> Any:
+    """分页请求返回 {items, next_cursor, has_more}，否则返回原接口的数据格式"""
+    return result if page.paged else legacy
@@ -0,0 +1,240 @@
+"""
+AI回复提示词组装
+- 商品提示片段（标题、归一化价格、精简后的详情）按商品内容哈希缓存，详情为JSON时只保留描述类文本字段
+- 自定义提示词按原始字符串缓存解析结果，避免每次 json.loads
+- 对话历史按token预算从新到旧选取，更早的轮次折叠为滚动摘要，提示词长度不再随商品详情和对话长度增长
+- 统计每次回复的提示词字节数/估算token数与大模型耗时
+"""
+
+import hashlib
+import html
+import json
+import re
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import config
+from utils.bounded_cache import TTLCache
+
+_CJK_PATTERN = re.compile(r'[　-鿿가-힯＀-￯]')
+_TAG_PATTERN = re.compile(r'<[^>]+>')
+_URL_PATTERN = re.compile(r'https?://\S+')
+_SPACE_PATTERN = re.compile(r'\s+')
+# 详情为JSON时保留的文本字段
+_TEXT_KEYS = ('title', 'desc', 'description', 'detail', 'content', 'text', 'price_text')
+
+
+def estimate_tokens(text: str) -> int:
+    """估算token数：中日韩字符约1个/字，其余字符约4个/token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def normalize_price(price: Any) -> str:
+    """价格归一化：数字去掉多余的小数位（99.00 -> 99, 99.50 -> 99.5），无法解析时原样返回"""
+    if price is None or price == '':
+        return '未知'
+    try:
+        value = float(re.sub(r'[^\d.]', '', str(price)) or 'nan')
+    except ValueError:
+        return str(price)
+    if value != value:  # NaN
+        return str(price)
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+
+def _collect_text(data: Any, out: List[str], depth: int = 0):
+    if depth > 4:
+        return
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, str) and key in _TEXT_KEYS:
+                out.append(value)
+            elif isinstance(value, (dict, list)):
+                _collect_text(value, out, depth + 1)
+    elif isinstance(data, list):
+        for value in data[:20]:
+            _collect_text(value, out, depth + 1)
+
+
+def trim_detail(detail: Any, max_chars: int) -> str:
+    """精简商品详情：JSON只取描述类字段，去掉HTML标签/链接/多余空白，超长时在句子边界截断"""
+    if not detail:
+        return '无'
+    text = detail
+    if isinstance(detail, str) and detail.lstrip()[:1] in ('{', '['):
+        try:
+            detail = json.loads(detail)
+        except ValueError:
+            pass
+    if isinstance(detail, (dict, list)):
+        parts: List[str] = []
+        _collect_text(detail, parts)
+        # 去重并保持顺序（标题经常在多个字段重复出现）
+        text = '；'.join(dict.fromkeys(p.strip() for p in parts if p and p.strip()))
+    text = _URL_PATTERN.sub('', _TAG_PATTERN.sub(' ', html.unescape(str(text))))
+    text = _SPACE_PATTERN.sub(' ', text).strip()
+    if not text:
+        return '无'
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    boundary = max(cut.rfind(mark) for mark in ('。', '！', '？', '；', '.', '!', '?', '\n'))
+    if boundary >= max_chars // 2:
+        cut = cut[:boundary + 1]
+    return cut + '…'
+
+
+class PromptMetrics:
+    """最近若干次回复的提示词大小与大模型耗时"""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._prompt_bytes: deque = deque(maxlen=window)
+        self._prompt_tokens: deque = deque(maxlen=window)
+        self._latency_ms: deque = deque(maxlen=window)
+        self.counters = {'replies': 0, 'fragment_hits': 0, 'fragment_misses': 0, 'summarized_turns': 0}
+
+    def record(self, prompt_bytes: int, prompt_tokens: int, latency_ms: float):
+        with self._lock:
+            self.counters['replies'] += 1
+            self._prompt_bytes.append(prompt_bytes)
+            self._prompt_tokens.append(prompt_tokens)
+            self._latency_ms.append(latency_ms)
+
+    @staticmethod
+    def _summary(values: deque) -> Dict[str, float]:
+        if not values:
+            return {'avg': 0, 'p95': 0, 'max': 0}
+        ordered = sorted(values)
+        return {
+            'avg': round(sum(ordered) / len(ordered), 1),
+            'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+            'max': round(ordered[-1], 1),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.counters,
+                'samples': len(self._prompt_bytes),
+                'prompt_bytes': self._summary(self._prompt_bytes),
+                'prompt_tokens': self._summary(self._prompt_tokens),
+                'llm_latency_ms': self._summary(self._latency_ms),
+            }
+
+
+class PromptBuilder:
+    """提示词组装（进程内单例，见 get_prompt_builder）"""
+
+    def __init__(self, max_detail_chars: int = 500, history_token_budget: int = 400,
+                 summary_token_budget: int = 150, max_history_turns: int = 10,
+                 fragment_cache_size: int = 1000, fragment_ttl: float = 3600):
+        self.max_detail_chars = max_detail_chars
+        self.history_token_budget = history_token_budget
+        self.summary_token_budget = summary_token_budget
+        self.max_history_turns = max_history_turns
+        self._fragments = TTLCache(max_size=fragment_cache_size, ttl=fragment_ttl)
+        self._custom_prompts = TTLCache(max_size=fragment_cache_size, ttl=fragment_ttl)
+        self.metrics = PromptMetrics()
+
+    def item_fragment(self, item_info: dict) -> str:
+        """商品提示片段，按 (标题, 价格, 详情) 内容哈希缓存"""
+        item_info = item_info or {}
+        title, price, desc = item_info.get('title', '未知'), item_info.get('price', '未知'), item_info.get('desc', '无')
+        key = hashlib.sha1(f"{title}\x00{price}\x00{desc}".encode('utf-8')).hexdigest()
+        fragment = self._fragments.get(key)
+        if fragment is not None:
+            self.metrics.counters['fragment_hits'] += 1
+            return fragment
+        self.metrics.counters['fragment_misses'] += 1
+        fragment = (f"商品标题: {title}\n"
+                    f"商品价格: {normalize_price(price)}元\n"
+                    f"商品描述: {trim_detail(desc, self.max_detail_chars)}")
+        self._fragments[key] = fragment
+        return fragment
+
+    def custom_prompts(self, raw: Optional[str]) -> Dict[str, str]:
+        """解析账号自定义提示词（按原始字符串缓存）"""
+        if not raw:
+            return {}
+        parsed = self._custom_prompts.get(raw)
+        if parsed is None:
+            parsed = json.loads(raw)
+            self._custom_prompts[raw] = parsed
+        return parsed
+
+    def history(self, turns: List[Tuple[str, str]], summary: List[str]) -> Tuple[str, str]:
+        """按token预算选取最近的对话轮次，预算外的更早轮次与已有滚动摘要合并
+
+        Args:
+            turns: 环形缓冲中的对话 [(role, content)]，从旧到新
+            summary: 已被环形缓冲淘汰的轮次摘要片段，从旧到新
+        Returns:
+            (对话历史文本, 摘要文本)
+        """
+        kept: List[str] = []
+        used = 0
+        index = len(turns)
+        while index > 0 and len(kept) < self.max_history_turns:
+            role, content = turns[index - 1]
+            line = f"{role}: {content}"
+            tokens = estimate_tokens(line)
+            # 至少保留最新一轮，即使它本身超出预算
+            if kept and used + tokens > self.history_token_budget:
+                break
+            kept.append(line)
+            used += tokens
+            index -= 1
+        kept.reverse()
+
+        older = list(summary) + [summarize_turn(role, content) for role, content in turns[:index]]
+        self.metrics.counters['summarized_turns'] += index
+        snippets: List[str] = []
+        used = 0
+        for snippet in reversed(older):
+            tokens = estimate_tokens(snippet)
+            if used + tokens > self.summary_token_budget:
+                break
+            snippets.append(snippet)
+            used += tokens
+        snippets.reverse()
+        return "\n".join(kept), "；".join(snippets)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics.stats(),
+            'history_token_budget': self.history_token_budget,
+            'summary_token_budget': self.summary_token_budget,
+            'fragments': self._fragments.stats('prompt_fragments'),
+        }
+
+
+def summarize_turn(role: str, content: str, max_chars: int = 24) -> str:
+    """把一轮对话压缩成摘要片段（截断长消息，去掉换行）"""
+    speaker = '买家' if role == 'user' else '卖家'
+    text = _SPACE_PATTERN.sub(' ', content or '').strip()
+    if len(text) > max_chars:
+        text = text[:max_chars] + '…'
+    return f"{speaker}:{text}"
+
+
+_builder: Optional[PromptBuilder] = None
+
+
+def get_prompt_builder() -> PromptBuilder:
+    """获取进程级提示词组装器，首次调用时按 AI_REPLY.prompt 配置创建"""
+    global _builder
+    if _builder is None:
+        conf = config.get('AI_REPLY.prompt', {}) or {}
+        _builder = PromptBuilder(
+            max_detail_chars=conf.get('max_detail_chars', 500),
+            history_token_budget=conf.get('history_token_budget', 400),
+            summary_token_budget=conf.get('summary_token_budget', 150),
+            max_history_turns=conf.get('max_history_turns', 10),
+            fragment_cache_size=conf.get('fragment_cache_size', 1000),
+        )
+    return _builder
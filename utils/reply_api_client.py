@@ -0,0 +1,210 @@
+"""
+外部回复接口（AUTO_REPLY.api）客户端
+- 复用进程级 aiohttp 长连接会话（见 llm_client_pool.http_session），不再每个账号各建连接
+- 每次请求受耗时预算约束（latency_budget_ms），超出即放弃，由调用方使用关键词回复
+- 相同请求（除消息时间外参数一致）的成功结果短时缓存
+- 按接口地址统计耗时（EWMA/p95）并熔断：连续失败达到阈值后冷却一段时间，冷却结束只放行一个探测请求
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from config import config
+from utils.bounded_cache import TTLCache
+from utils.llm_client_pool import llm_client_pool
+
+
+class _EndpointState:
+    """单个接口地址的熔断状态与耗时统计"""
+
+    def __init__(self, url: str, window: int = 100):
+        self.url = url
+        self.state = 'closed'  # closed / open / half_open
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self.latency_ewma_ms = 0.0
+        self._latencies: deque = deque(maxlen=window)
+        self.counters = {'requests': 0, 'successes': 0, 'empty': 0, 'failures': 0, 'timeouts': 0,
+                         'cache_hits': 0, 'short_circuited': 0, 'opened': 0}
+
+    def record_latency(self, latency_ms: float):
+        self._latencies.append(latency_ms)
+        self.latency_ewma_ms = latency_ms if not self.latency_ewma_ms else 0.8 * self.latency_ewma_ms + 0.2 * latency_ms
+
+    def p95_ms(self) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        p95 = self.p95_ms()
+        return {
+            'url': self.url,
+            'state': self.state if not (self.state == 'open' and now >= self.open_until) else 'half_open',
+            'consecutive_failures': self.consecutive_failures,
+            'open_remaining_seconds': round(max(0.0, self.open_until - now), 1) if self.state == 'open' else 0,
+            'latency_ewma_ms': round(self.latency_ewma_ms, 1),
+            'latency_p95_ms': round(p95, 1) if p95 is not None else None,
+            **self.counters,
+        }
+
+
+class ReplyAPIClient:
+    """进程级外部回复接口客户端（见 get_reply_api_client）"""
+
+    def __init__(self, latency_budget_ms: float = 3000, cache_ttl: float = 30, cache_size: int = 1000,
+                 failure_threshold: int = 5, open_seconds: float = 30):
+        self.latency_budget_ms = latency_budget_ms
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._cache = TTLCache(max_size=cache_size, ttl=cache_ttl) if cache_ttl and cache_ttl > 0 else None
+        self._endpoints: Dict[str, _EndpointState] = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, url: str) -> _EndpointState:
+        with self._lock:
+            state = self._endpoints.get(url)
+            if state is None:
+                state = _EndpointState(url)
+                self._endpoints[url] = state
+            return state
+
+    @staticmethod
+    def cache_key(url: str, payload: dict) -> str:
+        """消息时间不参与缓存键，其余参数一致即视为相同请求"""
+        body = {k: v for k, v in payload.items() if k != 'msg_time'}
+        raw = json.dumps(body, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(f"{url}\x00{raw}".encode('utf-8')).hexdigest()
+
+    def _allow(self, state: _EndpointState) -> bool:
+        """熔断检查：冷却期内拒绝；冷却结束后只放行一个探测请求"""
+        with self._lock:
+            if state.state == 'closed':
+                return True
+            if state.state == 'open' and time.time() >= state.open_until:
+                state.state = 'half_open'
+                state.probe_in_flight = False
+            if state.state == 'open' or state.probe_in_flight:
+                state.counters['short_circuited'] += 1
+                return False
+            state.probe_in_flight = True
+            return True
+
+    def _record(self, state: _EndpointState, ok: bool, latency_ms: float):
+        with self._lock:
+            state.record_latency(latency_ms)
+            state.probe_in_flight = False
+            if ok:
+                if state.state != 'closed':
+                    logger.info(f"回复API {state.url} 已恢复，关闭熔断")
+                state.state = 'closed'
+                state.consecutive_failures = 0
+                return
+            state.consecutive_failures += 1
+            if state.state == 'half_open' or state.consecutive_failures >= self.failure_threshold:
+                if state.state != 'open':
+                    state.counters['opened'] += 1
+                state.state = 'open'
+                state.open_until = time.time() + self.open_seconds
+                logger.warning(f"回复API {state.url} 连续失败{state.consecutive_failures}次，熔断{self.open_seconds}秒")
+
+    async def fetch(self, url: str, payload: dict, cookie_id: str = None) -> Optional[str]:
+        """请求回复接口，返回 data.send_msg（未格式化）；超出预算/熔断中/接口出错时返回None"""
+        state = self._endpoint(url)
+        key = self.cache_key(url, payload) if self._cache is not None else None
+        if key is not None:
+            cached = self._cache.get(key)
+            if cached is not None:
+                state.counters['cache_hits'] += 1
+                return cached
+
+        if not self._allow(state):
+            logger.debug(f"【{cookie_id}】回复API熔断中，跳过请求")
+            return None
+
+        state.counters['requests'] += 1
+        started = time.monotonic()
+        budget = self.latency_budget_ms / 1000 if self.latency_budget_ms and self.latency_budget_ms > 0 else None
+        try:
+            send_msg = await asyncio.wait_for(self._post(url, payload), timeout=budget)
+        except asyncio.TimeoutError:
+            state.counters['timeouts'] += 1
+            self._record(state, False, (time.monotonic() - started) * 1000)
+            logger.warning(f"【{cookie_id}】回复API超出耗时预算 {self.latency_budget_ms}ms")
+            return None
+        except asyncio.CancelledError:
+            with self._lock:
+                state.probe_in_flight = False
+            raise
+        except Exception as e:
+            state.counters['failures'] += 1
+            self._record(state, False, (time.monotonic() - started) * 1000)
+            logger.error(f"【{cookie_id}】调用回复API出错: {e}")
+            return None
+
+        # 接口正常返回（即使没有回复内容）即视为可用
+        self._record(state, True, (time.monotonic() - started) * 1000)
+        if not send_msg:
+            state.counters['empty'] += 1
+            return None
+        state.counters['successes'] += 1
+        if key is not None:
+            self._cache[key] = send_msg
+        return send_msg
+
+    @staticmethod
+    async def _post(url: str, payload: dict) -> Optional[str]:
+        async with llm_client_pool.http_session() as session, \
+                session.post(url, json=payload) as response:
+            if response.status >= 500:
+                raise Exception(f"HTTP {response.status}")
+            result = await response.json(content_type=None)
+
+        # 将code转换为字符串进行比较，或者直接用数字比较
+        if str(result.get('code')) == '200':
+            send_msg = (result.get('data') or {}).get('send_msg')
+            if not send_msg:
+                logger.warning("API返回成功但无回复消息")
+            return send_msg
+        logger.warning(f"API返回错误: {result.get('msg', '未知错误')}")
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            endpoints = [state.stats(now) for state in self._endpoints.values()]
+        return {
+            'latency_budget_ms': self.latency_budget_ms,
+            'failure_threshold': self.failure_threshold,
+            'open_seconds': self.open_seconds,
+            'cache': self._cache.stats('reply_api_cache') if self._cache is not None else None,
+            'endpoints': endpoints,
+        }
+
+
+_client: Optional[ReplyAPIClient] = None
+
+
+def get_reply_api_client() -> ReplyAPIClient:
+    """获取进程级回复接口客户端，首次调用时按 AUTO_REPLY.api 配置创建"""
+    global _client
+    if _client is None:
+        conf = config.get('AUTO_REPLY.api', {}) or {}
+        _client = ReplyAPIClient(
+            # 未配置预算时沿用原来的 timeout（秒）
+            latency_budget_ms=conf.get('latency_budget_ms', conf.get('timeout', 10) * 1000),
+            cache_ttl=conf.get('cache_ttl', 30),
+            cache_size=conf.get('cache_size', 1000),
+            failure_threshold=conf.get('failure_threshold', 5),
+            open_seconds=conf.get('open_seconds', 30),
+        )
+    return _client
@@ -0,0 +1,187 @@
+"""
+AI回复缓存
+相同账号、相同商品、相同意图下的相同问题（归一化后）直接复用之前的大模型回复，
+议价意图额外按议价轮次分桶；两层存储：内存LRU → SQLite(ai_reply_cache, 带过期时间)
+
+缓存键中包含商品信息和提示词/议价设置的指纹，商品信息或提示词变更后自然不再命中；
+账号AI设置保存、商品详情更新时也会主动清理对应缓存。是否启用由账号AI设置的
+reply_cache_enabled 控制（默认关闭）
+"""
+
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from config import config
+from utils.bounded_cache import TTLCache
+
+# 归一化时去掉的字符：空白、标点、符号（保留中文、字母、数字）
+_STRIP_PATTERN = re.compile(r'[\s\W_]+', re.UNICODE)
+
+
+def normalize_message(message: str) -> str:
+    """归一化用户消息：全角转半角(NFKC)、转小写、去掉空白和标点"""
+    text = unicodedata.normalize('NFKC', message or '').lower()
+    return _STRIP_PATTERN.sub('', text)
+
+
+def _digest(*parts: Any) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ReplyCache:
+    """AI回复缓存（进程内单例，见 get_reply_cache）"""
+
+    def __init__(self, ttl: float = 6 * 60 * 60, memory_max_size: int = 2000,
+                 max_rows_per_account: int = 1000, min_message_length: int = 2):
+        self.ttl = ttl
+        self.max_rows_per_account = max_rows_per_account
+        self.min_message_length = min_message_length
+        self.memory = TTLCache(max_size=memory_max_size, ttl=ttl)
+        self._lock = threading.Lock()
+        # 未命中时大模型调用耗时的指数移动平均，用于估算命中节省的时间
+        self._llm_latency_ewma_ms = 0.0
+        self.counters = {
+            'lookups': 0,
+            'memory_hits': 0,
+            'db_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'invalidations': 0,
+            'saved_latency_ms': 0.0,
+        }
+
+    def build_key(self, cookie_id: str, item_id: str, intent: str, message: str,
+                  item_info: dict, settings: dict, bargain_count: int = 0) -> Optional[str]:
+        """生成缓存键，消息归一化后过短（如“？”）时返回None表示不缓存"""
+        normalized = normalize_message(message)
+        if len(normalized) < self.min_message_length:
+            return None
+
+        # 议价意图按轮次分桶：同一轮次的回复可复用，超过最大轮数的都归为同一桶
+        bargain_bucket = None
+        if intent == 'price':
+            bargain_bucket = min(bargain_count, settings.get('max_bargain_rounds', 3))
+
+        item_fingerprint = _digest(
+            (item_info or {}).get('title'),
+            (item_info or {}).get('price'),
+            (item_info or {}).get('desc'),
+        )
+        prompt_fingerprint = _digest(
+            settings.get('model_name'),
+            settings.get('custom_prompts'),
+            settings.get('max_discount_percent'),
+            settings.get('max_discount_amount'),
+            settings.get('max_bargain_rounds'),
+        )
+        return _digest(cookie_id, item_id, intent, normalized, bargain_bucket,
+                       item_fingerprint, prompt_fingerprint)
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """按 内存 → SQLite 查找缓存的回复（同步，调用方负责放到线程池执行）"""
+        with self._lock:
+            self.counters['lookups'] += 1
+            reply = self.memory.get(cache_key)
+            if reply is not None:
+                self._record_hit('memory_hits')
+                return reply
+
+        try:
+            from db_manager import db_manager
+            reply = db_manager.get_ai_reply_cache(cache_key)
+        except Exception as e:
+            logger.warning(f"读取AI回复缓存表失败: {e}")
+            reply = None
+
+        with self._lock:
+            if reply:
+                self.memory[cache_key] = reply
+                self._record_hit('db_hits')
+                return reply
+            self.counters['misses'] += 1
+            return None
+
+    def _record_hit(self, counter: str):
+        self.counters[counter] += 1
+        self.counters['saved_latency_ms'] += self._llm_latency_ewma_ms
+
+    def put(self, cache_key: str, cookie_id: str, item_id: str, intent: str, message: str,
+            reply: str, llm_latency_ms: float = None):
+        """写入两层缓存，并用本次大模型耗时更新节省时间估算"""
+        if not reply:
+            return
+        with self._lock:
+            self.memory[cache_key] = reply
+            self.counters['stores'] += 1
+            if llm_latency_ms is not None:
+                if self._llm_latency_ewma_ms:
+                    self._llm_latency_ewma_ms = 0.8 * self._llm_latency_ewma_ms + 0.2 * llm_latency_ms
+                else:
+                    self._llm_latency_ewma_ms = llm_latency_ms
+        try:
+            from db_manager import db_manager
+            db_manager.save_ai_reply_cache(cache_key, cookie_id, item_id, intent, message, reply,
+                                           ttl=int(self.ttl), max_rows=self.max_rows_per_account)
+        except Exception as e:
+            logger.warning(f"写入AI回复缓存表失败: {e}")
+
+    def invalidate(self, cookie_id: str, item_id: str = None) -> int:
+        """清理账号（或账号下某商品）的缓存，返回SQLite中删除的条数
+
+        内存层的键是哈希值无法按账号筛选，直接整体清空（只是回退到SQLite层，代价很小）
+        """
+        with self._lock:
+            self.memory.clear()
+            self.counters['invalidations'] += 1
+        try:
+            from db_manager import db_manager
+            deleted = db_manager.delete_ai_reply_cache(cookie_id, item_id)
+        except Exception as e:
+            logger.warning(f"清理AI回复缓存失败: {e}")
+            return 0
+        if deleted:
+            target = f"商品 {item_id}" if item_id else "全部商品"
+            logger.info(f"【{cookie_id}】已清理{target}的AI回复缓存 {deleted} 条")
+        return deleted
+
+    def purge_expired(self) -> int:
+        return self.memory.purge_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中率和估算节省的大模型耗时"""
+        with self._lock:
+            lookups = self.counters['lookups']
+            hits = self.counters['memory_hits'] + self.counters['db_hits']
+            return {
+                **self.counters,
+                'saved_latency_ms': round(self.counters['saved_latency_ms'], 1),
+                'hits': hits,
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+                'llm_latency_ewma_ms': round(self._llm_latency_ewma_ms, 1),
+                'ttl': self.ttl,
+                'memory': self.memory.stats('reply_cache'),
+            }
+
+
+_reply_cache: Optional[ReplyCache] = None
+
+
+def get_reply_cache() -> ReplyCache:
+    """获取进程级AI回复缓存实例，首次调用时按 AI_REPLY.reply_cache 配置创建"""
+    global _reply_cache
+    if _reply_cache is None:
+        cache_conf = config.get('AI_REPLY.reply_cache', {}) or {}
+        _reply_cache = ReplyCache(
+            ttl=cache_conf.get('ttl', 6 * 60 * 60),
+            memory_max_size=cache_conf.get('memory_max_size', 2000),
+            max_rows_per_account=cache_conf.get('max_rows_per_account', 1000),
+            min_message_length=cache_conf.get('min_message_length', 2),
+        )
+    return _reply_cache
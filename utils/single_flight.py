@@ -0,0 +1,102 @@
+"""
+请求合并（single-flight）注册表
+同一key的并发请求只执行一次，后到的调用方等待进行中的结果；成功结果短暂缓存，
+进程内按名称共享（跨所有账号），并统计被合并/抑制的重复请求次数
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+from utils.bounded_cache import TTLCache
+
+
+class SingleFlight:
+    """按key合并并发异步调用
+
+    - 执行者抛出异常或返回空结果时不缓存，等待者得到None
+    - result_ttl 为0时不缓存已完成的结果，只合并进行中的请求
+    """
+
+    def __init__(self, name: str, result_ttl: float = 60, max_size: int = 1000):
+        self.name = name
+        self.result_ttl = result_ttl
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._results = TTLCache(max_size=max_size, ttl=result_ttl) if result_ttl else None
+        self.counters = {
+            'calls': 0,
+            'executions': 0,
+            'coalesced': 0,
+            'memo_hits': 0,
+            'failures': 0,
+        }
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """执行或等待key对应的调用，返回其结果"""
+        self.counters['calls'] += 1
+
+        if self._results is not None:
+            cached = self._results.get(key)
+            if cached is not None:
+                self.counters['memo_hits'] += 1
+                return cached
+
+        loop = asyncio.get_running_loop()
+        future = self._inflight.get(key)
+        if future is not None and future.get_loop() is loop:
+            self.counters['coalesced'] += 1
+            return await asyncio.shield(future)
+
+        future = loop.create_future()
+        self._inflight[key] = future
+        self.counters['executions'] += 1
+        result = None
+        try:
+            result = await func()
+            if result:
+                if self._results is not None:
+                    self._results[key] = result
+            else:
+                self.counters['failures'] += 1
+            return result
+        except Exception:
+            self.counters['failures'] += 1
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            future.set_result(result)
+
+    def forget(self, key: Hashable):
+        """丢弃key的缓存结果，下次调用会重新执行"""
+        if self._results is not None:
+            self._results.pop(key, None)
+
+    def purge_expired(self) -> int:
+        return self._results.purge_expired() if self._results is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            **self.counters,
+            'suppressed': self.counters['coalesced'] + self.counters['memo_hits'],
+            'inflight': len(self._inflight),
+            'memoized': len(self._results) if self._results is not None else 0,
+            'result_ttl': self.result_ttl,
+        }
+
+
+_registry: Dict[str, SingleFlight] = {}
+
+
+def get_single_flight(name: str, result_ttl: float = 60, max_size: int = 1000) -> SingleFlight:
+    """获取（不存在时创建）进程级命名的请求合并器"""
+    flight = _registry.get(name)
+    if flight is None:
+        flight = SingleFlight(name, result_ttl=result_ttl, max_size=max_size)
+        _registry[name] = flight
+    return flight
+
+
+def get_all_single_flight_stats() -> List[Dict[str, Any]]:
+    """返回所有请求合并器的统计"""
+    return [flight.stats() for flight in list(_registry.values())]
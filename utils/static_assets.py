@@ -0,0 +1,287 @@
+"""
+前端静态资源管线
+- 启动时扫描 static 目录（上传目录除外），按内容计算指纹，文件内容连同 gzip/brotli 预压缩版本一起常驻内存
+- HTML 页面中的 /static/... 引用改写为带指纹的地址（?v=<hash>）后渲染一次并缓存，文件变化时重新渲染
+- 请求按 Accept-Encoding 返回预压缩版本；带正确指纹的请求使用 immutable 长缓存，
+  其它请求使用 no-cache + ETag，未变化时返回 304
+- 文件变化检测按 check_interval 节流（最多每隔该秒数检查一次 mtime），不会每次请求都访问磁盘；
+  扫描、读取和压缩在后台线程中完成后整体替换快照，期间请求继续使用旧快照，不阻塞事件循环
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只提供 gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+_STATIC_REF_RE = re.compile(r'''(["'(])/static/([^"'()?#\s]+)(?:\?v=[^"'()#\s]*)?''')
+
+
+class Asset:
+    """一个静态文件（原始内容、预压缩版本和指纹）"""
+
+    __slots__ = ('rel', 'mtime', 'body', 'media_type', 'hash', 'etag', 'variants')
+
+    def __init__(self, rel: str, mtime: float, body: bytes, media_type: str):
+        self.rel = rel
+        self.mtime = mtime
+        self.body = body
+        self.media_type = media_type
+        self.hash = hashlib.sha256(body).hexdigest()[:12]
+        self.etag = f'"{self.hash}"'
+        self.variants: Dict[str, bytes] = {}
+
+
+class StaticAssetPipeline:
+    """静态资源的指纹、预压缩与HTML渲染（见 get_static_assets）"""
+
+    def __init__(self, static_dir: str, exclude: Tuple[str, ...] = ('uploads',), compress_min_bytes: int = 1024,
+                 gzip_level: int = 9, brotli_quality: int = 11, check_interval: float = 2.0):
+        self.static_dir = static_dir
+        self.exclude = exclude
+        self.compress_min_bytes = compress_min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.check_interval = check_interval
+        self._assets: Dict[str, Asset] = {}
+        self._pages: Dict[str, Asset] = {}
+        self._page_sources: Dict[str, float] = {}
+        self._last_check = 0.0
+        self._refreshing = False
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        self.stats = {'requests': 0, 'not_modified': 0, 'gzip': 0, 'br': 0, 'identity': 0, 'rebuilds': 0}
+
+    # ---------- 构建 ----------
+
+    def _scan_mtimes(self) -> Dict[str, float]:
+        mtimes = {}
+        for root, dirs, files in os.walk(self.static_dir):
+            if root == self.static_dir:
+                dirs[:] = [d for d in dirs if d not in self.exclude]
+            for name in files:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, self.static_dir).replace(os.sep, '/')
+                try:
+                    mtimes[rel] = os.path.getmtime(path)
+                except OSError:
+                    continue
+        return mtimes
+
+    def _compress(self, asset: Asset):
+        if len(asset.body) < self.compress_min_bytes or not asset.media_type.startswith(COMPRESSIBLE_TYPES):
+            return
+        gz = gzip.compress(asset.body, compresslevel=self.gzip_level, mtime=0)
+        if len(gz) < len(asset.body):
+            asset.variants['gzip'] = gz
+        if brotli is not None:
+            br = brotli.compress(asset.body, quality=self.brotli_quality)
+            if len(br) < len(asset.body):
+                asset.variants['br'] = br
+
+    def _load(self, rel: str, mtime: float) -> Optional[Asset]:
+        try:
+            with open(os.path.join(self.static_dir, rel), 'rb') as f:
+                body = f.read()
+        except OSError as e:
+            logger.warning(f"读取静态文件失败: {rel} - {e}")
+            return None
+        media_type = mimetypes.guess_type(rel)[0] or 'application/octet-stream'
+        if media_type.startswith('text/') or media_type == 'application/javascript':
+            media_type += '; charset=utf-8'
+        asset = Asset(rel, mtime, body, media_type)
+        self._compress(asset)
+        return asset
+
+    def rebuild(self) -> bool:
+        """在调用线程中检查文件变化并重建变化的资源，完成后整体替换快照，有变化时返回True"""
+        with self._rebuild_lock:
+            current_assets = self._assets
+            mtimes = self._scan_mtimes()
+            assets: Dict[str, Asset] = {}
+            changed = any(rel not in mtimes for rel in current_assets)
+            for rel, mtime in mtimes.items():
+                current = current_assets.get(rel)
+                asset = current if current is not None and current.mtime == mtime else self._load(rel, mtime)
+                if asset is None:
+                    if current is not None:
+                        assets[rel] = current
+                    continue
+                if current is None or asset.hash != current.hash:
+                    changed = True
+                assets[rel] = asset
+            pages = self._pages
+            if changed:
+                # 任一资源指纹变化都可能影响页面中的引用，已渲染过的页面在此一并重新渲染
+                pages = {}
+                for name in list(self._pages):
+                    page = self._render(assets, name)
+                    if page is not None:
+                        pages[name] = page
+                self.stats['rebuilds'] += 1
+            with self._lock:
+                self._assets = assets
+                self._pages = pages
+            return changed
+
+    def refresh(self) -> bool:
+        """按 check_interval 节流，在后台线程中检查文件变化；重建完成前继续使用旧快照，发起检查时返回True"""
+        now = time.time()
+        if now - self._last_check < self.check_interval:
+            return False
+        with self._lock:
+            if self._refreshing or now - self._last_check < self.check_interval:
+                return False
+            self._last_check = now
+            self._refreshing = True
+            self._refresh_thread = threading.Thread(target=self._background_rebuild, name='static-assets-refresh',
+                                                    daemon=True)
+        self._refresh_thread.start()
+        return True
+
+    def _background_rebuild(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            logger.warning(f"静态资源重建失败: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def build(self):
+        """启动时构建全部资源"""
+        start = time.time()
+        self._last_check = start
+        self.rebuild()
+        total = sum(len(a.body) for a in self._assets.values())
+        compressed = sum(len(a.variants.get('gzip', a.body)) for a in self._assets.values())
+        logger.info(f"静态资源已加载: {len(self._assets)} 个文件, {total // 1024}KB (gzip后 {compressed // 1024}KB), "
+                    f"brotli{'已启用' if brotli is not None else '未安装'}, 耗时 {time.time() - start:.2f}s")
+
+    # ---------- 页面与地址 ----------
+
+    def url(self, rel: str) -> str:
+        asset = self._assets.get(rel)
+        return f"/static/{rel}?v={asset.hash}" if asset else f"/static/{rel}"
+
+    def _render(self, assets: Dict[str, Asset], name: str) -> Optional[Asset]:
+        """用指定快照中的资源指纹改写页面引用并预压缩"""
+        source = assets.get(name)
+        if source is None:
+            return None
+
+        def rewrite(match: re.Match) -> str:
+            rel = match.group(2)
+            asset = assets.get(rel)
+            if asset is None:
+                return match.group(0)
+            return f"{match.group(1)}/static/{rel}?v={asset.hash}"
+
+        html = _STATIC_REF_RE.sub(rewrite, source.body.decode('utf-8'))
+        page = Asset(name, source.mtime, html.encode('utf-8'), 'text/html; charset=utf-8')
+        self._compress(page)
+        return page
+
+    def page(self, name: str) -> Optional[Asset]:
+        """获取渲染好的页面（引用改写为带指纹地址），页面文件不存在时返回None"""
+        self.refresh()
+        page = self._pages.get(name)
+        if page is not None:
+            return page
+        with self._lock:
+            page = self._render(self._assets, name)
+            if page is not None:
+                self._pages[name] = page
+            return page
+
+    def asset(self, rel: str) -> Optional[Asset]:
+        self.refresh()
+        return self._assets.get(rel)
+
+    # ---------- 响应 ----------
+
+    @staticmethod
+    def _accepted_encodings(accept_encoding: Optional[str]) -> List[str]:
+        accepted = []
+        for part in (accept_encoding or '').split(','):
+            token, _, params = part.strip().partition(';')
+            token = token.strip().lower()
+            if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                continue
+            if token:
+                accepted.append(token)
+        return accepted
+
+    def respond(self, asset: Asset, accept_encoding: Optional[str] = None, if_none_match: Optional[str] = None,
+                version: Optional[str] = None) -> Tuple[int, Dict[str, str], bytes]:
+        """生成响应 (状态码, 响应头, 响应体)；version 为请求中的 ?v= 指纹"""
+        self.stats['requests'] += 1
+        headers = {
+            'ETag': asset.etag,
+            'Cache-Control': IMMUTABLE_CACHE if version and version == asset.hash else REVALIDATE_CACHE,
+            'Content-Type': asset.media_type,
+        }
+        if asset.variants:
+            headers['Vary'] = 'Accept-Encoding'
+        if if_none_match and asset.etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+            self.stats['not_modified'] += 1
+            headers.pop('Content-Type')
+            return 304, headers, b''
+
+        accepted = self._accepted_encodings(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in asset.variants and encoding in accepted:
+                self.stats[encoding] += 1
+                headers['Content-Encoding'] = encoding
+                return 200, headers, asset.variants[encoding]
+        self.stats['identity'] += 1
+        return 200, headers, asset.body
+
+    def get_stats(self) -> Dict[str, object]:
+        with self._lock:
+            assets = list(self._assets.values())
+        return {
+            **self.stats,
+            'assets': len(assets),
+            'pages': len(self._pages),
+            'bytes': sum(len(a.body) for a in assets),
+            'gzip_bytes': sum(len(a.variants['gzip']) for a in assets if 'gzip' in a.variants),
+            'br_bytes': sum(len(a.variants['br']) for a in assets if 'br' in a.variants),
+            'brotli_available': brotli is not None,
+        }
+
+
+_pipeline: Optional[StaticAssetPipeline] = None
+
+
+def get_static_assets(static_dir: str) -> StaticAssetPipeline:
+    """获取静态资源管线（首次调用时按 STATIC_ASSETS 配置创建并构建）"""
+    global _pipeline
+    if _pipeline is None:
+        from config import config
+
+        conf = config.get('STATIC_ASSETS', {}) or {}
+        _pipeline = StaticAssetPipeline(
+            static_dir,
+            compress_min_bytes=conf.get('compress_min_bytes', 1024),
+            gzip_level=conf.get('gzip_level', 9),
+            brotli_quality=conf.get('brotli_quality', 11),
+            check_interval=conf.get('check_interval', 2),
+        )
+        _pipeline.build()
+    return _pipeline